@@ -0,0 +1,209 @@
+"""Benchmark suite for pypackager.
+
+    python -m benchmarks run [--profile NAME ...] [--output results.json]
+    python -m benchmarks compare results.json [--baseline benchmarks/baseline.json]
+    python -m benchmarks startup [--budget-ms 100] [--output results.json]
+    python -m benchmarks compress [--profile NAME ...] [--threads N] [--output results.json]
+
+`run` generates synthetic projects (see `projects.PROFILES`) in a work
+directory and builds each one cold (empty caches, no lockfile, no dist) and
+warm (everything kept), recording per-stage wall time, CPU time and peak RSS.
+Everything runs offline: pip only sees a local directory of generated
+dependency wheels. `compare` exits non-zero when a stage regressed beyond the
+threshold; store a baseline by running with `--output benchmarks/baseline.json`.
+`startup` times `--version` and `--help` (and, for reference, loading one
+builder) in fresh interpreters, failing when one exceeds the budget.
+`compress` writes each synthetic project's files as a zip and a tar.gz with
+the stdlib writers and with `core.archive`'s parallel ones, and reports the
+throughput of each.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from . import compare as comparison
+from . import compression, startup
+from .harness import benchmark_env, run_once
+from .projects import DEFAULT_PROFILES, PROFILES, generate, write_index
+
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+DEFAULT_TARGETS = ["wheel", "docker", "oci", "binary"]
+RESULTS_VERSION = 1
+
+
+def _median_stages(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    stages: Dict[str, Any] = {}
+    for name in runs[0]:
+        samples = [run[name] for run in runs if name in run]
+        stages[name] = {"calls": samples[0]["calls"]}
+        for metric in ("wall", "cpu", "peak_rss"):
+            values = [s[metric] for s in samples if s.get(metric) is not None]
+            stages[name][metric] = statistics.median(values) if values else None
+    return stages
+
+
+def _reset(project: Path, cache: Path) -> None:
+    for path in (project / "dist", cache):
+        shutil.rmtree(path, ignore_errors=True)
+    (project / "pypackager.lock").unlink(missing_ok=True)
+
+
+def _run(args: argparse.Namespace) -> int:
+    work = Path(args.workdir or os.path.join(tempfile.gettempdir(), "pypackager-bench")).resolve()
+    profiles = [PROFILES[name] for name in args.profiles or DEFAULT_PROFILES]
+    index = write_index(work / "index", max(p.dependencies for p in profiles))
+    results = []
+    for profile in profiles:
+        project = generate(profile, work / "projects", args.targets)
+        cache = work / "cache" / profile.name
+        env = benchmark_env(work, index, cache)
+        request = {"project": os.fspath(project), "targets": args.targets, "jobs": args.jobs}
+        for mode in ("cold", "warm"):
+            runs = []
+            for _ in range(args.repeat):
+                if mode == "cold":
+                    _reset(project, cache)
+                runs.append(run_once(request, env))
+            stages = _median_stages(runs)
+            results.append({
+                "project": profile.name,
+                "files": profile.files,
+                "dependencies": profile.dependencies,
+                "native": profile.native,
+                "mode": mode,
+                "runs": len(runs),
+                "stages": stages,
+            })
+            print(f"{profile.name:>7} {mode}: {stages['process']['wall']:.2f}s", file=sys.stderr)
+
+    _write_results(args.output, results, targets=args.targets, jobs=args.jobs)
+    return 0
+
+
+def _write_results(output: str | None, results: List[Dict[str, Any]], **extra: Any) -> None:
+    document = {
+        "version": RESULTS_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        **extra,
+        "results": results,
+    }
+    text = json.dumps(document, indent=2, sort_keys=True) + "\n"
+    if output:
+        Path(output).write_text(text, encoding="utf-8")
+    else:
+        sys.stdout.write(text)
+
+
+def _startup(args: argparse.Namespace) -> int:
+    with tempfile.TemporaryDirectory(prefix="pypackager-startup-") as cache:
+        env = dict(os.environ, PYPACKAGER_CACHE_DIR=cache)
+        stages = startup.measure(args.repeat, env)
+    over = []
+    for name, metrics in stages.items():
+        wall_ms = metrics["wall"] * 1000
+        flag = ""
+        if name in startup.BUDGETED and wall_ms > args.budget_ms:
+            over.append(name)
+            flag = f"  OVER BUDGET ({args.budget_ms:.0f} ms)"
+        print(f"{name:>12}: {wall_ms:6.1f} ms{flag}", file=sys.stderr)
+    _write_results(args.output, [{"project": "cli", "mode": "startup", "runs": args.repeat, "stages": stages}])
+    return 1 if over else 0
+
+
+def _compress(args: argparse.Namespace) -> int:
+    work = Path(args.workdir or os.path.join(tempfile.gettempdir(), "pypackager-bench")).resolve()
+    results = []
+    for profile in [PROFILES[name] for name in args.profiles or DEFAULT_PROFILES]:
+        project = generate(profile, work / "projects", DEFAULT_TARGETS)
+        stages = compression.measure(project, args.repeat, args.threads)
+        for name, metrics in stages.items():
+            print(
+                f"{profile.name:>7} {name:>12}: {metrics['mib_per_s']:7.1f} MiB/s "
+                f"({metrics['input_bytes'] / (1024 * 1024):.1f} MiB -> {metrics['output_bytes'] / (1024 * 1024):.1f} MiB, "
+                f"cpu {metrics['cpu']:.2f}s)",
+                file=sys.stderr,
+            )
+        results.append({"project": profile.name, "files": profile.files, "mode": "compress",
+                        "runs": args.repeat, "stages": stages})
+    _write_results(args.output, results, threads=args.threads or os.cpu_count())
+    return 0
+
+
+def _compare(args: argparse.Namespace) -> int:
+    current = json.loads(Path(args.results).read_text(encoding="utf-8"))
+    baseline_path = Path(args.baseline)
+    if not baseline_path.is_file():
+        print(f"No baseline at {baseline_path}; save one with `run --output {baseline_path}`", file=sys.stderr)
+        return 2
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    regressions, improvements = comparison.compare(baseline, current, args.threshold)
+    for change in improvements:
+        print(f"improved   {change.describe()}")
+    for change in regressions:
+        print(f"REGRESSION {change.describe()}")
+    print(f"{len(regressions)} regression(s), {len(improvements)} improvement(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="pypackager benchmark suite")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Build the synthetic projects cold and warm and record per-stage costs")
+    run.add_argument("--profile", dest="profiles", action="append", choices=sorted(PROFILES),
+                     help=f"Project size(s) to run; repeatable (default: {', '.join(DEFAULT_PROFILES)})")
+    run.add_argument("--target", dest="targets", action="append", choices=DEFAULT_TARGETS,
+                     help="Target(s) to build; repeatable (default: all)")
+    run.add_argument("--repeat", type=int, default=3, help="Runs per project and mode; medians are kept (default: 3)")
+    run.add_argument("-j", "--jobs", type=int, default=1, help="Pipeline concurrency (default: 1, for per-stage costs)")
+    run.add_argument("--workdir", default=None, help="Where projects, caches and the stand-in index live")
+    run.add_argument("-o", "--output", default=None, help="Write results JSON here (default: stdout)")
+
+    cmp = sub.add_parser("compare", help="Flag regressions against a baseline")
+    cmp.add_argument("results", help="Results JSON from `run`")
+    cmp.add_argument("--baseline", default=os.fspath(DEFAULT_BASELINE), help="Baseline results JSON")
+    cmp.add_argument("--threshold", type=float, default=0.10, help="Relative change to report (default: 0.10)")
+
+    start = sub.add_parser("startup", help="Time CLI startup (--version, --help, loading a builder)")
+    start.add_argument("--repeat", type=int, default=10, help="Runs per command; medians are kept (default: 10)")
+    start.add_argument("--budget-ms", type=float, default=100.0,
+                       help="Fail when a command's median wall time exceeds this (default: 100)")
+    start.add_argument("-o", "--output", default=None, help="Write results JSON here (default: stdout)")
+
+    comp = sub.add_parser("compress", help="Archive throughput of the stdlib and parallel zip/tar.gz writers")
+    comp.add_argument("--profile", dest="profiles", action="append", choices=sorted(PROFILES),
+                      help=f"Project size(s) to run; repeatable (default: {', '.join(DEFAULT_PROFILES)})")
+    comp.add_argument("--threads", type=int, default=0, help="Compression threads (default: one per CPU)")
+    comp.add_argument("--repeat", type=int, default=3, help="Runs per writer; medians are kept (default: 3)")
+    comp.add_argument("--workdir", default=None, help="Where the projects are generated")
+    comp.add_argument("-o", "--output", default=None, help="Write results JSON here (default: stdout)")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        args.targets = args.targets or DEFAULT_TARGETS
+        return _run(args)
+    if args.command == "startup":
+        return _startup(args)
+    if args.command == "compress":
+        return _compress(args)
+    return _compare(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
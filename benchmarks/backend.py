@@ -0,0 +1,126 @@
+"""Minimal PEP 517 backend for the synthetic benchmark projects.
+
+Copied into each generated project as `_backend/pypackager_bench_backend.py`
+and loaded through `backend-path`, so builds need no setuptools and never
+touch the network. It only uses the standard library and reads the project
+description from `_backend/bench.json` written by the generator.
+
+Native extensions are stubs: every `ext/*.c` file becomes an opaque
+`<name><EXT_SUFFIX>` file in the wheel (no compiler is run), which still
+gives the wheel a platform tag and the packaging tools real binaries to move.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import sysconfig
+import sys
+import tarfile
+import zipfile
+
+_ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+
+def _meta():
+    with open(os.path.join("_backend", "bench.json"), encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _dist_name(meta):
+    return meta["name"].replace("-", "_")
+
+
+def _tag(meta):
+    if not meta["native"]:
+        return "py3-none-any"
+    python = "cp%d%d" % sys.version_info[:2]
+    platform = sysconfig.get_platform().replace("-", "_").replace(".", "_")
+    return "%s-%s-%s" % (python, python, platform)
+
+
+def _metadata(meta):
+    lines = ["Metadata-Version: 2.1", "Name: %s" % meta["name"], "Version: %s" % meta["version"]]
+    lines += ["Requires-Dist: %s" % dep for dep in meta["dependencies"]]
+    return "\n".join(lines) + "\n"
+
+
+def _package_files(meta):
+    """(arcname, bytes) of the package sources and native stubs, sorted."""
+    files = []
+    for directory, dirnames, filenames in os.walk("src"):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(directory, filename)
+            with open(path, "rb") as fh:
+                files.append((os.path.relpath(path, "src").replace(os.sep, "/"), fh.read()))
+    suffix = sysconfig.get_config_var("EXT_SUFFIX") or ".so"
+    if os.path.isdir("ext"):
+        for filename in sorted(os.listdir("ext")):
+            if filename.endswith(".c"):
+                with open(os.path.join("ext", filename), "rb") as fh:
+                    stub = b"\x7fELF-pypackager-bench-stub\n" + hashlib.sha256(fh.read()).digest()
+                files.append(("%s/%s%s" % (meta["package"], filename[:-2], suffix), stub))
+    return files
+
+
+def _record_hash(data):
+    return "sha256=" + base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=").decode("ascii")
+
+
+def get_requires_for_build_wheel(config_settings=None):
+    return []
+
+
+def get_requires_for_build_sdist(config_settings=None):
+    return []
+
+
+def build_wheel(wheel_directory, config_settings=None, metadata_directory=None):
+    meta = _meta()
+    dist_info = "%s-%s.dist-info" % (_dist_name(meta), meta["version"])
+    tag = _tag(meta)
+    files = _package_files(meta)
+    files.append(("%s/METADATA" % dist_info, _metadata(meta).encode("utf-8")))
+    wheel = "Wheel-Version: 1.0\nGenerator: pypackager-bench\nRoot-Is-Purelib: %s\nTag: %s\n" % (
+        "false" if meta["native"] else "true", tag,
+    )
+    files.append(("%s/WHEEL" % dist_info, wheel.encode("utf-8")))
+    entry_points = "[console_scripts]\n%s = %s.cli:main\n" % (meta["name"], meta["package"])
+    files.append(("%s/entry_points.txt" % dist_info, entry_points.encode("utf-8")))
+    record = "".join("%s,%s,%d\n" % (name, _record_hash(data), len(data)) for name, data in files)
+    files.append(("%s/RECORD" % dist_info, (record + "%s/RECORD,,\n" % dist_info).encode("utf-8")))
+
+    filename = "%s-%s-%s.whl" % (_dist_name(meta), meta["version"], tag)
+    with zipfile.ZipFile(os.path.join(wheel_directory, filename), "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in files:
+            info = zipfile.ZipInfo(name, date_time=_ZIP_DATE)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            zf.writestr(info, data)
+    return filename
+
+
+def build_sdist(sdist_directory, config_settings=None):
+    meta = _meta()
+    base = "%s-%s" % (_dist_name(meta), meta["version"])
+    filename = base + ".tar.gz"
+    with tarfile.open(os.path.join(sdist_directory, filename), "w:gz", format=tarfile.PAX_FORMAT) as tar:
+        entries = [("PKG-INFO", _metadata(meta).encode("utf-8"))]
+        for top in ("pyproject.toml", "_backend", "src", "ext"):
+            if os.path.isfile(top):
+                with open(top, "rb") as fh:
+                    entries.append((top, fh.read()))
+            for directory, dirnames, filenames in os.walk(top):
+                dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+                for name in sorted(filenames):
+                    path = os.path.join(directory, name)
+                    with open(path, "rb") as fh:
+                        entries.append((path.replace(os.sep, "/"), fh.read()))
+        for name, data in entries:
+            info = tarfile.TarInfo("%s/%s" % (base, name))
+            info.size = len(data)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+    return filename
@@ -0,0 +1,68 @@
+"""Compare benchmark results against a stored baseline."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Differences below these floors are noise, whatever the ratio
+MIN_DELTA = {"wall": 0.05, "cpu": 0.05, "peak_rss": 8 * 1024 * 1024}
+# CLI startup is measured in milliseconds
+MODE_MIN_DELTA = {"startup": {"wall": 0.005, "cpu": 0.005, "peak_rss": 2 * 1024 * 1024}}
+METRICS = ("wall", "cpu", "peak_rss")
+
+
+@dataclass(frozen=True)
+class Change:
+    project: str
+    mode: str
+    stage: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else float("inf")
+
+    def describe(self) -> str:
+        def fmt(value: float) -> str:
+            if self.metric == "peak_rss":
+                return f"{value / (1024 * 1024):.1f} MiB"
+            return f"{value * 1000:.0f} ms"
+
+        return (
+            f"{self.project}/{self.mode} {self.stage} {self.metric}: "
+            f"{fmt(self.baseline)} -> {fmt(self.current)} ({(self.ratio - 1) * 100:+.0f}%)"
+        )
+
+
+def _stages(results: Dict[str, Any]) -> Iterator[Tuple[Tuple[str, str, str], Dict[str, Any]]]:
+    for entry in results.get("results", []):
+        for stage, metrics in entry["stages"].items():
+            yield (entry["project"], entry["mode"], stage), metrics
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.10
+) -> Tuple[List[Change], List[Change]]:
+    """Return (regressions, improvements): metrics that moved by more than `threshold`."""
+    previous = dict(_stages(baseline))
+    regressions: List[Change] = []
+    improvements: List[Change] = []
+    for key, metrics in _stages(current):
+        before = previous.get(key)
+        if before is None:
+            continue
+        for metric in METRICS:
+            old: Optional[float] = before.get(metric)
+            new: Optional[float] = metrics.get(metric)
+            floor = MODE_MIN_DELTA.get(key[1], MIN_DELTA)[metric]
+            if old is None or new is None or abs(new - old) < floor:
+                continue
+            change = Change(*key, metric=metric, baseline=old, current=new)
+            if new > old * (1 + threshold):
+                regressions.append(change)
+            elif new < old * (1 - threshold):
+                improvements.append(change)
+    return regressions, improvements
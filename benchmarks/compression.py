@@ -0,0 +1,108 @@
+"""Measure archive throughput: the stdlib writers against pypackager's parallel ones."""
+
+from __future__ import annotations
+
+import io
+import os
+import resource
+import statistics
+import sys
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from .harness import SRC
+
+if os.fspath(SRC) not in sys.path:
+    sys.path.insert(0, os.fspath(SRC))
+
+from pypackager.core.archive import Compression, ParallelGzipWriter, ParallelZipWriter  # noqa: E402
+
+LEVEL = 6
+
+
+def _files(project: Path) -> List[Tuple[str, bytes]]:
+    """The project's files (sources, native stubs, metadata), read into memory up front."""
+    files = []
+    for path in sorted(project.rglob("*")):
+        rel = path.relative_to(project).as_posix()
+        if path.is_file() and not rel.startswith(("dist/", "_backend/")):
+            files.append((rel, path.read_bytes()))
+    return files
+
+
+def _zip_stdlib(files: List[Tuple[str, bytes]], threads: int) -> int:
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED, compresslevel=LEVEL) as zf:
+        for name, data in files:
+            zf.writestr(name, data)
+    return out.tell()
+
+
+def _zip_parallel(files: List[Tuple[str, bytes]], threads: int) -> int:
+    out = io.BytesIO()
+    with ParallelZipWriter(out, Compression(level=LEVEL, threads=threads)) as zf:
+        for name, data in files:
+            zf.add_bytes(name, data)
+    return out.tell()
+
+
+def _tar(files: List[Tuple[str, bytes]], tar: tarfile.TarFile) -> None:
+    for name, data in files:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+
+def _tgz_stdlib(files: List[Tuple[str, bytes]], threads: int) -> int:
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode="w:gz", compresslevel=LEVEL) as tar:
+        _tar(files, tar)
+    return out.tell()
+
+
+def _tgz_parallel(files: List[Tuple[str, bytes]], threads: int) -> int:
+    out = io.BytesIO()
+    with ParallelGzipWriter(out, Compression(level=LEVEL, threads=threads)) as gz:
+        with tarfile.open(fileobj=gz, mode="w|") as tar:  # type: ignore[call-overload]
+            _tar(files, tar)
+    return out.tell()
+
+
+WRITERS: Dict[str, Callable[[List[Tuple[str, bytes]], int], int]] = {
+    "zip-stdlib": _zip_stdlib,
+    "zip-parallel": _zip_parallel,
+    "tgz-stdlib": _tgz_stdlib,
+    "tgz-parallel": _tgz_parallel,
+}
+
+
+def _cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(project: Path, repeat: int, threads: int) -> Dict[str, Any]:
+    """Median wall and CPU time of each writer over `repeat` runs, with MiB/s of input and output size."""
+    files = _files(project)
+    total = sum(len(data) for _name, data in files)
+    stages: Dict[str, Any] = {}
+    for name, writer in WRITERS.items():
+        samples = []
+        for _ in range(repeat):
+            cpu, started = _cpu(), time.perf_counter()
+            size = writer(files, threads or os.cpu_count() or 1)
+            samples.append((time.perf_counter() - started, _cpu() - cpu, size))
+        wall = statistics.median(s[0] for s in samples)
+        stages[name] = {
+            "calls": 1,
+            "wall": wall,
+            "cpu": statistics.median(s[1] for s in samples),
+            "peak_rss": None,
+            "input_bytes": total,
+            "output_bytes": samples[0][2],
+            "mib_per_s": total / (1024 * 1024) / wall if wall else None,
+        }
+    return stages
@@ -0,0 +1,153 @@
+"""Run `Pipeline.run` against a synthetic project and record per-stage costs.
+
+Each measured run happens in a fresh interpreter (`python -m
+benchmarks.harness <request.json>`) so that peak RSS belongs to that run
+alone. Inside it, the pipeline stages are wrapped to record wall time, CPU
+time (the process and its finished subprocesses, e.g. pip) and the peak RSS
+high-water mark when the stage ends. Stages run with `jobs=1` by default so
+their costs do not overlap.
+"""
+
+from __future__ import annotations
+
+import functools
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None  # type: ignore[assignment]
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+
+def _usage() -> Tuple[float, Optional[int]]:
+    """CPU seconds of this process and its reaped children, and the peak RSS in bytes so far."""
+    if resource is None:
+        return time.process_time(), None
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return cpu, max(own.ru_maxrss, children.ru_maxrss) * scale
+
+
+class StageRecorder:
+    """Accumulates wall/CPU time and peak RSS per named stage."""
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    def wrap(self, stage: str, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            wall_start = time.perf_counter()
+            cpu_start, _ = _usage()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                cpu_end, rss = _usage()
+                entry = self.stages.setdefault(stage, {"wall": 0.0, "cpu": 0.0, "peak_rss": None, "calls": 0})
+                entry["wall"] += time.perf_counter() - wall_start
+                entry["cpu"] += cpu_end - cpu_start
+                entry["calls"] += 1
+                if rss is not None:
+                    entry["peak_rss"] = max(entry["peak_rss"] or 0, rss)
+
+        return wrapper
+
+    def patch(self, owner: Any, attribute: str, stage: str) -> None:
+        setattr(owner, attribute, self.wrap(stage, getattr(owner, attribute)))
+
+
+def _instrument(recorder: StageRecorder) -> None:
+    """Wrap the pipeline stages; nested stages are also counted in their parents."""
+    from pypackager.core.envpool import EnvironmentProvider
+    from pypackager.core.pipeline import Pipeline
+    from pypackager.core.resolver import DependencyResolver
+    from pypackager.core.scanner import ProjectScanner
+    from pypackager.plugins import discover_builders
+
+    recorder.patch(ProjectScanner, "scan", "scan")
+    recorder.patch(DependencyResolver, "write_lockfile", "write_lockfile")
+    recorder.patch(DependencyResolver, "sync_wheelhouse", "sync_wheelhouse")
+    recorder.patch(Pipeline, "_fingerprints", "fingerprint")
+    # Pooled successor of `isolated_env`: provisions (or reuses) build environments
+    recorder.patch(EnvironmentProvider, "get", "environment")
+    for name, cls in discover_builders().items():
+        recorder.patch(cls, "build", f"build:{name}")
+    recorder.patch(Pipeline, "run", "pipeline")
+
+
+def measure(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the pipeline once, in this process, as described by `request`."""
+    from pypackager.config import load_config
+    from pypackager.core.pipeline import Pipeline
+
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    recorder = StageRecorder()
+    _instrument(recorder)
+    project = Path(request["project"])
+    pipeline = Pipeline(project, load_config(project))
+    pipeline.run(request["targets"], project / "dist", jobs=request.get("jobs", 1))
+    return recorder.stages
+
+
+def run_once(request: Dict[str, Any], env: Dict[str, str]) -> Dict[str, Any]:
+    """Measure one run in a fresh interpreter; adds the whole process as stage "process"."""
+    started = time.perf_counter()
+    proc = subprocess.Popen(  # noqa: S603
+        [sys.executable, "-m", "benchmarks.harness", json.dumps(request)],
+        cwd=Path(__file__).resolve().parent.parent,
+        env=env,
+        stdout=subprocess.PIPE,
+    )
+    assert proc.stdout is not None
+    output = proc.stdout.read()
+    _pid, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - started
+    if proc.returncode:
+        raise RuntimeError(f"Benchmark run of {request['project']} failed with exit status {proc.returncode}")
+    stages = json.loads(output)
+    scale = 1 if sys.platform == "darwin" else 1024
+    stages["process"] = {
+        "wall": wall,
+        "cpu": usage.ru_utime + usage.ru_stime,
+        "peak_rss": usage.ru_maxrss * scale,
+        "calls": 1,
+    }
+    return stages
+
+
+def benchmark_env(work: Path, index: Path, cache: Path) -> Dict[str, str]:
+    """Environment isolating a run: private caches and pip restricted to the stand-in index."""
+    env = dict(os.environ)
+    env.update(
+        PYPACKAGER_CACHE_DIR=os.fspath(cache),
+        PIP_NO_INDEX="1",
+        PIP_FIND_LINKS=os.fspath(index),
+        PIP_DISABLE_PIP_VERSION_CHECK="1",
+        PIP_CACHE_DIR=os.fspath(work / "pip-cache"),
+        PYTHONPATH=os.pathsep.join(filter(None, [os.fspath(SRC), env.get("PYTHONPATH")])),
+    )
+    env.pop("PYPACKAGER_WHEELHOUSE", None)
+    return env
+
+
+def main(argv: List[str]) -> int:
+    stages = measure(json.loads(argv[0]))
+    sys.stdout.write(json.dumps(stages))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
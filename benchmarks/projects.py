@@ -0,0 +1,207 @@
+"""Synthetic projects and the local wheelhouse stand-in they depend on."""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import shutil
+import zipfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND = Path(__file__).with_name("backend.py")
+BACKEND_MODULE = "pypackager_bench_backend"
+DEPENDENCY_VERSION = "1.0.0"
+# Modules per generated subpackage
+MODULES_PER_PACKAGE = 100
+
+
+@dataclass(frozen=True)
+class Profile:
+    """Shape of one synthetic project."""
+
+    name: str
+    files: int  # Python source files in the package
+    dependencies: int  # direct dependencies on stand-in wheels
+    native: int  # native extension stubs
+
+    @property
+    def project(self) -> str:
+        return f"bench-{self.name}"
+
+    @property
+    def package(self) -> str:
+        return f"bench_{self.name}"
+
+
+PROFILES: Dict[str, Profile] = {
+    p.name: p
+    for p in (
+        Profile("tiny", files=10, dependencies=0, native=0),
+        Profile("small", files=100, dependencies=2, native=0),
+        Profile("medium", files=1_000, dependencies=10, native=1),
+        Profile("large", files=10_000, dependencies=25, native=2),
+        Profile("huge", files=50_000, dependencies=50, native=4),
+    )
+}
+DEFAULT_PROFILES = ["tiny", "small", "medium", "large"]
+
+_MODULE_TEMPLATE = '''"""Synthetic module {index} of {package}."""
+
+from __future__ import annotations
+
+import dataclasses
+from typing import Dict, List
+
+CONSTANT_{index} = {index}
+
+
+@dataclasses.dataclass
+class Record{index}:
+    key: str
+    values: List[int] = dataclasses.field(default_factory=list)
+
+    def total(self) -> int:
+        return sum(self.values) + CONSTANT_{index}
+
+
+def build_{index}(keys: List[str]) -> Dict[str, Record{index}]:
+    """Index fresh records by key."""
+    return {{key: Record{index}(key, [len(key), {index}]) for key in keys}}
+
+
+def summarize_{index}(records: Dict[str, Record{index}]) -> str:
+    return ", ".join(f"{{k}}={{r.total()}}" for k, r in sorted(records.items()))
+'''
+
+_EXT_TEMPLATE = """#include <Python.h>
+
+/* Native extension stub {index}; the benchmark backend packages it without compiling. */
+static PyModuleDef module = {{PyModuleDef_HEAD_INIT, "_native{index}", NULL, -1, NULL}};
+
+PyMODINIT_FUNC PyInit__native{index}(void) {{ return PyModule_Create(&module); }}
+"""
+
+
+def dependency_name(index: int) -> str:
+    return f"benchdep-{index:03d}"
+
+
+def _record_hash(data: bytes) -> str:
+    return "sha256=" + base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=").decode("ascii")
+
+
+def _write_wheel(path: Path, files: Dict[str, bytes]) -> None:
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in sorted(files.items()):
+            info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            zf.writestr(info, data)
+
+
+def write_index(directory: Path, count: int) -> Path:
+    """Write `count` small pure-Python dependency wheels, the stand-in for a package index.
+
+    Each wheel is reused when present, so the index is only created once per work directory.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    for index in range(count):
+        name = dependency_name(index)
+        module = name.replace("-", "_")
+        wheel = directory / f"{module}-{DEPENDENCY_VERSION}-py3-none-any.whl"
+        if wheel.exists():
+            continue
+        dist_info = f"{module}-{DEPENDENCY_VERSION}.dist-info"
+        files = {
+            f"{module}/__init__.py": f'"""Stand-in dependency {index}."""\n\nVALUE = {index}\n'.encode("utf-8"),
+            f"{dist_info}/METADATA": (
+                f"Metadata-Version: 2.1\nName: {name}\nVersion: {DEPENDENCY_VERSION}\n"
+            ).encode("utf-8"),
+            f"{dist_info}/WHEEL": b"Wheel-Version: 1.0\nGenerator: pypackager-bench\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+        }
+        record = "".join(f"{n},{_record_hash(d)},{len(d)}\n" for n, d in sorted(files.items()))
+        files[f"{dist_info}/RECORD"] = (record + f"{dist_info}/RECORD,,\n").encode("utf-8")
+        tmp = wheel.with_suffix(".tmp")
+        _write_wheel(tmp, files)
+        tmp.replace(wheel)
+    return directory
+
+
+def generate(profile: Profile, root: Path, targets: List[str]) -> Path:
+    """Create the project for `profile` under `root`, unless an identical one exists."""
+    project = root / profile.project
+    stamp = json.dumps({"profile": asdict(profile), "backend": hashlib.sha256(BACKEND.read_bytes()).hexdigest(),
+                        "targets": targets}, sort_keys=True)
+    marker = project / "_backend" / "generated.json"
+    if marker.is_file() and marker.read_text(encoding="utf-8") == stamp:
+        return project
+    if project.exists():
+        shutil.rmtree(project)
+
+    package = project / "src" / profile.package
+    package.mkdir(parents=True)
+    (package / "__init__.py").write_text(f'"""Synthetic benchmark project {profile.project}."""\n', encoding="utf-8")
+    (package / "cli.py").write_text(
+        "def main():\n"
+        f'    print("{profile.project} ok")\n'
+        "    return 0\n",
+        encoding="utf-8",
+    )
+    # __init__.py and cli.py count towards the file total
+    for index in range(max(profile.files - 2, 0)):
+        sub = package / f"group_{index // MODULES_PER_PACKAGE:04d}"
+        if index % MODULES_PER_PACKAGE == 0:
+            sub.mkdir()
+            (sub / "__init__.py").write_text("", encoding="utf-8")
+        (sub / f"module_{index:05d}.py").write_text(
+            _MODULE_TEMPLATE.format(index=index, package=profile.package), encoding="utf-8"
+        )
+    if profile.native:
+        ext = project / "ext"
+        ext.mkdir()
+        for index in range(profile.native):
+            (ext / f"_native{index}.c").write_text(_EXT_TEMPLATE.format(index=index), encoding="utf-8")
+
+    dependencies = [f"{dependency_name(i)}=={DEPENDENCY_VERSION}" for i in range(profile.dependencies)]
+    (project / "pyproject.toml").write_text(
+        "[build-system]\n"
+        "requires = []\n"
+        f'build-backend = "{BACKEND_MODULE}"\n'
+        'backend-path = ["_backend"]\n'
+        "\n"
+        "[project]\n"
+        f'name = "{profile.project}"\n'
+        'version = "1.0.0"\n'
+        'requires-python = ">=3.9"\n'
+        f"dependencies = {json.dumps(dependencies)}\n"
+        "\n"
+        "[project.scripts]\n"
+        f'{profile.project} = "{profile.package}.cli:main"\n',
+        encoding="utf-8",
+    )
+    (project / "pypackager.toml").write_text(
+        "[pypackager]\n"
+        f"targets = {json.dumps(targets)}\n"
+        "\n"
+        "[pypackager.wheel]\n"
+        'formats = ["wheel"]\n',
+        encoding="utf-8",
+    )
+    backend = project / "_backend"
+    backend.mkdir()
+    shutil.copyfile(BACKEND, backend / f"{BACKEND_MODULE}.py")
+    (backend / "bench.json").write_text(
+        json.dumps({
+            "name": profile.project,
+            "version": "1.0.0",
+            "package": profile.package,
+            "dependencies": dependencies,
+            "native": profile.native,
+        }, indent=2),
+        encoding="utf-8",
+    )
+    marker.write_text(stamp, encoding="utf-8")
+    return project
@@ -0,0 +1,70 @@
+"""Measure CLI startup: fresh interpreters running commands that never reach the pipeline."""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from .harness import SRC
+
+# Stage name → arguments after `python`
+COMMANDS: Dict[str, List[str]] = {
+    "interpreter": ["-c", "pass"],
+    "version": ["-m", "pypackager.cli", "--version"],
+    "help": ["-m", "pypackager.cli", "--help"],
+    "build-help": ["-m", "pypackager.cli", "build", "--help"],
+    # Index lookup (cached after the first run) and import of a single builder
+    "load-builder": ["-c", "from pypackager.plugins import get_registry; get_registry().load('wheel')"],
+}
+# Commands held to the startup budget; the others are reference points
+BUDGETED = ("version", "help", "build-help")
+
+
+def _run(args: List[str], env: Dict[str, str]) -> Tuple[float, float, int]:
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    proc = subprocess.Popen(  # noqa: S603
+        [sys.executable, *args], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    _out, error = proc.communicate()
+    wall = time.perf_counter() - started
+    if proc.returncode:
+        raise RuntimeError(f"`python {' '.join(args)}` failed: {error.decode(errors='replace')}")
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime)
+    scale = 1 if sys.platform == "darwin" else 1024
+    return wall, cpu, after.ru_maxrss * scale
+
+
+def _time(args: List[str], env: Dict[str, str]) -> Tuple[float, float, int]:
+    """Wall time, CPU time and peak RSS of one run of `python args`.
+
+    The children's ru_maxrss is a high-water mark over every child reaped so
+    far, so each run is started from a freshly forked process of its own.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as pool:
+        return pool.submit(_run, args, env).result()
+
+
+def measure(repeat: int, env: Dict[str, str]) -> Dict[str, Any]:
+    """Median wall time, CPU time and peak RSS of each command over `repeat` runs."""
+    env = dict(env)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.fspath(SRC), env.get("PYTHONPATH")]))
+    stages: Dict[str, Any] = {}
+    for name, args in COMMANDS.items():
+        _time(args, env)  # warm the page cache and the entry-point index
+        samples = [_time(args, env) for _ in range(repeat)]
+        stages[name] = {
+            "calls": 1,
+            "wall": statistics.median(s[0] for s in samples),
+            "cpu": statistics.median(s[1] for s in samples),
+            "peak_rss": statistics.median(s[2] for s in samples),
+        }
+    return stages
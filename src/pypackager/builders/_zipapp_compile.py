@@ -0,0 +1,66 @@
+"""Byte-compile a staged zipapp payload for the binary target.
+
+Executed as a script by the target interpreter, so it must only use the
+standard library. Usage: `_zipapp_compile.py REQUEST OUTPUT`. Reads a JSON
+request {"root", "files", "bootstrap"} from REQUEST and writes a marshal
+(version 2, readable by any interpreter) tuple to OUTPUT: (magic, "X.Y"
+version, {relpath: marshalled code}, bootstrap pyc). Files that
+fail to compile are left out and compiled from source if ever imported. Large
+payloads are compiled on a process pool.
+"""
+
+import importlib.util
+import json
+import marshal
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+_PARALLEL_MIN = 64
+_CHUNK = 32
+
+
+def _bootstrap_pyc(path):
+    with open(path, "rb") as fh:
+        source = fh.read()
+    code = compile(source, "__main__.py", "exec", dont_inherit=True)
+    # Unchecked hash-based pyc: zipimport uses it without looking at the source
+    flags = (0b01).to_bytes(4, "little")
+    return importlib.util.MAGIC_NUMBER + flags + importlib.util.source_hash(source) + marshal.dumps(code)
+
+
+def _compile(task):
+    root, rel = task
+    with open(os.path.join(root, rel), "rb") as fh:
+        source = fh.read()
+    try:
+        return rel, marshal.dumps(compile(source, rel, "exec", dont_inherit=True)), None
+    except (SyntaxError, ValueError) as exc:
+        return rel, None, str(exc)
+
+
+def main():
+    request_path, output_path = sys.argv[1:3]
+    with open(request_path, encoding="utf-8") as fh:
+        request = json.load(fh)
+    tasks = [(request["root"], rel) for rel in request["files"]]
+    workers = os.cpu_count() or 1
+    if workers > 1 and len(tasks) > _PARALLEL_MIN:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_compile, tasks, chunksize=_CHUNK))
+    else:
+        results = [_compile(task) for task in tasks]
+    codes = {}
+    for rel, code, error in results:
+        if error is not None:
+            print(f"pypackager: not precompiling {rel}: {error}")
+            continue
+        codes[rel] = code
+    version = "%d.%d" % sys.version_info[:2]
+    result = (importlib.util.MAGIC_NUMBER, version, codes, _bootstrap_pyc(request["bootstrap"]))
+    with open(output_path, "wb") as fh:
+        fh.write(marshal.dumps(result, 2))
+
+
+if __name__ == "__main__":
+    main()
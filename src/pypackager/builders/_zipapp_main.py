@@ -0,0 +1,145 @@
+"""Bootstrap of pypackager binaries, stored as the zipapp's `__main__`.
+
+Runs on every launch under the target interpreter, so it only uses modules
+the interpreter has already imported at startup. The archive is laid out as
+
+    [#! line][payload][zip: __main__.py, __main__.pyc, __pypackager__/index]
+
+The marshalled index maps module names to the offsets of their precompiled
+code objects (and sources) in the payload, which is read with plain seeks:
+nothing is scanned or decompressed until a module is imported. Files that
+cannot be imported from memory (native extensions, package data, metadata)
+are extracted once into a cache directory keyed by the archive hash.
+"""
+
+import _frozen_importlib_external
+import marshal
+import os
+import sys
+import zlib
+from importlib.machinery import ModuleSpec
+
+_ARCHIVE = os.path.dirname(__file__)
+_INDEX = marshal.loads(__loader__.get_data("__pypackager__/index"))  # noqa: F821
+_MODULES = _INDEX["modules"]
+_PAYLOAD = _INDEX["payload"]
+_SAME_MAGIC = _INDEX["magic"] == _frozen_importlib_external.MAGIC_NUMBER
+
+_fh = None
+
+
+def _read(entry):
+    global _fh
+    offset, length, compressed = entry
+    if _fh is None:
+        _fh = open(_ARCHIVE, "rb")
+    _fh.seek(_PAYLOAD + offset)
+    data = _fh.read(length)
+    return zlib.decompress(data) if compressed else data
+
+
+class _ArchiveImporter:
+    """Meta path finder and loader for the modules in the archive index."""
+
+    def find_spec(self, fullname, path=None, target=None):
+        entry = _MODULES.get(fullname)
+        if entry is None:
+            return None
+        kind, rel = entry[0], entry[1]
+        origin = _ARCHIVE + "/" + rel
+        if kind == 2:  # namespace package
+            spec = ModuleSpec(fullname, None, is_package=True)
+            spec.submodule_search_locations = [origin]
+            return spec
+        spec = ModuleSpec(fullname, self, origin=origin, is_package=kind == 1)
+        if kind == 1:
+            spec.submodule_search_locations = [origin.rpartition("/")[0]]
+        spec.has_location = True
+        return spec
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        exec(self.get_code(module.__name__), module.__dict__)
+
+    def get_code(self, fullname):
+        entry = _MODULES[fullname]
+        if entry[2] is not None and _SAME_MAGIC:
+            return marshal.loads(_read(entry[2]))
+        # Compiled for another interpreter version: fall back to the source
+        return compile(_read(entry[3]), entry[1], "exec", dont_inherit=True)
+
+    def get_source(self, fullname):
+        from importlib.util import decode_source
+
+        return decode_source(_read(_MODULES[fullname][3]))
+
+    def is_package(self, fullname):
+        return _MODULES[fullname][0] == 1
+
+    def get_filename(self, fullname):
+        return _ARCHIVE + "/" + _MODULES[fullname][1]
+
+    def get_data(self, path):
+        with open(path, "rb") as fh:
+            return fh.read()
+
+
+def _cache_root():
+    root = os.environ.get("PYPACKAGER_ZIPAPP_CACHE")
+    if root:
+        return root
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "pypackager", "zipapp")
+
+
+def _extract():
+    """Return the directory holding the extracted files, extracting on first use."""
+    target = os.path.join(_cache_root(), _INDEX["name"] + "-" + _INDEX["hash"])
+    if os.path.isdir(target):
+        return target
+    tmp = "%s.%d.tmp" % (target, os.getpid())
+    for rel, (offset, length, compressed, executable) in _INDEX["files"].items():
+        path = os.path.join(tmp, *rel.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as out:
+            out.write(_read((offset, length, compressed)))
+        if executable:
+            os.chmod(path, 0o755)
+    try:
+        os.rename(tmp, target)
+    except OSError:  # another process extracted it first
+        import shutil
+
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def _main():
+    sys.meta_path.insert(0, _ArchiveImporter())
+    if _INDEX["files"]:
+        sys.path.insert(1, _extract())
+    module, _, attr = _INDEX["entry"].partition(":")
+    if os.environ.get("PYPACKAGER_ZIPAPP_PROBE"):
+        # Cold-start measurement: import the entry point and stop
+        __import__(module)
+        return 0
+    if not attr:
+        import runpy
+
+        runpy.run_module(module, run_name="__main__", alter_sys=True)
+        return 0
+    obj = __import__(module, fromlist=["__name__"])
+    for part in attr.split("."):
+        obj = getattr(obj, part)
+    return obj()
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -1,30 +1,364 @@
 from __future__ import annotations
 
+import configparser
+import csv
+import hashlib
+import json
 import logging
+import marshal
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
-from ..core.builder import Builder
+from packaging.utils import canonicalize_name
+
+from ..core import process, tracing
+from ..core.archive import Compression, ParallelZipWriter
+from ..core.builder import Builder, EnvironmentSpec
+from ..core.bytecode import REPORT_PATH, Bytecode, compile_tree, log_report, profile_imports
+from ..core.environment import BuildEnv, pip_install_target
 from ..core.project import ProjectInfo
+from ..core.resolver import DependencyResolver
+from .wheel import find_project_wheels
 
 logger = logging.getLogger(__name__)
 
+_BOOTSTRAP = Path(__file__).with_name("_zipapp_main.py")
+_COMPILE_SCRIPT = Path(__file__).with_name("_zipapp_compile.py")
+
+# Files that do not stop a package from being imported straight from the archive
+_PURE_EXTRAS = (".pyi", "py.typed")
+_COLD_START_RUNS = 5
+
+
+def _module_name(rel: str) -> Tuple[str, bool]:
+    """Dotted module name of a payload-relative .py path, and whether it is a package."""
+    parts = rel[: -len(".py")].split("/")
+    if parts[-1] == "__init__":
+        return ".".join(parts[:-1]), True
+    return ".".join(parts), False
+
+
+class _Payload:
+    """The concatenated, optionally zlib-compressed blobs that follow the #! line.
+
+    Blobs are compressed concurrently on a pool that lives as long as the
+    `with` block. `add` returns a handle, which `layout` maps to the blob's
+    (offset, length, compressed) once every blob is added.
+    """
+
+    def __init__(self, compression: Compression, compress: bool) -> None:
+        self.level = compression.level if compress else 0
+        self._pool = ThreadPoolExecutor(max_workers=compression.workers(), thread_name_prefix="pypackager-compress")
+        self._blobs: List[Future] = []
+        self.chunks: List[bytes] = []
+
+    def __enter__(self) -> "_Payload":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._pool.shutdown(cancel_futures=True)
+
+    def _pack(self, data: bytes) -> Tuple[bytes, bool]:
+        if self.level:
+            packed = zlib.compress(data, self.level)
+            if len(packed) < len(data):
+                return packed, True
+        return data, False
+
+    def add(self, data: bytes) -> int:
+        self._blobs.append(self._pool.submit(self._pack, data))
+        return len(self._blobs) - 1
+
+    def layout(self) -> List[Tuple[int, int, bool]]:
+        entries = []
+        offset = 0
+        for future in self._blobs:
+            data, compressed = future.result()
+            self.chunks.append(data)
+            entries.append((offset, len(data), compressed))
+            offset += len(data)
+        return entries
+
 
 class BinaryBuilder(Builder):
+    """Build a single-file executable zipapp holding the project and its dependencies.
+
+    The locked dependencies and the project wheel are installed into a staging
+    tree and byte-compiled by the target interpreter. Pure-Python packages are
+    imported from memory: a marshalled index in the archive maps each module to
+    its code object in the payload, so startup reads one small index instead of
+    scanning zip members. Packages with native extensions or data files, and
+    the dist-info metadata, are extracted on first launch into a cache keyed by
+    the archive hash (see `_zipapp_main`); their sources are byte-compiled
+    into hash-based .pyc files shipped alongside (see `core.bytecode`). With
+    `report_startup`, the binary is then launched a dozen times to measure and
+    report its cold start, and one run under `-X importtime` is profiled into
+    `reports/importtime.json` of the output directory.
+    """
+
     name = "binary"
+    version = "4"
+    depends_on = ("wheel",)
+    environment = EnvironmentSpec.shared()
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        entry_point: Optional[str] = None,
+        interpreter: Optional[str] = None,
+        compress: bool = True,
+        compression: Optional[Compression] = None,
+        bytecode: Optional[Bytecode] = None,
+        report_startup: bool = False,
+    ) -> None:
+        super().__init__()
         self._project: ProjectInfo | None = None
+        self.entry_point = entry_point
+        self.interpreter = interpreter
+        self.compress = compress
+        self.compression = compression or Compression()
+        self.bytecode = bytecode or Bytecode()
+        self.report_startup = report_startup
 
     def configure(self, project_info: ProjectInfo) -> None:
         self._project = project_info
 
-    def build(self, output_directory: Path) -> None:
+    def build(self, output_directory: Path, env: Optional[BuildEnv] = None) -> None:
         if not self._project:
             raise RuntimeError("BinaryBuilder not configured")
+        if env is None:
+            raise RuntimeError("BinaryBuilder requires a build environment")
+
+        wheels = find_project_wheels(self._project, self.dependency_output("wheel", output_directory))
+        if not wheels:
+            raise RuntimeError(
+                f"Binary target needs a {self._project.name} {self._project.version} wheel; "
+                "enable the wheel target and format"
+            )
+        pins = DependencyResolver(self._project.root).pinned_requirements() or list(self._project.dependencies)
+
         output_directory.mkdir(parents=True, exist_ok=True)
-        marker = output_directory / f"{self._project.name}-{self._project.version}-BINARY.txt"
-        marker.write_text(
-            "Placeholder artifact. PyInstaller packaging will follow.\n",
-            encoding="utf-8",
+        archive = output_directory / f"{self._project.name}.pyz"
+        with tempfile.TemporaryDirectory(prefix="pypackager-binary-") as tmp:
+            staging = Path(tmp)
+            if pins and env.wheelhouse is not None:
+                env.wheelhouse.ensure(pins, os.fspath(env.python))
+            pip_install_target(env.python, staging, [*pins, *(os.fspath(w) for w in wheels)], env.wheelhouse)
+            self._prune(staging)
+            entry = self.entry_point or self._default_entry_point(staging)
+            pure, extracted = self._classify(staging)
+            with tracing.span("binary compile", files=len(pure)):
+                magic, py_version, codes, bootstrap_pyc = self._compile(env, staging, pure)
+                extracted = self._precompile_extracted(env, staging, extracted)
+            with tracing.span("binary archive"):
+                self._write_archive(archive, staging, entry, pure, extracted, magic, codes, bootstrap_pyc, py_version)
+            logger.info(
+                "Wrote %s (%.1f KiB): %d module(s) in the index, %d file(s) extracted on first run; entry %s",
+                archive, archive.stat().st_size / 1024, len(pure), len(extracted), entry,
+            )
+        if not self.report_startup:
+            return
+        with tracing.span("binary cold start") as span:
+            report = self._report_cold_start(env, archive, entry)
+            if report is not None:
+                log_report(report, archive.name, output_directory / REPORT_PATH)
+                if span is not None:
+                    span.set(total_ms=report["total_ms"], imports_ms=report["imports_ms"])
+
+    @staticmethod
+    def _prune(staging: Path) -> None:
+        """Drop console scripts (the binary is the entry point) and `direct_url.json` (a host path).
+
+        RECORD rows of the dropped files go too, keeping the payload reproducible.
+        """
+        shutil.rmtree(staging / "bin", ignore_errors=True)
+        for direct_url in staging.glob("*.dist-info/direct_url.json"):
+            direct_url.unlink()
+        for record in sorted(staging.glob("*.dist-info/RECORD")):
+            rows = [
+                row for row in csv.reader(record.read_text(encoding="utf-8").splitlines())
+                if row and (staging / row[0]).resolve().is_relative_to(staging.resolve())
+                and (staging / row[0]).exists()
+            ]
+            with open(record, "w", encoding="utf-8", newline="") as fh:
+                csv.writer(fh, lineterminator="\n").writerows(rows)
+
+    def _default_entry_point(self, staging: Path) -> str:
+        """The project's console script (the one named after it, else the first); else its module."""
+        assert self._project is not None
+        name = canonicalize_name(self._project.name)
+        for dist_info in sorted(staging.glob("*.dist-info")):
+            if canonicalize_name(dist_info.name[: -len(".dist-info")].rpartition("-")[0]) != name:
+                continue
+            parser = configparser.ConfigParser(delimiters=("=",))
+            parser.optionxform = str  # type: ignore[assignment,method-assign]
+            parser.read(dist_info / "entry_points.txt", encoding="utf-8")
+            if parser.has_section("console_scripts"):
+                scripts = dict(parser.items("console_scripts"))
+                if scripts:
+                    return (scripts.get(self._project.name) or scripts[sorted(scripts)[0]]).split("[")[0].strip()
+        return name.replace("-", "_")
+
+    @staticmethod
+    def _classify(staging: Path) -> Tuple[List[str], List[str]]:
+        """Split the staged files into importable .py files and files to extract.
+
+        A top-level package goes to the index only if it holds nothing but
+        Python sources; otherwise it is extracted whole, so native extensions
+        and data keep their on-disk neighbours.
+        """
+        pure: List[str] = []
+        extracted: List[str] = []
+        for entry in sorted(staging.iterdir()):
+            if entry.is_file():
+                (pure if entry.suffix == ".py" else extracted).append(entry.name)
+                continue
+            files = sorted(
+                p.relative_to(staging).as_posix()
+                for p in entry.rglob("*")
+                if p.is_file() and "__pycache__" not in p.parts
+            )
+            importable = not entry.name.endswith((".dist-info", ".data")) and all(
+                f.endswith((".py", *_PURE_EXTRAS)) for f in files
+            )
+            if importable:
+                pure.extend(f for f in files if f.endswith(".py"))
+            else:
+                extracted.extend(files)
+        return pure, extracted
+
+    def _precompile_extracted(self, env: BuildEnv, staging: Path, extracted: List[str]) -> List[str]:
+        """`extracted` plus .pyc files for its modules, so their first import skips compiling."""
+        if not self.bytecode.compiles:
+            return extracted
+        packages = sorted({
+            rel.split("/", 1)[0] for rel in extracted
+            if rel.endswith(".py") and "/" in rel and not rel.split("/", 1)[0].endswith((".dist-info", ".data"))
+        })
+        if not packages:
+            return extracted
+        pycs = compile_tree(env.python, [staging / p for p in packages], self.bytecode.invalidation, staging)
+        return sorted({*extracted, *(Path(p).as_posix() for p in pycs)})
+
+    @staticmethod
+    def _compile(env: BuildEnv, staging: Path, pure: List[str]) -> Tuple[bytes, str, Dict[str, bytes], bytes]:
+        with tempfile.TemporaryDirectory(prefix="pypackager-compile-") as tmp:
+            request, result = Path(tmp, "request.json"), Path(tmp, "result")
+            request.write_text(
+                json.dumps({"root": os.fspath(staging), "files": pure, "bootstrap": os.fspath(_BOOTSTRAP)}),
+                encoding="utf-8",
+            )
+            try:
+                process.run([env.python, _COMPILE_SCRIPT, request, result])
+            except subprocess.CalledProcessError as exc:
+                raise RuntimeError(
+                    f"Byte-compiling the binary payload failed with exit status {exc.returncode}"
+                ) from exc
+            magic, py_version, codes, bootstrap_pyc = marshal.loads(result.read_bytes())
+        return magic, py_version, codes, bootstrap_pyc
+
+    def _write_archive(
+        self,
+        archive: Path,
+        staging: Path,
+        entry: str,
+        pure: List[str],
+        extracted: List[str],
+        magic: bytes,
+        codes: Dict[str, bytes],
+        bootstrap_pyc: bytes,
+        py_version: str,
+    ) -> None:
+        assert self._project is not None
+        with _Payload(self.compression, self.compress) as payload:
+            modules: Dict[str, Tuple[Any, ...]] = {}
+            for rel in pure:
+                name, is_package = _module_name(rel)
+                if not all(part.isidentifier() for part in name.split(".")):
+                    continue
+                code = codes.get(rel)
+                code_blob = payload.add(code) if code is not None else None
+                modules[name] = (1 if is_package else 0, rel, code_blob, payload.add((staging / rel).read_bytes()))
+                # Parent directories without __init__.py are namespace packages
+                parts = name.split(".")
+                for depth in range(1, len(parts)):
+                    parent = ".".join(parts[:depth])
+                    if parent not in modules and not (staging.joinpath(*parts[:depth]) / "__init__.py").is_file():
+                        modules[parent] = (2, "/".join(parts[:depth]))
+            files: Dict[str, Tuple[Any, ...]] = {}
+            for rel in extracted:
+                path = staging / rel
+                files[rel] = (payload.add(path.read_bytes()), os.access(path, os.X_OK))
+            blobs = payload.layout()
+        for name, module in modules.items():
+            if len(module) == 4:
+                kind, rel, code_blob, source_blob = module
+                modules[name] = (kind, rel, blobs[code_blob] if code_blob is not None else None, blobs[source_blob])
+        for rel, (blob, executable) in files.items():
+            files[rel] = (*blobs[blob], executable)
+
+        digest = hashlib.sha256()
+        for chunk in payload.chunks:
+            digest.update(chunk)
+        digest.update(marshal.dumps((entry, sorted(modules.items()), sorted(files.items())), 2))
+        shebang = f"#!{self.interpreter or f'/usr/bin/env python{py_version}'}\n".encode("utf-8")
+        index = {
+            "name": canonicalize_name(self._project.name),
+            "hash": digest.hexdigest()[:16],
+            "entry": entry,
+            "magic": magic,
+            "payload": len(shebang),
+            "modules": modules,
+            "files": files,
+        }
+
+        tmp = archive.with_name(f".{archive.name}.tmp")
+        with open(tmp, "wb") as fh:
+            fh.write(shebang)
+            for chunk in payload.chunks:
+                fh.write(chunk)
+            with ParallelZipWriter(fh, self.compression) as zf:
+                zf.add_bytes("__main__.py", _BOOTSTRAP.read_bytes())
+                zf.add_bytes("__main__.pyc", bootstrap_pyc)
+                zf.add_bytes("__pypackager__/index", marshal.dumps(index, 2))
+        tmp.chmod(0o755)
+        os.replace(tmp, archive)
+
+    def _report_cold_start(self, env: BuildEnv, archive: Path, entry: str) -> Optional[Dict[str, Any]]:
+        """Time launching the binary up to importing its entry point, against a bare interpreter.
+
+        With profiling on, one more warm run goes through `-X importtime`; its
+        report (see `core.bytecode`) is returned.
+        """
+        def timed(args: List[str], run_env: Dict[str, str]) -> float:
+            started = time.perf_counter()
+            subprocess.run(args, env=run_env, check=True, stdout=subprocess.DEVNULL)  # noqa: S603
+            return (time.perf_counter() - started) * 1000
+
+        python = os.fspath(env.python)
+        run_env = {k: v for k, v in os.environ.items() if k != "PYTHONPATH"}
+        with tempfile.TemporaryDirectory(prefix="pypackager-zipapp-cache-") as cache:
+            run_env.update(PYPACKAGER_ZIPAPP_PROBE="1", PYPACKAGER_ZIPAPP_CACHE=cache)
+            try:
+                first = timed([python, os.fspath(archive)], run_env)
+                warm = statistics.median(timed([python, os.fspath(archive)], run_env) for _ in range(_COLD_START_RUNS))
+                bare = statistics.median(timed([python, "-c", "pass"], run_env) for _ in range(_COLD_START_RUNS))
+                report = (
+                    profile_imports(env.python, [python, os.fspath(archive)], self.bytecode.top, run_env)
+                    if self.bytecode.profile else None
+                )
+            except subprocess.CalledProcessError as exc:
+                raise RuntimeError(f"{archive.name} failed to import its entry point {entry}") from exc
+        logger.info(
+            "Cold start to import %s: %.1f ms first run (with extraction), %.1f ms warm "
+            "(median of %d; bare interpreter %.1f ms)",
+            entry.partition(":")[0], first, warm, _COLD_START_RUNS, bare,
         )
-        logger.info("Binary builder produced placeholder artifact at %s", marker)
+        return report
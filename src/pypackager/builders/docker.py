@@ -1,53 +1,167 @@
 from __future__ import annotations
 
 import logging
+import shutil
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 from ..core.builder import Builder
+from ..core.bytecode import BYTECODE_SCRIPT, REPORT_PATH, Bytecode
+from ..core.context import BuildContext, project_files
+from ..core.environment import INSTALLER_SCRIPT, BuildEnv
 from ..core.project import ProjectInfo
+from ..core.resolver import DependencyResolver
+from .wheel import find_project_wheels
 
 logger = logging.getLogger(__name__)
 
+DOCKER_MODES = ("source", "wheel")
+DOCKER_CONTEXTS = ("directory", "tar")
+DOCKER_INSTALLERS = ("pypackager", "pip")
+INSTALLER_NAME = "pypackager-install.py"
+BYTECODE_NAME = "pypackager-bytecode.py"
+
+PIP_CACHE_MOUNT = "--mount=type=cache,target=/root/.cache/pip"
+
 
 class DockerBuilder(Builder):
+    """Generates a layer-cache-friendly, multi-stage Dockerfile.
+
+    Dependencies are installed from a requirements file rendered from the
+    lockfile before any project source is copied, so a source-only change
+    reuses the dependency layers. In "wheel" mode the image consumes the wheel
+    already built on the host in `dist/wheel` instead of rebuilding it.
+
+    The build context holds exactly the files the Dockerfile copies (see
+    `core.context`), staged as a hardlinked directory or a deterministic tarball.
+    With the "pypackager" installer the context also carries the parallel wheel
+    installer, which the image runs in place of `pip install` (falling back to
+    pip for wheels it cannot handle).
+
+    Each install is followed by byte-compiling, in parallel, the modules it
+    wrote (as listed in their RECORDs) into hash-based .pyc files, so the base
+    image's own packages are not recompiled and the project layer does not
+    repeat the dependencies' bytecode. An `importtime` stage exports the
+    import-time profile of the entry point (see `core.bytecode`); the default
+    target is still the runtime image.
+    """
+
     name = "docker"
+    version = "7"
+    depends_on = ("wheel",)
+    # The staged context hardlinks project sources; it is rebuilt, never cached
+    transient = ("context", "context.tar")
 
-    def __init__(self, base_image: str = "python:3.12-slim", entrypoint: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        base_image: str = "python:3.12-slim",
+        entrypoint: Optional[str] = None,
+        mode: str = "source",
+        runtime_image: Optional[str] = None,
+        context: str = "directory",
+        include: Optional[List[str]] = None,
+        installer: str = "pypackager",
+        bytecode: Optional[Bytecode] = None,
+    ) -> None:
+        super().__init__()
+        if mode not in DOCKER_MODES:
+            raise ValueError(f"Unknown docker mode {mode!r}; expected one of {', '.join(DOCKER_MODES)}")
+        if context not in DOCKER_CONTEXTS:
+            raise ValueError(f"Unknown docker context {context!r}; expected one of {', '.join(DOCKER_CONTEXTS)}")
+        if installer not in DOCKER_INSTALLERS:
+            raise ValueError(
+                f"Unknown docker installer {installer!r}; expected one of {', '.join(DOCKER_INSTALLERS)}"
+            )
         self._project: ProjectInfo | None = None
         self.base_image = base_image
         self.entrypoint = entrypoint
+        self.mode = mode
+        self.runtime_image = runtime_image
+        self.context = context
+        self.include = list(include or [])
+        self.installer = installer
+        self.bytecode = bytecode or Bytecode()
 
     def configure(self, project_info: ProjectInfo) -> None:
         self._project = project_info
 
-    def build(self, output_directory: Path) -> None:
+    def build(self, output_directory: Path, env: Optional[BuildEnv] = None) -> None:
         if not self._project:
             raise RuntimeError("DockerBuilder not configured")
-        
+
         output_directory.mkdir(parents=True, exist_ok=True)
-        
+        for stale in ("context", "context.tar", "Dockerfile.dockerignore", ".dockerignore"):
+            path = output_directory / stale
+            if path.is_dir():
+                shutil.rmtree(path)
+            elif path.exists():
+                path.unlink()
+
         # Determine Python version from requires-python or use default
         py_version = self._get_python_version()
-        base = self.base_image.replace("<version>", py_version) if "<version>" in self.base_image else self.base_image
-        
-        # Multi-stage Dockerfile: build stage creates wheels, runtime stage installs them
-        dockerfile_content = self._generate_dockerfile(base)
-        
+        base = self._image(self.base_image, py_version)
+        runtime = self._image(self.runtime_image, py_version) if self.runtime_image else base
+
+        requirements = output_directory / "requirements.txt"
+        requirements.write_text(self._generate_requirements(), encoding="utf-8")
         dockerfile = output_directory / "Dockerfile"
-        dockerfile.write_text(dockerfile_content, encoding="utf-8")
-        
-        # Create .dockerignore
-        dockerignore = output_directory / ".dockerignore"
-        dockerignore.write_text(self._generate_dockerignore(), encoding="utf-8")
-        
-        logger.info("Docker builder wrote Dockerfile and .dockerignore at %s", output_directory)
+        dockerfile.write_text(self._generate_dockerfile(base, runtime), encoding="utf-8")
+
+        context = self._build_context(self.dependency_output("wheel", output_directory))
+        context.add("Dockerfile", dockerfile)
+        context.add("requirements.txt", requirements)
+        if self.installer == "pypackager":
+            context.add(INSTALLER_NAME, INSTALLER_SCRIPT)
+        if self.bytecode.compiles or self.bytecode.profile:
+            context.add(BYTECODE_NAME, BYTECODE_SCRIPT)
+        if self.context == "tar":
+            target = output_directory / "context.tar"
+            with open(target, "wb") as fh:
+                context.write_tar(fh)
+            source = f"- < {target}"
+        else:
+            target = output_directory / "context"
+            context.stage(target)
+            source = f"{target}"
+
+        logger.info("Docker context: %d file(s), %.1f KiB at %s", len(context), context.size / 1024, target)
+        logger.info("Build the image with: DOCKER_BUILDKIT=1 docker build %s -t %s", source, self._project.name)
+        if self.bytecode.profile:
+            logger.info(
+                "Profile its imports into %s with: DOCKER_BUILDKIT=1 docker build --target importtime --output %s %s",
+                output_directory / REPORT_PATH, output_directory / REPORT_PATH.parent, source,
+            )
+
+    def _build_context(self, wheel_directory: Path) -> BuildContext:
+        """Select exactly the files the generated Dockerfile copies."""
+        assert self._project is not None
+        context = BuildContext()
+        if self.mode == "source":
+            context.update(project_files(self._project, self.include, self.project_sources(self._project.root)))
+            return context
+
+        wheels = find_project_wheels(self._project, wheel_directory)
+        if not wheels:
+            raise RuntimeError(
+                f"Docker wheel mode needs a {self._project.name} {self._project.version} wheel in "
+                f"{wheel_directory}; enable the wheel target and format"
+            )
+        for wheel in wheels:
+            context.add(f"wheels/{wheel.name}", wheel)
+        for filename in ("pyproject.toml", "pypackager.lock"):
+            if (self._project.root / filename).is_file():
+                context.add(filename, self._project.root / filename)
+        return context
+
+    @staticmethod
+    def _image(template: str, py_version: str) -> str:
+        return template.replace("<version>", py_version)
 
     def _get_python_version(self) -> str:
         """Extract Python version from requires-python or default to 3.12."""
         if not self._project or not self._project.python_requires:
             return "3.12"
-        
+
         # Parse requires-python like ">=3.9" to extract base version
         req = self._project.python_requires.strip()
         for prefix in [">=", "~=", "==", ">"]:
@@ -57,73 +171,109 @@ class DockerBuilder(Builder):
                 parts = version_str.split(".")[:2]
                 if len(parts) == 2:
                     return f"{parts[0]}.{parts[1]}"
-        
+
         return "3.12"
 
-    def _generate_dockerfile(self, base: str) -> str:
+    @staticmethod
+    def _mount(name: str) -> str:
+        return f" \\\n    --mount=type=bind,source={name},target=/tmp/{name}"
+
+    def _install_mount(self) -> str:
+        mounts = self._mount(INSTALLER_NAME) if self.installer == "pypackager" else ""
+        if self.bytecode.compiles:
+            mounts += self._mount(BYTECODE_NAME)
+        return mounts
+
+    def _install(self, wheels: str, pip_command: str) -> str:
+        """The command installing every wheel in `wheels`; pip does it if the installer cannot.
+
+        With hash-based bytecode, neither writes .pyc files; the compile step does.
+        """
+        if not self.bytecode.compiles:
+            if self.installer != "pypackager":
+                return pip_command
+            return f"python /tmp/{INSTALLER_NAME} --compile {wheels} \\\n    || {pip_command}"
+        pip_command = pip_command.replace("pip install", "pip install --no-compile", 1)
+        compile_command = (
+            f"python /tmp/{BYTECODE_NAME} compile --invalidation-mode {self.bytecode.invalidation} "
+            f"--installed-from {wheels}"
+        )
+        if self.installer != "pypackager":
+            return f"{pip_command} \\\n    && {compile_command}"
+        return f"python /tmp/{INSTALLER_NAME} {wheels} \\\n    || {pip_command} \\\n    && {compile_command}"
+
+    def _importtime_stages(self, project_name: str) -> str:
+        """Stages exporting the import-time profile; the final bare stage keeps runtime the default target."""
+        if not self.bytecode.profile:
+            return ""
+        return f'''
+# Import-time profile of the entry point: docker build --target importtime --output DIR
+FROM runtime AS importtime-run
+RUN{self._mount(BYTECODE_NAME)} \\
+    python /tmp/{BYTECODE_NAME} profile --top {self.bytecode.top} --distribution {project_name} \\
+    > /{REPORT_PATH.name}
+
+FROM scratch AS importtime
+COPY --from=importtime-run /{REPORT_PATH.name} /
+
+FROM runtime
+'''
+
+    def _generate_requirements(self) -> str:
+        """Pins from the lockfile, falling back to the declared dependencies."""
+        assert self._project is not None
+        pins: List[str] = DependencyResolver(self._project.root).pinned_requirements()
+        source = "pypackager.lock"
+        if not pins:
+            pins, source = list(self._project.dependencies), "pyproject.toml"
+        return f"# Generated by pypackager from {source}\n" + "".join(f"{p}\n" for p in pins)
+
+    def _generate_dockerfile(self, base: str, runtime: str) -> str:
         """Generate multi-stage Dockerfile content."""
         project_name = self._project.name if self._project else "app"
-        
+
         # Default CMD: run the installed package as a module
         cmd = self.entrypoint if self.entrypoint else f'["python", "-m", "{project_name}"]'
-        
-        return f'''# Multi-stage Dockerfile generated by pypackager
-# Stage 1: Build wheels from source
-FROM {base} AS builder
+
+        if self.mode == "wheel":
+            app_stage = '''# Stage 2: The project wheel already built on the host
+FROM scratch AS app
+COPY wheels/*.whl /wheels/
+'''
+        else:
+            app_stage = f'''# Stage 2: Build the project wheel; only this stage sees the source tree
+FROM {base} AS app
 
 WORKDIR /build
 COPY . /build
+RUN {PIP_CACHE_MOUNT} \\
+    pip wheel --no-deps --wheel-dir /wheels /build
+'''
+
+        return f'''# syntax=docker/dockerfile:1
+# Multi-stage Dockerfile generated by pypackager ({self.mode} mode)
+# Build with BuildKit from the context pypackager staged next to this file.
 
-RUN pip install --no-cache-dir build && \\
-    python -m build --wheel --outdir /wheels
+# Stage 1: Dependency wheels; rebuilt only when the locked requirements change
+FROM {base} AS deps
 
-# Stage 2: Runtime with installed wheels
-FROM {base} AS runtime
+COPY requirements.txt /wheels/requirements.txt
+RUN {PIP_CACHE_MOUNT} \\
+    pip wheel --wheel-dir /wheels -r /wheels/requirements.txt
+
+{app_stage}
+# Stage 3: Runtime
+FROM {runtime} AS runtime
 
 WORKDIR /app
+ENV PIP_NO_CACHE_DIR=1 PIP_DISABLE_PIP_VERSION_CHECK=1
 
-# Copy wheels from builder and install
-COPY --from=builder /wheels /tmp/wheels
-RUN pip install --no-cache-dir /tmp/wheels/*.whl && \\
-    rm -rf /tmp/wheels
+# Dependencies first so their layer survives source changes
+RUN --mount=type=bind,from=deps,source=/wheels,target=/tmp/deps{self._install_mount()} \\
+    {self._install("/tmp/deps", "pip install --no-index --find-links /tmp/deps -r /tmp/deps/requirements.txt")}
+RUN --mount=type=bind,from=app,source=/wheels,target=/tmp/app{self._install_mount()} \\
+    {self._install("/tmp/app", "pip install --no-index --no-deps /tmp/app/*.whl")}
 
 # Set entrypoint
 CMD {cmd}
-'''
-
-    def _generate_dockerignore(self) -> str:
-        """Generate .dockerignore to exclude build artifacts and venvs."""
-        return '''# Python artifacts
-__pycache__/
-*.py[cod]
-*$py.class
-*.so
-.Python
-*.egg-info/
-dist/
-build/
-
-# Virtual environments
-.venv/
-venv/
-ENV/
-
-# IDE
-.vscode/
-.idea/
-*.swp
-
-# Git
-.git/
-.gitignore
-
-# Testing
-.pytest_cache/
-.coverage
-htmlcov/
-
-# pypackager artifacts
-pypackager.lock
-pypackager-venv-*/
-dist-test/
-'''
+{self._importtime_stages(project_name)}'''
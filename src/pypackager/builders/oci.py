@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import base64
+import copy
+import csv
+import hashlib
+import json
+import logging
+import os
+import platform as host_platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..core import tracing
+from ..core.archive import Compression
+from ..core.builder import Builder, EnvironmentSpec
+from ..core.cache import user_cache_dir
+from ..core.environment import BuildEnv, pip_install_target, platform_tags
+from ..core.hashing import file_sha256
+from ..core.oci import BlobStore, Descriptor, Image, Layer, load_image, write_layer, write_layout
+from ..core.project import ProjectInfo
+from ..core.resolver import DependencyResolver
+from .wheel import find_project_wheels
+
+logger = logging.getLogger(__name__)
+
+# Bump when layer tarballs are written differently, so cached layers are rebuilt
+_LAYER_FORMAT = 2
+# Architectures as spelled by OCI, by `platform.machine()`
+_ARCHITECTURES = {"x86_64": "amd64", "amd64": "amd64", "aarch64": "arm64", "arm64": "arm64"}
+
+
+def _host_platform() -> str:
+    machine = host_platform.machine().lower()
+    return f"linux/{_ARCHITECTURES.get(machine, machine)}"
+
+
+class OciBuilder(Builder):
+    """Write an OCI image layout directly, without a container daemon.
+
+    The locked dependencies and the project wheel are installed with pip
+    (`--target`, from the wheelhouse only) into staging roots, and each root is
+    streamed into a reproducible gzip layer. For a platform other than the
+    host's, binary wheels of that platform are fetched and installed instead.
+    Layers are cached in the user cache by their inputs, so an unchanged
+    dependency set is reused by digest and only the small project layer is
+    rebuilt. The layers are stacked on a base image read from a local OCI
+    layout directory or tarball, or on an empty image when no base is
+    configured. File times and the creation time come from SOURCE_DATE_EPOCH
+    (default 0).
+    """
+
+    name = "oci"
+    version = "3"
+    depends_on = ("wheel",)
+    environment = EnvironmentSpec.shared()
+
+    def __init__(
+        self,
+        base: Optional[str] = None,
+        entrypoint: Optional[str] = None,
+        prefix: str = "/usr/local",
+        python_version: Optional[str] = None,
+        platform: Optional[str] = None,
+        compression: Optional[Compression] = None,
+    ) -> None:
+        super().__init__()
+        self._project: ProjectInfo | None = None
+        self.compression = compression or Compression()
+        self.base = base
+        self.entrypoint = entrypoint
+        self.prefix = "/" + prefix.strip("/")
+        self.python_version = python_version
+        self.platform = platform or _host_platform()
+        self.cache_root = user_cache_dir() / "oci"
+        self._epoch = 0
+
+    def configure(self, project_info: ProjectInfo) -> None:
+        self._project = project_info
+        self._epoch = int(os.environ.get("SOURCE_DATE_EPOCH", "0"))
+
+    def _base_path(self) -> Optional[Path]:
+        if not self.base:
+            return None
+        assert self._project is not None
+        return (self._project.root / self.base).resolve()
+
+    def external_inputs(self) -> List[str]:
+        epoch = [f"epoch:{self._epoch}"]
+        base = self._base_path()
+        if base is None:
+            return epoch
+        if base.is_dir():
+            return [*epoch, file_sha256(base / "index.json")] if (base / "index.json").is_file() else epoch
+        try:
+            st = base.stat()
+        except OSError:
+            return epoch
+        return [*epoch, f"{st.st_size}:{st.st_mtime_ns}"]
+
+    def build(self, output_directory: Path, env: Optional[BuildEnv] = None) -> None:
+        if not self._project:
+            raise RuntimeError("OciBuilder not configured")
+        if env is None:
+            raise RuntimeError("OciBuilder requires a build environment")
+
+        wheels = find_project_wheels(self._project, self.dependency_output("wheel", output_directory))
+        if not wheels:
+            raise RuntimeError(
+                f"OCI target needs a {self._project.name} {self._project.version} wheel; "
+                "enable the wheel target and format"
+            )
+
+        # The layout is rewritten from scratch; blobs are hardlinks into caches
+        for stale in ("blobs", "index.json", "oci-layout"):
+            path = output_directory / stale
+            if path.is_dir():
+                shutil.rmtree(path)
+            elif path.exists():
+                path.unlink()
+        output_directory.mkdir(parents=True, exist_ok=True)
+        store = BlobStore(output_directory / "blobs")
+
+        os_name, _, arch = self.platform.partition("/")
+        base = self._base_path()
+        if base is not None:
+            image = load_image(base, store, (os_name, arch))
+            logger.info("Base image %s: %d layer(s)", base, len(image.layers))
+        else:
+            image = Image(
+                config={"architecture": arch, "os": os_name, "config": {}, "rootfs": {"type": "layers", "diff_ids": []}},
+                layers=[],
+            )
+
+        py_version = self._get_python_version(image.config)
+        site_packages = f"{self.prefix}/lib/python{py_version}/site-packages"
+        pins = DependencyResolver(self._project.root).pinned_requirements() or list(self._project.dependencies)
+        platforms = self._pip_platforms()
+
+        layers: List[Tuple[str, Layer]] = []
+        if pins:
+            def install_dependencies(staging: Path) -> None:
+                if env.wheelhouse is not None and platforms is None:
+                    env.wheelhouse.ensure(pins, os.fspath(env.python))
+                elif env.wheelhouse is not None:
+                    env.wheelhouse.download(pins, py_version, platforms, os.fspath(env.python))
+                self._pip_install(env, staging, site_packages, py_version, pins, platforms)
+
+            layer = self._layer(
+                {"requirements": sorted(pins), "site": site_packages, "python": py_version, "platform": self.platform},
+                install_dependencies,
+            )
+            layers.append((f"pypackager: {len(pins)} locked dependencies", layer))
+        app_layer = self._layer(
+            {
+                "wheels": [file_sha256(w) for w in wheels], "site": site_packages, "python": py_version,
+                "platform": self.platform,
+            },
+            lambda staging: self._pip_install(
+                env, staging, site_packages, py_version, [os.fspath(w) for w in wheels], platforms
+            ),
+        )
+        layers.append((f"pypackager: {self._project.name} {self._project.version}", app_layer))
+
+        cache_store = BlobStore(self.cache_root / "blobs")
+        for _comment, layer in layers:
+            cache_store.copy_to(layer.descriptor.digest, store)
+        image = self._stack(image, layers)
+        manifest = write_layout(output_directory, store, image, self._project.version)
+        logger.info(
+            "Wrote OCI image layout %s (manifest %s, %d layer(s))",
+            output_directory, manifest.digest, len(image.layers),
+        )
+
+    def _get_python_version(self, base_config: Dict[str, Any]) -> str:
+        """Configured version, else the base image's PYTHON_VERSION, else the host's."""
+        if self.python_version:
+            return self.python_version
+        for item in (base_config.get("config") or {}).get("Env") or []:
+            key, _, value = item.partition("=")
+            if key == "PYTHON_VERSION" and value.count(".") >= 1:
+                return ".".join(value.split(".")[:2])
+        return f"{sys.version_info[0]}.{sys.version_info[1]}"
+
+    def _layer(self, inputs: Dict[str, Any], populate: Callable[[Path], None]) -> Layer:
+        """Return the cached layer for `inputs`, or build it with `populate(staging_root)`."""
+        inputs = {
+            **inputs,
+            "format": _LAYER_FORMAT,
+            "mtime": self._epoch,
+            "compression": [self.compression.level, sorted(self.compression.store)],
+        }
+        key = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+        cache_store = BlobStore(self.cache_root / "blobs")
+        record = self.cache_root / "layers" / f"{key}.json"
+        try:
+            data = json.loads(record.read_text(encoding="utf-8"))
+            layer = Layer(Descriptor.from_json(data), data["diffId"])
+            if cache_store.has(layer.descriptor.digest):
+                logger.info("Reusing layer %s", layer.descriptor.digest)
+                return layer
+        except (OSError, ValueError, KeyError):
+            pass
+
+        with tempfile.TemporaryDirectory(prefix="pypackager-oci-") as tmp, tracing.span("oci layer", key=key):
+            staging = Path(tmp)
+            populate(staging)
+            layer = write_layer(staging, cache_store, mtime=self._epoch, compression=self.compression)
+        record.parent.mkdir(parents=True, exist_ok=True)
+        record.write_text(json.dumps({**layer.descriptor.to_json(), "diffId": layer.diff_id}), encoding="utf-8")
+        logger.info("Built layer %s (%.1f KiB)", layer.descriptor.digest, layer.descriptor.size / 1024)
+        return layer
+
+    def _pip_platforms(self) -> Optional[List[str]]:
+        """pip platform tags of the image's platform; None when the host's wheels fit it."""
+        if sys.platform.startswith("linux") and self.platform == _host_platform():
+            return None
+        try:
+            return platform_tags(self.platform)
+        except ValueError as exc:
+            raise RuntimeError(f"OCI target: {exc}") from exc
+
+    def _pip_install(
+        self,
+        env: BuildEnv,
+        staging: Path,
+        site_packages: str,
+        py_version: str,
+        requirements: List[str],
+        platforms: Optional[List[str]] = None,
+    ) -> None:
+        target = staging / site_packages.lstrip("/")
+        pip_install_target(
+            env.python, target, requirements, env.wheelhouse, python_version=py_version, platforms=platforms
+        )
+        self._relocate(staging, target)
+
+    def _relocate(self, staging: Path, target: Path) -> None:
+        """Fix up a `pip install --target` tree for its place in the image.
+
+        Scripts move from site-packages/bin to <prefix>/bin with the image's
+        interpreter in their shebang, `direct_url.json` (a host path) is
+        dropped, and each RECORD is rewritten to match.
+        """
+        bindir = staging / self.prefix.lstrip("/") / "bin"
+        moved: Dict[str, str] = {}
+        scripts = target / "bin"
+        if scripts.is_dir():
+            bindir.mkdir(parents=True, exist_ok=True)
+            for script in sorted(scripts.iterdir()):
+                data = script.read_bytes()
+                if data.startswith(b"#!") and b"python" in data.split(b"\n", 1)[0]:
+                    data = f"#!{self.prefix}/bin/python".encode("utf-8") + data[data.index(b"\n"):]
+                (bindir / script.name).write_bytes(data)
+                (bindir / script.name).chmod(0o755)
+                moved[script.name] = os.path.relpath(bindir / script.name, target).replace(os.sep, "/")
+            shutil.rmtree(scripts)
+        for record in sorted(target.glob("*.dist-info/RECORD")):
+            direct_url = record.parent / "direct_url.json"
+            dropped = {f"{record.parent.name}/direct_url.json"} if direct_url.exists() else set()
+            direct_url.unlink(missing_ok=True)
+            rows = []
+            for row in csv.reader(record.read_text(encoding="utf-8").splitlines()):
+                if not row or row[0] in dropped:
+                    continue
+                # pip records scripts relative to its temporary install scheme
+                head, _, script_name = row[0].rpartition("/")
+                if script_name in moved and (head == "bin" or head.endswith("/bin")):
+                    data = (target / moved[script_name]).read_bytes()
+                    digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=").decode("ascii")
+                    row = [moved[script_name], f"sha256={digest}", str(len(data))]
+                rows.append(row)
+            with open(record, "w", encoding="utf-8", newline="") as fh:
+                csv.writer(fh, lineterminator="\n").writerows(rows)
+
+    def _stack(self, base: Image, layers: List[Tuple[str, Layer]]) -> Image:
+        """The base image with `layers` appended and the runtime command set."""
+        assert self._project is not None
+        config = copy.deepcopy(base.config)
+        created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self._epoch))
+        config["created"] = created
+        rootfs = config.setdefault("rootfs", {"type": "layers", "diff_ids": []})
+        rootfs.setdefault("diff_ids", []).extend(layer.diff_id for _comment, layer in layers)
+        history = config.setdefault("history", [])
+        history.extend({"created": created, "created_by": comment} for comment, _layer in layers)
+        runtime = config.setdefault("config", {})
+        # Default CMD: run the installed package as a module
+        runtime["Cmd"] = json.loads(self.entrypoint) if self.entrypoint else ["python", "-m", self._project.name]
+        return Image(config=config, layers=[*base.layers, *(layer for _comment, layer in layers)])
@@ -2,40 +2,211 @@ from __future__ import annotations
 
 import logging
 import os
-import subprocess
-from pathlib import Path
+import shutil
+import tarfile
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
+from typing import Iterator, List, Optional
 
-from ..core.builder import Builder
-from ..core.environment import isolated_env
+from packaging.utils import InvalidWheelFilename, canonicalize_name, parse_wheel_filename
+from packaging.version import Version
+
+from ..core.archive import Compression
+from ..core.backend import Pep517Backend, get_worker
+from ..core.builder import Builder, EnvironmentSpec
+from ..core.environment import BuildEnv
 from ..core.project import ProjectInfo
+from ..core.reproducible import normalize_archive, recompress_archive, source_date_epoch
+from ..core.sources import IGNORED_FILES
 
 logger = logging.getLogger(__name__)
 
+# Sources that make a wheel specific to the interpreter building it
+_NATIVE_SUFFIXES = frozenset({".c", ".cc", ".cpp", ".cxx", ".f", ".f90", ".go", ".m", ".mm", ".pyx", ".rs"})
+_NATIVE_BUILD_FILES = frozenset({"Cargo.toml", "CMakeLists.txt", "meson.build"})
+
+
+def find_project_wheels(project: ProjectInfo, directory: Path) -> List[Path]:
+    """Wheels in `directory` built for the project's current name and version."""
+    name, version = canonicalize_name(project.name), Version(project.version)
+    wheels = []
+    for wheel in sorted(directory.glob("*.whl")):
+        try:
+            wheel_name, wheel_version, _build, _tags = parse_wheel_filename(wheel.name)
+        except InvalidWheelFilename:
+            continue
+        if wheel_name == name and wheel_version == version:
+            wheels.append(wheel)
+    return wheels
+
+
+def _link_or_copy(source: str, target: str) -> None:
+    # git replaces files by renaming over them, so hardlinks never see its writes
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
 
 class WheelBuilder(Builder):
+    """Build wheels and sdists by calling the project's PEP 517 backend.
+
+    Hooks run in a persistent worker process inside the build environment (see
+    `core.backend`), which is reused across targets and projects. `formats`
+    selects which artifacts are kept; with `from_sdist` the wheel is built from
+    the unpacked sdist, as a release check that the sdist is complete. The
+    backend writes the archives uncompressed, and they are then compressed
+    once in parallel; with `reproducible`, that pass also normalizes them
+    (see `core.reproducible`) so that identical sources give identical bytes.
+    """
+
     name = "wheel"
+    version = "3"
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        formats: Optional[List[str]] = None,
+        from_sdist: bool = False,
+        copy_source: bool = False,
+        reproducible: bool = True,
+        compression: Optional[Compression] = None,
+    ) -> None:
+        super().__init__()
         self._project: ProjectInfo | None = None
+        self.formats = list(formats or ["wheel", "sdist"])
+        self.from_sdist = from_sdist
+        self.copy_source = copy_source
+        self.reproducible = reproducible
+        self.compression = compression
+        self._epoch: Optional[int] = None
 
     def configure(self, project_info: ProjectInfo) -> None:
         self._project = project_info
+        self._epoch = source_date_epoch(project_info.root) if self.reproducible else None
+
+    def external_inputs(self) -> List[str]:
+        # Archive timestamps come from the commit time or SOURCE_DATE_EPOCH
+        return [f"epoch:{self._epoch}"] if self._epoch is not None else []
 
-    def build(self, output_directory: Path) -> None:
+    def interpreter_independent(self) -> bool:
+        # Without native sources the wheel is pure and the same from every interpreter
         if not self._project:
             raise RuntimeError("WheelBuilder not configured")
+        for file in self.project_sources(self._project.root):
+            path = PurePosixPath(file.path)
+            if path.suffix in _NATIVE_SUFFIXES or path.name in _NATIVE_BUILD_FILES:
+                return False
+        return True
+
+    def environment_spec(self) -> EnvironmentSpec:
+        # The project's build backend is installed into a dedicated environment
+        # whose interpreter hosts the PEP 517 worker.
+        if not self._project:
+            raise RuntimeError("WheelBuilder not configured")
+        return EnvironmentSpec.dedicated(*self._project.build_requires)
+
+    def build(self, output_directory: Path, env: Optional[BuildEnv] = None) -> None:
+        if not self._project:
+            raise RuntimeError("WheelBuilder not configured")
+        if env is None:
+            raise RuntimeError("WheelBuilder requires a build environment")
 
         output_directory.mkdir(parents=True, exist_ok=True)
-        project_root = self._project.root
+        with self._source_tree() as source_dir:
+            backend = Pep517Backend(self._project, get_worker(env.python), source_dir, defer_compression=True)
+            artifacts = self._build(env, backend, output_directory)
+        # The backend wrote them uncompressed; compress each once, in parallel
+        for artifact in artifacts:
+            if self._epoch is not None:
+                normalize_archive(artifact, self._epoch, self.compression)
+            else:
+                recompress_archive(artifact, self.compression)
+        logger.info("Wheel builder produced artifacts in %s", output_directory)
 
-        def _env_python(env_path: Path) -> Path:
-            return env_path / ("Scripts" if os.name == "nt" else "bin") / ("python.exe" if os.name == "nt" else "python")
+    @contextmanager
+    def _source_tree(self) -> Iterator[Path]:
+        """The project root, or a private copy of it with `copy_source`.
 
-        with isolated_env() as env_path:
-            py_exe = _env_python(env_path)
-            # Install build tooling into the isolated environment
-            subprocess.check_call([str(py_exe), "-m", "pip", "install", "build>=1.1.1"], cwd=project_root)  # noqa: S603,S607
-            # Produce both wheel and sdist to support downstream packaging steps
-            subprocess.check_call([str(py_exe), "-m", "build", "--wheel", "--sdist", "--outdir", str(output_directory)], cwd=project_root)  # noqa: S603,S607
+        Backends such as setuptools write into the source tree (build/,
+        *.egg-info, sdist staging), so concurrent builds of one project, as in
+        a build matrix, each need their own copy. The copy keeps the git
+        metadata (hardlinked) for backends that version from VCS, such as
+        setuptools-scm.
+        """
+        assert self._project is not None
+        if not self.copy_source:
+            yield self._project.root
+            return
+        with tempfile.TemporaryDirectory(prefix="pypackager-src-") as tmp:
+            for file in self.project_sources(self._project.root):
+                target = Path(tmp, file.path)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(self._project.root / file.path, target)
+            for name in IGNORED_FILES:
+                # Left out of the listing, but an in-place build would see them
+                if (self._project.root / name).is_file():
+                    shutil.copy2(self._project.root / name, Path(tmp, name))
+            git = self._project.root / ".git"
+            if git.is_dir():
+                shutil.copytree(git, Path(tmp, ".git"), symlinks=True, copy_function=_link_or_copy)
+            elif git.is_file():
+                # A worktree's pointer to its repository
+                shutil.copy2(git, Path(tmp, ".git"))
+            yield Path(tmp)
 
-        logger.info("Wheel builder produced artifacts in %s", output_directory)
+    def _build(self, env: BuildEnv, backend: Pep517Backend, output_directory: Path) -> List[Path]:
+        """Build the selected formats; returns the artifacts kept in `output_directory`."""
+        artifacts: List[Path] = []
+        want_wheel = "wheel" in self.formats
+        want_sdist = "sdist" in self.formats
+        if want_sdist or (want_wheel and self.from_sdist):
+            self._install_missing(env, backend, "sdist")
+            sdist_dir = output_directory if want_sdist else Path(tempfile.mkdtemp(prefix="pypackager-sdist-"))
+            try:
+                sdist = sdist_dir / backend.build_sdist(sdist_dir)
+                logger.info("Built sdist %s", sdist.name)
+                if want_sdist:
+                    artifacts.append(sdist)
+                if want_wheel and self.from_sdist:
+                    artifacts.append(self._build_wheel_from_sdist(env, sdist, output_directory))
+            finally:
+                if not want_sdist:
+                    shutil.rmtree(sdist_dir, ignore_errors=True)
+        if want_wheel and not self.from_sdist:
+            artifacts.append(self._build_wheel(env, backend, output_directory))
+        return artifacts
+
+    def _build_wheel(self, env: BuildEnv, backend: Pep517Backend, output_directory: Path) -> Path:
+        self._install_missing(env, backend, "wheel")
+        wheel = backend.build_wheel(output_directory)
+        logger.info("Built wheel %s", wheel)
+        return output_directory / wheel
+
+    def _build_wheel_from_sdist(self, env: BuildEnv, sdist: Path, output_directory: Path) -> Path:
+        assert self._project is not None
+        with tempfile.TemporaryDirectory(prefix="pypackager-unpack-") as tmp:
+            with tarfile.open(sdist) as tar:
+                if hasattr(tarfile, "data_filter"):
+                    tar.extractall(tmp, filter="data")
+                else:  # pragma: no cover - Python < 3.12 without the backport
+                    tar.extractall(tmp)  # noqa: S202
+            roots = [p for p in Path(tmp).iterdir() if p.is_dir()]
+            if len(roots) != 1:
+                raise RuntimeError(f"Unexpected sdist layout in {sdist.name}")
+            backend = Pep517Backend(
+                self._project, get_worker(env.python), source_dir=roots[0], defer_compression=True
+            )
+            return self._build_wheel(env, backend, output_directory)
+
+    @staticmethod
+    def _install_missing(env: BuildEnv, backend: Pep517Backend, distribution: str) -> None:
+        """Install dynamic build requirements the environment lacks.
+
+        This dirties the pooled environment, which the pool resets on its next
+        checkout; static requirements belong in `[build-system] requires`.
+        """
+        missing = backend.missing_requirements(backend.get_requires_for_build(distribution))
+        if missing:
+            logger.info("Installing dynamic build requirements: %s", ", ".join(missing))
+            env.install(missing)
@@ -1,38 +1,160 @@
 from __future__ import annotations
 
 import argparse
-import logging
-from pathlib import Path
-from typing import List
+import sys
+from typing import TYPE_CHECKING, List
 
 from . import __version__
-from .config import load_config
-from .core.pipeline import Pipeline
-from .logging import setup_logging
 
+if TYPE_CHECKING:  # pragma: no cover
+    import logging
+    from pathlib import Path
 
-def _parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    from .core.wheelhouse import Wheelhouse
+
+# The pipeline stack (packaging, tomllib, subprocess, ...) is imported by the
+# commands that use it, so `--help` and `--version` return immediately.
+
+COMMANDS = ("build", "watch", "wheelhouse", "serve", "cache")
+DEFAULT_COMMAND = "build"
+
+
+def _add_common_args(parser: argparse.ArgumentParser) -> List[argparse.Action]:
+    """Add the options shared by the project commands; returns their actions."""
+    actions = [
+        parser.add_argument("--config", dest="config", default=None, help="Path to pypackager.toml config file"),
+        parser.add_argument("--offline", dest="offline", action="store_true",
+                            help="Install only from the local wheelhouse; fail fast when a wheel is missing"),
+    ]
+
+    vgroup = parser.add_mutually_exclusive_group()
+    actions.append(vgroup.add_argument("-v", dest="verbose", action="count", default=0,
+                                       help="Increase verbosity (-v, -vv)"))
+    actions.append(vgroup.add_argument("-q", dest="quiet", action="store_true", help="Quiet mode"))
+
+    actions.append(parser.add_argument("--log-json", dest="log_json", action="store_true",
+                                       help="Emit logs as JSON, with timings of every stage and subprocess"))
+    actions.append(parser.add_argument(
+        "--profile", dest="profile", default=None, metavar="FILE",
+        help="Write a Chrome trace (chrome://tracing, Perfetto) of the stages and subprocesses",
+    ))
+    return actions
+
+
+def _add_build_args(parser: argparse.ArgumentParser) -> List[argparse.Action]:
+    """Add the options of `build` and `watch`; returns their actions."""
+    actions = [
+        parser.add_argument("project", nargs="?", default=".", help="Path to project root (default: .)"),
+        parser.add_argument("--only", dest="only", action="append", choices=["wheel", "docker", "oci", "binary"],
+                            help="Build only specified target(s); can be used multiple times"),
+        parser.add_argument("--output", dest="output", default=None,
+                            help="Output directory (default: <project>/dist)"),
+        parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=None,
+                            help="Maximum number of targets built concurrently (default: CPU count)"),
+        parser.add_argument("--force", dest="force", action="store_true",
+                            help="Rebuild every target even if its inputs are unchanged"),
+    ]
+    return actions + _add_common_args(parser)
+
+
+def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(prog="pypackager", description="Unified build pipeline for Python projects")
-    parser.add_argument("command", nargs="?", default="build", choices=["build"], help="Command to run")
-    parser.add_argument("project", nargs="?", default=".", help="Path to project root (default: .)")
     parser.add_argument("--version", action="version", version=f"pypackager {__version__}")
+    sub = parser.add_subparsers(dest="command", metavar="command")
 
-    parser.add_argument("--only", dest="only", action="append", choices=["wheel", "docker", "binary"],
-                        help="Build only specified target(s); can be used multiple times")
-    parser.add_argument("--output", dest="output", default=None, help="Output directory (default: <project>/dist)")
-    parser.add_argument("--config", dest="config", default=None, help="Path to pypackager.toml config file")
+    build = sub.add_parser("build", help="Build artifacts once (default)")
+    _add_build_args(build)
+    build.add_argument("--no-daemon", dest="no_daemon", action="store_true",
+                       help="Build in this process even if `pypackager serve` is running")
+    build.add_argument("--workspace", dest="workspace", default=None, metavar="ROOT",
+                       help="Build every project under ROOT, in local dependency order")
+    build.add_argument("--exclude", dest="exclude", action="append", default=[], metavar="GLOB",
+                       help="With --workspace: skip directories matching GLOB (relative to ROOT); repeatable")
 
-    vgroup = parser.add_mutually_exclusive_group()
-    vgroup.add_argument("-v", dest="verbose", action="count", default=0, help="Increase verbosity (-v, -vv)")
-    vgroup.add_argument("-q", dest="quiet", action="store_true", help="Quiet mode")
+    watch = sub.add_parser("watch", help="Watch the project and rebuild on change")
+    _add_build_args(watch)
+    wgroup = watch.add_argument_group("watch options")
+    wgroup.add_argument("--poll", dest="poll", action="store_true",
+                        help="Detect changes by stat polling instead of inotify")
+    wgroup.add_argument("--interval", dest="interval", type=float, default=0.5,
+                        help="Polling interval in seconds (default: 0.5)")
+    wgroup.add_argument("--debounce", dest="debounce", type=float, default=0.3,
+                        help="Quiet period in seconds before rebuilding (default: 0.3)")
+
+    wheelhouse = sub.add_parser("wheelhouse", help="Manage the shared local wheelhouse")
+    wheelhouse.add_argument("action", choices=["sync"], help="sync: fetch wheels for the project's dependencies")
+    wheelhouse.add_argument("project", nargs="?", default=".", help="Path to project root (default: .)")
+    wheelhouse.add_argument("--refresh", dest="refresh", action="store_true",
+                            help="Re-fetch even if this requirement set was synced before")
+    _add_common_args(wheelhouse)
+
+    serve = sub.add_parser("serve", help="Run a build daemon that `pypackager build` forwards to")
+    serve.add_argument("--socket", dest="socket", default=None,
+                       help="Unix socket to listen on (default: per interpreter, in the user cache dir)")
+    serve.add_argument("--idle-timeout", dest="idle_timeout", type=float, default=30 * 60.0,
+                       help="Exit after this many seconds without requests; 0 never (default: 1800)")
+    serve.add_argument("--max-memory", dest="max_memory", type=int, default=1024,
+                       help="Drop cached projects, then exit, above this resident size in MiB (default: 1024)")
+    serve.add_argument("--stop", dest="stop", action="store_true",
+                       help="Ask the running daemon to exit once its builds finish")
+    sgroup = serve.add_mutually_exclusive_group()
+    sgroup.add_argument("-v", dest="verbose", action="count", default=0, help="Increase verbosity (-v, -vv)")
+    sgroup.add_argument("-q", dest="quiet", action="store_true", help="Quiet mode")
+    serve.add_argument("--log-json", dest="log_json", action="store_true", help="Emit logs as JSON")
+    serve.set_defaults(profile=None)
+
+    cache = sub.add_parser("cache", help="Run a remote artifact cache server for other machines' builds")
+    cache.add_argument("action", choices=["serve"], help="serve: store and serve cache entries over HTTP")
+    cache.add_argument("--root", dest="root", required=True, help="Directory holding the cache entries")
+    cache.add_argument("--bind", dest="bind", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    cache.add_argument("--port", dest="port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    cgroup = cache.add_mutually_exclusive_group()
+    cgroup.add_argument("-v", dest="verbose", action="count", default=0, help="Increase verbosity (-v, -vv)")
+    cgroup.add_argument("-q", dest="quiet", action="store_true", help="Quiet mode")
+    cache.add_argument("--log-json", dest="log_json", action="store_true", help="Emit logs as JSON")
+    cache.set_defaults(profile=None)
+    return parser
 
-    parser.add_argument("--log-json", dest="log_json", action="store_true", help="Emit logs as JSON")
 
-    return parser.parse_args(argv)
+def _with_command(parser: argparse.ArgumentParser, argv: List[str]) -> List[str]:
+    """Insert the default command when none is given, keeping `pypackager [project]` working.
+
+    Options given before the command are moved after it.
+    """
+    if any(a in ("-h", "--help", "--version") for a in argv[:1]):
+        return argv
+    actions = _add_build_args(argparse.ArgumentParser(add_help=False))
+    takes_value = {s for a in actions if a.nargs != 0 for s in a.option_strings}
+    skip = False
+    for i, token in enumerate(argv):
+        if skip:
+            skip = False
+            continue
+        if token.startswith("-"):
+            skip = token in takes_value
+            continue
+        if token in COMMANDS:
+            return [token, *argv[:i], *argv[i + 1:]]
+        break
+    return [DEFAULT_COMMAND, *argv]
+
+
+def _parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = _build_parser()
+    args = list(sys.argv[1:] if argv is None else argv)
+    return parser.parse_args(_with_command(parser, args))
 
 
 def main(argv: List[str] | None = None) -> int:
     args = _parse_args(argv)
+    if getattr(args, "jobs", None) is not None and args.jobs < 1:
+        raise SystemExit("pypackager: error: --jobs must be at least 1")
+
+    import logging
+    from pathlib import Path
+
+    from .core import tracing
+    from .logging import setup_logging
 
     # Logging setup
     level = logging.INFO
@@ -44,16 +166,235 @@ def main(argv: List[str] | None = None) -> int:
         level = logging.INFO
 
     setup_logging(level=level, json_output=args.log_json)
+    log = logging.getLogger("pypackager")
+
+    if not (args.profile or args.log_json):
+        return _run_command(args, log)
+    tracer = tracing.enable(events=bool(args.profile), log=args.log_json)
+    try:
+        return _run_command(args, log)
+    finally:
+        tracing.disable()
+        if args.profile:
+            tracer.write(Path(args.profile).resolve())
+
+
+def _run_command(args: argparse.Namespace, log: logging.Logger) -> int:
+    from pathlib import Path
+
+    if args.command == "serve":
+        return _serve(args, log)
+    if args.command == "cache":
+        return _cache_serve(args, log)
+    if args.command == "build" and args.workspace:
+        return _build_workspace(args, log)
+    if args.command == "build":
+        status = _forward_build(args, log)
+        if status is not None:
+            return status
+
+    from .config import load_config
+    from .core.pipeline import Pipeline
+    from .core.scheduler import BuildFailed
+    from .core.wheelhouse import Wheelhouse, WheelhouseMissing
 
     project_root = Path(args.project).resolve()
+    config_path = Path(args.config) if args.config else None
+    cfg = load_config(project_root, config_path)
+    wheelhouse = Wheelhouse(offline=args.offline)
+
+    if args.command == "wheelhouse":
+        return _wheelhouse_sync(args, project_root, wheelhouse)
+
     output_dir = Path(args.output).resolve() if args.output else (project_root / "dist")
 
-    cfg = load_config(project_root, Path(args.config) if args.config else None)
+    if args.command == "watch":
+        return _watch(args, project_root, output_dir, config_path, wheelhouse)
+
     targets = args.only or cfg.targets
+    pipeline = Pipeline(project_root, config=cfg, wheelhouse=wheelhouse)
+    try:
+        pipeline.run(targets=targets, output_dir=output_dir, jobs=args.jobs, force=args.force)
+    except (BuildFailed, WheelhouseMissing) as exc:
+        log.error("%s", exc)
+        return 1
+
+    return 0
+
+
+def _build_workspace(args: argparse.Namespace, log: logging.Logger) -> int:
+    from pathlib import Path
+
+    from .config import load_config
+    from .core.scheduler import STATUS_OK
+    from .core.wheelhouse import Wheelhouse
+    from .core.workspace import Workspace
+
+    root = Path(args.workspace).resolve()
+    config_path = Path(args.config).resolve() if args.config else None
+    workspace = Workspace(
+        root,
+        exclude=[*load_config(root, config_path).workspace.exclude, *args.exclude],
+        config_path=config_path,
+        wheelhouse=Wheelhouse(offline=args.offline),
+    )
+    results = workspace.build(
+        targets=args.only,
+        output_dir=Path(args.output).resolve() if args.output else None,
+        jobs=args.jobs,
+        force=args.force,
+    )
+    failed = sorted(r.name for r in results.values() if r.status != STATUS_OK)
+    if failed:
+        log.error("Workspace build failed or skipped for: %s", ", ".join(failed))
+        return 1
+    return 0
+
+
+def _forward_build(args: argparse.Namespace, log: logging.Logger) -> int | None:
+    """Run the build in `pypackager serve` when one is listening; None to build in-process."""
+    import os
+    from pathlib import Path
+
+    from .core import daemon
+
+    # Profiling traces this process, so it builds here
+    if args.no_daemon or args.profile or os.environ.get("PYPACKAGER_NO_DAEMON"):
+        return None
+    message = {
+        "command": "build",
+        "project": os.fspath(Path(args.project).resolve()),
+        "config": os.fspath(Path(args.config).resolve()) if args.config else None,
+        "output": os.fspath(Path(args.output).resolve()) if args.output else None,
+        "targets": args.only,
+        "jobs": args.jobs,
+        "force": args.force,
+        "offline": args.offline,
+        "level": log.getEffectiveLevel(),
+    }
+    try:
+        return daemon.request(message)
+    except daemon.DaemonUnavailable as exc:
+        log.debug("Building in-process: %s", exc)
+        return None
+
+
+def _serve(args: argparse.Namespace, log: logging.Logger) -> int:
+    from pathlib import Path
+
+    from .core import daemon
+
+    socket_path = Path(args.socket).resolve() if args.socket else daemon.default_socket_path()
+    if args.stop:
+        if daemon.stop(socket_path):
+            log.info("Asked the build daemon at %s to stop", socket_path)
+            return 0
+        log.error("No build daemon is listening on %s", socket_path)
+        return 1
+    server = daemon.BuildDaemon(socket_path, idle_timeout=args.idle_timeout, max_memory=args.max_memory << 20)
+    try:
+        server.serve()
+    except RuntimeError as exc:
+        log.error("%s", exc)
+        return 1
+    return 0
+
+
+def _cache_serve(args: argparse.Namespace, log: logging.Logger) -> int:
+    import os
+    from pathlib import Path
+
+    from .core.cache_server import CacheServer
+
+    try:
+        server = CacheServer(
+            Path(args.root).resolve(), args.bind, args.port, token=os.environ.get("PYPACKAGER_REMOTE_CACHE_TOKEN")
+        )
+    except OSError as exc:
+        log.error("Cannot listen on %s:%d: %s", args.bind, args.port, exc)
+        return 1
+    log.info("Serving the remote cache in %s at %s", server.root, server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def _wheelhouse_sync(args: argparse.Namespace, project_root: Path, wheelhouse: Wheelhouse) -> int:
+    import logging
+
+    from .core.scanner import ProjectScanner
+    from .core.wheelhouse import WheelhouseMissing
+
+    project = ProjectScanner(project_root).scan()
+    requirements = [*project.dependencies, *project.build_requires]
+    try:
+        if args.offline:
+            wheelhouse.ensure(requirements)
+            added = []
+        else:
+            added = wheelhouse.sync(requirements, refresh=args.refresh)
+    except WheelhouseMissing as exc:
+        logging.getLogger("pypackager").error("%s", exc)
+        return 1
+    logging.getLogger("pypackager").info(
+        "Wheelhouse %s is ready (%d wheel(s) added)", wheelhouse.wheels_dir, len(added)
+    )
+    return 0
+
+
+def _watch(
+    args: argparse.Namespace,
+    project_root: Path,
+    output_dir: Path,
+    config_path: Path | None,
+    wheelhouse: Wheelhouse,
+) -> int:
+    import logging
+    from pathlib import Path
+
+    from .config import DEFAULT_CONFIG_FILENAMES, load_config
+    from .core.envpool import EnvironmentPool, EnvironmentProvider
+    from .core.pipeline import Pipeline
+    from .core.watch import watch
+
+    log = logging.getLogger("pypackager")
+    config_names = set(DEFAULT_CONFIG_FILENAMES)
+    if config_path is not None:
+        config_names.add(config_path.name)
+
+    with EnvironmentProvider(EnvironmentPool(wheelhouse=wheelhouse)) as provider:
+        pipeline = Pipeline(project_root, config=load_config(project_root, config_path), provider=provider)
 
-    pipeline = Pipeline(project_root, config=cfg)
-    pipeline.run(targets=targets, output_dir=output_dir)
+        def rebuild(changed: set) -> None:
+            nonlocal pipeline
+            if config_names & {Path(p).name for p in changed}:
+                # The remote cache and matrix cells come from the config too
+                config = load_config(project_root, config_path)
+                if pipeline.remote is not None:
+                    pipeline.remote.close()
+                pipeline = Pipeline(project_root, config=config, provider=provider)
+            targets = args.only or pipeline.config.targets
+            pipeline.run(targets=targets, output_dir=output_dir, jobs=args.jobs, force=args.force)
 
+        try:
+            rebuild(set())
+        except Exception as exc:  # keep watching so the next edit can fix it
+            log.error("%s", exc)
+        try:
+            watch(
+                rebuild,
+                project_root,
+                exclude=[output_dir],
+                interval=args.interval,
+                debounce=args.debounce,
+                polling=args.poll,
+            )
+        except KeyboardInterrupt:
+            log.info("Stopped watching")
     return 0
 
 
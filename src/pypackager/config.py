@@ -3,12 +3,10 @@ from __future__ import annotations
 import logging
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 
-try:
-    import tomllib  # Python 3.11+
-except ModuleNotFoundError:  # pragma: no cover - fallback
-    import tomli as tomllib  # type: ignore
+from .core.bytecode import INVALIDATION_MODES
+from .core.metadata import load_toml
 
 logger = logging.getLogger(__name__)
 
@@ -17,12 +15,121 @@ logger = logging.getLogger(__name__)
 class DockerConfig:
     base_image: str = "python:3.12-slim"
     entrypoint: Optional[str] = None
+    # "source" builds the project wheel in the image; "wheel" reuses dist/wheel
+    mode: str = "source"
+    # Image for the final stage; defaults to base_image
+    runtime_image: Optional[str] = None
+    # Build context: a hardlinked "directory" or a deterministic "tar"
+    context: str = "directory"
+    # Extra globs (relative to the project root) to send with the sources
+    include: List[str] = field(default_factory=list)
+    # Installs in the image: "pypackager" (parallel, pip as fallback) or "pip"
+    installer: str = "pypackager"
+
+
+@dataclass
+class OciConfig:
+    # Base image: a local OCI layout directory or tarball, relative to the project
+    base: Optional[str] = None
+    entrypoint: Optional[str] = None
+    # Installation prefix inside the image; site-packages is derived from it
+    prefix: str = "/usr/local"
+    # Python version of the image (default: base image PYTHON_VERSION, else host)
+    python_version: Optional[str] = None
+    # os/architecture to select from multi-platform bases (default: linux/<host>)
+    platform: Optional[str] = None
+
+
+@dataclass
+class BinaryConfig:
+    # "module:function" or "module" to run; default: the project's console script
+    entry_point: Optional[str] = None
+    # Interpreter for the #! line (default: /usr/bin/env pythonX.Y of the build)
+    interpreter: Optional[str] = None
+    # zlib-compress the archive payload
+    compress: bool = True
+    # Launch the built binary to report its cold start and import profile
+    report_startup: bool = False
+
+
+WHEEL_FORMATS = ("wheel", "sdist")
+
+
+@dataclass
+class WheelConfig:
+    # Artifacts to keep: any of "wheel", "sdist"
+    formats: List[str] = field(default_factory=lambda: ["wheel", "sdist"])
+    # Build the wheel from the unpacked sdist instead of the source tree
+    from_sdist: bool = False
+    # Rewrite archives with sorted members and clamped timestamps (see SOURCE_DATE_EPOCH)
+    reproducible: bool = True
+
+
+@dataclass
+class LockConfig:
+    # Interpreters to resolve for; empty means the running interpreter
+    interpreters: List[str] = field(default_factory=list)
+
+
+@dataclass
+class MatrixConfig:
+    # Interpreters to build for: "3.12" (python3.12 on PATH), a command or a path.
+    # Those not found on this machine are skipped.
+    interpreters: List[str] = field(default_factory=list)
+    # Base image per major.minor or python tag for the docker target
+    images: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class WorkspaceConfig:
+    # Globs (relative to the workspace root) of directories not searched for projects
+    exclude: List[str] = field(default_factory=list)
+
+
+@dataclass
+class CompressionConfig:
+    # zlib level for wheels, sdists, zipapps and layers; 0 stores without compressing
+    level: int = 6
+    # Compression threads per archive; 0 means one per CPU
+    threads: int = 0
+    # Globs of zip member names to store uncompressed, besides already-compressed formats
+    store: List[str] = field(default_factory=list)
+
+
+@dataclass
+class BytecodeConfig:
+    # .pyc invalidation for the docker and binary targets: "unchecked-hash",
+    # "checked-hash" or "none" (the installer's default compiling)
+    invalidation: str = "unchecked-hash"
+    # Import the entry point once under -X importtime and report the slowest imports
+    profile: bool = True
+    # Imports listed in the report
+    top: int = 15
+
+
+@dataclass
+class CacheConfig:
+    # Shared artifact cache: http(s)://host:port, file:///path or a directory
+    # (PYPACKAGER_REMOTE_CACHE overrides it)
+    remote: Optional[str] = None
+    # Fetch targets built elsewhere / upload the targets built here
+    pull: bool = True
+    push: bool = True
 
 
 @dataclass
 class Config:
     targets: List[str] = field(default_factory=lambda: ["wheel", "docker", "binary"])
     docker: DockerConfig = field(default_factory=DockerConfig)
+    wheel: WheelConfig = field(default_factory=WheelConfig)
+    lock: LockConfig = field(default_factory=LockConfig)
+    oci: OciConfig = field(default_factory=OciConfig)
+    matrix: MatrixConfig = field(default_factory=MatrixConfig)
+    binary: BinaryConfig = field(default_factory=BinaryConfig)
+    workspace: WorkspaceConfig = field(default_factory=WorkspaceConfig)
+    cache: CacheConfig = field(default_factory=CacheConfig)
+    compression: CompressionConfig = field(default_factory=CompressionConfig)
+    bytecode: BytecodeConfig = field(default_factory=BytecodeConfig)
 
 
 DEFAULT_CONFIG_FILENAMES = ["pypackager.toml", ".pypackager.toml"]
@@ -44,7 +151,7 @@ def load_config(project_root: Path, config_path: Optional[Path] = None) -> Confi
         logger.debug("No config file found; using defaults")
         return Config()
 
-    data = tomllib.loads(config_path.read_text(encoding="utf-8"))
+    data = load_toml(config_path)
     cfg = data.get("pypackager", {})
     targets = cfg.get("targets") or ["wheel", "docker", "binary"]
     
@@ -52,6 +159,99 @@ def load_config(project_root: Path, config_path: Optional[Path] = None) -> Confi
     docker_config = DockerConfig(
         base_image=docker_cfg.get("base_image", "python:3.12-slim"),
         entrypoint=docker_cfg.get("entrypoint"),
+        mode=docker_cfg.get("mode", "source"),
+        runtime_image=docker_cfg.get("runtime_image"),
+        context=docker_cfg.get("context", "directory"),
+        include=list(docker_cfg.get("include") or []),
+        installer=docker_cfg.get("installer", "pypackager"),
     )
+    if docker_config.mode not in ("source", "wheel"):
+        raise ValueError(f"Unknown docker mode in {config_path}: {docker_config.mode}")
+    if docker_config.context not in ("directory", "tar"):
+        raise ValueError(f"Unknown docker context in {config_path}: {docker_config.context}")
+    if docker_config.installer not in ("pypackager", "pip"):
+        raise ValueError(f"Unknown docker installer in {config_path}: {docker_config.installer}")
     
-    return Config(targets=list(targets), docker=docker_config)
+    wheel_cfg = cfg.get("wheel", {})
+    formats = list(wheel_cfg.get("formats") or WHEEL_FORMATS)
+    unknown = sorted(set(formats) - set(WHEEL_FORMATS))
+    if unknown:
+        raise ValueError(f"Unknown wheel format(s) in {config_path}: {', '.join(unknown)}")
+    wheel_config = WheelConfig(
+        formats=formats,
+        from_sdist=bool(wheel_cfg.get("from_sdist", False)),
+        reproducible=bool(wheel_cfg.get("reproducible", True)),
+    )
+
+    lock_cfg = cfg.get("lock", {})
+    lock_config = LockConfig(interpreters=list(lock_cfg.get("interpreters") or []))
+
+    oci_cfg = cfg.get("oci", {})
+    oci_config = OciConfig(
+        base=oci_cfg.get("base"),
+        entrypoint=oci_cfg.get("entrypoint"),
+        prefix=oci_cfg.get("prefix", "/usr/local"),
+        python_version=oci_cfg.get("python_version"),
+        platform=oci_cfg.get("platform"),
+    )
+
+    matrix_cfg = cfg.get("matrix", {})
+    matrix_config = MatrixConfig(
+        interpreters=[str(i) for i in matrix_cfg.get("interpreters") or []],
+        images={str(k): str(v) for k, v in (matrix_cfg.get("images") or {}).items()},
+    )
+
+    binary_cfg = cfg.get("binary", {})
+    binary_config = BinaryConfig(
+        entry_point=binary_cfg.get("entry_point"),
+        interpreter=binary_cfg.get("interpreter"),
+        compress=bool(binary_cfg.get("compress", True)),
+        report_startup=bool(binary_cfg.get("report_startup", False)),
+    )
+
+    workspace_cfg = cfg.get("workspace", {})
+    workspace_config = WorkspaceConfig(exclude=[str(p) for p in workspace_cfg.get("exclude") or []])
+
+    compression_cfg = cfg.get("compression", {})
+    compression_config = CompressionConfig(
+        level=int(compression_cfg.get("level", 6)),
+        threads=int(compression_cfg.get("threads", 0)),
+        store=[str(p) for p in compression_cfg.get("store") or []],
+    )
+    if not 0 <= compression_config.level <= 9:
+        raise ValueError(f"Compression level in {config_path} must be between 0 and 9")
+
+    bytecode_cfg = cfg.get("bytecode", {})
+    bytecode_config = BytecodeConfig(
+        invalidation=bytecode_cfg.get("invalidation", "unchecked-hash"),
+        profile=bool(bytecode_cfg.get("profile", True)),
+        top=int(bytecode_cfg.get("top", 15)),
+    )
+    if bytecode_config.invalidation not in INVALIDATION_MODES:
+        raise ValueError(
+            f"Unknown bytecode invalidation in {config_path}: {bytecode_config.invalidation}; "
+            f"expected one of {', '.join(INVALIDATION_MODES)}"
+        )
+    if bytecode_config.top < 1:
+        raise ValueError(f"Bytecode report size in {config_path} must be at least 1")
+
+    cache_cfg = cfg.get("cache", {})
+    cache_config = CacheConfig(
+        remote=cache_cfg.get("remote"),
+        pull=bool(cache_cfg.get("pull", True)),
+        push=bool(cache_cfg.get("push", True)),
+    )
+
+    return Config(
+        targets=list(targets),
+        docker=docker_config,
+        wheel=wheel_config,
+        lock=lock_config,
+        oci=oci_config,
+        matrix=matrix_config,
+        binary=binary_config,
+        workspace=workspace_config,
+        cache=cache_config,
+        compression=compression_config,
+        bytecode=bytecode_config,
+    )
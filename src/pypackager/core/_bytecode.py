@@ -0,0 +1,265 @@
+"""Byte-compile installed modules and profile the imports of an entry point.
+
+Executed as a script by the target interpreter (in a Docker build, or on the
+host for the binary target), so it must only use the standard library.
+
+    python _bytecode.py compile [--invalidation-mode M] [--base DIR] [--jobs N] [--json]
+                                [--installed-from WHEELS] [PATH ...]
+    python _bytecode.py profile [--top N] (--entry MODULE[:ATTR] | --distribution NAME | -- COMMAND ...)
+
+`compile` writes hash-based .pyc files (reproducible: no timestamps) for
+every .py file under the PATHs, by default the interpreter's site-packages,
+on a process pool. `--installed-from` compiles instead the .py files listed
+by the installed RECORDs of the wheels in WHEELS, i.e. what installing them
+wrote. Files whose existing .pyc already has the requested invalidation mode
+and the source's hash are left alone, so compiling again after installing
+more packages rewrites nothing else (and adds nothing to a Docker layer).
+`--base` records source paths relative to DIR in the code objects. With
+`--json`, the .pyc files (relative to `--base`) are printed as a JSON list.
+
+`profile` runs the entry point once with `-X importtime` up to the point
+where `main` would be called, and prints a JSON report: the wall time to
+reach it, the import total and the slowest imports by cumulative and by
+self time.
+"""
+
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import py_compile
+import re
+import subprocess
+import sys
+import sysconfig
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+MODES = {
+    "checked-hash": py_compile.PycInvalidationMode.CHECKED_HASH,
+    "unchecked-hash": py_compile.PycInvalidationMode.UNCHECKED_HASH,
+}
+# Flags word of a hash-based pyc header (PEP 552): bit 0 hash-based, bit 1 check_source
+_FLAGS = {"checked-hash": 0b11, "unchecked-hash": 0b01}
+_PARALLEL_MIN = 64
+_CHUNK = 32
+_IMPORTTIME = "import time:"
+
+
+def _sources(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            if path.endswith(".py"):
+                yield path
+            continue
+        for directory, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+            for name in sorted(filenames):
+                if name.endswith(".py"):
+                    yield os.path.join(directory, name)
+
+
+def _up_to_date(source, pyc, mode):
+    """Whether `pyc` already holds `source` compiled with `mode` by this interpreter."""
+    try:
+        with open(pyc, "rb") as fh:
+            header = fh.read(16)
+        with open(source, "rb") as fh:
+            data = fh.read()
+    except OSError:
+        return False
+    return (
+        header[:4] == importlib.util.MAGIC_NUMBER
+        and int.from_bytes(header[4:8], "little") == _FLAGS[mode]
+        and header[8:16] == importlib.util.source_hash(data)
+    )
+
+
+def _compile(task):
+    source, mode, base = task
+    pyc = importlib.util.cache_from_source(source)
+    if _up_to_date(source, pyc, mode):
+        return source, pyc, "current", None
+    dfile = os.path.relpath(source, base) if base else None
+    try:
+        py_compile.compile(source, cfile=pyc, dfile=dfile, doraise=True, invalidation_mode=MODES[mode])
+    except (py_compile.PyCompileError, OSError, ValueError) as exc:
+        return source, pyc, "failed", str(exc).strip().splitlines()[-1] if str(exc).strip() else repr(exc)
+    return source, pyc, "compiled", None
+
+
+def compile_tree(paths, mode="unchecked-hash", base=None, jobs=0):
+    """Byte-compile every .py file under `paths`; returns [(source, pyc, status, error)]."""
+    tasks = [(source, mode, base) for source in _sources(paths)]
+    jobs = jobs or os.cpu_count() or 1
+    if jobs > 1 and len(tasks) > _PARALLEL_MIN:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(_compile, tasks, chunksize=_CHUNK))
+    return [_compile(task) for task in tasks]
+
+
+def _default_paths():
+    paths = sysconfig.get_paths()
+    return sorted({paths["purelib"], paths["platlib"]})
+
+
+def _normalize(name):
+    return re.sub(r"[-_.]+", "_", name).lower()
+
+
+def _installed_sources(wheel_dir):
+    """The .py files under site-packages that the installed RECORDs of the wheels in `wheel_dir` list."""
+    wanted = set()
+    for wheel in os.listdir(wheel_dir):
+        if wheel.endswith(".whl"):
+            name, version = wheel.split("-")[:2]
+            wanted.add((_normalize(name), version))
+    sources = []
+    for site in _default_paths():
+        try:
+            entries = sorted(os.listdir(site))
+        except OSError:
+            continue
+        for entry in entries:
+            name, _, version = entry[:-len(".dist-info")].rpartition("-")
+            if not entry.endswith(".dist-info") or (_normalize(name), version) not in wanted:
+                continue
+            try:
+                with open(os.path.join(site, entry, "RECORD"), newline="", encoding="utf-8") as fh:
+                    rows = list(csv.reader(fh))
+            except OSError:
+                continue
+            # Scripts and data outside site-packages ("../../bin/...") are not imported
+            sources.extend(
+                os.path.join(site, row[0]) for row in rows
+                if row and row[0].endswith(".py") and not row[0].startswith(("/", "../"))
+            )
+    return sources
+
+
+def parse_importtime(text):
+    """(module, self µs, cumulative µs, depth) for each `-X importtime` line in `text`."""
+    imports = []
+    for line in text.splitlines():
+        if not line.startswith(_IMPORTTIME):
+            continue
+        fields = line[len(_IMPORTTIME):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(fields[0]), int(fields[1]), depth))
+    return imports
+
+
+def report(imports, wall, top):
+    """The profile of one run: totals and the `top` slowest imports."""
+    def rows(key):
+        ranked = sorted(imports, key=key, reverse=True)[:top]
+        return [{"module": name, "self_ms": own / 1000, "cumulative_ms": total / 1000} for name, own, total, _ in ranked]
+
+    return {
+        "total_ms": round(wall * 1000, 3),
+        "imports_ms": sum(total for _name, _own, total, depth in imports if depth == 0) / 1000,
+        "modules": len(imports),
+        "slowest_cumulative": rows(lambda i: i[2]),
+        "slowest_self": rows(lambda i: i[1]),
+    }
+
+
+def _entry_from_distribution(name):
+    """The console script named after distribution `name` (else its first), else the module `name`."""
+    from importlib import metadata
+
+    try:
+        scripts = [ep for ep in metadata.distribution(name).entry_points if ep.group == "console_scripts"]
+    except metadata.PackageNotFoundError:
+        scripts = []
+    if scripts:
+        named = [ep for ep in scripts if ep.name == name]
+        return (named or sorted(scripts, key=lambda ep: ep.name))[0].value.split("[")[0].strip()
+    return name.replace("-", "_")
+
+
+def profile(command, top=15, env=None):
+    """Run `command` once with import-time profiling; returns the report (see `report`)."""
+    run_env = dict(os.environ if env is None else env, PYTHONPROFILEIMPORTTIME="1")
+    started = time.perf_counter()
+    proc = subprocess.run(command, env=run_env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)  # noqa: S603
+    wall = time.perf_counter() - started
+    stderr = proc.stderr.decode("utf-8", "replace")
+    if proc.returncode:
+        other = [line for line in stderr.splitlines() if not line.startswith(_IMPORTTIME)]
+        raise RuntimeError("%s exited with status %d: %s" % (command[0], proc.returncode, "\n".join(other[-20:])))
+    return report(parse_importtime(stderr), wall, top)
+
+
+def _entry_command(entry):
+    module, _, attr = entry.partition(":")
+    code = "import importlib; m = importlib.import_module(%r)" % module.strip()
+    for part in attr.strip().split(".") if attr.strip() else ():
+        code += "; m = getattr(m, %r)" % part
+    return [sys.executable, "-c", code]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pypackager-bytecode", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    comp = commands.add_parser("compile")
+    comp.add_argument("paths", nargs="*")
+    comp.add_argument("--invalidation-mode", choices=sorted(MODES), default="unchecked-hash")
+    comp.add_argument("--base", help="Record source paths relative to this directory")
+    comp.add_argument("--jobs", type=int, default=0)
+    comp.add_argument("--json", action="store_true", help="Print the .pyc files as a JSON list")
+    comp.add_argument("--installed-from", metavar="WHEELS", help="Compile what installing the wheels in WHEELS wrote")
+    prof = commands.add_parser("profile")
+    prof.add_argument("--top", type=int, default=15)
+    which = prof.add_mutually_exclusive_group()
+    which.add_argument("--entry", help="module or module:attribute to import")
+    which.add_argument("--distribution", help="Profile the console script of this installed distribution")
+    prof.add_argument("cmd", nargs=argparse.REMAINDER, help="-- COMMAND ... to run instead")
+    args = parser.parse_args(argv)
+
+    if args.command == "compile":
+        started = time.perf_counter()
+        if args.installed_from:
+            paths = _installed_sources(args.installed_from)
+        else:
+            paths = args.paths or _default_paths()
+        results = compile_tree(paths, args.invalidation_mode, args.base, args.jobs)
+        counts = {"compiled": 0, "current": 0, "failed": 0}
+        for source, _pyc, status, error in results:
+            counts[status] += 1
+            if error:
+                print("pypackager: not precompiling %s: %s" % (source, error), file=sys.stderr)
+        print(
+            "pypackager: byte-compiled %d module(s) (%s) in %.2fs; %d already current, %d failed"
+            % (counts["compiled"], args.invalidation_mode, time.perf_counter() - started, counts["current"],
+               counts["failed"]),
+            file=sys.stderr,
+        )
+        if args.json:
+            pycs = [pyc for _source, pyc, status, _error in results if status != "failed"]
+            print(json.dumps([os.path.relpath(p, args.base) if args.base else p for p in pycs]))
+        return 0
+
+    command = args.cmd[1:] if args.cmd[:1] == ["--"] else args.cmd
+    if not command:
+        if args.entry:
+            command = _entry_command(args.entry)
+        elif args.distribution:
+            command = _entry_command(_entry_from_distribution(args.distribution))
+        else:
+            parser.error("profile needs --entry, --distribution or a command")
+    try:
+        result = profile(command, args.top)
+    except (OSError, RuntimeError) as exc:
+        print("pypackager: %s" % exc, file=sys.stderr)
+        return 1
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""Long-lived PEP 517 hook worker.
+
+Executed as a script by the build environment's interpreter, so it must only
+use the standard library. Requests arrive as JSON lines on stdin and responses
+are written as JSON lines to the original stdout; anything the backend prints
+is redirected to stderr, which the parent streams to its logs.
+
+A request with `"defer_compression": true` runs the hook with zlib forced to
+level 0, so archives come out with stored deflate blocks for the parent to
+compress once, in parallel.
+
+One backend is loaded at a time: the worker is shared by every project built
+with its interpreter, so switching to another backend (or another project's
+in-tree one) first forgets the previous one's modules and `backend-path`.
+
+A request with `"track": true` also reports, through an audit hook, the files
+and directories under the source tree the hook read (files it wrote are left
+out) and whether it started a subprocess, so its result can be cached against
+them.
+"""
+
+import importlib
+import json
+import os
+import sys
+import traceback
+import zlib
+
+_OPTIONAL_HOOKS = {
+    "get_requires_for_build_wheel": [],
+    "get_requires_for_build_sdist": [],
+    "prepare_metadata_for_build_wheel": None,
+}
+
+# (spec, backend paths) of the loaded backend, the paths it added to sys.path, and the backend
+_loaded = None
+_SPAWN_EVENTS = frozenset({"subprocess.Popen", "os.system", "os.posix_spawn", "os.spawn", "os.exec", "os.fork"})
+# What the tracked request in progress has touched, if any
+_tracker = None
+_compressobj = zlib.compressobj
+
+
+def _stored_compressobj(level=-1, *args, **kwargs):
+    # zipfile, tarfile and gzip all compress through zlib.compressobj
+    return _compressobj(0, *args, **kwargs)
+
+
+class _Tracker:
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        self.prefix = self.root + os.sep
+        self.read = set()
+        self.written = set()
+        self.listed = set()
+        self.spawned = False
+
+    def _path(self, path):
+        if isinstance(path, int) or path is None:
+            return None
+        try:
+            path = os.path.abspath(os.fsdecode(path))
+        except (TypeError, ValueError):
+            return None
+        return path if path == self.root or path.startswith(self.prefix) else None
+
+    def event(self, event, args):
+        if event == "open":
+            path = self._path(args[0])
+            if path is not None:
+                flags = args[2] if len(args) > 2 and isinstance(args[2], int) else 0
+                (self.written if flags & (os.O_WRONLY | os.O_RDWR) else self.read).add(path)
+        elif event in ("os.listdir", "os.scandir"):
+            path = self._path(args[0] if args and args[0] is not None else ".")
+            if path is not None:
+                self.listed.add(path)
+        elif event in _SPAWN_EVENTS:
+            self.spawned = True
+
+    def report(self):
+        rel = lambda paths: sorted(os.path.relpath(p, self.root) for p in paths)  # noqa: E731
+        return {
+            "files": rel(p for p in self.read - self.written if os.path.isfile(p)),
+            "dirs": rel(p for p in self.listed if os.path.isdir(p)),
+            "spawned": self.spawned,
+        }
+
+
+def _audit(event, args):
+    tracker = _tracker
+    if tracker is not None:
+        tracker.event(event, args)
+
+
+def _unload(paths):
+    """Take `paths` off sys.path and forget the modules imported from them."""
+    for path in paths:
+        while path in sys.path:
+            sys.path.remove(path)
+    prefixes = tuple(path + os.sep for path in paths)
+    for name, module in list(sys.modules.items()):
+        filename = getattr(module, "__file__", None)
+        if prefixes and filename and os.path.abspath(filename).startswith(prefixes):
+            del sys.modules[name]
+
+
+def _load_backend(spec, backend_path, root):
+    global _loaded
+    paths = [os.path.abspath(os.path.join(root, p)) for p in backend_path]
+    key = (spec, tuple(paths))
+    if _loaded is not None:
+        if _loaded[0] == key:
+            return _loaded[2]
+        _unload(_loaded[1])
+        _loaded = None
+    module_name, _, attr = spec.partition(":")
+    # import_module would return another project's module of the same name
+    for name in list(sys.modules):
+        if name == module_name or name.startswith(module_name + "."):
+            del sys.modules[name]
+    added = [path for path in paths if path not in sys.path]
+    sys.path[:0] = added
+    importlib.invalidate_caches()
+    backend = importlib.import_module(module_name)
+    for part in filter(None, attr.split(".")):
+        backend = getattr(backend, part)
+    _loaded = (key, added, backend)
+    return backend
+
+
+def _missing(requirements):
+    from importlib import metadata
+
+    missing = []
+    for req in requirements:
+        name = req
+        for sep in "[<>=!~;@( ":
+            name = name.split(sep, 1)[0]
+        try:
+            metadata.version(name.strip())
+        except metadata.PackageNotFoundError:
+            missing.append(req)
+    return missing
+
+
+def _handle(request):
+    hook = request["hook"]
+    if hook == "missing_requirements":
+        importlib.invalidate_caches()
+        return _missing(request["requirements"])
+    os.chdir(request["root"])
+    backend = _load_backend(request["backend"], request.get("backend_path") or [], request["root"])
+    func = getattr(backend, hook, None)
+    if func is None:
+        if hook in _OPTIONAL_HOOKS:
+            return _OPTIONAL_HOOKS[hook]
+        raise AttributeError(f"Backend {request['backend']!r} has no hook {hook!r}")
+    if not request.get("defer_compression"):
+        return func(*request.get("args", []), **request.get("kwargs", {}))
+    zlib.compressobj = _stored_compressobj
+    try:
+        return func(*request.get("args", []), **request.get("kwargs", {}))
+    finally:
+        zlib.compressobj = _compressobj
+
+
+def main():
+    global _tracker
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), "w", buffering=1, encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.addaudithook(_audit)
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        try:
+            if request.get("track"):
+                tracker = _Tracker(request["root"])
+                _tracker = tracker
+                try:
+                    result = _handle(request)
+                finally:
+                    _tracker = None
+                response = {"ok": True, "result": result, "inputs": tracker.report()}
+            else:
+                response = {"ok": True, "result": _handle(request)}
+        except BaseException as exc:  # report everything, including SystemExit from setup.py
+            response = {
+                "ok": False,
+                "error": f"{type(exc).__name__}: {exc}",
+                "traceback": traceback.format_exc(),
+            }
+        sys.stdout.flush()
+        sys.stderr.flush()
+        protocol.write(json.dumps(response) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+"""Parallel installer for already-resolved wheels.
+
+Executed as a script by the interpreter it installs for (a build
+environment's, or the image's during a Docker build), so it must only use the
+standard library. Nothing is resolved: every wheel given is installed, with
+its files unpacked (or hardlinked from a shared cache of unpacked wheels) on a
+thread pool, `RECORD` and `INSTALLER` written, console-script launchers
+generated and, optionally, the modules byte-compiled on a process pool.
+
+All wheels are checked before anything is written. When one needs something
+this installer does not do (Windows launchers, an unknown wheel version,
+files claimed by two wheels), it exits with `EXIT_UNSUPPORTED` and the caller
+falls back to pip.
+"""
+
+import argparse
+import base64
+import compileall
+import configparser
+import csv
+import hashlib
+import importlib.util
+import io
+import os
+import re
+import shutil
+import sys
+import sysconfig
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+EXIT_UNSUPPORTED = 3
+CHUNK_SIZE = 1 << 20
+# Unpacked wheels used within this many seconds are never pruned
+PRUNE_GRACE = 3600
+# Generated rather than installed from the wheel
+_GENERATED = ("RECORD", "INSTALLER", "REQUESTED", "direct_url.json")
+_SCHEMES = ("purelib", "platlib", "scripts", "data", "headers")
+_LAUNCHER = """\
+# -*- coding: utf-8 -*-
+import re
+import sys
+from {module} import {name}
+if __name__ == "__main__":
+    sys.argv[0] = re.sub(r"(-script\\.pyw|\\.exe)?$", "", sys.argv[0])
+    sys.exit({call}())
+"""
+
+
+class Unsupported(Exception):
+    """A wheel this installer cannot install; pip can."""
+
+
+def _canonical(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _record_hash(digest):
+    return "sha256=" + base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _csv_rows(text):
+    return [row for row in csv.reader(io.StringIO(text)) if row]
+
+
+def scheme(target=None, prefix=None):
+    """Install locations: `pip --target`'s layout under `target`, else this interpreter's scheme."""
+    if target is not None:
+        return {
+            "purelib": target, "platlib": target, "scripts": os.path.join(target, "bin"),
+            "data": target, "headers": os.path.join(target, "include"),
+        }
+    variables = {"base": prefix, "platbase": prefix} if prefix else None
+    paths = sysconfig.get_paths(vars=variables)
+    root = prefix or sys.prefix
+    return {
+        "purelib": paths["purelib"], "platlib": paths["platlib"], "scripts": paths["scripts"],
+        "data": paths["data"],
+        "headers": os.path.join(root, "include", "site", "python%d.%d" % sys.version_info[:2]),
+    }
+
+
+def shebang(executable):
+    """`#!executable`, or a /bin/sh trampoline when the kernel cannot take the path as is."""
+    if len(executable) < 127 and " " not in executable:
+        return "#!%s\n" % executable
+    return "#!/bin/sh\n'''exec' \"%s\" \"$0\" \"$@\"\n' '''\n" % executable
+
+
+class Wheel:
+    """A wheel's layout, read from its zip directory and metadata without unpacking it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.filename = os.path.basename(path)
+        with zipfile.ZipFile(path) as zf:
+            self.members = [info for info in zf.infolist() if not info.is_dir()]
+            tops = {info.filename.split("/", 1)[0] for info in self.members if "/" in info.filename}
+            dist_infos = sorted(top for top in tops if top.endswith(".dist-info"))
+            if len(dist_infos) != 1:
+                raise Unsupported("%s: expected one .dist-info directory, found %d" % (self.filename, len(dist_infos)))
+            self.dist_info = dist_infos[0]
+            wheel = self._headers(zf, "WHEEL")
+            record = zf.read(self.dist_info + "/RECORD").decode("utf-8")
+            try:
+                entry_points = zf.read(self.dist_info + "/entry_points.txt").decode("utf-8")
+            except KeyError:
+                entry_points = ""
+        self.name = _canonical(self.dist_info[: -len(".dist-info")].rpartition("-")[0])
+        major = wheel.get("Wheel-Version", "").split(".")[0]
+        if major != "1":
+            raise Unsupported("%s: unsupported Wheel-Version %r" % (self.filename, wheel.get("Wheel-Version")))
+        self.purelib = wheel.get("Root-Is-Purelib", "").strip().lower() == "true"
+        self.hashes = {row[0]: row[1:3] for row in _csv_rows(record) if len(row) >= 3 and row[1]}
+        self.scripts = self._entry_points(entry_points)
+
+    def _headers(self, zf, name):
+        headers = {}
+        for line in zf.read(self.dist_info + "/" + name).decode("utf-8").splitlines():
+            key, sep, value = line.partition(":")
+            if sep:
+                headers[key.strip()] = value.strip()
+        return headers
+
+    def _entry_points(self, text):
+        parser = configparser.ConfigParser(delimiters=("=",), interpolation=None)
+        parser.optionxform = str
+        parser.read_string(text)
+        scripts = {}
+        for section in ("console_scripts", "gui_scripts"):
+            if not parser.has_section(section):
+                continue
+            for script, value in parser.items(section):
+                module, sep, attr = value.split("[", 1)[0].strip().partition(":")
+                if not sep or not module.strip() or not attr.strip():
+                    raise Unsupported("%s: entry point %s = %s has no callable" % (self.filename, script, value))
+                scripts[script] = (module.strip(), attr.strip())
+        if scripts and os.name == "nt":
+            raise Unsupported("%s: Windows script launchers need pip" % self.filename)
+        return scripts
+
+    def plan(self, paths):
+        """(member, destination, is a script) for every file this wheel installs."""
+        root = paths["purelib"] if self.purelib else paths["platlib"]
+        data = self.dist_info[: -len(".dist-info")] + ".data/"
+        plan = []
+        for info in self.members:
+            name = info.filename
+            parts = name.split("/")
+            if name.startswith("/") or ".." in parts or "\\" in name:
+                raise Unsupported("%s: unsafe member name %s" % (self.filename, name))
+            if parts[0] == self.dist_info and parts[-1] in _GENERATED and len(parts) == 2:
+                continue
+            if name.startswith(data):
+                key, _, rest = name[len(data):].partition("/")
+                if key not in _SCHEMES or not rest:
+                    raise Unsupported("%s: unknown data directory in %s" % (self.filename, name))
+                base = os.path.join(paths["headers"], self.name) if key == "headers" else paths[key]
+                plan.append((info, os.path.join(base, *rest.split("/")), key == "scripts"))
+            else:
+                plan.append((info, os.path.join(root, *parts), False))
+        return plan
+
+    def site_dir(self, paths):
+        return paths["purelib"] if self.purelib else paths["platlib"]
+
+
+def _verify(wheel, info, digest, size):
+    expected = wheel.hashes.get(info.filename)
+    if expected is None:
+        return
+    if expected[0].startswith("sha256=") and _record_hash(digest.digest()) != expected[0]:
+        raise RuntimeError("%s: %s does not match the hash in RECORD" % (wheel.filename, info.filename))
+    if expected[1] and int(expected[1]) != size:
+        raise RuntimeError("%s: %s does not match the size in RECORD" % (wheel.filename, info.filename))
+
+
+def _mode(info):
+    return 0o755 if (info.external_attr >> 16) & 0o111 else 0o644
+
+
+def _extract(zf, wheel, info, dest):
+    """Write one member to `dest`, checking it against RECORD."""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with zf.open(info) as fin, open(dest, "wb") as fout:
+        for chunk in iter(lambda: fin.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+            fout.write(chunk)
+    _verify(wheel, info, digest, size)
+    os.chmod(dest, _mode(info))
+
+
+def unpack(wheel, cache):
+    """The directory under `cache` holding `wheel` unpacked, creating it if needed."""
+    digest = _file_sha256(wheel.path)
+    root = os.path.join(cache, digest[:2], digest)
+    if os.path.isdir(root):
+        os.utime(root)
+        return root
+    os.makedirs(os.path.dirname(root), exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".%s." % digest[:12], dir=os.path.dirname(root))
+    try:
+        size = 0
+        with zipfile.ZipFile(wheel.path) as zf:
+            for info in wheel.members:
+                _extract(zf, wheel, info, os.path.join(tmp, *info.filename.split("/")))
+                size += info.file_size
+        with open(root + ".size", "w") as fh:
+            fh.write(str(size))
+        try:
+            os.rename(tmp, root)
+        except OSError:
+            # Unpacked concurrently by another install
+            if not os.path.isdir(root):
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return root
+
+
+def prune(cache, max_bytes):
+    """Remove least recently used unpacked wheels until `cache` fits in `max_bytes`."""
+    entries = []
+    total = 0
+    now = time.time()
+    for shard in os.scandir(cache) if os.path.isdir(cache) else ():
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            if not entry.name.endswith(".size"):
+                continue
+            root = entry.path[: -len(".size")]
+            try:
+                with open(entry.path) as fh:
+                    size = int(fh.read() or 0)
+                used = os.stat(root).st_mtime
+            except (OSError, ValueError):
+                continue
+            total += size
+            entries.append((used, size, root))
+    for used, size, root in sorted(entries):
+        if total <= max_bytes or now - used < PRUNE_GRACE:
+            break
+        shutil.rmtree(root, ignore_errors=True)
+        os.unlink(root + ".size")
+        total -= size
+
+
+def _installed(site_dirs, name):
+    """.dist-info directories of installed distributions named `name`."""
+    found = []
+    for site in site_dirs:
+        if not os.path.isdir(site):
+            continue
+        for entry in os.scandir(site):
+            if entry.name.endswith(".dist-info") and _canonical(entry.name[:-10].rpartition("-")[0]) == name:
+                found.append(entry.path)
+    return found
+
+
+def uninstall(dist_info, root):
+    """Remove the files a RECORD lists (only those under `root`) and the .dist-info directory."""
+    site = os.path.dirname(dist_info)
+    root = os.path.realpath(root)
+    parents = set()
+    try:
+        with open(os.path.join(dist_info, "RECORD"), encoding="utf-8") as fh:
+            rows = _csv_rows(fh.read())
+    except OSError:
+        rows = []
+    for row in rows:
+        path = os.path.normpath(os.path.join(site, row[0]))
+        if not os.path.realpath(path).startswith(root + os.sep):
+            continue
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            continue
+        parents.add(os.path.dirname(path))
+    shutil.rmtree(dist_info, ignore_errors=True)
+    for parent in sorted(parents, key=len, reverse=True):
+        while parent.startswith(root + os.sep) and parent != site:
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+
+def _place(src, dest, stats):
+    """Hardlink `src` to `dest`, copying when the cache is on another filesystem.
+
+    Installed files then share their inode with the cache: they may be
+    deleted or replaced, never modified in place.
+    """
+    if os.path.lexists(dest):
+        os.unlink(dest)
+    try:
+        os.link(src, dest)
+        stats["linked"] += 1
+    except OSError:
+        shutil.copy2(src, dest)
+        stats["copied"] += 1
+
+
+def _write(path, data, mode=0o644):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.lexists(path):
+        os.unlink(path)
+    with open(path, "wb") as fh:
+        fh.write(data)
+    os.chmod(path, mode)
+    return _record_hash(hashlib.sha256(data).digest()), str(len(data))
+
+
+def _install(wheel, plan, paths, cache, executable):
+    """Install one wheel from its plan; returns its RECORD rows, installed modules and counts."""
+    site = wheel.site_dir(paths)
+    head = shebang(executable).encode("utf-8")
+    rows = []
+    modules = []
+    stats = {"linked": 0, "copied": 0}
+    source = unpack(wheel, cache) if cache else None
+    with zipfile.ZipFile(wheel.path) as zf:
+        for info, dest, script in plan:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if script:
+                # Written afresh: the shebang may change and scripts are always executable
+                with zf.open(info) as fh:
+                    data = fh.read()
+                if data.startswith(b"#!python"):
+                    data = head + data.split(b"\n", 1)[1] if b"\n" in data else head
+                rows.append((dest, *_write(dest, data, 0o755)))
+                stats["copied"] += 1
+                continue
+            if source is not None:
+                _place(os.path.join(source, *info.filename.split("/")), dest, stats)
+            else:
+                if os.path.lexists(dest):
+                    os.unlink(dest)
+                _extract(zf, wheel, info, dest)
+                stats["copied"] += 1
+            expected = wheel.hashes.get(info.filename)
+            if expected and expected[0].startswith("sha256="):
+                rows.append((dest, expected[0], expected[1] or str(info.file_size)))
+            else:
+                rows.append((dest, _record_hash(bytes.fromhex(_file_sha256(dest))), str(info.file_size)))
+            if dest.endswith(".py"):
+                modules.append(dest)
+    for script, (module, attr) in sorted(wheel.scripts.items()):
+        name, _, rest = attr.partition(".")
+        text = _LAUNCHER.format(module=module, name=name, call=attr if rest else name)
+        dest = os.path.join(paths["scripts"], script)
+        rows.append((dest, *_write(dest, head + text.encode("utf-8"), 0o755)))
+    dist_info = os.path.join(site, wheel.dist_info)
+    rows.append((os.path.join(dist_info, "INSTALLER"), *_write(os.path.join(dist_info, "INSTALLER"), b"pypackager\n")))
+    return rows, modules, stats
+
+
+def _compile(path):
+    return compileall.compile_file(path, force=True, quiet=2)
+
+
+def compile_modules(modules, jobs):
+    """Byte-compile `modules` for this interpreter; returns the .pyc files written."""
+    if jobs > 1 and len(modules) > 64:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            list(pool.map(_compile, modules, chunksize=32))
+    else:
+        for module in modules:
+            _compile(module)
+    return [pyc for pyc in (importlib.util.cache_from_source(m) for m in modules) if os.path.exists(pyc)]
+
+
+def _write_record(wheel, paths, rows):
+    site = wheel.site_dir(paths)
+    record = os.path.join(site, wheel.dist_info, "RECORD")
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    for path, digest, size in sorted(rows):
+        writer.writerow([os.path.relpath(path, site).replace(os.sep, "/"), digest, size])
+    writer.writerow([os.path.relpath(record, site).replace(os.sep, "/"), "", ""])
+    _write(record, out.getvalue().encode("utf-8"))
+
+
+def install(wheels, paths, executable=None, cache=None, jobs=0, compile=False):
+    """Install `wheels` (paths) into the scheme `paths`; returns counts of what was done.
+
+    Raises `Unsupported`, before anything is written, when pip must do it.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    executable = executable or sys.executable
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        parsed = list(pool.map(Wheel, wheels))
+    names = {}
+    owners = {}
+    plans = []
+    for wheel in parsed:
+        if wheel.name in names:
+            raise Unsupported("%s and %s are the same project" % (names[wheel.name], wheel.filename))
+        names[wheel.name] = wheel.filename
+        plan = wheel.plan(paths)
+        for _info, dest, _script in plan:
+            if owners.setdefault(os.path.normcase(dest), wheel.filename) != wheel.filename:
+                raise Unsupported("%s and %s both install %s" % (owners[os.path.normcase(dest)], wheel.filename, dest))
+        plans.append(plan)
+
+    site_dirs = sorted({paths["purelib"], paths["platlib"]})
+    for wheel in parsed:
+        for dist_info in _installed(site_dirs, wheel.name):
+            uninstall(dist_info, paths["data"])
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(
+            lambda item: _install(item[0], item[1], paths, cache, executable), zip(parsed, plans)
+        ))
+    stats = {"wheels": len(parsed), "linked": 0, "copied": 0, "compiled": 0}
+    for _rows, _modules, counts in results:
+        stats["linked"] += counts["linked"]
+        stats["copied"] += counts["copied"]
+    if compile:
+        # One pool for every wheel's modules; RECORD lists the .pyc files too
+        compiled = set(compile_modules([m for _rows, modules, _counts in results for m in modules], jobs))
+        stats["compiled"] = len(compiled)
+        for rows, modules, _counts in results:
+            for module in modules:
+                pyc = importlib.util.cache_from_source(module)
+                if pyc in compiled:
+                    rows.append((pyc, _record_hash(bytes.fromhex(_file_sha256(pyc))), str(os.path.getsize(pyc))))
+    for wheel, (rows, _modules, _counts) in zip(parsed, results):
+        _write_record(wheel, paths, rows)
+    return stats
+
+
+def _wheel_paths(args):
+    wheels = []
+    for arg in args:
+        if os.path.isdir(arg):
+            wheels.extend(os.path.join(arg, n) for n in sorted(os.listdir(arg)) if n.endswith(".whl"))
+        else:
+            wheels.append(arg)
+    return wheels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Install already-resolved wheels in parallel.")
+    parser.add_argument("wheels", nargs="*", help="Wheel files, or directories of them")
+    parser.add_argument("--target", help="Install into this directory (pip --target layout)")
+    parser.add_argument("--prefix", help="Install under this prefix instead of the interpreter's")
+    parser.add_argument("--cache", help="Shared directory of unpacked wheels to hardlink from")
+    parser.add_argument("--cache-max-bytes", type=int, default=0, help="Prune the cache down to this size")
+    parser.add_argument("--jobs", type=int, default=0, help="Worker threads and processes (default: CPU count)")
+    parser.add_argument("--compile", action="store_true", help="Byte-compile installed modules")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    wheels = _wheel_paths(args.wheels)
+    try:
+        stats = install(wheels, scheme(args.target, args.prefix), cache=args.cache, jobs=args.jobs, compile=args.compile)
+    except Unsupported as e:
+        print("Needs pip: %s" % e, file=sys.stderr)
+        return EXIT_UNSUPPORTED
+    if args.cache and args.cache_max_bytes:
+        prune(args.cache, args.cache_max_bytes)
+    print(
+        "Installed %d wheel(s) in %.2fs: %d file(s) hardlinked, %d copied, %d module(s) compiled"
+        % (stats["wheels"], time.perf_counter() - started, stats["linked"], stats["copied"], stats["compiled"])
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,401 @@
+from __future__ import annotations
+
+import fnmatch
+import io
+import os
+import struct
+import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Deque, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Uncompressed bytes per deflate block; output never depends on the thread count
+BLOCK_SIZE = 256 * 1024
+# Preset dictionary carried from one block to the next (the deflate window)
+WINDOW_SIZE = 32 * 1024
+# Compressed members larger than this are spooled to disk until written
+SPOOL_SIZE = 16 * 1024 * 1024
+SPOOL_CHUNK = 1024 * 1024
+# Blocks in flight per worker thread
+BLOCKS_PER_WORKER = 4
+
+# Formats that are compressed already; deflating them again only costs time
+STORED_SUFFIXES = frozenset({
+    ".7z", ".br", ".bz2", ".gif", ".gz", ".jar", ".jpeg", ".jpg", ".lz4", ".mp3", ".mp4", ".png",
+    ".pyz", ".webp", ".whl", ".woff", ".woff2", ".xz", ".zip", ".zst",
+})
+
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP_STORED = 0
+_ZIP_DEFLATED = 8
+
+
+@dataclass(frozen=True)
+class Compression:
+    """How pypackager compresses the archives it writes."""
+
+    # zlib level 1-9; 0 stores every member uncompressed
+    level: int = 6
+    # Compression threads; 0 means one per CPU
+    threads: int = 0
+    # Extra globs of member names to store uncompressed (see STORED_SUFFIXES)
+    store: Tuple[str, ...] = ()
+
+    def __post_init__(self) -> None:
+        if not 0 <= self.level <= 9:
+            raise ValueError(f"Compression level must be between 0 and 9, not {self.level}")
+
+    def workers(self) -> int:
+        return self.threads or os.cpu_count() or 1
+
+    def stores(self, name: str) -> bool:
+        """Whether member `name` is written uncompressed."""
+        if self.level == 0 or os.path.splitext(name)[1].lower() in STORED_SUFFIXES:
+            return True
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.store)
+
+
+def _deflate(data: bytes, dictionary: bytes, level: int, last: bool) -> bytes:
+    """One block of a raw deflate stream, primed with the tail of the previous block.
+
+    Blocks other than the last end on a byte boundary (Z_SYNC_FLUSH), so their
+    concatenation is a single valid stream, as with pigz.
+    """
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+# (data, preset dictionary, last block of its stream, deflate or store, owner)
+_Block = Tuple[bytes, bytes, bool, bool, Any]
+
+
+class _BlockQueue:
+    """Compress blocks on a thread pool and hand back their output in submission order.
+
+    Small blocks (e.g. whole small files) are batched into one task of about
+    `BLOCK_SIZE` bytes, so per-task overhead does not dominate archives of
+    many small members. At most `limit` tasks are in flight; submitting more
+    first retires the oldest, so memory stays bounded whatever the size of
+    the input.
+    """
+
+    def __init__(self, compression: Compression) -> None:
+        self.level = compression.level
+        workers = compression.workers()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pypackager-compress")
+        self._limit = workers * BLOCKS_PER_WORKER
+        self._pending: Deque[Tuple[Future, List[_Block]]] = deque()
+        self._batch: List[_Block] = []
+        self._batch_size = 0
+
+    def submit(self, data: bytes, dictionary: bytes, last: bool, deflate: bool, owner: Any) -> None:
+        self._batch.append((data, dictionary, last, deflate, owner))
+        self._batch_size += len(data)
+        if self._batch_size >= BLOCK_SIZE:
+            self._submit_batch()
+
+    def _submit_batch(self) -> None:
+        if not self._batch:
+            return
+        while len(self._pending) >= self._limit:
+            self._retire()
+        batch, self._batch, self._batch_size = self._batch, [], 0
+        self._pending.append((self._pool.submit(self._compress, batch), batch))
+
+    def _compress(self, batch: List[_Block]) -> List[bytes]:
+        return [
+            _deflate(data, dictionary, self.level, last) if deflate else data
+            for data, dictionary, last, deflate, _owner in batch
+        ]
+
+    def _retire(self) -> None:
+        future, batch = self._pending.popleft()
+        for (data, _dictionary, _last, _deflate, owner), output in zip(batch, future.result()):
+            owner._block_done(data, output)
+
+    def drain(self) -> None:
+        """Compress everything submitted and pass each block to its owner's `_block_done`, in order."""
+        self._submit_batch()
+        while self._pending:
+            self._retire()
+
+    def close(self, cancel: bool = False) -> None:
+        if cancel:
+            for future, _batch in self._pending:
+                future.cancel()
+            self._pending.clear()
+        self._pool.shutdown(wait=True)
+
+
+def _dos_time(date_time: Tuple[int, ...]) -> Tuple[int, int]:
+    year, month, day, hour, minute, second = date_time[:6]
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+class _Member:
+    """A zip member whose blocks are being compressed; written once its last block is back."""
+
+    def __init__(self, writer: "ParallelZipWriter", name: str, mode: int, date_time: Tuple[int, ...], deflate: bool):
+        self.writer = writer
+        self.name = name
+        self.mode = mode
+        self.date_time = date_time
+        self.deflate = deflate
+        self.crc = 0
+        self.size = 0
+        self.compressed_size = 0
+        self.blocks = 0  # submitted and not yet back
+        self.closed = False
+        # Compressed output: in memory, or in a temporary file past SPOOL_SIZE
+        self.chunks: List[bytes] = []
+        self.spool: Optional[IO[bytes]] = None
+
+    def _block_done(self, data: bytes, output: bytes) -> None:
+        self.crc = zlib.crc32(data, self.crc)
+        self.compressed_size += len(output)
+        if self.spool is None and self.compressed_size > SPOOL_SIZE:
+            self.spool = tempfile.TemporaryFile()
+            for chunk in self.chunks:
+                self.spool.write(chunk)
+            self.chunks = []
+        if self.spool is not None:
+            self.spool.write(output)
+        else:
+            self.chunks.append(output)
+        self.blocks -= 1
+        if self.closed and not self.blocks:
+            self.writer._write_member(self)
+
+    def output(self) -> Iterator[bytes]:
+        if self.spool is None:
+            yield from self.chunks
+            return
+        with self.spool:
+            self.spool.seek(0)
+            yield from iter(lambda: self.spool.read(SPOOL_CHUNK), b"")  # type: ignore[union-attr]
+
+
+@dataclass
+class _Entry:
+    name: bytes
+    flags: int
+    method: int
+    dos_time: int
+    dos_date: int
+    crc: int
+    compressed_size: int
+    size: int
+    external_attr: int
+    offset: int
+
+
+class ParallelZipWriter:
+    """Write a zip archive, deflating members concurrently on a thread pool.
+
+    zlib releases the GIL, so members (and blocks of large members) compress
+    in parallel. Members are written in the order they were added, with
+    fixed headers (no extra fields, unix attributes), so the same inputs give
+    the same bytes for any thread count. Offsets are relative to the
+    position of `fileobj` when the writer is created, as with `zipfile`, so
+    the archive may follow other data (e.g. a #! line).
+    """
+
+    def __init__(self, fileobj: IO[bytes], compression: Optional[Compression] = None) -> None:
+        self._fh = fileobj
+        self.compression = compression or Compression()
+        self._queue = _BlockQueue(self.compression)
+        self._offset = 0
+        self._entries: List[_Entry] = []
+        self._names: Set[str] = set()
+        self._closed = False
+
+    def __enter__(self) -> "ParallelZipWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, *exc: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._queue.close(cancel=True)
+
+    def _write(self, data: bytes) -> None:
+        self._fh.write(data)
+        self._offset += len(data)
+
+    def add(
+        self,
+        name: str,
+        stream: IO[bytes],
+        mode: int = 0o644,
+        date_time: Tuple[int, ...] = ZIP_DATE,
+        compress: Optional[bool] = None,
+    ) -> None:
+        """Add a member read from `stream`; `compress` overrides `Compression.stores`."""
+        if name in self._names:
+            raise ValueError(f"Duplicate archive member: {name}")
+        self._names.add(name)
+        deflate = not self.compression.stores(name) if compress is None else compress and self.compression.level > 0
+        member = _Member(self, name, mode, date_time, deflate)
+        dictionary = b""
+        block = stream.read(BLOCK_SIZE)
+        while True:
+            following = stream.read(BLOCK_SIZE) if len(block) == BLOCK_SIZE else b""
+            member.size += len(block)
+            member.blocks += 1
+            self._queue.submit(block, dictionary, not following, deflate, member)
+            if not following:
+                break
+            dictionary = block[-WINDOW_SIZE:]
+            block = following
+        member.closed = True
+        if not member.blocks:
+            self._write_member(member)
+
+    def add_bytes(self, name: str, data: bytes, mode: int = 0o644, date_time: Tuple[int, ...] = ZIP_DATE) -> None:
+        self.add(name, io.BytesIO(data), mode, date_time)
+
+    def add_file(self, name: str, path: Path, date_time: Tuple[int, ...] = ZIP_DATE) -> None:
+        """Add a file; its mode is reduced to 0755 or 0644."""
+        mode = 0o755 if os.stat(path).st_mode & 0o111 else 0o644
+        with open(path, "rb") as fh:
+            self.add(name, fh, mode, date_time)
+
+    def mkdir(self, name: str, date_time: Tuple[int, ...] = ZIP_DATE) -> None:
+        name = name.rstrip("/") + "/"
+        # Directories are ordered with the members around them
+        self._queue.drain()
+        self._append_entry(name, _ZIP_STORED, date_time, 0, 0, 0, (0o40755 << 16) | 0x10)
+
+    def _write_member(self, member: _Member) -> None:
+        method = _ZIP_DEFLATED if member.deflate else _ZIP_STORED
+        self._append_entry(
+            member.name, method, member.date_time, member.crc, member.compressed_size, member.size,
+            ((0o100000 | member.mode) << 16), member.output(),
+        )
+
+    def _append_entry(
+        self,
+        name: str,
+        method: int,
+        date_time: Tuple[int, ...],
+        crc: int,
+        compressed_size: int,
+        size: int,
+        external_attr: int,
+        data: Iterable[bytes] = (),
+    ) -> None:
+        encoded = name.encode("utf-8")
+        flags = 0 if encoded.isascii() else 0x800
+        dos_time, dos_date = _dos_time(date_time)
+        entry = _Entry(encoded, flags, method, dos_time, dos_date, crc, compressed_size, size, external_attr, self._offset)
+        zip64 = size >= _ZIP64_LIMIT or compressed_size >= _ZIP64_LIMIT
+        extra = struct.pack("<HHQQ", 1, 16, size, compressed_size) if zip64 else b""
+        self._write(struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, 45 if zip64 else 20, flags, method, dos_time, dos_date, crc,
+            _ZIP64_LIMIT if zip64 else compressed_size, _ZIP64_LIMIT if zip64 else size, len(encoded), len(extra),
+        ))
+        self._write(encoded + extra)
+        for chunk in data:
+            self._write(chunk)
+        self._entries.append(entry)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.drain()
+        finally:
+            self._queue.close()
+        start = self._offset
+        for e in self._entries:
+            fields = [v for v, big in ((e.size, e.size >= _ZIP64_LIMIT),
+                                        (e.compressed_size, e.compressed_size >= _ZIP64_LIMIT),
+                                        (e.offset, e.offset >= _ZIP64_LIMIT)) if big]
+            extra = struct.pack(f"<HH{len(fields)}Q", 1, 8 * len(fields), *fields) if fields else b""
+            version = 45 if fields else 20
+            self._write(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | version, version, e.flags, e.method, e.dos_time,
+                e.dos_date, e.crc, min(e.compressed_size, _ZIP64_LIMIT), min(e.size, _ZIP64_LIMIT),
+                len(e.name), len(extra), 0, 0, 0, e.external_attr, min(e.offset, _ZIP64_LIMIT),
+            ))
+            self._write(e.name + extra)
+        size, count = self._offset - start, len(self._entries)
+        if count >= 0xFFFF or start >= _ZIP64_LIMIT or size >= _ZIP64_LIMIT:
+            end64 = self._offset
+            self._write(struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, size, start))
+            self._write(struct.pack("<IIQI", 0x07064B50, 0, end64, 1))
+        self._write(struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+            min(size, _ZIP64_LIMIT), min(start, _ZIP64_LIMIT), 0,
+        ))
+
+
+class ParallelGzipWriter:
+    """A writable gzip stream deflated in blocks on a thread pool.
+
+    Input is cut into fixed-size blocks compressed concurrently and written
+    in order, each primed with the previous block's last 32 KiB, so the
+    result is an ordinary single-member gzip file. The header carries no name
+    or timestamp, and the bytes do not depend on the thread count.
+    """
+
+    def __init__(self, fileobj: IO[bytes], compression: Optional[Compression] = None) -> None:
+        self._fh = fileobj
+        self.compression = compression or Compression()
+        self._queue = _BlockQueue(self.compression)
+        self._buffer = bytearray()
+        self._dictionary = b""
+        self._crc = 0
+        self._size = 0
+        self._closed = False
+        level = self.compression.level
+        xfl = 2 if level == 9 else 4 if level == 1 else 0
+        self._fh.write(b"\x1f\x8b\x08\x00" + struct.pack("<I", 0) + bytes((xfl, 255)))
+
+    def __enter__(self) -> "ParallelGzipWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, *exc: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._queue.close(cancel=True)
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) > BLOCK_SIZE:
+            self._submit(bytes(self._buffer[:BLOCK_SIZE]), last=False)
+            del self._buffer[:BLOCK_SIZE]
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def _submit(self, block: bytes, last: bool) -> None:
+        self._queue.submit(block, self._dictionary, last, True, self)
+        self._dictionary = block[-WINDOW_SIZE:]
+
+    def _block_done(self, data: bytes, output: bytes) -> None:
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._fh.write(output)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._submit(bytes(self._buffer), last=True)
+            self._buffer.clear()
+            self._queue.drain()
+        finally:
+            self._queue.close()
+        self._fh.write(struct.pack("<II", self._crc, self._size & 0xFFFFFFFF))
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import subprocess
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import tracing
+from .process import current_target
+from .project import ProjectInfo
+
+logger = logging.getLogger(__name__)
+
+_WORKER_SCRIPT = Path(__file__).with_name("_pep517_worker.py")
+
+
+class BackendError(RuntimeError):
+    """A PEP 517 hook raised inside the worker."""
+
+    def __init__(self, hook: str, error: str, traceback: str = "") -> None:
+        super().__init__(f"{hook} failed: {error}")
+        self.hook = hook
+        self.traceback = traceback
+
+
+class BackendWorker:
+    """A persistent interpreter that executes PEP 517 hooks on request.
+
+    The worker runs `_pep517_worker.py` under a build environment's python and
+    keeps imported backends loaded, so repeated builds skip interpreter startup
+    and backend import. Requests are serialized; the backend's own output is
+    streamed to the log, prefixed with the target that issued the request.
+    """
+
+    def __init__(self, python: Path) -> None:
+        self.python = python
+        self._lock = threading.Lock()
+        self._prefix = "-"
+        # Context of the latest request, so backend output is routed like its caller's logs
+        self._context = contextvars.copy_context()
+        self._proc = subprocess.Popen(  # noqa: S603
+            [os.fspath(python), "-u", os.fspath(_WORKER_SCRIPT)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+        )
+        self._stderr_thread = threading.Thread(target=self._pump_stderr, daemon=True)
+        self._stderr_thread.start()
+        logger.debug("Started PEP 517 worker %d for %s", self._proc.pid, python)
+
+    @property
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def _pump_stderr(self) -> None:
+        assert self._proc.stderr is not None
+        for line in self._proc.stderr:
+            self._context.run(logger.info, "[%s] %s", self._prefix, line.rstrip())
+
+    def call(self, hook: str, **request: Any) -> Any:
+        return self._request(hook, request)["result"]
+
+    def call_tracked(self, hook: str, **request: Any) -> Tuple[Any, Dict[str, Any]]:
+        """`call`, also returning what the hook read under `root` (see `_pep517_worker`)."""
+        response = self._request(hook, {**request, "track": True})
+        return response["result"], response["inputs"]
+
+    def _request(self, hook: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        with tracing.span(f"backend {hook}", "backend") as span, self._lock:
+            if not self.alive:
+                raise RuntimeError(f"PEP 517 worker for {self.python} exited")
+            self._prefix = current_target.get() or "-"
+            self._context = contextvars.copy_context()
+            assert self._proc.stdin is not None and self._proc.stdout is not None
+            # The worker outlives the call, so its usage is read from /proc
+            before = tracing.process_stats(self._proc.pid) if span is not None else None
+            self._proc.stdin.write(json.dumps({"hook": hook, **request}) + "\n")
+            self._proc.stdin.flush()
+            line = self._proc.stdout.readline()
+            after = tracing.process_stats(self._proc.pid) if before is not None else None
+            if span is not None and before is not None and after is not None:
+                written = after[1] - before[1] if after[1] is not None and before[1] is not None else None
+                span.add_child(after[0] - before[0], written=written)
+        if not line:
+            raise RuntimeError(f"PEP 517 worker for {self.python} exited during {hook}")
+        response = json.loads(line)
+        if not response["ok"]:
+            logger.debug("%s traceback:\n%s", hook, response.get("traceback", ""))
+            raise BackendError(hook, response["error"], response.get("traceback", ""))
+        return response
+
+    def close(self) -> None:
+        if self._proc.stdin and not self._proc.stdin.closed:
+            self._proc.stdin.close()
+        try:
+            self._proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            self._proc.wait()
+
+
+_workers: Dict[str, BackendWorker] = {}
+_workers_lock = threading.Lock()
+
+
+def get_worker(python: Path) -> BackendWorker:
+    """Return the shared worker for an interpreter, starting it if needed.
+
+    Workers live until interpreter exit, so they serve every target and every
+    project built in the same process.
+    """
+    key = os.fspath(python)
+    with _workers_lock:
+        worker = _workers.get(key)
+        if worker is None or not worker.alive:
+            worker = _workers[key] = BackendWorker(python)
+        return worker
+
+
+@atexit.register
+def shutdown_workers() -> None:
+    with _workers_lock:
+        workers = list(_workers.values())
+        _workers.clear()
+    for worker in workers:
+        worker.close()
+
+
+class Pep517Backend:
+    """The build backend of one project, invoked through a `BackendWorker`.
+
+    With `defer_compression`, archives are written uncompressed (level 0) by
+    the backend, for the caller to compress once (see `core.reproducible`).
+    """
+
+    def __init__(
+        self,
+        project: ProjectInfo,
+        worker: BackendWorker,
+        source_dir: Optional[Path] = None,
+        defer_compression: bool = False,
+    ) -> None:
+        self.project = project
+        self.worker = worker
+        self.source_dir = source_dir or project.root
+        self.defer_compression = defer_compression
+
+    def _call(self, hook: str, *args: Any) -> Any:
+        return self.worker.call(hook, **self._request(args))
+
+    def _request(self, args: Tuple[Any, ...]) -> Dict[str, Any]:
+        return {
+            "root": os.fspath(self.source_dir),
+            "backend": self.project.build_backend,
+            "backend_path": self.project.backend_path,
+            "args": list(args),
+        }
+
+    def missing_requirements(self, requirements: List[str]) -> List[str]:
+        return self.worker.call("missing_requirements", requirements=list(requirements))
+
+    def get_requires_for_build(self, distribution: str) -> List[str]:
+        return list(self._call(f"get_requires_for_build_{distribution}", {}))
+
+    def prepare_metadata_for_build_wheel(self, metadata_directory: Path) -> Optional[str]:
+        return self._call("prepare_metadata_for_build_wheel", os.fspath(metadata_directory), {})
+
+    def prepare_metadata_tracked(self, metadata_directory: Path) -> Tuple[Optional[str], Dict[str, Any]]:
+        """`prepare_metadata_for_build_wheel`, with the files and directories it read."""
+        return self.worker.call_tracked(
+            "prepare_metadata_for_build_wheel", **self._request((os.fspath(metadata_directory), {}))
+        )
+
+    def build_wheel_tracked(self, wheel_directory: Path) -> Tuple[str, Dict[str, Any]]:
+        """`build_wheel`, with the files and directories it read."""
+        return self.worker.call_tracked("build_wheel", **self._request((os.fspath(wheel_directory), {}, None)))
+
+    def build_wheel(self, wheel_directory: Path, metadata_directory: Optional[Path] = None) -> str:
+        metadata = os.fspath(metadata_directory) if metadata_directory else None
+        return self._build("build_wheel", os.fspath(wheel_directory), {}, metadata)
+
+    def build_sdist(self, sdist_directory: Path) -> str:
+        return self._build("build_sdist", os.fspath(sdist_directory), {})
+
+    def _build(self, hook: str, *args: Any) -> str:
+        return self.worker.call(hook, **self._request(args), defer_compression=self.defer_compression)
@@ -1,8 +1,50 @@
 from __future__ import annotations
 
 import abc
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Protocol
+from typing import Dict, List, Optional, Tuple
+
+from .environment import BuildEnv
+from .sources import SourceTree
+
+# Environment kinds a builder can request from the pipeline
+ENV_NONE = "none"
+ENV_SHARED = "shared"
+ENV_DEDICATED = "dedicated"
+
+# Tooling installed into every shared/dedicated build environment. PEP 517
+# hooks run in a stdlib-only worker, so nothing beyond pip is needed today.
+TOOLCHAIN_REQUIREMENTS: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class EnvironmentSpec:
+    """Build environment a builder needs.
+
+    - none: the builder runs without a virtual environment
+    - shared: the toolchain environment, shared by all builders asking for it
+    - dedicated: the toolchain plus extra `requirements`
+
+    `interpreter` selects the base interpreter (default: the running one); the
+    pipeline sets it for build matrix cells.
+    """
+
+    kind: str = ENV_NONE
+    requirements: Tuple[str, ...] = ()
+    interpreter: Optional[str] = None
+
+    @classmethod
+    def none(cls) -> "EnvironmentSpec":
+        return cls(ENV_NONE)
+
+    @classmethod
+    def shared(cls) -> "EnvironmentSpec":
+        return cls(ENV_SHARED)
+
+    @classmethod
+    def dedicated(cls, *requirements: str) -> "EnvironmentSpec":
+        return cls(ENV_DEDICATED, tuple(sorted(set(requirements))))
 
 
 class Builder(abc.ABC):
@@ -10,15 +52,63 @@ class Builder(abc.ABC):
 
     Each builder implements two steps:
     - configure(project_info): ingest project metadata and prepare internal state
-    - build(output_directory): produce artifacts under the given directory
+    - build(output_directory, env): produce artifacts under the given directory
+
+    Builders declare the environment they need through `environment` (or by
+    overriding `environment_spec()` once configured). The pipeline provisions
+    it lazily and passes it to `build()`; builders needing none receive `None`.
+
+    `depends_on` names targets whose artifacts this builder consumes; the
+    scheduler runs those first when they are part of the same build, and the
+    pipeline records where their artifacts live in `dependency_outputs`. Bump
+    `version` whenever a change to the builder alters its output, so
+    incremental builds do not reuse stale artifacts; inputs outside the
+    project and config (e.g. a base image) are reported by `external_inputs()`,
+    and builders whose output does not depend on the interpreter say so in
+    `interpreter_independent()`, so that matrix cells share one build.
+
+    `sources` is the project's file listing, set by the pipeline so that
+    fingerprinting and every builder share one enumeration (see `project_sources()`).
+
+    `transient` names outputs in the output directory that are not artifacts
+    (e.g. a staged copy of the sources): they are neither recorded nor
+    cached, and a cache hit needs them still in place.
     """
 
     name: str = "builder"
+    version: str = "1"
+    environment: EnvironmentSpec = EnvironmentSpec()
+    depends_on: Tuple[str, ...] = ()
+    transient: Tuple[str, ...] = ()
+    dependency_outputs: Dict[str, Path]
+    sources: Optional[SourceTree] = None
+
+    def __init__(self) -> None:
+        self.dependency_outputs = {}
 
     @abc.abstractmethod
     def configure(self, project_info: "ProjectInfo") -> None:  # noqa: F821 (forward decl)
         ...
 
+    def environment_spec(self) -> EnvironmentSpec:
+        return self.environment
+
+    def dependency_output(self, name: str, output_directory: Path) -> Path:
+        """Artifact directory of dependency target `name` (a sibling by default)."""
+        return self.dependency_outputs.get(name, output_directory.parent / name)
+
+    def project_sources(self, project_root: Path) -> SourceTree:
+        """The shared listing of the project's files, or a fresh one outside a pipeline."""
+        return self.sources or SourceTree(project_root)
+
+    def external_inputs(self) -> List[str]:
+        """Stamps of inputs outside the project that affect this builder's output."""
+        return []
+
+    def interpreter_independent(self) -> bool:
+        """Whether every interpreter (matrix cell) gets the same output; called once configured."""
+        return False
+
     @abc.abstractmethod
-    def build(self, output_directory: Path) -> None:
+    def build(self, output_directory: Path, env: Optional[BuildEnv] = None) -> None:
         ...
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Runs with the target interpreter: on the host for binaries, in the image for Docker
+BYTECODE_SCRIPT = Path(__file__).with_name("_bytecode.py")
+INVALIDATION_MODES = ("unchecked-hash", "checked-hash", "none")
+# Where import profiles go, relative to a target's artifact directory
+REPORT_PATH = Path("reports", "importtime.json")
+_LOGGED_IMPORTS = 5
+
+
+@dataclass(frozen=True)
+class Bytecode:
+    """How the docker and binary targets precompile and profile what they install."""
+
+    # Hash-based .pyc invalidation (PEP 552); "none" leaves compiling to the installer
+    invalidation: str = "unchecked-hash"
+    # Import the entry point once under `-X importtime` and report the slowest imports
+    profile: bool = True
+    # Imports listed in the report
+    top: int = 15
+
+    def __post_init__(self) -> None:
+        if self.invalidation not in INVALIDATION_MODES:
+            raise ValueError(
+                f"Unknown bytecode invalidation {self.invalidation!r}; "
+                f"expected one of {', '.join(INVALIDATION_MODES)}"
+            )
+        if self.top < 1:
+            raise ValueError(f"Bytecode report size must be at least 1, not {self.top}")
+
+    @property
+    def compiles(self) -> bool:
+        return self.invalidation != "none"
+
+
+def compile_tree(python: Path, paths: Sequence[Path], invalidation: str, base: Path) -> List[str]:
+    """Byte-compile the .py files under `paths` next to their sources with `python`.
+
+    Returns the .pyc files written or already current, relative to `base`.
+    """
+    proc = subprocess.run(  # noqa: S603
+        [
+            os.fspath(python), os.fspath(BYTECODE_SCRIPT), "compile", "--invalidation-mode", invalidation,
+            "--base", os.fspath(base), "--json", *(os.fspath(p) for p in paths),
+        ],
+        capture_output=True,
+        check=False,
+    )
+    for line in proc.stderr.decode("utf-8", "replace").splitlines():
+        logger.info("%s", line)
+    if proc.returncode:
+        raise RuntimeError(f"Byte-compiling {base} failed with exit status {proc.returncode}")
+    return json.loads(proc.stdout)
+
+
+def profile_imports(
+    python: Path, command: Sequence[str], top: int, env: Optional[Mapping[str, str]] = None
+) -> Dict[str, Any]:
+    """Run `command` once under `-X importtime` (see `_bytecode.profile`) and return its report."""
+    proc = subprocess.run(  # noqa: S603
+        [os.fspath(python), os.fspath(BYTECODE_SCRIPT), "profile", "--top", str(top), "--", *command],
+        env=dict(env) if env is not None else None,
+        capture_output=True,
+        check=False,
+    )
+    if proc.returncode:
+        raise RuntimeError(f"Profiling imports failed: {proc.stderr.decode('utf-8', 'replace').strip()}")
+    return json.loads(proc.stdout)
+
+
+def log_report(report: Mapping[str, Any], label: str, path: Optional[Path] = None) -> None:
+    """Log the slowest imports of `report` and write it to `path` as JSON."""
+    logger.info(
+        "Import profile of %s: %.1f ms to reach main, %.1f ms importing %d module(s)",
+        label, report["total_ms"], report["imports_ms"], report["modules"],
+    )
+    for row in report["slowest_cumulative"][:_LOGGED_IMPORTS]:
+        logger.info("  %8.1f ms  %s (%.1f ms self)", row["cumulative_ms"], row["module"], row["self_ms"])
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        os.replace(tmp, path)
+        logger.info("Wrote the import profile of %s to %s", label, path)
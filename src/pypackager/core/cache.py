@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+
+def user_cache_dir() -> Path:
+    """Return the per-user cache root for pypackager.
+
+    `PYPACKAGER_CACHE_DIR` overrides the platform default.
+    """
+    override = os.environ.get("PYPACKAGER_CACHE_DIR")
+    if override:
+        return Path(override).expanduser()
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or str(Path.home() / "AppData" / "Local")
+        return Path(base) / "pypackager" / "Cache"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / "pypackager"
+    base = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(base) / "pypackager"
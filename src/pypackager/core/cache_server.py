@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+from .remote_cache import CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# The only keys clients use; anything else is refused
+_KEY = re.compile(r"^/(?:ac/[0-9a-f]{64}\.json|cas/[0-9a-f]{2}/[0-9a-f]{64})$")
+# Largest value accepted by PUT
+MAX_UPLOAD = 8 << 30
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "CacheServer"
+    protocol_version = "HTTP/1.1"
+
+    def _path(self) -> Optional[Path]:
+        if not _KEY.match(self.path):
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return None
+        token = self.server.token
+        if token and self.headers.get("Authorization") != f"Bearer {token}":
+            self.send_error(HTTPStatus.UNAUTHORIZED)
+            return None
+        return self.server.root / self.path.lstrip("/")
+
+    def _send_file(self, head: bool) -> None:
+        path = self._path()
+        if path is None:
+            return
+        try:
+            fh = open(path, "rb")
+        except FileNotFoundError:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        with fh:
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.fstat(fh.fileno()).st_size))
+            self.end_headers()
+            if not head:
+                shutil.copyfileobj(fh, self.wfile, CHUNK_SIZE)
+
+    def do_GET(self) -> None:  # noqa: N802
+        self._send_file(head=False)
+
+    def do_HEAD(self) -> None:  # noqa: N802
+        self._send_file(head=True)
+
+    def do_PUT(self) -> None:  # noqa: N802
+        path = self._path()
+        if path is None:
+            return
+        try:
+            remaining = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self.send_error(HTTPStatus.LENGTH_REQUIRED)
+            return
+        if not 0 <= remaining <= MAX_UPLOAD:
+            self.send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        digest = hashlib.sha256()
+        try:
+            with open(tmp, "wb") as out:
+                while remaining:
+                    chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ConnectionError("Upload ended early")
+                    digest.update(chunk)
+                    out.write(chunk)
+                    remaining -= len(chunk)
+            # Blobs are addressed by their content; refuse corrupt uploads
+            if path.parent.parent.name == "cas" and digest.hexdigest() != path.name:
+                self.send_error(HTTPStatus.BAD_REQUEST, "Content does not match its SHA-256")
+                return
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Failed to store %s: %s", self.path, e)
+            self.close_connection = True
+            return
+        finally:
+            tmp.unlink(missing_ok=True)
+        self.send_response(HTTPStatus.CREATED)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+class CacheServer(ThreadingHTTPServer):
+    """A minimal remote cache: stores what clients PUT under `root`, serves it back.
+
+    Meant for a handful of runners on a trusted network (optionally behind a
+    bearer token); anything larger should put the same layout behind a real
+    web server or object store.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, root: Path, bind: str = "127.0.0.1", port: int = 8765, token: Optional[str] = None) -> None:
+        self.root = root
+        self.token = token
+        root.mkdir(parents=True, exist_ok=True)
+        super().__init__((bind, port), _Handler)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
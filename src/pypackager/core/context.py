@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import stat
+import tarfile
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import tomllib  # Python 3.11+
+except ModuleNotFoundError:  # pragma: no cover - fallback
+    import tomli as tomllib  # type: ignore
+
+from packaging.utils import canonicalize_name
+
+from .project import ProjectInfo
+from .sources import SourceTree, walk_files
+
+logger = logging.getLogger(__name__)
+
+# Root files every backend may read while building the project
+METADATA_FILES = {"pyproject.toml", "setup.py", "setup.cfg", "MANIFEST.in", "pypackager.lock"}
+METADATA_PREFIXES = ("README", "LICENSE", "LICENCE", "COPYING", "NOTICE", "AUTHORS")
+# Root directories that are never packages, as in setuptools' flat-layout discovery
+NON_PACKAGE_DIRS = {
+    "tests", "test", "docs", "doc", "examples", "example", "benchmarks",
+    "scripts", "tools", "tasks", "fixtures", "data",
+}
+
+
+def _declared_files(pyproject: Path) -> List[str]:
+    """Readme and license paths/globs declared in pyproject.toml."""
+    try:
+        project = tomllib.loads(pyproject.read_text(encoding="utf-8")).get("project") or {}
+    except (OSError, tomllib.TOMLDecodeError):
+        return []
+    declared = []
+    readme = project.get("readme")
+    if isinstance(readme, str):
+        declared.append(readme)
+    elif isinstance(readme, dict) and readme.get("file"):
+        declared.append(readme["file"])
+    license_ = project.get("license")
+    if isinstance(license_, dict) and license_.get("file"):
+        declared.append(license_["file"])
+    license_files = project.get("license-files")
+    if isinstance(license_files, list):
+        declared.extend(str(p) for p in license_files)
+    return declared
+
+
+def project_files(
+    project: ProjectInfo, include: Iterable[str] = (), sources: Optional[SourceTree] = None
+) -> Dict[str, Path]:
+    """The files a build backend needs to build `project`, by relative path.
+
+    That is the packaging metadata, the `src/` tree or the root-level packages
+    and modules of a flat layout, the backend path, declared readme/license
+    files and any `include` globs. Tests, data and other untracked bulk stay
+    out. Files come from `sources` (the build's shared listing, so in a git
+    checkout only tracked and unignored ones), except those matched by
+    `include`, which are taken as found.
+    """
+    root = project.root
+    name = canonicalize_name(project.name)
+    backend_dirs = {p.strip("/") for p in project.backend_path if p.strip("/.")}
+    listing = sorted(sources if sources is not None else SourceTree(root))
+    paths = {file.path for file in listing}
+    top_dirs = {path.partition("/")[0] for path in paths if "/" in path}
+    packages = {
+        directory for directory in top_dirs
+        if directory == "src"
+        or directory in backend_dirs
+        or (
+            directory not in NON_PACKAGE_DIRS
+            and (f"{directory}/__init__.py" in paths or canonicalize_name(directory) == name)
+        )
+    }
+    nested = tuple(f"{d}/" for d in backend_dirs if "/" in d)
+    # Metadata is always sent, even when derived (the lockfile) or untracked
+    files = {filename: root / filename for filename in sorted(METADATA_FILES) if (root / filename).is_file()}
+    for file in listing:
+        top, sep, _rest = file.path.partition("/")
+        if not sep:
+            if top.upper().startswith(METADATA_PREFIXES) or top.endswith(".py"):
+                files[top] = root / top
+        elif top in packages or file.path.startswith(nested):
+            files[file.path] = root / file.path
+    for pattern in [*_declared_files(root / "pyproject.toml"), *include]:
+        for path in sorted(root.glob(pattern)):
+            rel = path.relative_to(root).as_posix()
+            if path.is_dir():
+                files.update((f"{rel}/{file.path}", path / file.path) for file in walk_files(path))
+            elif path.is_file():
+                files[rel] = path
+    return files
+
+
+class BuildContext:
+    """An exact, ordered set of files to send as a `docker build` context.
+
+    Entries map archive names to files on disk. The context is either staged as
+    a directory of hardlinks (copies across filesystems) or streamed file by
+    file into a deterministic tarball: sorted entries, zeroed timestamps and
+    ownership, and modes reduced to 0644/0755.
+    """
+
+    def __init__(self) -> None:
+        self._files: Dict[str, Path] = {}
+
+    def add(self, arcname: str, path: Path) -> None:
+        self._files[arcname] = path
+
+    def update(self, files: Dict[str, Path]) -> None:
+        self._files.update(files)
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def entries(self) -> List[Tuple[str, Path]]:
+        return sorted(self._files.items())
+
+    @property
+    def size(self) -> int:
+        return sum(path.stat().st_size for path in self._files.values())
+
+    def stage(self, directory: Path) -> None:
+        """Recreate `directory` with a hardlink to every entry."""
+        if directory.exists():
+            shutil.rmtree(directory)
+        for arcname, path in self.entries():
+            target = directory / arcname
+            target.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copy2(path, target)
+
+    def write_tar(self, fileobj: BinaryIO) -> None:
+        """Stream the context as an uncompressed tarball to `fileobj`."""
+        with tarfile.open(fileobj=fileobj, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+            for arcname, path in self.entries():
+                st = path.stat()
+                info = tarfile.TarInfo(arcname)
+                info.size = st.st_size
+                info.mode = 0o755 if st.st_mode & stat.S_IXUSR else 0o644
+                info.mtime = 0
+                info.uid = info.gid = 0
+                info.uname = info.gname = ""
+                with open(path, "rb") as fh:
+                    tar.addfile(info, fh)
@@ -0,0 +1,476 @@
+from __future__ import annotations
+
+import contextvars
+import gc
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from .. import __version__
+from .cache import user_cache_dir
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .envpool import EnvironmentProvider
+    from .pipeline import Pipeline
+
+logger = logging.getLogger(__name__)
+
+# The client half of this module runs on every `pypackager build`; the
+# pipeline stack is only imported by the daemon itself.
+
+PROTOCOL_VERSION = 1
+DEFAULT_IDLE_TIMEOUT = 30 * 60.0
+DEFAULT_MAX_MEMORY = 1024 * 1024 * 1024
+DEFAULT_MAX_PROJECTS = 16
+# Variables that change what a build does; the daemon serves only clients that agree
+_ENV_PREFIXES = ("PYPACKAGER_", "PIP_", "DOCKER_")
+_ENV_NAMES = ("PYTHONPATH", "SOURCE_DATE_EPOCH")
+_ENV_IGNORED = ("PYPACKAGER_NO_DAEMON", "PYPACKAGER_SOCKET")
+# sun_path is 108 bytes on Linux, 104 on macOS
+_MAX_SOCKET_PATH = 100
+
+
+class DaemonUnavailable(RuntimeError):
+    """No daemon is listening, or it cannot serve this client."""
+
+
+def default_socket_path() -> Path:
+    """Socket of the daemon for this interpreter and pypackager version.
+
+    `PYPACKAGER_SOCKET` overrides it.
+    """
+    override = os.environ.get("PYPACKAGER_SOCKET")
+    if override:
+        return Path(override).expanduser()
+    key = hashlib.sha256(f"{sys.executable}\0{__version__}".encode("utf-8")).hexdigest()[:12]
+    path = user_cache_dir() / "daemon" / f"{key}.sock"
+    if len(os.fsencode(path)) > _MAX_SOCKET_PATH:
+        uid = os.getuid() if hasattr(os, "getuid") else 0
+        path = Path(tempfile.gettempdir()) / f"pypackager-{uid}-{key}.sock"
+    return path
+
+
+def environment_fingerprint(environ: Optional[Dict[str, str]] = None) -> str:
+    environ = dict(os.environ if environ is None else environ)
+    relevant = sorted(
+        (k, v) for k, v in environ.items()
+        if (k.startswith(_ENV_PREFIXES) or k in _ENV_NAMES) and k not in _ENV_IGNORED
+    )
+    return hashlib.sha256(json.dumps(relevant).encode("utf-8")).hexdigest()
+
+
+def _send(wfile: Any, message: Dict[str, Any]) -> None:
+    wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+    wfile.flush()
+
+
+def _connect(path: Path, timeout: Optional[float] = 2.0) -> socket.socket:
+    if not hasattr(socket, "AF_UNIX"):
+        raise DaemonUnavailable("Unix domain sockets are not supported on this platform")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(os.fspath(path))
+    except OSError as e:
+        sock.close()
+        raise DaemonUnavailable(f"No build daemon at {path}: {e.strerror or e}") from None
+    return sock
+
+
+def request(message: Dict[str, Any], path: Optional[Path] = None) -> int:
+    """Send `message` to the daemon and replay its log records locally until it exits.
+
+    Returns the exit status of the request. Raises `DaemonUnavailable` when
+    no daemon is listening or it refuses the request (e.g. because its
+    environment differs from ours), in which case nothing was done.
+    """
+    path = path or default_socket_path()
+    sock = _connect(path)
+    message = {
+        "protocol": PROTOCOL_VERSION,
+        "version": __version__,
+        "executable": sys.executable,
+        "environment": environment_fingerprint(),
+        **message,
+    }
+    with sock, sock.makefile("rb") as rfile, sock.makefile("wb") as wfile:
+        try:
+            _send(wfile, message)
+            # The first reply comes once the request is accepted; logs stream afterwards
+            first = rfile.readline()
+        except OSError as e:
+            raise DaemonUnavailable(f"Build daemon at {path} did not answer: {e}") from None
+        if not first:
+            raise DaemonUnavailable(f"Build daemon at {path} closed the connection")
+        reply = json.loads(first)
+        if "refused" in reply:
+            raise DaemonUnavailable(reply["refused"])
+        sock.settimeout(None)
+        logger.debug("Forwarded %s to the build daemon (pid %s)", message.get("command"), reply.get("pid"))
+        for line in rfile:
+            reply = json.loads(line)
+            if "log" in reply:
+                record = logging.makeLogRecord(reply["log"])
+                logging.getLogger(record.name).handle(record)
+            elif "exit" in reply:
+                return int(reply["exit"])
+    logger.error("Lost the connection to the build daemon at %s", path)
+    return 1
+
+
+def stop(path: Optional[Path] = None) -> bool:
+    """Ask the daemon at `path` to shut down once its builds finish; False if none is running."""
+    try:
+        return request({"command": "shutdown"}, path) == 0
+    except DaemonUnavailable:
+        return False
+
+
+# -- Daemon -----------------------------------------------------------------
+
+
+class _Client:
+    """One connection: log records of its request are streamed back to it."""
+
+    def __init__(self, wfile: Any, level: int) -> None:
+        self.level = level
+        self._wfile = wfile
+        self._lock = threading.Lock()
+        self.gone = False
+
+    def send(self, message: Dict[str, Any]) -> None:
+        with self._lock:
+            if self.gone:
+                return
+            try:
+                _send(self._wfile, message)
+            except OSError:
+                # The build carries on; only its output is lost
+                self.gone = True
+
+
+_client: contextvars.ContextVar[Optional[_Client]] = contextvars.ContextVar("pypackager_daemon_client", default=None)
+
+
+class _ForwardHandler(logging.Handler):
+    """Send each record to the client whose request (context) emitted it."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        client = _client.get()
+        if client is None or record.levelno < client.level:
+            return
+        fields: Dict[str, Any] = {
+            "name": record.name,
+            "levelno": record.levelno,
+            "levelname": record.levelname,
+            "msg": record.getMessage(),
+            "created": record.created,
+        }
+        if record.exc_info:
+            fields["exc_text"] = logging.Formatter().formatException(record.exc_info)
+        trace = getattr(record, "trace", None)
+        if trace:
+            fields["trace"] = trace
+        client.send({"log": fields})
+
+
+def _rss() -> int:
+    """Current resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        # Peak rather than current RSS; KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _config_stamp(project_root: Path, config_path: Optional[Path]) -> Tuple:
+    from ..config import DEFAULT_CONFIG_FILENAMES
+
+    stamps = []
+    for path in [config_path] if config_path else [project_root / n for n in DEFAULT_CONFIG_FILENAMES]:
+        try:
+            st = path.stat()
+            stamps.append((os.fspath(path), st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamps.append((os.fspath(path), None, None))
+    return tuple(stamps)
+
+
+@dataclass
+class _Project:
+    pipeline: "Pipeline"
+    config_stamp: Tuple
+    # Shared by every cached entry of one project root: they write the same dist/
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class BuildDaemon:
+    """Serve build requests over a Unix domain socket, keeping state warm between them.
+
+    Each project keeps its `Pipeline` (scan, lockfile and builder registry),
+    and all projects share the environment providers, so build environments
+    and PEP 517 workers outlive individual builds. Builds of one project root
+    are serialized, whatever their config; different projects build
+    concurrently. The daemon exits after
+    `idle_timeout` seconds without requests, and sheds cached projects (or
+    exits) when its resident memory exceeds `max_memory` bytes.
+    """
+
+    def __init__(
+        self,
+        socket_path: Optional[Path] = None,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        max_memory: int = DEFAULT_MAX_MEMORY,
+        max_projects: int = DEFAULT_MAX_PROJECTS,
+    ) -> None:
+        self.socket_path = socket_path or default_socket_path()
+        self.idle_timeout = idle_timeout
+        self.max_memory = max_memory
+        self.max_projects = max_projects
+        self.environment = environment_fingerprint()
+        self._projects: Dict[Tuple[str, str, bool], _Project] = {}
+        self._providers: Dict[bool, "EnvironmentProvider"] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._active = 0
+        self._last_request = time.monotonic()
+        # Log levels asked for by the clients being served; the root logger runs at the lowest
+        self._base_level = logging.WARNING
+        self._client_levels: List[int] = []
+        self._threads: List[threading.Thread] = []
+
+    def serve(self) -> None:
+        """Listen until stopped, idle for too long, or over the memory bound."""
+        from .locking import FileLock
+
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        lock = FileLock(self.socket_path.with_name(self.socket_path.name + ".lock"))
+        if not lock.acquire(blocking=False):
+            raise RuntimeError(f"A build daemon is already running for {self.socket_path}")
+        root = logging.getLogger()
+        self._base_level = root.level
+        # The daemon's own output keeps its level when clients ask for more detail
+        for handler in root.handlers:
+            if handler.level == logging.NOTSET:
+                handler.setLevel(root.level)
+        forward = _ForwardHandler()
+        root.addHandler(forward)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # We hold the lock, so an existing socket is left over from a crash
+            self.socket_path.unlink(missing_ok=True)
+            server.bind(os.fspath(self.socket_path))
+            os.chmod(self.socket_path, 0o600)
+            server.listen(16)
+            server.settimeout(1.0)
+            self._install_signal_handlers()
+            logger.info("Build daemon %d listening on %s", os.getpid(), self.socket_path)
+            while not self._stop.is_set():
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    self._check_idle()
+                    continue
+                thread = threading.Thread(target=self._serve_connection, args=(conn,), name="pypackager-client")
+                thread.start()
+                self._threads = [t for t in self._threads if t.is_alive()] + [thread]
+        finally:
+            server.close()
+            self.socket_path.unlink(missing_ok=True)
+            for thread in self._threads:
+                thread.join()
+            self._close()
+            root.removeHandler(forward)
+            lock.release()
+            logger.info("Build daemon %d stopped", os.getpid())
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _install_signal_handlers(self) -> None:
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: self.stop())
+
+    def _check_idle(self) -> None:
+        with self._lock:
+            idle = self._active == 0 and time.monotonic() - self._last_request > self.idle_timeout
+        if self.idle_timeout > 0 and idle:
+            logger.info("No requests for %.0fs; shutting down", self.idle_timeout)
+            self.stop()
+
+    def _serve_connection(self, conn: socket.socket) -> None:
+        with conn, conn.makefile("rb") as rfile, conn.makefile("wb") as wfile:
+            try:
+                line = rfile.readline()
+                message = json.loads(line) if line else None
+            except (OSError, ValueError) as e:
+                logger.warning("Dropping malformed request: %s", e)
+                return
+            if not message:
+                return
+            reason = self._refusal(message)
+            try:
+                if reason:
+                    _send(wfile, {"refused": reason})
+                    return
+                _send(wfile, {"accepted": True, "pid": os.getpid()})
+            except OSError:
+                return
+            client = _Client(wfile, int(message.get("level", logging.INFO)))
+            with self._lock:
+                self._active += 1
+                self._last_request = time.monotonic()
+                self._client_levels.append(client.level)
+                self._set_root_level()
+            token = _client.set(client)
+            try:
+                status = self._dispatch(message)
+            finally:
+                _client.reset(token)
+                with self._lock:
+                    self._active -= 1
+                    self._last_request = time.monotonic()
+                    self._client_levels.remove(client.level)
+                    self._set_root_level()
+            client.send({"exit": status})
+        self._enforce_memory()
+
+    def _set_root_level(self) -> None:
+        """Let through what the most verbose client being served asked for; caller holds the lock."""
+        logging.getLogger().setLevel(min([self._base_level, *self._client_levels]))
+
+    def _refusal(self, message: Dict[str, Any]) -> Optional[str]:
+        if message.get("protocol") != PROTOCOL_VERSION or message.get("version") != __version__:
+            return f"the daemon runs pypackager {__version__} (protocol {PROTOCOL_VERSION})"
+        if message.get("command") == "shutdown":
+            return None
+        if message.get("executable") != sys.executable:
+            return f"the daemon runs under {sys.executable}"
+        if message.get("environment") != self.environment:
+            return "the daemon was started with different PYPACKAGER_/PIP_ environment variables"
+        if self._stop.is_set():
+            return "the daemon is shutting down"
+        return None
+
+    def _dispatch(self, message: Dict[str, Any]) -> int:
+        command = message.get("command")
+        if command == "shutdown":
+            logger.info("Shutdown requested; finishing running builds")
+            self.stop()
+            return 0
+        if command == "build":
+            return self._build(message)
+        logger.error("Unknown daemon command: %s", command)
+        return 2
+
+    def _build(self, message: Dict[str, Any]) -> int:
+        from .scheduler import BuildFailed
+        from .wheelhouse import WheelhouseMissing
+
+        project_root = Path(message["project"])
+        config_path = Path(message["config"]) if message.get("config") else None
+        output_dir = Path(message["output"]) if message.get("output") else project_root / "dist"
+        offline = bool(message.get("offline"))
+        try:
+            project = self._project(project_root, config_path, offline)
+            if project.lock.locked():
+                logger.info("Waiting for another build of %s", project_root)
+            with project.lock:
+                stamp = _config_stamp(project_root, config_path)
+                if stamp != project.config_stamp:
+                    from ..config import load_config
+
+                    project.pipeline.config = load_config(project_root, config_path)
+                    project.config_stamp = stamp
+                assert project.pipeline.config is not None
+                targets = message.get("targets") or project.pipeline.config.targets
+                project.pipeline.run(
+                    targets=targets, output_dir=output_dir, jobs=message.get("jobs"), force=bool(message.get("force"))
+                )
+                project.last_used = time.monotonic()
+        except (BuildFailed, WheelhouseMissing) as exc:
+            logging.getLogger("pypackager").error("%s", exc)
+            return 1
+        except Exception as exc:
+            logging.getLogger("pypackager").error("Build failed: %s", exc)
+            logger.debug("Build of %s traceback", project_root, exc_info=True)
+            return 1
+        return 0
+
+    def _project(self, project_root: Path, config_path: Optional[Path], offline: bool) -> _Project:
+        from ..config import load_config
+        from .envpool import EnvironmentPool, EnvironmentProvider
+        from .pipeline import Pipeline
+        from .wheelhouse import Wheelhouse
+
+        key = (os.fspath(project_root), os.fspath(config_path or ""), offline)
+        with self._lock:
+            project = self._projects.get(key)
+            if project is not None:
+                return project
+            provider = self._providers.get(offline)
+            if provider is None:
+                pool = EnvironmentPool(wheelhouse=Wheelhouse(offline=offline))
+                provider = self._providers[offline] = EnvironmentProvider(pool)
+        # Loading the config may fail; do it outside the lock
+        stamp = _config_stamp(project_root, config_path)
+        pipeline = Pipeline(project_root, config=load_config(project_root, config_path), provider=provider)
+        with self._lock:
+            # Other entries for this root (another config or offline mode) build into the same tree
+            lock = next((p.lock for k, p in self._projects.items() if k[0] == key[0]), None) or threading.Lock()
+            project = self._projects.setdefault(key, _Project(pipeline, stamp, lock))
+            self._evict(self.max_projects)
+        return project
+
+    def _evict(self, keep: int) -> int:
+        """Drop least recently used idle projects until at most `keep` remain; caller holds the lock."""
+        idle = sorted(
+            ((p.last_used, key) for key, p in self._projects.items() if not p.lock.locked()), reverse=True
+        )
+        dropped = 0
+        while len(self._projects) > keep and idle:
+            _, key = idle.pop()
+            del self._projects[key]
+            dropped += 1
+        return dropped
+
+    def _enforce_memory(self) -> None:
+        if self.max_memory <= 0 or _rss() <= self.max_memory:
+            return
+        with self._lock:
+            dropped = self._evict(0)
+        gc.collect()
+        rss = _rss()
+        logger.info("Memory above %d MiB; dropped %d cached project(s), now %d MiB",
+                    self.max_memory >> 20, dropped, rss >> 20)
+        if rss > self.max_memory:
+            logger.warning("Still above the memory bound; shutting down so the next build starts fresh")
+            self.stop()
+
+    def _close(self) -> None:
+        from .backend import shutdown_workers
+
+        with self._lock:
+            self._projects.clear()
+            providers = list(self._providers.values())
+            self._providers.clear()
+        for provider in providers:
+            provider.close()
+        shutdown_workers()
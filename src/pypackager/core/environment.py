@@ -1,16 +1,45 @@
 from __future__ import annotations
 
 import logging
+import os
+import platform as host_platform
 import shutil
 import tempfile
 from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
 import subprocess
 import sys
 import venv
+from typing import TYPE_CHECKING, Iterable, List, Optional, Sequence
+
+from packaging import tags
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import parse_wheel_filename
+
+from . import process
+from .cache import user_cache_dir
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .wheelhouse import Wheelhouse
 
 logger = logging.getLogger(__name__)
 
+INSTALLER_SCRIPT = Path(__file__).with_name("_wheel_installer.py")
+# Same as `_wheel_installer.EXIT_UNSUPPORTED`
+_EXIT_UNSUPPORTED = 3
+DEFAULT_UNPACKED_MAX_BYTES = 2 * 1024 ** 3
+# OCI architectures, by the machine name in wheel platform tags
+_MACHINES = {
+    "amd64": "x86_64", "386": "i686", "arm64": "aarch64", "arm64/v8": "aarch64", "arm/v7": "armv7l",
+    "ppc64le": "ppc64le", "s390x": "s390x",
+}
+# glibc minor versions of manylinux: the oldest accepted (manylinux2014) and the
+# newest assumed when the host has no glibc to go by
+_MANYLINUX_OLDEST = 17
+_MANYLINUX_DEFAULT = 28
+_MANYLINUX_LEGACY = {17: "manylinux2014", 12: "manylinux2010", 5: "manylinux1"}
+
 
 class _EnvBuilder(venv.EnvBuilder):
     def post_setup(self, context) -> None:  # type: ignore[override]
@@ -21,6 +50,211 @@ class _EnvBuilder(venv.EnvBuilder):
             logger.warning("pip not available in venv at %s", context.env_dir)
 
 
+def env_python(env_path: Path) -> Path:
+    """Return the interpreter path inside a virtual environment."""
+    if os.name == "nt":
+        return env_path / "Scripts" / "python.exe"
+    return env_path / "bin" / "python"
+
+
+def install_wheels(
+    python: Path, wheels: Sequence[Path], target: Optional[Path] = None, compile: bool = False
+) -> bool:
+    """Install resolved `wheels` with pypackager's parallel installer; False when pip must do it.
+
+    Files are hardlinked from a shared cache of unpacked wheels in the user
+    cache. `PYPACKAGER_INSTALLER=pip` turns the installer off.
+    """
+    if not wheels or os.environ.get("PYPACKAGER_INSTALLER", "").lower() == "pip":
+        return False
+    max_bytes = int(os.environ.get("PYPACKAGER_UNPACKED_MAX_BYTES", DEFAULT_UNPACKED_MAX_BYTES))
+    args = [
+        python, INSTALLER_SCRIPT, "--cache", user_cache_dir() / "unpacked", "--cache-max-bytes", str(max_bytes),
+    ]
+    if target is not None:
+        args.extend(["--target", target])
+    if compile:
+        args.append("--compile")
+    try:
+        process.run([*args, *wheels])
+    except subprocess.CalledProcessError as e:
+        if e.returncode != _EXIT_UNSUPPORTED:
+            raise
+        logger.info("Falling back to pip for %d wheel(s)", len(wheels))
+        return False
+    return True
+
+
+def platform_tags(platform: str) -> List[str]:
+    """pip `--platform` tags for the OCI platform `os/architecture[/variant]`, most preferred first.
+
+    Only Linux is supported. manylinux tags run from the host's glibc version
+    (2.28 on hosts without glibc) down to manylinux2014.
+    """
+    os_name, _, arch = platform.partition("/")
+    machine = _MACHINES.get(arch)
+    if os_name != "linux" or machine is None:
+        raise ValueError(f"Cannot select wheels for platform {platform!r}; expected linux/<{'|'.join(_MACHINES)}>")
+    libc, version = host_platform.libc_ver()
+    newest = int(version.split(".")[1]) if libc == "glibc" and version.count(".") >= 1 else _MANYLINUX_DEFAULT
+    minors = list(range(max(newest, _MANYLINUX_OLDEST), _MANYLINUX_OLDEST - 1, -1))
+    if machine in ("x86_64", "i686"):
+        minors.extend([12, 5])
+    platforms = []
+    for minor in minors:
+        platforms.append(f"manylinux_2_{minor}_{machine}")
+        if minor in _MANYLINUX_LEGACY:
+            platforms.append(f"{_MANYLINUX_LEGACY[minor]}_{machine}")
+    return platforms
+
+
+def _supported_tags(
+    python: Path, python_version: Optional[str], platforms: Optional[Sequence[str]] = None
+) -> Optional[List[tags.Tag]]:
+    """Wheel tags `python` accepts, most preferred first; None if only pip can tell.
+
+    With `python_version` these are the tags of that CPython version on this
+    platform, as for `pip --python-version`, or on `platforms` (see
+    `platform_tags`) as for `pip --implementation cp --platform`.
+    """
+    if platforms is not None:
+        assert python_version is not None
+        version = tuple(int(part) for part in python_version.split(".")[:2])
+        return [
+            *tags.cpython_tags(version, platforms=platforms),
+            *tags.compatible_tags(version, interpreter=f"cp{version[0]}{version[1]}", platforms=platforms),
+        ]
+    if python_version is not None:
+        if tags.interpreter_name() != "cp":
+            return None
+        version = tuple(int(part) for part in python_version.split(".")[:2])
+        return [*tags.cpython_tags(version), *tags.compatible_tags(version)]
+    from .wheelhouse import _interpreter_tag
+
+    if _interpreter_tag(os.fspath(python)) != _interpreter_tag(sys.executable):
+        return None
+    return list(tags.sys_tags())
+
+
+def _locked_wheels(
+    python: Path,
+    requirements: Sequence[str],
+    wheelhouse: Optional["Wheelhouse"],
+    python_version: Optional[str],
+    platforms: Optional[Sequence[str]] = None,
+) -> Optional[List[Path]]:
+    """Wheels for `requirements` given as exact pins or wheel paths; None when pip must pick them."""
+    if wheelhouse is None:
+        return None
+    supported = _supported_tags(python, python_version, platforms)
+    if supported is None:
+        return None
+    paths: List[Path] = []
+    pins = []
+    for req in requirements:
+        if req.endswith(".whl") and Path(req).is_file():
+            # pip rejects a wheel for another platform; leave that to it
+            if not parse_wheel_filename(Path(req).name)[3] & set(supported):
+                return None
+            paths.append(Path(req))
+            continue
+        try:
+            parsed = Requirement(req)
+        except InvalidRequirement:
+            return None
+        if parsed.marker is not None:
+            # Markers are evaluated here for the running interpreter only
+            if python_version is not None:
+                return None
+            if not parsed.marker.evaluate():
+                continue
+        specs = list(parsed.specifier)
+        if parsed.url or len(specs) != 1 or specs[0].operator != "==" or "*" in specs[0].version:
+            return None
+        pins.append((parsed.name, specs[0].version))
+    found = wheelhouse.find(pins, supported)
+    return None if found is None else [*found, *paths]
+
+
+def pip_install(
+    python: Path,
+    requirements: Iterable[str],
+    wheelhouse: Optional["Wheelhouse"] = None,
+    upgrade: bool = False,
+) -> None:
+    """pip-install `requirements` with `python`, from the wheelhouse when given.
+
+    When the wheelhouse knows what the requirements resolve to (see
+    `Wheelhouse.resolved`), those wheels are installed directly instead.
+    """
+    reqs = list(requirements)
+    if not reqs:
+        return
+    args = [python, "-m", "pip", "install", "--disable-pip-version-check"]
+    if upgrade:
+        args.append("--upgrade")
+    if wheelhouse is not None:
+        wheelhouse.ensure(reqs, os.fspath(python))
+        wheels = wheelhouse.resolved(reqs, os.fspath(python))
+        if wheels is not None and install_wheels(python, wheels, compile=True):
+            return
+        args.extend(wheelhouse.install_args())
+    process.run([*args, *reqs])
+
+
+def pip_install_target(
+    python: Path,
+    target: Path,
+    requirements: Iterable[str],
+    wheelhouse: Optional["Wheelhouse"] = None,
+    python_version: Optional[str] = None,
+    platforms: Optional[Sequence[str]] = None,
+) -> None:
+    """Install `requirements` (exact pins or wheel paths) into the directory `target`, pip-style.
+
+    Dependencies are not resolved; pass the full locked set. Only the
+    wheelhouse is consulted when one is given; when it has a wheel for every
+    pin they are installed directly, else by pip. `python_version` installs
+    binary wheels for that Python version instead of `python`'s, and
+    `platforms` (pip platform tags, with `python_version`) binary CPython
+    wheels for another platform.
+    """
+    reqs = list(requirements)
+    if not reqs:
+        return
+    wheels = _locked_wheels(python, reqs, wheelhouse, python_version, platforms)
+    if wheels is not None and install_wheels(python, wheels, target=target):
+        return
+    args = [
+        python, "-m", "pip", "install", "--disable-pip-version-check",
+        "--no-compile", "--no-warn-script-location", "--no-deps", "--target", target,
+    ]
+    if python_version is not None:
+        args.extend(["--only-binary", ":all:", "--python-version", python_version])
+    if platforms:
+        args.extend(["--implementation", "cp"])
+        for platform in platforms:
+            args.extend(["--platform", platform])
+    if wheelhouse is not None:
+        args.extend(wheelhouse.install_args())
+    process.run([*args, *reqs])
+
+
+@dataclass(frozen=True)
+class BuildEnv:
+    """A provisioned virtual environment handed to builders."""
+
+    path: Path
+    wheelhouse: Optional["Wheelhouse"] = None
+
+    @property
+    def python(self) -> Path:
+        return env_python(self.path)
+
+    def install(self, requirements: Iterable[str]) -> None:
+        pip_install(self.python, requirements, self.wheelhouse)
+
+
 @contextmanager
 def isolated_env() -> Path:
     """Create an ephemeral isolated virtual environment and yield its path.
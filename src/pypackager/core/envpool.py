@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import venv
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import process, tracing
+from .builder import ENV_NONE, TOOLCHAIN_REQUIREMENTS, EnvironmentSpec
+from .cache import user_cache_dir
+from .environment import BuildEnv, env_python, pip_install
+from .locking import FileLock
+from .wheelhouse import Wheelhouse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+_META = "pool.json"
+
+
+@functools.lru_cache(maxsize=None)
+def _interpreter_version(interpreter: str) -> str:
+    if os.path.realpath(interpreter) == os.path.realpath(sys.executable):
+        return sys.version.split()[0]
+    out = subprocess.check_output(  # noqa: S603
+        [interpreter, "-c", "import sys; print(sys.version.split()[0])"], text=True
+    )
+    return out.strip()
+
+
+def _site_packages(env_path: Path) -> List[Path]:
+    if os.name == "nt":
+        return [env_path / "Lib" / "site-packages"]
+    return sorted(env_path.glob("lib/python*/site-packages"))
+
+
+def _snapshot(env_path: Path) -> List[str]:
+    """Names of installed top-level entries; used to detect dirtied envs."""
+    entries: List[str] = []
+    scripts = env_python(env_path).parent
+    for directory in [*_site_packages(env_path), scripts]:
+        if directory.is_dir():
+            entries.extend(f"{directory.name}/{e.name}" for e in os.scandir(directory) if e.name != "__pycache__")
+    return sorted(entries)
+
+
+def _tree_size(path: Path) -> int:
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class EnvironmentPool:
+    """Persistent pool of warm virtual environments in the user cache.
+
+    Entries are keyed by interpreter (path and version) plus a hash of the tool
+    requirements installed into them. Each key holds one or more slots; a slot
+    is checked out for exclusive use behind a file lock, so concurrent builds
+    (threads or processes) each get their own environment. Slots whose contents
+    changed during a build are rebuilt on next checkout, and least recently used
+    slots are evicted once the pool exceeds its size budget.
+    """
+
+    def __init__(
+        self,
+        root: Optional[Path] = None,
+        max_bytes: Optional[int] = None,
+        wheelhouse: Optional[Wheelhouse] = None,
+    ) -> None:
+        self.root = root or (user_cache_dir() / "envs")
+        self.wheelhouse = wheelhouse
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("PYPACKAGER_ENV_POOL_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key_for(requirements: Iterable[str], interpreter: Optional[str] = None) -> str:
+        interpreter = interpreter or sys.executable
+        payload = json.dumps(
+            {
+                "interpreter": os.path.realpath(interpreter),
+                "version": _interpreter_version(interpreter),
+                "requirements": sorted({r.strip() for r in requirements if r.strip()}),
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:20]
+
+    @contextmanager
+    def checkout(
+        self, requirements: Iterable[str] = (), interpreter: Optional[str] = None
+    ) -> Iterator[Path]:
+        """Check out a ready environment with `requirements` installed and yield its path."""
+        reqs = sorted({r.strip() for r in requirements if r.strip()})
+        interpreter = interpreter or sys.executable
+        key = self.key_for(reqs, interpreter)
+        slot, lock = self._claim_slot(self.root / key)
+        env_path = slot / "venv"
+        try:
+            meta = self._read_meta(slot)
+            if meta is None or meta.get("snapshot") != _snapshot(env_path):
+                if meta is not None:
+                    logger.info("Resetting dirty pooled environment %s", env_path)
+                meta = self._provision(slot, reqs, interpreter)
+                fresh = True
+            else:
+                logger.info("Reusing pooled environment %s", env_path)
+                fresh = False
+            meta["last_used"] = time.time()
+            self._write_meta(slot, meta)
+            yield env_path
+            if _snapshot(env_path) != meta["snapshot"]:
+                logger.debug("Pooled environment %s was modified; it will be reset", env_path)
+        finally:
+            lock.release()
+        if fresh:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used idle slots until the pool fits its budget."""
+        slots: List[Tuple[float, int, Path]] = []
+        total = 0
+        for key_dir in self._iter_dirs(self.root):
+            for slot in self._iter_dirs(key_dir):
+                meta = self._read_meta(slot) or {}
+                size = int(meta.get("size", 0))
+                total += size
+                slots.append((float(meta.get("last_used", 0.0)), size, slot))
+        if total <= self.max_bytes:
+            return
+        for _last_used, size, slot in sorted(slots):
+            if total <= self.max_bytes:
+                break
+            lock = FileLock(self._lock_path(slot))
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                shutil.rmtree(slot, ignore_errors=True)
+                total -= size
+                logger.info("Evicted pooled environment %s", slot)
+            finally:
+                lock.release()
+
+    def _claim_slot(self, key_dir: Path) -> Tuple[Path, FileLock]:
+        index = 0
+        while True:
+            slot = key_dir / str(index)
+            lock = FileLock(self._lock_path(slot))
+            if lock.acquire(blocking=False):
+                return slot, lock
+            index += 1
+
+    def _provision(self, slot: Path, requirements: List[str], interpreter: str) -> Dict[str, object]:
+        if slot.exists():
+            shutil.rmtree(slot)
+        env_path = slot / "venv"
+        started = time.perf_counter()
+        with tracing.span("venv create", "environment", interpreter=interpreter):
+            if os.path.realpath(interpreter) == os.path.realpath(sys.executable):
+                venv.EnvBuilder(with_pip=True, symlinks=os.name != "nt").create(str(env_path))
+            else:
+                process.run([interpreter, "-m", "venv", env_path])
+        pip_install(env_python(env_path), requirements, self.wheelhouse, upgrade=True)
+        logger.info("Provisioned pooled environment %s in %.2fs", env_path, time.perf_counter() - started)
+        return {
+            "interpreter": os.path.realpath(interpreter),
+            "version": _interpreter_version(interpreter),
+            "requirements": requirements,
+            "snapshot": _snapshot(env_path),
+            "size": _tree_size(env_path),
+        }
+
+    @staticmethod
+    def _lock_path(slot: Path) -> Path:
+        return slot.parent / f"{slot.name}.lock"
+
+    @staticmethod
+    def _iter_dirs(path: Path) -> Iterator[Path]:
+        if not path.is_dir():
+            return
+        for entry in os.scandir(path):
+            if entry.is_dir():
+                yield Path(entry.path)
+
+    @staticmethod
+    def _read_meta(slot: Path) -> Optional[Dict[str, object]]:
+        try:
+            return json.loads((slot / _META).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_meta(slot: Path, meta: Dict[str, object]) -> None:
+        tmp = slot / f"{_META}.tmp"
+        tmp.write_text(json.dumps(meta, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, slot / _META)
+
+
+class EnvironmentProvider:
+    """Lazily provision the environments builders declare, once per spec.
+
+    Environments are checked out of an `EnvironmentPool` on first request and
+    held until `close()`, so builders sharing a spec share one environment and
+    builders declaring none never cause a venv to be created. Safe to call from
+    concurrently running targets; distinct specs provision in parallel.
+    """
+
+    def __init__(self, pool: Optional[EnvironmentPool] = None) -> None:
+        self.pool = pool or EnvironmentPool()
+        self._stack = ExitStack()
+        self._envs: Dict[Tuple[str, ...], BuildEnv] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple[str, ...], threading.Lock] = {}
+
+    def get(self, spec: EnvironmentSpec) -> Optional[BuildEnv]:
+        if spec.kind == ENV_NONE:
+            return None
+        requirements = tuple(sorted({*TOOLCHAIN_REQUIREMENTS, *spec.requirements}))
+        key = (spec.interpreter or "", *requirements)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            env = self._envs.get(key)
+            if env is None:
+                checkout = self.pool.checkout(requirements, spec.interpreter)
+                env_path = checkout.__enter__()
+                with self._lock:
+                    self._stack.push(checkout.__exit__)
+                env = self._envs[key] = BuildEnv(env_path, self.pool.wheelhouse)
+        return env
+
+    def close(self) -> None:
+        with self._lock:
+            self._envs.clear()
+            self._stack.close()
+
+    def __enter__(self) -> "EnvironmentProvider":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
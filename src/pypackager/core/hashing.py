@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: Path) -> str:
+    """Return the hex SHA-256 digest of a file, read in fixed-size chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from .builder import Builder
+from .cache import user_cache_dir
+from .hashing import file_sha256
+from .project import ProjectInfo
+from .sources import SourceTree
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".pypackager-manifest.json"
+SOURCE_INDEX_NAME = ".pypackager-sources.json"
+
+
+def _write_json(path: Path, data: object) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(data, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _read_json(path: Path) -> Dict:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+class SourceIndex:
+    """Content digest of a project's source tree, cached by file stat.
+
+    Files are identified by git blob id: taken from the git index when it
+    vouches for them (see `core.sources`), else from the previous run's
+    index when the size and mtime are unchanged, else by reading the file.
+    """
+
+    def __init__(self, sources: SourceTree, index_path: Path) -> None:
+        self.sources = sources
+        self.index_path = index_path
+
+    def digest(self) -> str:
+        previous = _read_json(self.index_path).get("blobs", {})
+        current: Dict[str, List] = {}
+        for file in self.sources:
+            cached = previous.get(file.path)
+            if file.digest:
+                current[file.path] = [file.size, file.mtime_ns, file.digest]
+            elif cached and cached[0] == file.size and cached[1] == file.mtime_ns:
+                current[file.path] = cached
+            else:
+                current[file.path] = [file.size, file.mtime_ns, self.sources.digest(file)]
+        if current != previous:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            _write_json(self.index_path, {"blobs": current})
+        digest = hashlib.sha256()
+        for rel in sorted(current):
+            digest.update(f"{rel}\0{current[rel][2]}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+
+class ArtifactStore:
+    """Content-addressed copies of built artifacts under the user cache."""
+
+    def __init__(self, root: Optional[Path] = None) -> None:
+        self.root = root or (user_cache_dir() / "artifacts")
+
+    def path_for(self, sha256: str) -> Path:
+        return self.root / "sha256" / sha256[:2] / sha256
+
+    def put(self, path: Path, sha256: str) -> None:
+        target = self.path_for(sha256)
+        if target.exists():
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f"{sha256}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+
+    def restore(self, sha256: str, dest: Path) -> bool:
+        source = self.path_for(sha256)
+        if not source.is_file() or file_sha256(source) != sha256:
+            return False
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        # Replace rather than overwrite: `dest` may be hardlinked elsewhere
+        tmp = dest.with_name(f"{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copyfile(source, tmp)
+        os.replace(tmp, dest)
+        return True
+
+
+def _files(artifact_dir: Path, transient: Iterable[str]) -> List[Path]:
+    """Files under `artifact_dir`, sorted, outside the `transient` paths."""
+    skipped = {os.path.join(artifact_dir, rel) for rel in transient}
+    files = []
+    for directory, dirnames, filenames in os.walk(artifact_dir):
+        dirnames[:] = [d for d in dirnames if os.path.join(directory, d) not in skipped]
+        files.extend(
+            Path(directory, f) for f in filenames
+            if os.path.join(directory, f) not in skipped and os.path.isfile(os.path.join(directory, f))
+        )
+    return sorted(files)
+
+
+class BuildCache:
+    """Fingerprint builder runs and skip those whose inputs are unchanged.
+
+    A target's fingerprint covers the project sources (including
+    pyproject.toml), the resolved configuration, the builder class and version,
+    the interpreter (unless the builder is interpreter-independent) and the
+    fingerprints of the targets it depends on. Results
+    are recorded in a manifest in the output directory; on a match the recorded
+    artifacts are verified and, when missing or modified, restored from the
+    artifact store.
+    """
+
+    def __init__(self, output_dir: Path, store: Optional[ArtifactStore] = None) -> None:
+        self.output_dir = output_dir
+        self.manifest_path = output_dir / MANIFEST_NAME
+        self.store = store or ArtifactStore()
+        self._lock = threading.Lock()
+        self._manifest = _read_json(self.manifest_path)
+
+    def source_digest(self, sources: SourceTree) -> str:
+        return SourceIndex(sources, self.output_dir / SOURCE_INDEX_NAME).digest()
+
+    @staticmethod
+    def fingerprint(
+        builder: Builder,
+        project: ProjectInfo,
+        config: object,
+        source_digest: str,
+        dependency_fingerprints: Iterable[str] = (),
+        interpreter: Optional[Tuple[str, str]] = None,
+    ) -> str:
+        cls = type(builder)
+        # Nothing machine-specific: checkouts elsewhere share fingerprints (and remote cache entries)
+        project_data = dataclasses.asdict(project)
+        project_data.pop("root", None)
+        config_data = dataclasses.asdict(config) if dataclasses.is_dataclass(config) else None
+        if config_data is not None:
+            config_data.pop("cache", None)
+            # Archives come out the same whatever the number of compression threads
+            config_data.get("compression", {}).pop("threads", None)
+        payload = {
+            "sources": source_digest,
+            "project": project_data,
+            "config": config_data,
+            "builder": f"{cls.__module__}.{cls.__qualname__}",
+            "builder_version": builder.version,
+            "external_inputs": builder.external_inputs(),
+            "interpreter": None if builder.interpreter_independent() else list(
+                interpreter or (os.path.realpath(sys.executable), sys.version)
+            ),
+            "dependencies": sorted(dependency_fingerprints),
+        }
+        blob = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def lookup(self, name: str, fingerprint: str, artifact_dir: Path) -> bool:
+        """Return True if `name` is up to date, restoring artifacts if needed."""
+        with self._lock:
+            entry = self._manifest.get("targets", {}).get(name)
+        if not entry or entry.get("fingerprint") != fingerprint:
+            return False
+        if not all(os.path.lexists(artifact_dir / rel) for rel in entry.get("transient", ())):
+            return False
+        # The entry is shared with other threads; restored stamps go into a copy
+        artifacts = {rel: dict(record) for rel, record in entry.get("artifacts", {}).items()}
+        restored = False
+        for rel, record in artifacts.items():
+            path = artifact_dir / rel
+            if self._intact(path, record):
+                continue
+            if not self.store.restore(record["sha256"], path):
+                logger.debug("Artifact %s for %s is missing and not in the store", rel, name)
+                return False
+            st = path.stat()
+            record["size"], record["mtime_ns"] = st.st_size, st.st_mtime_ns
+            restored = True
+            logger.info("Restored %s for target %s from artifact store", rel, name)
+        if restored:
+            with self._lock:
+                targets = self._manifest.setdefault("targets", {})
+                # Unless a concurrent record or adopt has replaced it meanwhile
+                if targets.get(name) is entry:
+                    targets[name] = {**entry, "artifacts": artifacts}
+            self._save()
+        return True
+
+    def adopt(self, name: str, fingerprint: str, artifact_dir: Path) -> bool:
+        """Take the artifacts of another target with the same fingerprint, as a matrix cell's pure wheel."""
+        with self._lock:
+            source = next(
+                (
+                    (other, entry) for other, entry in self._manifest.get("targets", {}).items()
+                    if other != name and entry.get("fingerprint") == fingerprint and not entry.get("transient")
+                ),
+                None,
+            )
+        if source is None:
+            return False
+        other, entry = source
+        shutil.rmtree(artifact_dir, ignore_errors=True)
+        artifacts: Dict[str, Dict] = {}
+        for rel, record in entry.get("artifacts", {}).items():
+            path = artifact_dir / rel
+            if not self.store.restore(record["sha256"], path):
+                logger.debug("Artifact %s of %s is not in the store", rel, other)
+                return False
+            st = path.stat()
+            artifacts[rel] = {"sha256": record["sha256"], "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        with self._lock:
+            self._manifest.setdefault("targets", {})[name] = {"fingerprint": fingerprint, "artifacts": artifacts}
+        self._save()
+        logger.info("Target %s has the same inputs as %s; reused its artifacts", name, other)
+        return True
+
+    def record(
+        self, name: str, fingerprint: str, artifact_dir: Path, transient: Iterable[str] = ()
+    ) -> Dict[str, Dict]:
+        """Record the artifacts of a finished build; returns them by relative path.
+
+        The `transient` outputs (see `Builder.transient`) are left out; those
+        present are noted, and a later `lookup` needs them in place.
+        """
+        left = [rel for rel in transient if os.path.lexists(artifact_dir / rel)]
+        artifacts: Dict[str, Dict] = {}
+        for path in _files(artifact_dir, left):
+            st = path.stat()
+            sha256 = file_sha256(path)
+            self.store.put(path, sha256)
+            rel = path.relative_to(artifact_dir).as_posix()
+            artifacts[rel] = {"sha256": sha256, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        with self._lock:
+            targets = self._manifest.setdefault("targets", {})
+            previous = targets.get(name)
+            targets[name] = {
+                "fingerprint": fingerprint,
+                "artifacts": artifacts,
+            }
+            if left:
+                targets[name]["transient"] = left
+        self._save()
+        if previous is not None:
+            self._compare(name, previous.get("artifacts", {}), artifacts)
+        return artifacts
+
+    @staticmethod
+    def _compare(name: str, previous: Mapping[str, Dict], current: Mapping[str, Dict]) -> None:
+        """Report whether a rebuild reproduced the previous build's artifacts."""
+        changed = sorted(
+            rel for rel in set(previous) | set(current)
+            if previous.get(rel, {}).get("sha256") != current.get(rel, {}).get("sha256")
+        )
+        if not changed:
+            logger.info("Target %s rebuilt byte-identical to its previous build", name)
+        else:
+            logger.info("Target %s differs from its previous build in: %s", name, ", ".join(changed))
+
+    def _save(self) -> None:
+        with self._lock:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            _write_json(self.manifest_path, self._manifest)
+
+    @staticmethod
+    def _intact(path: Path, record: Dict) -> bool:
+        try:
+            st = path.stat()
+        except OSError:
+            return False
+        if st.st_size != record.get("size"):
+            return False
+        if st.st_mtime_ns == record.get("mtime_ns"):
+            return True
+        return file_sha256(path) == record.get("sha256")
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+_PROBE = (
+    "import json, sys; "
+    "print(json.dumps([sys.implementation.name, sys.version_info[0], sys.version_info[1], sys.version]))"
+)
+_IMPLEMENTATION_TAGS = {"cpython": "cp", "pypy": "pp"}
+_VERSION_RE = re.compile(r"^\d+\.\d+$")
+
+
+@dataclass(frozen=True)
+class MatrixCell:
+    """One interpreter of the build matrix."""
+
+    tag: str  # python tag, e.g. "cp312"
+    interpreter: str  # absolute path
+    version: str  # major.minor
+    full_version: str  # sys.version of the interpreter
+    image: Optional[str] = None  # base image for container targets
+
+
+def _probe(interpreter: str) -> Optional[List]:
+    try:
+        out = subprocess.check_output([interpreter, "-c", _PROBE], text=True, timeout=30)  # noqa: S603
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return json.loads(out)
+
+
+def _locate(entry: str) -> Optional[str]:
+    """Resolve a matrix entry: "3.12" means `python3.12` on PATH; else a command or path."""
+    command = f"python{entry}" if _VERSION_RE.match(entry) else entry
+    if os.sep in command or (os.altsep and os.altsep in command):
+        return os.path.abspath(command) if os.path.isfile(command) else None
+    return shutil.which(command)
+
+
+def discover_cells(interpreters: Iterable[str], images: Optional[Mapping[str, str]] = None) -> List[MatrixCell]:
+    """Probe the configured interpreters; those not found locally are skipped with a warning.
+
+    `images` maps a major.minor version or python tag to a base image.
+    """
+    images = images or {}
+    cells: Dict[str, MatrixCell] = {}
+    for entry in interpreters:
+        path = _locate(entry)
+        info = _probe(path) if path else None
+        if info is None:
+            logger.warning("Matrix interpreter %s not found on this machine; skipping", entry)
+            continue
+        implementation, major, minor, full_version = info
+        tag = f"{_IMPLEMENTATION_TAGS.get(implementation, implementation)}{major}{minor}"
+        version = f"{major}.{minor}"
+        if tag in cells:
+            logger.warning("Matrix interpreter %s duplicates %s; skipping", entry, tag)
+            continue
+        cells[tag] = MatrixCell(tag, path, version, full_version, images.get(tag) or images.get(version))
+    if not cells:
+        raise ValueError("None of the [pypackager.matrix] interpreters were found")
+    return sorted(cells.values(), key=lambda c: (c.tag[:2], tuple(int(p) for p in c.version.split("."))))
@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import dataclasses
+import email.parser
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import zipfile
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+try:
+    import tomllib  # Python 3.11+
+except ModuleNotFoundError:  # pragma: no cover - fallback
+    import tomli as tomllib  # type: ignore
+
+from . import tracing
+from .cache import user_cache_dir
+from .hashing import file_sha256
+from .project import ProjectInfo
+from .sources import is_ignored_dir, is_ignored_file
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .envpool import EnvironmentProvider
+    from .wheelhouse import Wheelhouse
+
+logger = logging.getLogger(__name__)
+
+METADATA_VERSION = 1
+# Fields a backend may compute; `name` is always static (PEP 621)
+DYNAMIC_FIELDS = ("version", "dependencies", "requires-python")
+_EXTRA_MARKER = re.compile(r"\bextra\s*==")
+
+_toml: Dict[Path, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+_toml_lock = threading.Lock()
+
+
+def load_toml(path: Path) -> Dict[str, Any]:
+    """Parsed contents of a TOML file, memoized until its size or modification time changes.
+
+    pyproject.toml and pypackager.toml are read by the scanner, the config
+    loader, the workspace and the daemon; each is parsed once per change.
+    Callers must not modify the returned data.
+    """
+    st = path.stat()
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _toml_lock:
+        cached = _toml.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    data = tomllib.loads(path.read_text(encoding="utf-8"))
+    with _toml_lock:
+        _toml[path] = (stamp, data)
+    return data
+
+
+def _listing_sha(path: Path, at_root: bool) -> str:
+    """Hash of a directory's entries, leaving out build outputs, caches and the lockfile."""
+    names = sorted(
+        name for name in os.listdir(path) if not is_ignored_dir(name, at_root) and not is_ignored_file(name)
+    )
+    return hashlib.sha256("\0".join(names).encode("utf-8")).hexdigest()
+
+
+def _git_state(root: Path) -> Optional[str]:
+    """`git describe` of the checkout with a dirty flag, as version plugins see it; None outside git."""
+    try:
+        proc = subprocess.run(  # noqa: S603
+            ["git", "describe", "--tags", "--long", "--dirty", "--always", "--abbrev=40"],  # noqa: S607
+            cwd=root,
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return proc.stdout.strip() if proc.returncode == 0 else None
+
+
+def _from_metadata(text: str, fields: List[str]) -> Dict[str, Any]:
+    """The `fields` (pyproject names) of a core metadata file."""
+    message = email.parser.Parser().parsestr(text)
+    values: Dict[str, Any] = {}
+    if "version" in fields:
+        values["version"] = message["Version"]
+    if "dependencies" in fields:
+        # Requirements of extras are optional-dependencies, not dependencies
+        values["dependencies"] = [
+            req for req in message.get_all("Requires-Dist") or []
+            if not _EXTRA_MARKER.search(req.partition(";")[2])
+        ]
+    if "requires-python" in fields:
+        values["requires-python"] = message["Requires-Python"]
+    return values
+
+
+class MetadataCache:
+    """Dynamic project metadata computed by PEP 517 backends, cached on disk.
+
+    The backend's `prepare_metadata_for_build_wheel` (or, lacking it,
+    `build_wheel`) runs in the project's build environment while the worker
+    records the files and directories it reads under the project. The fields
+    are stored with those inputs' sizes, modification times and SHA-256; a
+    later lookup re-stats them and only re-hashes what changed, so an
+    unchanged project costs a few stat calls. When the backend ran a
+    subprocess (e.g. `git` for a version from tags), the checkout's
+    `git describe --dirty` is part of the inputs too.
+    """
+
+    def __init__(self, root: Optional[Path] = None) -> None:
+        self.root = root or (user_cache_dir() / "metadata")
+        self._entries: Dict[Path, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(project: ProjectInfo, pyproject: Path, dynamic: List[str], interpreter: Optional[str] = None) -> str:
+        payload = {
+            "format": METADATA_VERSION,
+            "pyproject": file_sha256(pyproject),
+            "dynamic": sorted(dynamic),
+            "backend": [project.build_backend, project.backend_path, sorted(project.build_requires)],
+            "interpreter": os.path.realpath(interpreter or sys.executable),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _path(self, project_root: Path) -> Path:
+        digest = hashlib.sha256(os.fsencode(os.path.realpath(project_root))).hexdigest()[:20]
+        return self.root / f"{digest}.json"
+
+    def lookup(self, project_root: Path, key: str) -> Optional[Dict[str, Any]]:
+        """Cached fields for `key` if none of the backend's inputs changed since."""
+        with self._lock:
+            entry = self._entries.get(project_root)
+        if entry is None:
+            try:
+                entry = json.loads(self._path(project_root).read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                return None
+        if entry.get("key") != key:
+            return None
+        # Cached entries are shared between threads; refresh mtimes in a copy
+        entry = {**entry, "files": [list(i) for i in entry["files"]], "dirs": [list(i) for i in entry["dirs"]]}
+        changed = False
+        for item in entry["files"]:
+            rel, mtime_ns, size, digest = item
+            try:
+                st = (project_root / rel).stat()
+            except OSError:
+                return None
+            if (st.st_mtime_ns, st.st_size) == (mtime_ns, size):
+                continue
+            if st.st_size != size or file_sha256(project_root / rel) != digest:
+                logger.debug("Dynamic metadata of %s is stale: %s changed", project_root, rel)
+                return None
+            item[1] = st.st_mtime_ns
+            changed = True
+        for item in entry["dirs"]:
+            rel, mtime_ns, digest = item
+            try:
+                st = (project_root / rel).stat()
+                if st.st_mtime_ns == mtime_ns:
+                    continue
+                if _listing_sha(project_root / rel, rel == ".") != digest:
+                    logger.debug("Dynamic metadata of %s is stale: %s changed", project_root, rel or ".")
+                    return None
+            except OSError:
+                return None
+            item[1] = st.st_mtime_ns
+            changed = True
+        if entry.get("git") is not None and _git_state(project_root) != entry["git"]:
+            logger.debug("Dynamic metadata of %s is stale: the git checkout changed", project_root)
+            return None
+        if changed:
+            self._write(project_root, entry)
+        with self._lock:
+            self._entries[project_root] = entry
+        return entry["fields"]
+
+    def store(self, project_root: Path, key: str, fields: Dict[str, Any], inputs: Dict[str, Any]) -> None:
+        """Remember `fields` against the `inputs` a tracked backend call reported."""
+        files = []
+        for rel in inputs["files"]:
+            path = project_root / rel
+            try:
+                st = path.stat()
+                files.append([rel, st.st_mtime_ns, st.st_size, file_sha256(path)])
+            except OSError:
+                continue
+        dirs = []
+        for rel in inputs["dirs"]:
+            path = project_root / rel
+            try:
+                dirs.append([rel, path.stat().st_mtime_ns, _listing_sha(path, rel == ".")])
+            except OSError:
+                continue
+        git = None
+        if inputs["spawned"]:
+            git = _git_state(project_root)
+            if git is None:
+                logger.info("Not caching dynamic metadata of %s: its backend runs subprocesses", project_root)
+                return
+        entry = {"key": key, "fields": fields, "files": files, "dirs": dirs, "git": git}
+        self._write(project_root, entry)
+        with self._lock:
+            self._entries[project_root] = entry
+
+    def _write(self, project_root: Path, entry: Dict[str, Any]) -> None:
+        path = self._path(project_root)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(entry, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def resolve(
+        self,
+        project: ProjectInfo,
+        dynamic: List[str],
+        provider: Optional["EnvironmentProvider"] = None,
+        wheelhouse: Optional["Wheelhouse"] = None,
+    ) -> ProjectInfo:
+        """`project` with its `dynamic` fields filled in, from the cache or the backend."""
+        pyproject = project.root / "pyproject.toml"
+        key = self.key(project, pyproject, dynamic)
+        fields = self.lookup(project.root, key)
+        if fields is None:
+            with tracing.span("dynamic metadata", project=project.name):
+                fields, inputs = self._prepare(project, dynamic, provider, wheelhouse)
+            self.store(project.root, key, fields, inputs)
+            logger.info(
+                "Resolved dynamic metadata of %s (%s) with its build backend", project.name, ", ".join(dynamic)
+            )
+        changes: Dict[str, Any] = {}
+        if "version" in fields:
+            changes["version"] = fields["version"]
+        if "dependencies" in fields:
+            changes["dependencies"] = list(fields["dependencies"])
+        if "requires-python" in fields:
+            changes["python_requires"] = fields["requires-python"]
+        return dataclasses.replace(project, **changes)
+
+    @staticmethod
+    def _prepare(
+        project: ProjectInfo,
+        dynamic: List[str],
+        provider: Optional["EnvironmentProvider"],
+        wheelhouse: Optional["Wheelhouse"],
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        from .backend import Pep517Backend, get_worker
+        from .builder import EnvironmentSpec
+        from .envpool import EnvironmentPool, EnvironmentProvider
+
+        owned = provider is None
+        if provider is None:
+            provider = EnvironmentProvider(EnvironmentPool(wheelhouse=wheelhouse))
+        try:
+            # The wheel builder's environment, which the build then reuses
+            env = provider.get(EnvironmentSpec.dedicated(*project.build_requires))
+            assert env is not None
+            backend = Pep517Backend(project, get_worker(env.python))
+            missing = backend.missing_requirements(backend.get_requires_for_build("wheel"))
+            if missing:
+                logger.info("Installing dynamic build requirements: %s", ", ".join(missing))
+                env.install(missing)
+            with tempfile.TemporaryDirectory(prefix="pypackager-metadata-") as tmp:
+                dist_info, inputs = backend.prepare_metadata_tracked(Path(tmp))
+                if dist_info:
+                    text = (Path(tmp) / dist_info / "METADATA").read_text(encoding="utf-8")
+                else:
+                    # Backends without the optional hook: read the metadata of a built wheel
+                    wheel, inputs = backend.build_wheel_tracked(Path(tmp))
+                    with zipfile.ZipFile(Path(tmp) / wheel) as zf:
+                        name = next(n for n in zf.namelist() if n.endswith(".dist-info/METADATA"))
+                        text = zf.read(name).decode("utf-8")
+        finally:
+            if owned:
+                provider.close()
+        return _from_metadata(text, dynamic), inputs
+
+
+_default_cache: Optional[MetadataCache] = None
+
+
+def default_cache() -> MetadataCache:
+    """The process-wide cache, so repeated scans (watch mode, the daemon) skip reading it back."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = MetadataCache()
+    return _default_cache
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import tarfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .archive import Compression, ParallelGzipWriter
+
+logger = logging.getLogger(__name__)
+
+MEDIA_INDEX = "application/vnd.oci.image.index.v1+json"
+MEDIA_MANIFEST = "application/vnd.oci.image.manifest.v1+json"
+MEDIA_CONFIG = "application/vnd.oci.image.config.v1+json"
+MEDIA_LAYER = "application/vnd.oci.image.layer.v1.tar+gzip"
+# Docker media types found in `docker save` archives and registries
+DOCKER_MANIFEST_LIST = "application/vnd.docker.distribution.manifest.list.v2+json"
+INDEX_TYPES = (MEDIA_INDEX, DOCKER_MANIFEST_LIST)
+
+REF_NAME = "org.opencontainers.image.ref.name"
+
+
+def canonical_json(data: Any) -> bytes:
+    return json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+@dataclass(frozen=True)
+class Descriptor:
+    media_type: str
+    digest: str
+    size: int
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"mediaType": self.media_type, "digest": self.digest, "size": self.size}
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "Descriptor":
+        return cls(data.get("mediaType", ""), data["digest"], int(data["size"]))
+
+
+@dataclass(frozen=True)
+class Layer:
+    descriptor: Descriptor
+    diff_id: str
+
+
+@dataclass
+class Image:
+    """An image manifest and config, with blobs available in some `BlobStore`."""
+
+    config: Dict[str, Any]
+    layers: List[Layer]
+
+
+class _HashingWriter:
+    """Write-through file wrapper that tracks the SHA-256 and size of the stream."""
+
+    def __init__(self, fh: Any) -> None:
+        self._fh = fh
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._fh.write(data)
+        self.sha256.update(data)
+        self.size += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        self._fh.flush()
+
+    @property
+    def digest(self) -> str:
+        return f"sha256:{self.sha256.hexdigest()}"
+
+
+class BlobStore:
+    """Content-addressed blobs laid out as in an OCI `blobs/` directory."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def path(self, digest: str) -> Path:
+        algorithm, _, hexdigest = digest.partition(":")
+        return self.root / algorithm / hexdigest
+
+    def has(self, digest: str) -> bool:
+        return self.path(digest).is_file()
+
+    def tempfile(self) -> Path:
+        """A path to stage a blob at; next to `root`, since `blobs/` may only hold digests."""
+        self.root.parent.mkdir(parents=True, exist_ok=True)
+        return self.root.parent / f".{self.root.name}.{os.getpid()}.{threading.get_ident()}.partial"
+
+    def commit(self, tmp: Path, digest: str) -> Path:
+        target = self.path(digest)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, target)
+        return target
+
+    def put_bytes(self, data: bytes, media_type: str) -> Descriptor:
+        digest = f"sha256:{hashlib.sha256(data).hexdigest()}"
+        if not self.has(digest):
+            tmp = self.tempfile()
+            tmp.write_bytes(data)
+            self.commit(tmp, digest)
+        return Descriptor(media_type, digest, len(data))
+
+    def read_json(self, digest: str) -> Dict[str, Any]:
+        return json.loads(self.path(digest).read_bytes())
+
+    def copy_to(self, digest: str, other: "BlobStore") -> None:
+        """Make `digest` available in `other`, hardlinking when possible."""
+        if other.has(digest):
+            return
+        target = other.path(digest)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(self.path(digest), target)
+        except OSError:
+            shutil.copyfile(self.path(digest), target)
+
+
+def _tree_entries(root: Path) -> List[Tuple[str, Path]]:
+    """Every directory, file and symlink under `root`, sorted by relative path."""
+    entries = []
+    for directory, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(directory, root).replace(os.sep, "/")
+        for name in [*dirnames, *filenames]:
+            rel = name if rel_dir == "." else f"{rel_dir}/{name}"
+            entries.append((rel, Path(directory, name)))
+    return sorted(entries)
+
+
+def write_layer(source: Path, store: BlobStore, mtime: int = 0, compression: Optional[Compression] = None) -> Layer:
+    """Stream the tree under `source` into a gzip-compressed layer blob.
+
+    Entries are sorted, owned by root, stamped with `mtime` and reduced to
+    0755/0644 permissions, and the gzip stream (compressed in parallel blocks)
+    carries no name or timestamp, so the same tree always yields the same
+    digest.
+    """
+    tmp = store.tempfile()
+    try:
+        with open(tmp, "wb") as raw:
+            compressed = _HashingWriter(raw)
+            with ParallelGzipWriter(compressed, compression) as gz:  # type: ignore[arg-type]
+                uncompressed = _HashingWriter(gz)
+                with tarfile.open(fileobj=uncompressed, mode="w|", format=tarfile.PAX_FORMAT) as tar:  # type: ignore[call-overload]
+                    for rel, path in _tree_entries(source):
+                        st = path.lstat()
+                        info = tarfile.TarInfo(rel)
+                        info.mtime = mtime
+                        info.uid = info.gid = 0
+                        info.uname = info.gname = ""
+                        if stat.S_ISLNK(st.st_mode):
+                            info.type = tarfile.SYMTYPE
+                            info.linkname = os.readlink(path)
+                            info.mode = 0o777
+                            tar.addfile(info)
+                        elif stat.S_ISDIR(st.st_mode):
+                            info.type = tarfile.DIRTYPE
+                            info.mode = 0o755
+                            tar.addfile(info)
+                        else:
+                            info.size = st.st_size
+                            info.mode = 0o755 if st.st_mode & stat.S_IXUSR else 0o644
+                            with open(path, "rb") as fh:
+                                tar.addfile(info, fh)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    store.commit(tmp, compressed.digest)
+    return Layer(Descriptor(MEDIA_LAYER, compressed.digest, compressed.size), uncompressed.digest)
+
+
+def _select_manifest(store: BlobStore, index: Dict[str, Any], platform: Tuple[str, str]) -> Descriptor:
+    manifests = index.get("manifests") or []
+    if not manifests:
+        raise RuntimeError("OCI index lists no manifests")
+    chosen = manifests[0]
+    for entry in manifests:
+        p = entry.get("platform") or {}
+        if (p.get("os"), p.get("architecture")) == platform:
+            chosen = entry
+            break
+    descriptor = Descriptor.from_json(chosen)
+    if descriptor.media_type in INDEX_TYPES:
+        return _select_manifest(store, store.read_json(descriptor.digest), platform)
+    return descriptor
+
+
+def _import_tarball(archive: Path, store: BlobStore) -> Dict[str, Any]:
+    """Copy the blobs of an OCI layout tarball into `store`; return its index."""
+    index: Optional[Dict[str, Any]] = None
+    with tarfile.open(archive) as tar:
+        for member in tar:
+            name = member.name[2:] if member.name.startswith("./") else member.name
+            if name == "index.json":
+                fh = tar.extractfile(member)
+                assert fh is not None
+                index = json.loads(fh.read())
+            elif name.startswith("blobs/") and member.isfile():
+                algorithm, _, hexdigest = name[len("blobs/"):].partition("/")
+                digest = f"{algorithm}:{hexdigest}"
+                if store.has(digest):
+                    continue
+                if algorithm != "sha256":
+                    raise RuntimeError(f"{archive}: unsupported digest algorithm in {member.name}")
+                tmp = store.tempfile()
+                fh = tar.extractfile(member)
+                assert fh is not None
+                try:
+                    with open(tmp, "wb") as raw:
+                        out = _HashingWriter(raw)
+                        shutil.copyfileobj(fh, out)  # type: ignore[misc]
+                    if out.digest != digest:
+                        raise RuntimeError(f"{archive}: blob {member.name} does not match its digest ({out.digest})")
+                except BaseException:
+                    tmp.unlink(missing_ok=True)
+                    raise
+                store.commit(tmp, digest)
+    if index is None:
+        raise RuntimeError(f"{archive} is not an OCI image layout tarball (no index.json)")
+    return index
+
+
+def load_image(source: Path, store: BlobStore, platform: Tuple[str, str]) -> Image:
+    """Load a base image from an OCI layout directory or tarball into `store`."""
+    if source.is_dir():
+        index_path = source / "index.json"
+        if not index_path.is_file():
+            raise RuntimeError(f"{source} is not an OCI image layout (no index.json)")
+        source_store = BlobStore(source / "blobs")
+        index = json.loads(index_path.read_text(encoding="utf-8"))
+        manifest_desc = _select_manifest(source_store, index, platform)
+        manifest = source_store.read_json(manifest_desc.digest)
+        for desc in [manifest["config"], *manifest.get("layers", [])]:
+            source_store.copy_to(desc["digest"], store)
+    else:
+        index = _import_tarball(source, store)
+        manifest_desc = _select_manifest(store, index, platform)
+        manifest = store.read_json(manifest_desc.digest)
+
+    config = store.read_json(manifest["config"]["digest"])
+    diff_ids = (config.get("rootfs") or {}).get("diff_ids") or []
+    descriptors = [Descriptor.from_json(d) for d in manifest.get("layers", [])]
+    if len(diff_ids) != len(descriptors):
+        raise RuntimeError(f"Base image {source} has {len(descriptors)} layers but {len(diff_ids)} diff_ids")
+    return Image(config=config, layers=[Layer(d, diff_id) for d, diff_id in zip(descriptors, diff_ids)])
+
+
+def write_layout(directory: Path, store: BlobStore, image: Image, ref_name: str) -> Descriptor:
+    """Write `image`'s config, manifest and index into the OCI layout at `directory`.
+
+    `store` must be the layout's own `blobs/` store and hold every layer.
+    """
+    config = store.put_bytes(canonical_json(image.config), MEDIA_CONFIG)
+    manifest = {
+        "schemaVersion": 2,
+        "mediaType": MEDIA_MANIFEST,
+        "config": config.to_json(),
+        "layers": [layer.descriptor.to_json() for layer in image.layers],
+    }
+    manifest_desc = store.put_bytes(canonical_json(manifest), MEDIA_MANIFEST)
+    index = {
+        "schemaVersion": 2,
+        "mediaType": MEDIA_INDEX,
+        "manifests": [{**manifest_desc.to_json(), "annotations": {REF_NAME: ref_name}}],
+    }
+    (directory / "oci-layout").write_bytes(canonical_json({"imageLayoutVersion": "1.0.0"}))
+    (directory / "index.json").write_bytes(canonical_json(index))
+    return manifest_desc
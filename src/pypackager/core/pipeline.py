@@ -1,61 +1,393 @@
 from __future__ import annotations
 
+import dataclasses
 import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Iterable, List, Mapping
+from functools import partial
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
 
+from . import tracing
+from .archive import Compression
+from .bytecode import Bytecode
 from .project import ProjectInfo
 from .scanner import ProjectScanner
 from .resolver import DependencyResolver
-from .environment import isolated_env
-from ..plugins import discover_builders
+from .builder import Builder
+from .envpool import EnvironmentPool, EnvironmentProvider
+from .incremental import BuildCache
+from .matrix import MatrixCell, discover_cells
+from .remote_cache import RemoteCache, remote_cache_from_config
+from .scheduler import BuildFailed, Scheduler, STATUS_OK, TargetResult
+from .sources import SourceTree
+from .wheelhouse import Wheelhouse
+from ..plugins import get_registry
 from ..config import Config
 
 logger = logging.getLogger(__name__)
 
 
+def _empty_dir(path: Path) -> None:
+    """Create `path`, or remove everything in it."""
+    path.mkdir(parents=True, exist_ok=True)
+    for entry in path.iterdir():
+        if entry.is_dir() and not entry.is_symlink():
+            shutil.rmtree(entry)
+        else:
+            entry.unlink()
+
+
 class Pipeline:
-    def __init__(self, project_root: Path, config: Config | None = None) -> None:
+    """Orchestrates scan → lock → build for one project.
+
+    A pipeline may be run repeatedly (e.g. by `pypackager watch`): the scanned
+    `ProjectInfo` and discovered builders are kept between runs, and when an
+    `EnvironmentProvider` is supplied its warm environments outlive each run.
+    Every pip install goes through the shared `Wheelhouse`. With a remote
+    cache configured, targets missing from the local cache are fetched from
+    it before being built, and fresh builds are uploaded to it.
+    """
+
+    def __init__(
+        self,
+        project_root: Path,
+        config: Config | None = None,
+        provider: EnvironmentProvider | None = None,
+        wheelhouse: Wheelhouse | None = None,
+    ) -> None:
         self.project_root = project_root
         self.config = config
+        self.provider = provider
+        self.wheelhouse = wheelhouse or (provider.pool.wheelhouse if provider else None) or Wheelhouse()
+        self._project: Optional[ProjectInfo] = None
+        self._builders: Dict[str, type] = {}
+        self._cells: Optional[List[MatrixCell]] = None
+        self._cells_key: Optional[Tuple] = None
+        # Digests of inputs built elsewhere (e.g. local dependency wheels in a workspace)
+        self.upstream: List[str] = []
+        # Versions of locally built dependencies, fixed during resolution
+        self.local_pins: Dict[str, str] = {}
+        self.remote: Optional[RemoteCache] = remote_cache_from_config(config)
+
+    def scan(self) -> ProjectInfo:
+        """Return project metadata, re-locking only when it changed.
 
-    def run(self, targets: Iterable[str], output_dir: Path) -> None:
-        scanner = ProjectScanner(self.project_root)
-        project = scanner.scan()
+        Rescanning an unchanged project is cheap: pyproject.toml is parsed
+        again only when its stat changes, and dynamic fields come from the
+        metadata cache (see `core.metadata`).
+        """
+        with tracing.span("scan"):
+            project = ProjectScanner(self.project_root, self.provider, self.wheelhouse).scan()
+        if project != self._project:
+            resolver = DependencyResolver(
+                self.project_root,
+                wheelhouse=self.wheelhouse,
+                interpreters=(self.config.lock.interpreters if self.config else [])
+                or [cell.interpreter for cell in self.matrix_cells()],
+                local_pins=self.local_pins,
+            )
+            with tracing.span("lock"):
+                resolver.write_lockfile(project.name, project.version, project.dependencies, project.python_requires)
+            with tracing.span("wheelhouse"):
+                resolver.sync_wheelhouse(self.wheelhouse, [*resolver.pinned_requirements(), *project.build_requires])
+            self._project = project
+        return self._project
 
-        resolver = DependencyResolver(self.project_root)
-        resolver.write_lockfile(project.name, project.version, project.dependencies)
+    def matrix_cells(self) -> List[MatrixCell]:
+        """Interpreters of the `[pypackager.matrix]`, probed once; empty without a matrix."""
+        matrix = self.config.matrix if self.config else None
+        key = (tuple(matrix.interpreters), tuple(sorted(matrix.images.items()))) if matrix else None
+        if self._cells is None or key != self._cells_key:
+            self._cells = discover_cells(matrix.interpreters, matrix.images) if matrix and matrix.interpreters else []
+            self._cells_key = key
+        return self._cells
 
-        builders = discover_builders()
-        selected = self._select_builders(builders, set(targets))
+    def run(
+        self,
+        targets: Iterable[str],
+        output_dir: Path,
+        jobs: Optional[int] = None,
+        force: bool = False,
+        limiter: Optional[threading.Semaphore] = None,
+    ) -> Dict[str, TargetResult]:
+        """Build `targets`; returns each target's result and raises `BuildFailed` if any failed.
+
+        `limiter` bounds the targets running at once across pipelines sharing it.
+        """
+        with tracing.span("pipeline", project=os.fspath(self.project_root)):
+            return self._run(targets, output_dir, jobs, force, limiter)
+
+    def _run(
+        self,
+        targets: Iterable[str],
+        output_dir: Path,
+        jobs: Optional[int],
+        force: bool,
+        limiter: Optional[threading.Semaphore],
+    ) -> Dict[str, TargetResult]:
+        project = self.scan()
+
+        selected = self._select_builders(set(targets))
         if not selected:
             raise ValueError("No builders selected or discovered")
 
         output_dir.mkdir(parents=True, exist_ok=True)
+        # Listed once, lazily, for fingerprinting and for builders that send sources on
+        sources = SourceTree(self.project_root, exclude=[output_dir])
+
+        # Without a matrix there is a single, unnamed cell
+        cells: List[Optional[MatrixCell]] = [*self.matrix_cells()] or [None]
+        instances: Dict[str, Builder] = {}
+        dependencies: Dict[str, Tuple[str, ...]] = {}
+        artifact_dirs: Dict[str, Path] = {}
+        task_cells: Dict[str, Optional[MatrixCell]] = {}
+        for cell in cells:
+            for name, cls in selected.items():
+                task = self._task_name(name, cell)
+                builder = self._create_builder(name, cls, project, cell)
+                builder.dependency_outputs = {d: self._artifact_dir(output_dir, d, cell) for d in builder.depends_on}
+                builder.sources = sources
+                instances[task] = builder
+                dependencies[task] = tuple(self._task_name(d, cell) for d in builder.depends_on)
+                artifact_dirs[task] = self._artifact_dir(output_dir, name, cell)
+                task_cells[task] = cell
 
-        for name, builder_cls in selected.items():
-            # Pass config to docker builder
-            if name == "docker" and self.config:
-                builder = builder_cls(
-                    base_image=self.config.docker.base_image,
-                    entrypoint=self.config.docker.entrypoint
+        cache = BuildCache(output_dir)
+        with tracing.span("fingerprint"):
+            fingerprints = self._fingerprints(cache, sources, project, instances, dependencies, task_cells)
+        order = self._cell_order(instances, dependencies, task_cells, fingerprints)
+
+        if self.provider is not None:
+            provider_cm = nullcontext(self.provider)
+        else:
+            provider_cm = EnvironmentProvider(EnvironmentPool(wheelhouse=self.wheelhouse))
+        started = time.perf_counter()
+        with provider_cm as provider:
+            tasks = {
+                task: partial(
+                    self._run_builder,
+                    task,
+                    builder,
+                    provider,
+                    artifact_dirs[task],
+                    cache,
+                    fingerprints[task],
+                    force,
+                    task_cells[task].interpreter if task_cells[task] else None,
+                    self.remote,
                 )
-            else:
-                builder = builder_cls()
-            
-            logger.info("Configuring builder: %s", name)
+                for task, builder in instances.items()
+            }
+            try:
+                results = Scheduler(jobs, limiter=limiter).run(tasks, order)
+            finally:
+                if self.remote is not None:
+                    with tracing.span("remote flush", "cache"):
+                        self.remote.flush()
+        if cells != [None]:
+            self._log_matrix_summary(results, task_cells, time.perf_counter() - started)
+
+        if any(r.status != STATUS_OK for r in results.values()):
+            raise BuildFailed(results)
+        return results
+
+    @staticmethod
+    def _cell_order(
+        instances: Mapping[str, Builder],
+        dependencies: Mapping[str, Tuple[str, ...]],
+        task_cells: Mapping[str, Optional[MatrixCell]],
+        fingerprints: Mapping[str, str],
+    ) -> Dict[str, Tuple[str, ...]]:
+        """`dependencies`, plus: matrix cells sharing a fingerprint wait for the first to build it.
+
+        They then take its artifacts from the cache (see `BuildCache.adopt`)
+        instead of building the same thing again.
+        """
+        order = dict(dependencies)
+        first: Dict[str, str] = {}
+        for task in instances:
+            if task_cells[task] is None:
+                continue
+            owner = first.setdefault(fingerprints[task], task)
+            if owner != task:
+                order[task] = (*order[task], owner)
+        return order
+
+    @staticmethod
+    def _task_name(name: str, cell: Optional[MatrixCell]) -> str:
+        return f"{name}[{cell.tag}]" if cell else name
+
+    @staticmethod
+    def _artifact_dir(output_dir: Path, name: str, cell: Optional[MatrixCell]) -> Path:
+        return output_dir / name / cell.tag if cell else output_dir / name
+
+    @staticmethod
+    def _log_matrix_summary(
+        results: Mapping[str, TargetResult], task_cells: Mapping[str, Optional[MatrixCell]], wall: float
+    ) -> None:
+        per_cell: Dict[str, List[TargetResult]] = {}
+        for task, result in results.items():
+            cell = task_cells[task]
+            assert cell is not None
+            per_cell.setdefault(cell.tag, []).append(result)
+        logger.info("Matrix summary (wall time %.2fs):", wall)
+        for tag, cell_results in per_cell.items():
+            detail = ", ".join(
+                f"{r.name.split('[', 1)[0]} {r.duration:.2f}s" + ("" if r.status == STATUS_OK else f" {r.status}")
+                for r in sorted(cell_results, key=lambda r: r.name)
+            )
+            logger.info("  %s: %.2fs (%s)", tag, sum(r.duration for r in cell_results), detail)
+
+    def _create_builder(
+        self, name: str, builder_cls: type, project: ProjectInfo, cell: Optional[MatrixCell] = None
+    ) -> Builder:
+        # Pass config to docker builder
+        if name == "docker" and self.config:
+            base_image, runtime_image = self.config.docker.base_image, self.config.docker.runtime_image
+            if cell is not None:
+                # Each matrix cell pins the image to its interpreter's version
+                if not cell.image and "<version>" not in base_image:
+                    base_image = "python:<version>-slim"
+                base_image = (cell.image or base_image).replace("<version>", cell.version)
+                runtime_image = runtime_image.replace("<version>", cell.version) if runtime_image else None
+            builder = builder_cls(
+                base_image=base_image,
+                entrypoint=self.config.docker.entrypoint,
+                mode=self.config.docker.mode,
+                runtime_image=runtime_image,
+                context=self.config.docker.context,
+                include=self.config.docker.include,
+                installer=self.config.docker.installer,
+                bytecode=self._bytecode(),
+            )
+        elif name == "oci" and self.config:
+            builder = builder_cls(
+                base=self.config.oci.base,
+                entrypoint=self.config.oci.entrypoint,
+                prefix=self.config.oci.prefix,
+                python_version=cell.version if cell else self.config.oci.python_version,
+                platform=self.config.oci.platform,
+                compression=self._compression(),
+            )
+        elif name == "wheel" and self.config:
+            builder = builder_cls(
+                formats=self.config.wheel.formats,
+                from_sdist=self.config.wheel.from_sdist,
+                reproducible=self.config.wheel.reproducible,
+                compression=self._compression(),
+                # Cells build concurrently; keep their in-tree build state apart
+                copy_source=cell is not None,
+            )
+        elif name == "binary" and self.config:
+            builder = builder_cls(
+                entry_point=self.config.binary.entry_point,
+                interpreter=self.config.binary.interpreter,
+                compress=self.config.binary.compress,
+                report_startup=self.config.binary.report_startup,
+                compression=self._compression(),
+                bytecode=self._bytecode(),
+            )
+        else:
+            builder = builder_cls()
+
+        logger.info("Configuring builder: %s", self._task_name(name, cell))
+        with tracing.span(f"configure {self._task_name(name, cell)}"):
             builder.configure(project)
-            with isolated_env() as _env:
-                # Future: install deps and tools in env
-                artifact_dir = output_dir / name
-                artifact_dir.mkdir(parents=True, exist_ok=True)
-                logger.info("Running builder: %s", name)
-                builder.build(artifact_dir)
+        return builder
+
+    def _compression(self) -> Compression:
+        settings = self.config.compression if self.config else None
+        if settings is None:
+            return Compression()
+        return Compression(level=settings.level, threads=settings.threads, store=tuple(settings.store))
+
+    def _bytecode(self) -> Bytecode:
+        settings = self.config.bytecode if self.config else None
+        if settings is None:
+            return Bytecode()
+        return Bytecode(invalidation=settings.invalidation, profile=settings.profile, top=settings.top)
+
+    def _fingerprints(
+        self,
+        cache: BuildCache,
+        sources: SourceTree,
+        project: ProjectInfo,
+        instances: Mapping[str, Builder],
+        dependencies: Mapping[str, Iterable[str]],
+        task_cells: Mapping[str, Optional[MatrixCell]],
+    ) -> Dict[str, str]:
+        source_digest = cache.source_digest(sources)
+        fingerprints: Dict[str, str] = {}
+
+        def visit(name: str) -> str:
+            if name not in fingerprints:
+                deps = [visit(d) for d in dependencies[name] if d in instances] + self.upstream
+                cell = task_cells[name]
+                fingerprints[name] = cache.fingerprint(
+                    instances[name], project, self.config, source_digest, deps,
+                    interpreter=(os.path.realpath(cell.interpreter), cell.full_version) if cell else None,
+                )
+            return fingerprints[name]
+
+        for name in instances:
+            visit(name)
+        return fingerprints
 
     @staticmethod
-    def _select_builders(
-        available: Mapping[str, type], requested: set[str]
-    ) -> Mapping[str, type]:
-        if not requested:
-            return available
-        return {k: v for k, v in available.items() if k in requested}
+    def _run_builder(
+        name: str,
+        builder: Builder,
+        provider: EnvironmentProvider,
+        artifact_dir: Path,
+        cache: BuildCache,
+        fingerprint: str,
+        force: bool,
+        interpreter: Optional[str] = None,
+        remote: Optional[RemoteCache] = None,
+    ) -> None:
+        with tracing.span(f"cache lookup {name}", "cache"):
+            hit = not force and (
+                cache.lookup(name, fingerprint, artifact_dir) or cache.adopt(name, fingerprint, artifact_dir)
+            )
+        if hit:
+            logger.info("Cache hit for target %s; skipping build", name)
+            return
+        # A fetch cannot bring back transient outputs, so such targets are rebuilt
+        if remote is not None and builder.transient:
+            remote = None
+        if not force and remote is not None and remote.fetch(name, fingerprint, artifact_dir):
+            with tracing.span(f"cache store {name}", "cache"):
+                cache.record(name, fingerprint, artifact_dir)
+            return
+        logger.info("Cache %s for target %s", "bypassed" if force else "miss", name)
+
+        # Environments are provisioned on first request and shared by spec
+        spec = builder.environment_spec()
+        if interpreter is not None:
+            spec = dataclasses.replace(spec, interpreter=interpreter)
+        with tracing.span(f"environment {name}", spec=spec.kind):
+            env = provider.get(spec)
+        # Every file left in the directory is recorded (and uploaded) as an
+        # artifact, so earlier builds' outputs (an older version's wheel) go first
+        _empty_dir(artifact_dir)
+        logger.info("Running builder: %s", name)
+        with tracing.span(f"build {name}", "build"):
+            if env is None:
+                builder.build(artifact_dir)
+            else:
+                builder.build(artifact_dir, env)
+        with tracing.span(f"cache store {name}", "cache"):
+            artifacts = cache.record(name, fingerprint, artifact_dir, builder.transient)
+        if remote is not None:
+            remote.upload(name, fingerprint, artifact_dir, artifacts)
+
+    def _select_builders(self, requested: set[str]) -> Mapping[str, type]:
+        """Classes of the requested builders (all when none are), imported on first use."""
+        registry = get_registry()
+        names = [name for name in registry.names() if not requested or name in requested]
+        self._builders.update(registry.load_many(n for n in names if n not in self._builders))
+        return {name: self._builders[name] for name in names if name in self._builders}
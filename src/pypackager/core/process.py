@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import subprocess
+from pathlib import Path
+from typing import Mapping, Optional, Sequence, Union
+
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# Name of the build target running in the current thread; set by the scheduler
+current_target: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "pypackager_current_target", default=None
+)
+
+StrPath = Union[str, Path]
+
+
+def _span_name(args: Sequence[str]) -> str:
+    """Span name of a command: `pip install` for `python -m pip install ...`, else the program."""
+    if len(args) >= 3 and args[1] == "-m":
+        return " ".join(args[2:4])
+    return os.path.basename(args[0]) if args else "?"
+
+
+def run(
+    cmd: Sequence[StrPath],
+    cwd: Optional[StrPath] = None,
+    env: Optional[Mapping[str, str]] = None,
+) -> None:
+    """Run a subprocess, streaming its combined output line by line.
+
+    Each line is logged with the current target as prefix so output from
+    concurrently running targets stays attributable. Raises
+    `subprocess.CalledProcessError` on a non-zero exit status.
+    """
+    args = [os.fspath(c) for c in cmd]
+    prefix = current_target.get() or "-"
+    logger.debug("[%s] $ %s", prefix, " ".join(args))
+    with tracing.span(_span_name(args), "subprocess", argv=" ".join(args)[:500]) as span:
+        proc = subprocess.Popen(  # noqa: S603
+            args,
+            cwd=cwd,
+            env=dict(env) if env is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            text=True,
+            errors="replace",
+            bufsize=1,
+        )
+        assert proc.stdout is not None
+        with proc.stdout:
+            for line in proc.stdout:
+                logger.info("[%s] %s", prefix, line.rstrip())
+        returncode = tracing.wait(proc, span)
+        if span is not None:
+            span.set(returncode=returncode)
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, args)
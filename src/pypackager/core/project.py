@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import List, Optional
 
@@ -12,3 +12,6 @@ class ProjectInfo:
     root: Path
     python_requires: Optional[str]
     dependencies: List[str]
+    build_requires: List[str] = field(default_factory=list)
+    build_backend: str = "setuptools.build_meta:__legacy__"
+    backend_path: List[str] = field(default_factory=list)
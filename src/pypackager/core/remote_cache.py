@@ -0,0 +1,377 @@
+from __future__ import annotations
+
+import abc
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Dict, List, Mapping, Optional, Set
+
+from . import tracing
+from ..config import Config
+
+logger = logging.getLogger(__name__)
+
+ENTRY_VERSION = 1
+CHUNK_SIZE = 1024 * 1024
+UPLOAD_WORKERS = 4
+DEFAULT_TIMEOUT = 30.0
+
+
+class CacheUnavailable(RuntimeError):
+    """The remote cache could not be reached or answered with an error."""
+
+
+class CacheBackend(abc.ABC):
+    """Key/value blob storage behind a `RemoteCache`.
+
+    Keys are relative posix paths (`ac/<fingerprint>.json`,
+    `cas/<sha256[:2]>/<sha256>`). Backends raise `CacheUnavailable` when the
+    storage cannot be used at all; a missing key is not an error.
+    """
+
+    @abc.abstractmethod
+    def open(self, key: str) -> Optional[IO[bytes]]:
+        """A stream of the value of `key`, or None if absent."""
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool: ...
+
+    @abc.abstractmethod
+    def put(self, key: str, source: Path, size: int) -> None:
+        """Store the contents of `source` under `key`, atomically."""
+
+
+class FileSystemBackend(CacheBackend):
+    """A directory shared by all clients, e.g. an NFS mount."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def open(self, key: str) -> Optional[IO[bytes]]:
+        try:
+            return open(self.root / key, "rb")
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            raise CacheUnavailable(f"{self.root}: {e}") from e
+
+    def exists(self, key: str) -> bool:
+        return (self.root / key).is_file()
+
+    def put(self, key: str, source: Path, size: int) -> None:
+        target = self.root / key
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            shutil.copyfile(source, tmp)
+            os.replace(tmp, target)
+        except OSError as e:
+            raise CacheUnavailable(f"{self.root}: {e}") from e
+
+
+class HttpBackend(CacheBackend):
+    """GET/HEAD/PUT of `<url>/<key>`, as served by `pypackager cache serve`.
+
+    `PYPACKAGER_REMOTE_CACHE_TOKEN`, when set, is sent as a bearer token.
+    """
+
+    def __init__(self, url: str, timeout: float = DEFAULT_TIMEOUT, token: Optional[str] = None) -> None:
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.token = token if token is not None else os.environ.get("PYPACKAGER_REMOTE_CACHE_TOKEN")
+
+    def _request(self, key: str, method: str, data: Optional[IO[bytes]] = None, size: int = 0) -> IO[bytes]:
+        request = urllib.request.Request(f"{self.url}/{urllib.parse.quote(key)}", method=method, data=data)
+        if self.token:
+            request.add_header("Authorization", f"Bearer {self.token}")
+        if data is not None:
+            request.add_header("Content-Length", str(size))
+            request.add_header("Content-Type", "application/octet-stream")
+        return urllib.request.urlopen(request, timeout=self.timeout)  # noqa: S310
+
+    def open(self, key: str) -> Optional[IO[bytes]]:
+        try:
+            return self._request(key, "GET")
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise CacheUnavailable(f"GET {self.url}/{key}: HTTP {e.code}") from e
+        except (urllib.error.URLError, OSError) as e:
+            raise CacheUnavailable(f"{self.url}: {getattr(e, 'reason', e)}") from e
+
+    def exists(self, key: str) -> bool:
+        try:
+            with self._request(key, "HEAD"):
+                return True
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return False
+            raise CacheUnavailable(f"HEAD {self.url}/{key}: HTTP {e.code}") from e
+        except (urllib.error.URLError, OSError) as e:
+            raise CacheUnavailable(f"{self.url}: {getattr(e, 'reason', e)}") from e
+
+    def put(self, key: str, source: Path, size: int) -> None:
+        try:
+            with open(source, "rb") as fh, self._request(key, "PUT", fh, size):
+                pass
+        except urllib.error.HTTPError as e:
+            raise CacheUnavailable(f"PUT {self.url}/{key}: HTTP {e.code}") from e
+        except (urllib.error.URLError, OSError) as e:
+            raise CacheUnavailable(f"{self.url}: {getattr(e, 'reason', e)}") from e
+
+
+def backend_from_url(url: str) -> CacheBackend:
+    """`http(s)://...` for the HTTP protocol; `file://...` or a plain path for a shared directory."""
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme in ("http", "https"):
+        return HttpBackend(url)
+    if parsed.scheme == "file":
+        return FileSystemBackend(Path(urllib.request.url2pathname(parsed.path)))
+    if parsed.scheme and len(parsed.scheme) > 1:
+        raise ValueError(f"Unsupported remote cache URL: {url}")
+    return FileSystemBackend(Path(url).expanduser())
+
+
+def blob_key(sha256: str) -> str:
+    return f"cas/{sha256[:2]}/{sha256}"
+
+
+def entry_key(fingerprint: str) -> str:
+    return f"ac/{fingerprint}.json"
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    errors: int = 0
+    uploads: int = 0
+    bytes_downloaded: int = 0
+    bytes_uploaded: int = 0
+
+
+def _mib(n: int) -> str:
+    return f"{n / (1024 * 1024):.1f} MiB"
+
+
+class RemoteCache:
+    """Share target artifacts between machines, keyed by the target fingerprint.
+
+    An entry (`ac/<fingerprint>.json`) lists a target's artifacts by path,
+    SHA-256, size and mode; their contents are stored once by hash under
+    `cas/`. Downloads are streamed to disk and verified against their hash
+    before they replace anything. Uploads run on background threads while the
+    build continues, blobs before the entry that references them, and are
+    awaited by `flush()`. The first failure to reach the backend disables the
+    cache for the rest of the process, so an unreachable cache costs one
+    timeout and never fails a build.
+    """
+
+    def __init__(self, backend: CacheBackend, pull: bool = True, push: bool = True) -> None:
+        self.backend = backend
+        self.pull = pull
+        self.push = push
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._available = True
+        self._uploads: List[Future] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Entries and blobs found broken, overwritten by the next upload that has them
+        self._damaged: Set[str] = set()
+
+    def _failed(self, error: Exception) -> None:
+        with self._lock:
+            self.stats.errors += 1
+            was_available, self._available = self._available, False
+        if was_available:
+            logger.warning("Remote cache unavailable, continuing without it: %s", error)
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self.stats, name, getattr(self.stats, name) + delta)
+
+    def fetch(self, name: str, fingerprint: str, artifact_dir: Path) -> bool:
+        """Restore `name`'s artifacts for `fingerprint` into `artifact_dir`; False on a miss."""
+        if not (self.pull and self._available):
+            return False
+        with tracing.span(f"remote fetch {name}", "cache") as span:
+            try:
+                entry = self._read_entry(fingerprint)
+                if entry is None:
+                    self._count(misses=1)
+                    return False
+                with tempfile.TemporaryDirectory(prefix=".pypackager-remote-", dir=artifact_dir.parent) as tmp:
+                    staged = self._download_all(entry["artifacts"], Path(tmp))
+                    if staged is None:
+                        with self._lock:
+                            self._damaged.add(fingerprint)
+                        self._count(misses=1)
+                        return False
+                    if artifact_dir.exists():
+                        shutil.rmtree(artifact_dir)
+                    os.replace(staged, artifact_dir)
+            except CacheUnavailable as e:
+                self._failed(e)
+                return False
+            size = sum(a["size"] for a in entry["artifacts"].values())
+            if span is not None:
+                span.set(bytes=size)
+        self._count(hits=1)
+        logger.info("Remote cache hit for target %s (%d artifact(s), %s)", name, len(entry["artifacts"]), _mib(size))
+        return True
+
+    def _read_entry(self, fingerprint: str) -> Optional[Dict]:
+        stream = self.backend.open(entry_key(fingerprint))
+        if stream is None:
+            return None
+        with stream:
+            try:
+                data = json.loads(stream.read())
+            except (OSError, ValueError) as e:
+                raise CacheUnavailable(f"Unreadable cache entry for {fingerprint}: {e}") from e
+        if data.get("version") != ENTRY_VERSION or data.get("fingerprint") != fingerprint:
+            return None
+        return data
+
+    def _download_all(self, artifacts: Mapping[str, Dict], staging: Path) -> Optional[Path]:
+        root = staging / "artifacts"
+        root.mkdir()
+        for rel, record in sorted(artifacts.items()):
+            dest = (root / rel).resolve()
+            if root.resolve() not in dest.parents:
+                logger.warning("Ignoring remote cache entry with unsafe path %s", rel)
+                return None
+            if not self._download(record["sha256"], dest):
+                logger.warning("Remote cache is missing or has a corrupt blob for %s", rel)
+                with self._lock:
+                    self._damaged.add(record["sha256"])
+                return None
+            if record.get("mode", 0) & stat.S_IXUSR:
+                os.chmod(dest, 0o755)
+        return root
+
+    def _download(self, sha256: str, dest: Path) -> bool:
+        stream = self.backend.open(blob_key(sha256))
+        if stream is None:
+            return False
+        digest = hashlib.sha256()
+        received = 0
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with stream, open(dest, "wb") as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    received += len(chunk)
+        except OSError as e:
+            raise CacheUnavailable(f"Download of {sha256} failed: {e}") from e
+        finally:
+            self._count(bytes_downloaded=received)
+        return digest.hexdigest() == sha256
+
+    def upload(self, name: str, fingerprint: str, artifact_dir: Path, artifacts: Mapping[str, Dict]) -> None:
+        """Queue the upload of a freshly built target; returns immediately."""
+        if not (self.push and self._available) or not artifacts:
+            return
+        entry = {
+            "version": ENTRY_VERSION,
+            "fingerprint": fingerprint,
+            "target": name,
+            "artifacts": {
+                rel: {
+                    "sha256": record["sha256"],
+                    "size": record["size"],
+                    "mode": stat.S_IMODE((artifact_dir / rel).stat().st_mode),
+                }
+                for rel, record in artifacts.items()
+            },
+        }
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="pypackager-upload")
+            self._uploads.append(self._executor.submit(self._upload, name, entry, artifact_dir))
+
+    def _upload(self, name: str, entry: Dict, artifact_dir: Path) -> None:
+        if not self._available:
+            return
+        with tracing.span(f"remote upload {name}", "cache"):
+            try:
+                with self._lock:
+                    damaged = {entry["fingerprint"], *(r["sha256"] for r in entry["artifacts"].values())} & self._damaged
+                if not damaged and self.backend.exists(entry_key(entry["fingerprint"])):
+                    return
+                sent = 0
+                for rel, record in sorted(entry["artifacts"].items()):
+                    key = blob_key(record["sha256"])
+                    if record["sha256"] in damaged or not self.backend.exists(key):
+                        self.backend.put(key, artifact_dir / rel, record["size"])
+                        sent += record["size"]
+                with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as fh:
+                    json.dump(entry, fh, sort_keys=True)
+                try:
+                    size = os.path.getsize(fh.name)
+                    self.backend.put(entry_key(entry["fingerprint"]), Path(fh.name), size)
+                finally:
+                    os.unlink(fh.name)
+            except CacheUnavailable as e:
+                self._failed(e)
+                return
+            except OSError as e:
+                # The artifacts changed under us (e.g. a rebuild); skip this upload
+                logger.warning("Skipping remote cache upload of %s: %s", name, e)
+                return
+        self._count(uploads=1, bytes_uploaded=sent + size)
+        logger.debug("Uploaded target %s to the remote cache (%s)", name, _mib(sent))
+
+    def flush(self) -> None:
+        """Wait for queued uploads and log the transfers since the previous flush."""
+        with self._lock:
+            pending, self._uploads = self._uploads, []
+        waiting = sum(not f.done() for f in pending)
+        if waiting:
+            logger.info("Waiting for %d remote cache upload(s)", waiting)
+        for future in pending:
+            future.result()
+        with self._lock:
+            s, self.stats = self.stats, CacheStats()
+        logger.info(
+            "Remote cache: %d hit(s), %d miss(es), %d error(s); %s downloaded, %s uploaded in %d upload(s)",
+            s.hits, s.misses, s.errors, _mib(s.bytes_downloaded), _mib(s.bytes_uploaded), s.uploads,
+        )
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+def remote_cache_from_config(config: Optional[Config]) -> Optional[RemoteCache]:
+    """The cache configured by `PYPACKAGER_REMOTE_CACHE` or `[pypackager.cache]`, if any."""
+    settings = config.cache if config else None
+    url = os.environ.get("PYPACKAGER_REMOTE_CACHE") or (settings.remote if settings else None)
+    if not url:
+        return None
+    cache = RemoteCache(
+        backend_from_url(url),
+        pull=settings.pull if settings else True,
+        push=settings.push if settings else True,
+    )
+    logger.debug("Using remote cache %s (pull=%s, push=%s)", url, cache.pull, cache.push)
+    return cache
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import base64
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import IO, List, Optional, Tuple
+
+from . import tracing
+from .archive import Compression, ParallelGzipWriter, ParallelZipWriter
+from .hashing import CHUNK_SIZE, file_sha256
+
+logger = logging.getLogger(__name__)
+
+# The earliest time a zip archive can represent (1980-01-01T00:00:00Z)
+ZIP_EPOCH = 315532800
+_SIGNATURES = ("RECORD.jws", "RECORD.p7s")
+
+
+def source_date_epoch(project_root: Path) -> int:
+    """`SOURCE_DATE_EPOCH`, else the time of the last commit touching the project, else 1980-01-01.
+
+    Only commits to the project directory count, so in a monorepo a commit
+    elsewhere leaves the project's archives (and their fingerprints) alone.
+    """
+    value = os.environ.get("SOURCE_DATE_EPOCH")
+    if value:
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"SOURCE_DATE_EPOCH must be an integer, not {value!r}") from None
+    try:
+        proc = subprocess.run(  # noqa: S603
+            ["git", "log", "-1", "--format=%ct", "--", "."],  # noqa: S607
+            cwd=project_root,
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return ZIP_EPOCH
+    stamp = proc.stdout.strip()
+    return int(stamp) if proc.returncode == 0 and stamp.isdigit() else ZIP_EPOCH
+
+
+class _Digest:
+    """Read-through wrapper counting the bytes and SHA-256 of what is read from it."""
+
+    def __init__(self, fh: IO[bytes]) -> None:
+        self._fh = fh
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, n: int = -1) -> bytes:
+        data = self._fh.read(n)
+        self.sha256.update(data)
+        self.size += len(data)
+        return data
+
+    def record_hash(self) -> str:
+        return "sha256=" + base64.urlsafe_b64encode(self.sha256.digest()).rstrip(b"=").decode("ascii")
+
+
+def _wheel_order(name: str) -> Tuple[int, str]:
+    """Sort key for wheel members: the .dist-info directory last, its RECORD at the very end."""
+    top, _, rest = name.partition("/")
+    if not top.endswith(".dist-info"):
+        return 0, name
+    return (2, name) if rest == "RECORD" else (1, name)
+
+
+def normalize_wheel(wheel: Path, epoch: int, compression: Optional[Compression] = None) -> bool:
+    """Rewrite `wheel` reproducibly; True if its bytes changed.
+
+    Members are sorted (the .dist-info directory last), stamped with the
+    earlier of their own time and `epoch`, given 0644/0755 permissions and
+    recompressed in parallel (see `core.archive`); RECORD is regenerated from
+    the hashes of the data as it is copied. Signatures of the old RECORD are
+    dropped.
+    """
+    stamp = time.gmtime(max(epoch, ZIP_EPOCH))[:6]
+    tmp = wheel.with_name(f".{wheel.name}.tmp")
+    rows: List[str] = []
+    record_name: Optional[str] = None
+    with zipfile.ZipFile(wheel) as src, open(tmp, "wb") as fh, ParallelZipWriter(fh, compression) as dst:
+        for info in sorted(src.infolist(), key=lambda i: _wheel_order(i.filename)):
+            top, _, rest = info.filename.partition("/")
+            if top.endswith(".dist-info") and rest in _SIGNATURES:
+                logger.warning("Dropping %s from %s: it signs the original RECORD", info.filename, wheel.name)
+                continue
+            if top.endswith(".dist-info") and rest == "RECORD":
+                record_name = info.filename
+                continue
+            date_time = min(info.date_time, stamp)
+            if info.is_dir():
+                dst.mkdir(info.filename, date_time)
+                continue
+            mode = 0o755 if (info.external_attr >> 16) & 0o111 else 0o644
+            with src.open(info) as fin:
+                digest = _Digest(fin)
+                dst.add(info.filename, digest, mode, date_time)  # type: ignore[arg-type]
+            rows.append(f"{_csv_field(info.filename)},{digest.record_hash()},{digest.size}")
+        if record_name is None:
+            raise RuntimeError(f"{wheel.name} has no .dist-info/RECORD")
+        rows.append(f"{_csv_field(record_name)},,")
+        dst.add_bytes(record_name, "".join(f"{row}\n" for row in rows).encode("utf-8"), date_time=stamp)
+    return _replace_if_changed(tmp, wheel)
+
+
+def _csv_field(value: str) -> str:
+    return f'"{value.replace(chr(34), chr(34) * 2)}"' if any(c in value for c in ',"\n\r') else value
+
+
+def normalize_sdist(sdist: Path, epoch: int, compression: Optional[Compression] = None) -> bool:
+    """Rewrite a .tar.gz sdist reproducibly; True if its bytes changed.
+
+    Members are sorted by name, owned by root with empty user/group names,
+    stamped with the earlier of their own time and `epoch`, and reduced to
+    0644/0755 permissions; the gzip stream is compressed in parallel and its
+    header carries no name or timestamp.
+    Archives already in sorted order are rewritten in a single streaming
+    pass; others have their members spooled to a temporary directory first.
+    """
+    tmp = sdist.with_name(f".{sdist.name}.tmp")
+    with tarfile.open(sdist, "r|gz") as tar:
+        names = [member.name for member in tar]
+    with open(tmp, "wb") as raw, ParallelGzipWriter(raw, compression) as gz:
+        with tarfile.open(fileobj=gz, mode="w|", format=tarfile.PAX_FORMAT) as out:  # type: ignore[call-overload]
+            if names == sorted(set(names)):
+                with tarfile.open(sdist, "r|gz") as tar:
+                    for member in tar:
+                        _add_member(out, member, tar.extractfile(member) if member.isfile() else None, epoch)
+            else:
+                with tempfile.TemporaryDirectory(prefix="pypackager-sdist-") as spool:
+                    members = []
+                    with tarfile.open(sdist, "r|gz") as tar:
+                        for index, member in enumerate(tar):
+                            if member.isfile():
+                                with tar.extractfile(member) as fin, open(Path(spool, str(index)), "wb") as fout:  # type: ignore[union-attr]
+                                    shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+                            members.append((member.name, index, member))
+                    # A name repeated in the archive keeps its last occurrence, as on extraction
+                    latest = {name: (index, member) for name, index, member in members}
+                    for name in sorted(latest):
+                        index, member = latest[name]
+                        if member.isfile():
+                            with open(Path(spool, str(index)), "rb") as fin:
+                                _add_member(out, member, fin, epoch)
+                        else:
+                            _add_member(out, member, None, epoch)
+    return _replace_if_changed(tmp, sdist)
+
+
+def _add_member(out: tarfile.TarFile, member: tarfile.TarInfo, data: Optional[IO[bytes]], epoch: int) -> None:
+    member.mtime = min(int(member.mtime), epoch)
+    member.uid = member.gid = 0
+    member.uname = member.gname = ""
+    member.pax_headers = {}
+    if member.isdir():
+        member.mode = 0o755
+    elif member.issym():
+        member.mode = 0o777
+    else:
+        member.mode = 0o755 if member.mode & 0o111 else 0o644
+    out.addfile(member, data)
+
+
+def _replace_if_changed(tmp: Path, target: Path) -> bool:
+    if file_sha256(tmp) == file_sha256(target):
+        tmp.unlink()
+        return False
+    os.replace(tmp, target)
+    return True
+
+
+def recompress_wheel(wheel: Path, compression: Optional[Compression] = None) -> None:
+    """Recompress `wheel` in parallel, keeping its members, their order, times and modes."""
+    tmp = wheel.with_name(f".{wheel.name}.tmp")
+    with zipfile.ZipFile(wheel) as src, open(tmp, "wb") as fh, ParallelZipWriter(fh, compression) as dst:
+        for info in src.infolist():
+            if info.is_dir():
+                dst.mkdir(info.filename, info.date_time)
+                continue
+            with src.open(info) as fin:
+                dst.add(info.filename, fin, (info.external_attr >> 16) & 0o7777 or 0o644, info.date_time)  # type: ignore[arg-type]
+    os.replace(tmp, wheel)
+
+
+def recompress_sdist(sdist: Path, compression: Optional[Compression] = None) -> None:
+    """Recompress a .tar.gz sdist in parallel, leaving its tar stream as it is."""
+    tmp = sdist.with_name(f".{sdist.name}.tmp")
+    with gzip.open(sdist, "rb") as src, open(tmp, "wb") as raw, ParallelGzipWriter(raw, compression) as gz:
+        shutil.copyfileobj(src, gz, CHUNK_SIZE)
+    os.replace(tmp, sdist)
+
+
+def normalize_archive(path: Path, epoch: int, compression: Optional[Compression] = None) -> None:
+    """Make a built wheel or sdist reproducible in place."""
+    with tracing.span(f"normalize {path.name}"):
+        try:
+            if path.name.endswith(".whl"):
+                changed = normalize_wheel(path, epoch, compression)
+            elif path.name.endswith(".tar.gz"):
+                changed = normalize_sdist(path, epoch, compression)
+            else:
+                raise ValueError(f"Not a wheel or .tar.gz sdist: {path.name}")
+        except BaseException:
+            path.with_name(f".{path.name}.tmp").unlink(missing_ok=True)
+            raise
+    logger.info("Normalized %s%s", path.name, "" if changed else " (already reproducible)")
+
+
+def recompress_archive(path: Path, compression: Optional[Compression] = None) -> None:
+    """Compress a wheel or sdist the backend wrote uncompressed, as `normalize_archive` does."""
+    with tracing.span(f"recompress {path.name}"):
+        try:
+            if path.name.endswith(".whl"):
+                recompress_wheel(path, compression)
+            elif path.name.endswith(".tar.gz"):
+                recompress_sdist(path, compression)
+            else:
+                raise ValueError(f"Not a wheel or .tar.gz sdist: {path.name}")
+        except BaseException:
+            path.with_name(f".{path.name}.tmp").unlink(missing_ok=True)
+            raise
+    logger.info("Compressed %s", path.name)
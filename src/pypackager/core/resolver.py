@@ -1,38 +1,420 @@
 from __future__ import annotations
 
-import datetime as _dt
+import hashlib
+import json
 import logging
+import os
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, List
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+try:
+    import tomllib  # Python 3.11+
+except ModuleNotFoundError:  # pragma: no cover - fallback
+    import tomli as tomllib  # type: ignore
+
+from packaging.markers import Marker
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import canonicalize_name
+
+from . import process
+from .cache import user_cache_dir
+from .hashing import file_sha256
+from .wheelhouse import Wheelhouse
 
 logger = logging.getLogger(__name__)
 
+LOCK_VERSION = 1
+LOCK_FILENAME = "pypackager.lock"
+
+# Marker variables that identify a resolution environment
+_ENV_KEYS = ("implementation_name", "python_version", "sys_platform", "platform_machine")
+
+
+@dataclass
+class LockedPackage:
+    name: str
+    version: str
+    hashes: List[str] = field(default_factory=list)
+    requires: List[str] = field(default_factory=list)
+    # Environments (see `_env_label`) this pin applies to
+    environments: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Resolution:
+    """Pinned packages per resolution environment."""
+
+    environments: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    packages: Dict[Tuple[str, str], LockedPackage] = field(default_factory=dict)
+
+    def pins(self, environment: str) -> Dict[str, str]:
+        return {
+            pkg.name: pkg.version for pkg in self.packages.values() if environment in pkg.environments
+        }
+
+
+def _env_label(env: Mapping[str, str]) -> str:
+    return "-".join(env[k] for k in _ENV_KEYS)
+
+
+def _env_marker(env: Mapping[str, str]) -> str:
+    return " and ".join(f'{k} == "{env[k]}"' for k in _ENV_KEYS)
+
+
+def _toml_str(value: str) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _toml_list(values: Iterable[str]) -> str:
+    return "[" + ", ".join(_toml_str(v) for v in values) + "]"
+
 
 class DependencyResolver:
-    """Dependency resolver stub for MVP scaffolding.
+    """Resolve declared dependencies into a pinned, deterministic lockfile.
+
+    Resolution runs pip's resolver (`pip install --dry-run --report`) once per
+    target interpreter, so environment markers are evaluated by the interpreter
+    they apply to. The lockfile pins every package with its artifact hashes and,
+    when a pin does not apply to every target, an environment marker. It is
+    sorted and carries no timestamp, so identical inputs give identical bytes.
+
+    Results are memoized by a hash of the inputs (dependencies,
+    `requires-python`, target interpreters): an unchanged project skips
+    resolution entirely. When declared dependencies are only added or removed,
+    the previous pins are kept as constraints and only new requirements are
+    resolved, while removed ones are pruned from the graph.
 
-    MVP: produce a TOML lockfile with declared dependencies.
-    Note: future implementation will resolve dependencies using pip in isolated environments.
+    `local_pins` names packages built locally (workspace projects) with their
+    versions. They resolve to their wheels in the wheelhouse (see
+    `Wheelhouse.local`) as direct references, so an index never supplies a
+    same-named distribution instead.
     """
 
-    def __init__(self, project_root: Path) -> None:
+    def __init__(
+        self,
+        project_root: Path,
+        wheelhouse: Optional[Wheelhouse] = None,
+        interpreters: Sequence[str] = (),
+        cache_dir: Optional[Path] = None,
+        local_pins: Optional[Mapping[str, str]] = None,
+    ) -> None:
         self.project_root = project_root
+        self.local_pins = {canonicalize_name(n): v for n, v in (local_pins or {}).items()}
+        self.lock_path = project_root / LOCK_FILENAME
+        self.wheelhouse = wheelhouse
+        self.interpreters = list(interpreters) or [sys.executable]
+        self.cache_dir = cache_dir or (user_cache_dir() / "resolve")
+        self._environments: Optional[Dict[str, Dict[str, str]]] = None
+        # The interpreter resolving each environment: the first one with its label
+        self._labelled: Dict[str, str] = {}
 
-    def write_lockfile(self, name: str, version: str, dependencies: Iterable[str]) -> Path:
-        lock_path = self.project_root / "pypackager.lock"
-        deps = list(dependencies)
-        created = _dt.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
-        # lightweight TOML emit to avoid a writer dependency
-        body = [
-            f"# pypackager lockfile (MVP stub)\n",
-            f"# created: {created}\n",
-            "[project]\n",
-            f"name = \"{name}\"\n",
-            f"version = \"{version}\"\n",
-            "\n[dependencies]\n",
+    def write_lockfile(
+        self,
+        name: str,
+        version: str,
+        dependencies: Iterable[str],
+        python_requires: Optional[str] = None,
+    ) -> Path:
+        deps = sorted({d.strip() for d in dependencies if d.strip()})
+        input_hash = self.input_hash(deps, python_requires)
+        previous = self._read_lock()
+        resolution: Optional[Resolution] = None
+        if previous.get("input-hash") == input_hash:
+            project = previous.get("project", {})
+            if (project.get("name"), project.get("version")) == (name, version):
+                logger.info("Lockfile up to date: %s", self.lock_path)
+                return self.lock_path
+            resolution = self._from_lock(previous)
+
+        resolution = resolution or self._cached(input_hash)
+        if resolution is None:
+            resolution = self._resolve_incrementally(deps, python_requires, previous) or self._resolve(deps)
+            self._store(input_hash, resolution)
+        self.lock_path.write_text(
+            self._render(name, version, python_requires, deps, input_hash, resolution), encoding="utf-8"
+        )
+        logger.info("Wrote lockfile: %s", self.lock_path)
+        return self.lock_path
+
+    def pinned_requirements(self) -> List[str]:
+        """Exact `name==version` requirements from the lockfile, with markers."""
+        reqs = []
+        for pkg in self._read_lock().get("package", []):
+            req = f"{pkg['name']}=={pkg['version']}"
+            if pkg.get("marker"):
+                req += f"; {pkg['marker']}"
+            reqs.append(req)
+        return reqs
+
+    def sync_wheelhouse(
+        self, wheelhouse: Wheelhouse, requirements: Iterable[str], python: Optional[str] = None
+    ) -> None:
+        """Populate `wheelhouse` with wheels for `requirements` and their dependencies.
+
+        In offline mode this only verifies the wheels are present.
+        """
+        wheelhouse.ensure(requirements, python)
+
+    def input_hash(self, dependencies: Sequence[str], python_requires: Optional[str]) -> str:
+        payload = {
+            "lock-version": LOCK_VERSION,
+            "dependencies": sorted(dependencies),
+            "requires-python": python_requires,
+            "environments": sorted(self.environments()),
+        }
+        if self.local_pins:
+            # A local wheel may change (e.g. gain a dependency) without a version bump
+            wheels = self.wheelhouse.local if self.wheelhouse is not None else {}
+            payload["local-pins"] = sorted(
+                (name, version, file_sha256(wheels[name]) if name in wheels else None)
+                for name, version in self.local_pins.items()
+            )
+        blob = json.dumps(payload, sort_keys=True)
+        return "sha256:" + hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def environments(self) -> Dict[str, Dict[str, str]]:
+        """Marker environments of the target interpreters, by label."""
+        if self._environments is None:
+            envs: Dict[str, Dict[str, str]] = {}
+            labelled: Dict[str, str] = {}
+            for interpreter in self.interpreters:
+                if os.path.realpath(interpreter) == os.path.realpath(sys.executable):
+                    from packaging.markers import default_environment
+
+                    env = dict(default_environment())
+                else:
+                    env = self._probe_environment(interpreter)
+                label = _env_label(env)
+                envs.setdefault(label, env)
+                labelled.setdefault(label, interpreter)
+            self._environments, self._labelled = envs, labelled
+        return self._environments
+
+    @staticmethod
+    def _probe_environment(interpreter: str) -> Dict[str, str]:
+        # Target interpreters may lack `packaging`; compute the marker keys we use directly.
+        script = (
+            "import json, os, platform, sys; print(json.dumps({"
+            "'implementation_name': sys.implementation.name, "
+            "'python_version': '.'.join(platform.python_version_tuple()[:2]), "
+            "'python_full_version': platform.python_version(), "
+            "'sys_platform': sys.platform, 'platform_machine': platform.machine(), "
+            "'os_name': os.name, 'platform_system': platform.system(), "
+            "'platform_python_implementation': platform.python_implementation(), "
+            "'platform_release': platform.release(), 'platform_version': platform.version(), "
+            "'implementation_version': platform.python_version()}))"
+        )
+        out = subprocess.check_output([interpreter, "-c", script], text=True)  # noqa: S603
+        return json.loads(out)
+
+    def _resolve(
+        self,
+        dependencies: Sequence[str],
+        constraints: Optional[Mapping[str, Mapping[str, str]]] = None,
+    ) -> Resolution:
+        resolution = Resolution(environments=self.environments())
+        for label, env in self.environments().items():
+            if not dependencies:
+                continue
+            report = self._pip_report(self._labelled[label], dependencies, (constraints or {}).get(label, {}))
+            self._merge_report(resolution, label, env, report)
+        logger.info("Resolved %d package pin(s) for %d environment(s)", len(resolution.packages), len(resolution.environments))
+        return resolution
+
+    def _pip_report(self, interpreter: str, requirements: Sequence[str], constraints: Mapping[str, str]) -> Dict:
+        with tempfile.TemporaryDirectory(prefix="pypackager-resolve-") as tmp:
+            report_path = Path(tmp) / "report.json"
+            cmd = [
+                interpreter, "-m", "pip", "install", "--dry-run", "--ignore-installed", "--quiet",
+                "--disable-pip-version-check", "--report", os.fspath(report_path),
+            ]
+            references = self._local_references()
+            constraints = {
+                n: v for n, v in {**constraints, **self.local_pins}.items() if n not in references
+            }
+            if constraints:
+                constraints_path = Path(tmp) / "constraints.txt"
+                constraints_path.write_text(
+                    "".join(f"{n}=={v}\n" for n, v in sorted(constraints.items())), encoding="utf-8"
+                )
+                cmd += ["--constraint", os.fspath(constraints_path)]
+            if self.wheelhouse is not None and self.wheelhouse.offline:
+                cmd += self.wheelhouse.install_args()
+            elif self.wheelhouse is not None and self.wheelhouse.wheels_dir.is_dir():
+                cmd += ["--find-links", os.fspath(self.wheelhouse.wheels_dir)]
+            cmd += [*requirements, *references.values()]
+            process.run(cmd)
+            return json.loads(report_path.read_text(encoding="utf-8"))
+
+    def _local_references(self) -> Dict[str, str]:
+        """Direct references to the wheels of `local_pins` present in the wheelhouse."""
+        wheels = self.wheelhouse.local if self.wheelhouse is not None else {}
+        return {name: f"{name} @ {wheels[name].as_uri()}" for name in self.local_pins if name in wheels}
+
+    @staticmethod
+    def _merge_report(resolution: Resolution, label: str, env: Mapping[str, str], report: Mapping) -> None:
+        items = report.get("install", [])
+        resolved = {canonicalize_name(item["metadata"]["name"]) for item in items}
+        for item in items:
+            meta = item["metadata"]
+            name = canonicalize_name(meta["name"])
+            extras = set(item.get("requested_extras") or []) | {""}
+            requires: Set[str] = set()
+            for spec in meta.get("requires_dist") or []:
+                try:
+                    req = Requirement(spec)
+                except InvalidRequirement:
+                    continue
+                dep = canonicalize_name(req.name)
+                if dep not in resolved:
+                    continue
+                if req.marker is None or any(req.marker.evaluate({**env, "extra": e}) for e in extras):
+                    requires.add(dep)
+            hashes = item.get("download_info", {}).get("archive_info", {}).get("hashes", {})
+            pkg = resolution.packages.setdefault((name, meta["version"]), LockedPackage(name, meta["version"]))
+            pkg.hashes = sorted(set(pkg.hashes) | {f"{algo}:{value}" for algo, value in hashes.items()})
+            pkg.requires = sorted(set(pkg.requires) | requires)
+            pkg.environments = sorted(set(pkg.environments) | {label})
+
+    def _resolve_incrementally(
+        self, dependencies: Sequence[str], python_requires: Optional[str], previous: Mapping
+    ) -> Optional[Resolution]:
+        """Reuse the previous lock when only declared dependencies changed."""
+        if not previous or previous.get("version") != LOCK_VERSION:
+            return None
+        old_project = previous.get("project", {})
+        old_deps = set(old_project.get("dependencies", []))
+        if sorted(previous.get("environments", [])) != sorted(self.environments()):
+            return None
+        if old_project.get("requires-python") != python_requires:
+            return None
+
+        resolution = self._from_lock(previous)
+        if any(self.local_pins.get(canonicalize_name(n), v) != v for n, v in resolution.packages):
+            return None
+        kept = [d for d in dependencies if d in old_deps]
+        added = [d for d in dependencies if d not in old_deps]
+        self._prune(resolution, kept)
+        if added:
+            constraints = {label: resolution.pins(label) for label in resolution.environments}
+            try:
+                update = self._resolve(added, constraints)
+            except subprocess.CalledProcessError:
+                logger.info("Incremental resolution conflicted with existing pins; resolving from scratch")
+                return None
+            for key, pkg in update.packages.items():
+                existing = resolution.packages.setdefault(key, LockedPackage(pkg.name, pkg.version))
+                existing.hashes = sorted(set(existing.hashes) | set(pkg.hashes))
+                existing.requires = sorted(set(existing.requires) | set(pkg.requires))
+                existing.environments = sorted(set(existing.environments) | set(pkg.environments))
+        logger.info("Re-resolved incrementally: %d added, %d removed", len(added), len(old_deps - set(kept)))
+        return resolution
+
+    def _from_lock(self, lock: Mapping) -> Resolution:
+        resolution = Resolution(environments=self.environments())
+        for entry in lock.get("package", []):
+            pkg = LockedPackage(
+                entry["name"], entry["version"], list(entry.get("hashes", [])),
+                list(entry.get("requires", [])), list(entry.get("environments", [])),
+            )
+            resolution.packages[(pkg.name, pkg.version)] = pkg
+        return resolution
+
+    @staticmethod
+    def _prune(resolution: Resolution, roots: Sequence[str]) -> None:
+        """Drop pins no longer reachable from `roots` in each environment."""
+        for label, env in resolution.environments.items():
+            by_name = {p.name: p for p in resolution.packages.values() if label in p.environments}
+            stack = []
+            for spec in roots:
+                req = Requirement(spec)
+                if req.marker is None or req.marker.evaluate(dict(env)):
+                    stack.append(canonicalize_name(req.name))
+            reachable: Set[str] = set()
+            while stack:
+                name = stack.pop()
+                if name in reachable or name not in by_name:
+                    continue
+                reachable.add(name)
+                stack.extend(by_name[name].requires)
+            for name, pkg in by_name.items():
+                if name not in reachable:
+                    pkg.environments = [e for e in pkg.environments if e != label]
+        for key in [k for k, p in resolution.packages.items() if not p.environments]:
+            del resolution.packages[key]
+
+    def _render(
+        self,
+        name: str,
+        version: str,
+        python_requires: Optional[str],
+        dependencies: Sequence[str],
+        input_hash: str,
+        resolution: Resolution,
+    ) -> str:
+        labels = sorted(resolution.environments)
+        lines = [
+            "# pypackager lockfile; generated, do not edit\n",
+            f"version = {LOCK_VERSION}\n",
+            f"input-hash = {_toml_str(input_hash)}\n",
+            f"environments = {_toml_list(labels)}\n",
+            "\n[project]\n",
+            f"name = {_toml_str(name)}\n",
+            f"version = {_toml_str(version)}\n",
         ]
-        for i, dep in enumerate(deps):
-            body.append(f"dep{i} = \"{dep}\"\n")
-        lock_path.write_text("".join(body), encoding="utf-8")
-        logger.info("Wrote lockfile: %s", lock_path)
-        return lock_path
+        if python_requires:
+            lines.append(f"requires-python = {_toml_str(python_requires)}\n")
+        lines.append(f"dependencies = {_toml_list(sorted(dependencies))}\n")
+        for key in sorted(resolution.packages):
+            pkg = resolution.packages[key]
+            lines += [
+                "\n[[package]]\n",
+                f"name = {_toml_str(pkg.name)}\n",
+                f"version = {_toml_str(pkg.version)}\n",
+            ]
+            if sorted(pkg.environments) != labels:
+                marker = " or ".join(
+                    f"({_env_marker(resolution.environments[e])})" for e in sorted(pkg.environments)
+                )
+                Marker(marker)  # validate
+                lines.append(f"marker = {_toml_str(marker)}\n")
+            lines += [
+                f"environments = {_toml_list(sorted(pkg.environments))}\n",
+                f"requires = {_toml_list(sorted(pkg.requires))}\n",
+                f"hashes = {_toml_list(sorted(pkg.hashes))}\n",
+            ]
+        return "".join(lines)
+
+    def _read_lock(self) -> Dict:
+        try:
+            return tomllib.loads(self.lock_path.read_text(encoding="utf-8"))
+        except (OSError, tomllib.TOMLDecodeError):
+            return {}
+
+    def _cached(self, input_hash: str) -> Optional[Resolution]:
+        path = self.cache_dir / f"{input_hash.split(':', 1)[1]}.json"
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        logger.info("Reusing cached resolution %s", path.name)
+        resolution = Resolution(environments=data["environments"])
+        for entry in data["packages"]:
+            pkg = LockedPackage(**entry)
+            resolution.packages[(pkg.name, pkg.version)] = pkg
+        return resolution
+
+    def _store(self, input_hash: str, resolution: Resolution) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.cache_dir / f"{input_hash.split(':', 1)[1]}.json"
+        data = {
+            "environments": resolution.environments,
+            "packages": [vars(resolution.packages[k]) for k in sorted(resolution.packages)],
+        }
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, path)
@@ -2,50 +2,77 @@ from __future__ import annotations
 
 import logging
 from pathlib import Path
-from typing import List, Optional
-
-try:
-    import tomllib  # Python 3.11+
-except ModuleNotFoundError:  # pragma: no cover - fallback
-    import tomli as tomllib  # type: ignore
+from typing import TYPE_CHECKING, List, Optional
 
+from .metadata import DYNAMIC_FIELDS, MetadataCache, default_cache, load_toml
 from .project import ProjectInfo
 
+if TYPE_CHECKING:  # pragma: no cover
+    from .envpool import EnvironmentProvider
+    from .wheelhouse import Wheelhouse
+
 logger = logging.getLogger(__name__)
 
 
 class ProjectScanner:
     """Scan a Python project and derive metadata from PEP 621 pyproject.toml.
 
-    MVP: require pyproject.toml with PEP 621 fields `project.name`, `project.version`.
-    Legacy setup.py support will be added later.
+    `project.name` must be static. Fields listed in `project.dynamic`
+    (version, dependencies, requires-python) are computed by the build
+    backend and cached (see `core.metadata`); the backend runs in an
+    environment from `provider`, or from a temporary one when none is given.
     """
 
-    def __init__(self, project_root: Path) -> None:
+    def __init__(
+        self,
+        project_root: Path,
+        provider: Optional["EnvironmentProvider"] = None,
+        wheelhouse: Optional["Wheelhouse"] = None,
+        metadata: Optional[MetadataCache] = None,
+    ) -> None:
         self.project_root = project_root
         self.pyproject_path = project_root / "pyproject.toml"
+        self.provider = provider
+        self.wheelhouse = wheelhouse
+        self.metadata = metadata
 
     def scan(self) -> ProjectInfo:
         if not self.pyproject_path.exists():
             raise FileNotFoundError(f"pyproject.toml not found at {self.pyproject_path}")
 
-        data = tomllib.loads(self.pyproject_path.read_text(encoding="utf-8"))
+        data = load_toml(self.pyproject_path)
         project = data.get("project") or {}
 
         name = project.get("name")
+        dynamic: List[str] = [f for f in project.get("dynamic") or [] if f in DYNAMIC_FIELDS]
         version = project.get("version")
-        if not name or not version:
-            raise ValueError("project.name and project.version are required in pyproject.toml")
+        if not name or not (version or "version" in dynamic):
+            raise ValueError(
+                "project.name and project.version (or \"version\" in project.dynamic) are required in pyproject.toml"
+            )
 
         requires_python: Optional[str] = project.get("requires-python")
         deps: List[str] = list(project.get("dependencies") or [])
+        # PEP 518 default when no [build-system] table is present
+        build_system = data.get("build-system") or {}
+        # An explicit empty list is valid: a backend shipped in-tree via backend-path
+        requires = build_system.get("requires")
+        build_requires: List[str] = list(requires) if requires is not None else ["setuptools>=40.8.0"]
+        build_backend: str = build_system.get("build-backend") or "setuptools.build_meta:__legacy__"
+        backend_path: List[str] = list(build_system.get("backend-path") or [])
 
         info = ProjectInfo(
             name=name,
-            version=str(version),
+            version=str(version or ""),
             root=self.project_root,
             python_requires=requires_python,
             dependencies=deps,
+            build_requires=build_requires,
+            build_backend=build_backend,
+            backend_path=backend_path,
         )
+        if dynamic:
+            metadata = self.metadata or default_cache()
+            info = metadata.resolve(info, dynamic, self.provider, self.wheelhouse)
         logger.debug("Scanned project: %s", info)
         return info
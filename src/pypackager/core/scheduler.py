@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Set
+
+from .process import current_target
+
+logger = logging.getLogger(__name__)
+
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+
+
+@dataclass
+class TargetResult:
+    name: str
+    status: str
+    duration: float = 0.0
+    error: Optional[BaseException] = None
+
+
+class BuildFailed(RuntimeError):
+    """Raised when one or more targets failed; carries every target's result."""
+
+    def __init__(self, results: Mapping[str, TargetResult]) -> None:
+        self.results = dict(results)
+        failed = sorted(n for n, r in self.results.items() if r.status == STATUS_FAILED)
+        skipped = sorted(n for n, r in self.results.items() if r.status == STATUS_SKIPPED)
+        message = f"Build failed for target(s): {', '.join(failed)}"
+        if skipped:
+            message += f" (skipped dependents: {', '.join(skipped)})"
+        super().__init__(message)
+
+
+def default_jobs() -> int:
+    return os.cpu_count() or 1
+
+
+class Scheduler:
+    """Run interdependent targets on a bounded thread pool.
+
+    A target starts once all of its dependencies succeeded. When a target fails,
+    its transitive dependents are skipped while unrelated targets keep running.
+    Schedulers sharing a `limiter` semaphore also share its job slots: each
+    task holds one while it runs. `label` names the tasks in log messages.
+    """
+
+    def __init__(
+        self, jobs: Optional[int] = None, limiter: Optional[threading.Semaphore] = None, label: str = "target"
+    ) -> None:
+        jobs = jobs or default_jobs()
+        if jobs < 1:
+            raise ValueError("jobs must be at least 1")
+        self.jobs = jobs
+        self.limiter = limiter
+        self.label = label
+
+    def run(
+        self,
+        tasks: Mapping[str, Callable[[], None]],
+        dependencies: Mapping[str, Iterable[str]],
+    ) -> Dict[str, TargetResult]:
+        deps: Dict[str, Set[str]] = {
+            name: {d for d in dependencies.get(name, ()) if d in tasks} for name in tasks
+        }
+        self._check_acyclic(deps)
+
+        results: Dict[str, TargetResult] = {}
+        pending = dict(deps)
+        running: Dict[Future, str] = {}
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="pypackager") as pool:
+            while pending or running:
+                for name in [n for n, d in pending.items() if d <= results.keys()]:
+                    del pending[name]
+                    if any(results[d].status != STATUS_OK for d in deps[name]):
+                        logger.warning("Skipping %s %s: a dependency failed", self.label, name)
+                        results[name] = TargetResult(name, STATUS_SKIPPED)
+                        continue
+                    # Tasks run in a copy of the caller's context (log routing, tracing)
+                    context = contextvars.copy_context()
+                    running[pool.submit(context.run, self._run_task, name, tasks[name])] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    results[running.pop(future)] = result
+        return results
+
+    def _run_task(self, name: str, task: Callable[[], None]) -> TargetResult:
+        label = self.label.capitalize()
+        token = current_target.set(name)
+        started = time.perf_counter()
+        try:
+            with self.limiter or nullcontext():
+                task()
+        except Exception as exc:
+            logger.error("%s %s failed: %s", label, name, exc)
+            logger.debug("%s %s traceback", label, name, exc_info=True)
+            return TargetResult(name, STATUS_FAILED, time.perf_counter() - started, exc)
+        finally:
+            current_target.reset(token)
+        duration = time.perf_counter() - started
+        logger.info("%s %s finished in %.2fs", label, name, duration)
+        return TargetResult(name, STATUS_OK, duration)
+
+    @staticmethod
+    def _check_acyclic(deps: Mapping[str, Set[str]]) -> None:
+        visiting: Set[str] = set()
+        done: Set[str] = set()
+
+        def visit(name: str, path: List[str]) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                cycle = " -> ".join(path[path.index(name):] + [name])
+                raise ValueError(f"Dependency cycle between targets: {cycle}")
+            visiting.add(name)
+            for dep in sorted(deps[name]):
+                visit(dep, path + [name])
+            visiting.discard(name)
+            done.add(name)
+
+        for name in sorted(deps):
+            visit(name, [])
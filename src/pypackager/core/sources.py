@@ -0,0 +1,569 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import stat
+import struct
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Directories never considered build inputs, at any depth / at the project root
+IGNORED_DIRS = {
+    ".git", ".hg", ".svn", "__pycache__", ".tox", ".nox",
+    ".mypy_cache", ".pytest_cache", ".ruff_cache", "node_modules",
+}
+IGNORED_ROOT_DIRS = {".venv", "venv", "env", "build", "dist"}
+# Files derived from other inputs or rewritten on every run
+IGNORED_FILES = {"pypackager.lock"}
+IGNORED_SUFFIXES = (".pyc", ".pyo")
+
+# Threads for the scandir walk (directory listing and stat are I/O bound)
+WALK_WORKERS = 8
+# Directory entries a walk task handles before splitting off the rest of its subtree
+WALK_BATCH = 2048
+# A directory modified this close to a listing of untracked files may have changed
+# within the same mtime tick; such a listing is not reused
+_RACY_NS = 1_000_000_000
+
+_ENTRY = struct.Struct(">10I20sH")
+_ASSUME_VALID = 0x8000
+_EXTENDED = 0x4000
+_SKIP_WORKTREE = 0x4000
+_INTENT_TO_ADD = 0x2000
+_GITLINK = 0o160000
+# Attributes that make the worktree bytes differ from the blob git hashed
+_CONVERTING_ATTRIBUTES = {"text", "eol", "crlf", "filter", "ident", "working-tree-encoding"}
+
+
+def is_ignored_dir(name: str, at_root: bool) -> bool:
+    return (
+        name in IGNORED_DIRS
+        or (at_root and name in IGNORED_ROOT_DIRS)
+        or name.endswith(".egg-info")
+    )
+
+
+def is_ignored_file(name: str) -> bool:
+    return name in IGNORED_FILES or name.endswith(IGNORED_SUFFIXES)
+
+
+def is_ignored_path(rel: str) -> bool:
+    """Whether a relative posix path lies in an ignored directory or is an ignored file."""
+    parts = rel.split("/")
+    if is_ignored_file(parts[-1]):
+        return True
+    return any(is_ignored_dir(part, i == 0) for i, part in enumerate(parts[:-1]))
+
+
+def blob_sha(path: Path) -> str:
+    """Git's object id of a file's contents: SHA-1 of `blob <size>\\0` followed by the bytes."""
+    with open(path, "rb") as fh:
+        digest = hashlib.sha1(b"blob %d\0" % os.fstat(fh.fileno()).st_size, usedforsecurity=False)
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SourceFile(NamedTuple):
+    """One input file of a project (a tuple: there may be hundreds of thousands)."""
+
+    path: str  # relative to the project root, "/"-separated
+    size: int
+    mtime_ns: int
+    # Git blob id of the contents when known without reading the file (see `blob_sha`)
+    digest: Optional[str] = None
+    inode: int = 0
+
+
+def _walk(project_root: Path, exclude: Iterable[str]) -> Iterator[Tuple[str, List[os.DirEntry]]]:
+    root = str(project_root)
+    excluded = {os.path.realpath(p) for p in exclude}
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        files = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not is_ignored_dir(entry.name, current == root) and os.path.realpath(entry.path) not in excluded:
+                    stack.append(entry.path)
+            elif entry.is_file() and not is_ignored_file(entry.name):
+                files.append(entry)
+        yield current, files
+
+
+def iter_source_dirs(project_root: Path, exclude: Iterable[str] = ()) -> Iterator[str]:
+    """Yield every non-ignored directory of the project, the root included."""
+    for directory, _files in _walk(project_root, exclude):
+        yield directory
+
+
+def walk_files(project_root: Path, exclude: Iterable[str] = (), workers: int = WALK_WORKERS) -> Iterator[SourceFile]:
+    """Files under `project_root` outside ignored directories, from a parallel `os.scandir` walk.
+
+    Each task lists and stats a subtree depth-first until it has seen
+    `WALK_BATCH` entries, then hands the directories it did not reach back
+    to the pool, so small trees cost a few tasks and large ones spread
+    across threads. Files are yielded as tasks finish, in no fixed order.
+    """
+    root = os.fspath(project_root)
+    excluded = {os.path.realpath(p) for p in exclude}
+
+    def visit(stack: List[Tuple[str, str]]) -> Tuple[List[SourceFile], List[Tuple[str, str]]]:
+        files: List[SourceFile] = []
+        seen = 0
+        while stack and seen < WALK_BATCH:
+            path, rel = stack.pop()
+            try:
+                entries = list(os.scandir(path))
+            except OSError:
+                continue
+            seen += len(entries) + 1
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not is_ignored_dir(entry.name, not rel) and os.path.realpath(entry.path) not in excluded:
+                            stack.append((entry.path, rel + entry.name + "/"))
+                    elif entry.is_file() and not is_ignored_file(entry.name):
+                        st = entry.stat()
+                        files.append(SourceFile(rel + entry.name, st.st_size, st.st_mtime_ns, inode=st.st_ino))
+                except OSError:
+                    continue
+        return files, stack
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pypackager-walk") as pool:
+        pending = {pool.submit(visit, [(root, "")])}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, left = future.result()
+                # Share the unvisited directories among the idle threads
+                tasks = max(1, min(len(left), workers - len(pending)))
+                pending.update(pool.submit(visit, left[i::tasks]) for i in range(tasks) if left[i::tasks])
+                yield from files
+
+
+@dataclass
+class _IndexEntry:
+    path: str  # relative to the worktree root
+    mode: int
+    stat: Tuple[int, ...]  # ctime s/ns, mtime s/ns, inode, size, as git stores them
+    sha: bytes
+    trusted: bool  # the hash may be used when the stat data still matches
+
+
+class GitIndex:
+    """The entries of a git checkout's index, read directly from `.git/index`.
+
+    Supports index versions 2-4 with SHA-1 object ids; split and sparse
+    indexes and other object formats raise ValueError. When attributes or
+    config convert content on checkout, the worktree bytes may differ from
+    the hashed blobs (see `converts`) and only the file list is usable.
+    """
+
+    def __init__(self, worktree: Path, git_dir: Path, common_dir: Path) -> None:
+        self.worktree = worktree
+        self.git_dir = git_dir
+        self.common_dir = common_dir
+        self.path = git_dir / "index"
+
+    @classmethod
+    def find(cls, path: Path) -> Optional["GitIndex"]:
+        """The index of the git checkout containing `path`, or None outside one."""
+        current = Path(os.path.realpath(path))
+        for directory in (current, *current.parents):
+            dot_git = directory / ".git"
+            if dot_git.is_dir():
+                git_dir = dot_git
+            elif dot_git.is_file():
+                # Worktrees and submodules: "gitdir: <path>"
+                try:
+                    content = dot_git.read_text(encoding="utf-8").strip()
+                except OSError:
+                    return None
+                if not content.startswith("gitdir:"):
+                    return None
+                git_dir = Path(os.path.realpath(directory / content[len("gitdir:"):].strip()))
+            else:
+                continue
+            try:
+                # Linked worktrees share the config of the main repository
+                common = (git_dir / "commondir").read_text(encoding="utf-8").strip()
+            except OSError:
+                common = "."
+            common_dir = Path(os.path.realpath(git_dir / common))
+            return cls(directory, git_dir, common_dir)
+        return None
+
+    def stamp(self) -> Tuple[int, int, int]:
+        st = self.path.stat()
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _config(self) -> Dict[str, str]:
+        """The (lower-cased) keys of the repository and user git config that matter here."""
+        home = Path.home()
+        xdg = Path(os.environ.get("XDG_CONFIG_HOME") or home / ".config")
+        values: Dict[str, str] = {}
+        for config in (Path("/etc/gitconfig"), xdg / "git" / "config", home / ".gitconfig", self.common_dir / "config"):
+            for line in self._read(config).splitlines():
+                key, _, value = (part.strip() for part in line.strip().lower().partition("="))
+                if key in ("objectformat", "autocrlf", "attributesfile"):
+                    values[key] = value
+        return values
+
+    def check_format(self) -> None:
+        if self._config().get("objectformat", "sha1") != "sha1":
+            raise ValueError("the repository does not use SHA-1 object ids")
+
+    @staticmethod
+    def _converting(text: str) -> bool:
+        for line in text.splitlines():
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            for attribute in fields[1:]:
+                if attribute.startswith(("-", "!")):
+                    continue
+                if attribute.partition("=")[0] in _CONVERTING_ATTRIBUTES:
+                    return True
+        return False
+
+    def entries(self, prefix: str = "") -> List[_IndexEntry]:
+        """Index entries under the worktree-relative directory `prefix` ("" for all).
+
+        Hashes are trusted unless git itself would re-check the file: entries
+        flagged assume-valid, skip-worktree or intent-to-add, unmerged paths
+        (listed once) and "racily clean" entries modified no earlier than the
+        index was written.
+        """
+        data = self.path.read_bytes()
+        if data[:4] != b"DIRC":
+            raise ValueError("not a git index")
+        version, count = struct.unpack_from(">II", data, 4)
+        if version not in (2, 3, 4):
+            raise ValueError(f"unsupported index version {version}")
+        st = os.stat(self.path)
+        index_mtime = (st.st_mtime_ns // 1_000_000_000, st.st_mtime_ns % 1_000_000_000)
+        scope = prefix.rstrip("/") + "/" if prefix else ""
+        entries: List[_IndexEntry] = []
+        unmerged = set()
+        offset, previous = 12, b""
+        for _ in range(count):
+            fields = _ENTRY.unpack_from(data, offset)
+            ctime_s, ctime_ns, mtime_s, mtime_ns, _dev, ino, mode, _uid, _gid, size, sha, flags = fields
+            pos = offset + _ENTRY.size
+            extended = 0
+            if flags & _EXTENDED and version >= 3:
+                (extended,) = struct.unpack_from(">H", data, pos)
+                pos += 2
+            if version == 4:
+                # The path is the previous one with N bytes dropped, plus a suffix
+                strip, pos = self._varint(data, pos)
+                end = data.index(b"\0", pos)
+                raw = previous[: len(previous) - strip] + data[pos:end]
+                offset = end + 1
+            else:
+                end = data.index(b"\0", pos)
+                raw = data[pos:end]
+                offset += (end - offset + 8) & ~7
+            previous = raw
+            if mode == stat.S_IFDIR:
+                raise ValueError("sparse index")
+            path = os.fsdecode(raw)
+            if scope and not path.startswith(scope):
+                continue
+            if (flags >> 12) & 3:
+                unmerged.add(path)
+                continue
+            trusted = (
+                not flags & _ASSUME_VALID
+                and not extended & (_SKIP_WORKTREE | _INTENT_TO_ADD)
+                and (mtime_s, mtime_ns) < index_mtime
+            )
+            entries.append(_IndexEntry(path, mode, (ctime_s, ctime_ns, mtime_s, mtime_ns, ino, size), sha, trusted))
+        while offset + 8 <= len(data) - 20:
+            signature, length = struct.unpack_from(">4sI", data, offset)
+            if signature in (b"link", b"sdir"):
+                raise ValueError("split or sparse index")
+            offset += 8 + length
+        for path in sorted(unmerged):
+            entries.append(_IndexEntry(path, stat.S_IFREG, (), b"", False))
+        return entries
+
+    def converts(self, prefix: str, paths: Iterable[str]) -> bool:
+        """Whether checkout may convert the contents of files under the directory `prefix`.
+
+        That is when `core.autocrlf` or `core.attributesFile` is set, or a
+        `.gitattributes` among `paths` (worktree-relative files under
+        `prefix`), in a directory above or in `info/` sets a converting
+        attribute such as `text`, `eol` or `filter`.
+        """
+        config = self._config()
+        if config.get("autocrlf", "false") not in ("false", "no", "off", "0", "") or "attributesfile" in config:
+            return True
+        files = [rel for rel in paths if rel.rpartition("/")[2] == ".gitattributes"]
+        files.extend((parent / ".gitattributes").as_posix() for parent in Path(prefix or ".", "x").parents)
+        texts = [self._read(self.worktree / rel) for rel in files]
+        texts.append(self._read(self.common_dir / "info" / "attributes"))
+        return any(self._converting(text) for text in texts)
+
+    @staticmethod
+    def _read(path: Path) -> str:
+        try:
+            return path.read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            return ""
+
+    @staticmethod
+    def _varint(data: bytes, pos: int) -> Tuple[int, int]:
+        """Git's offset encoding (each continuation adds one before shifting)."""
+        byte = data[pos]
+        pos += 1
+        value = byte & 0x7F
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            value = ((value + 1) << 7) | (byte & 0x7F)
+        return value, pos
+
+    def untracked(self, directory: Path) -> List[str]:
+        """Untracked, non-ignored files under `directory` (relative to it), as `git ls-files` lists them."""
+        proc = subprocess.run(  # noqa: S603
+            ["git", "ls-files", "--others", "--exclude-standard", "-z", "--", "."],  # noqa: S607
+            cwd=directory,
+            capture_output=True,
+            timeout=300,
+        )
+        if proc.returncode != 0:
+            raise ValueError(proc.stderr.decode("utf-8", "replace").strip() or "git ls-files failed")
+        # Nested repositories are listed as directories ("name/")
+        return [os.fsdecode(p) for p in proc.stdout.split(b"\0") if p and not p.endswith(b"/")]
+
+
+_indexes: Dict[Tuple[Path, str], Tuple[Tuple[int, int, int], List[_IndexEntry]]] = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_entries(index: GitIndex, prefix: str) -> List[_IndexEntry]:
+    """`index.entries(prefix)`, parsed again only when the index file changes."""
+    key = (index.path, prefix)
+    stamp = index.stamp()
+    with _indexes_lock:
+        cached = _indexes.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    index.check_format()
+    entries = index.entries(prefix)
+    with _indexes_lock:
+        _indexes[key] = (stamp, entries)
+    return entries
+
+
+_untracked: Dict[Tuple[Path, str], Tuple[Tuple, List[str]]] = {}
+
+
+def _directory_stamps(root: str, paths: Iterable[str], info_exclude: Path) -> Tuple:
+    """mtimes of every directory holding `paths` (up to `root`), of their .gitignore and of `info_exclude`.
+
+    Creating, removing or renaming a file changes its directory's mtime, so
+    equal stamps mean the same untracked files, unless ignore rules outside
+    these files (a global excludes file) changed.
+    """
+    directories = {""}
+    for rel in paths:
+        directory = rel.rpartition("/")[0]
+        while directory not in directories:
+            directories.add(directory)
+            directory = directory.rpartition("/")[0]
+
+    def mtime(path: str) -> int:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return -1
+
+    stamps = [(os.fspath(info_exclude), mtime(os.fspath(info_exclude)), 0)]
+    for directory in sorted(directories):
+        base = f"{root}/{directory}" if directory else root
+        stamps.append((directory, mtime(base), mtime(f"{base}/.gitignore")))
+    return tuple(stamps)
+
+
+def _untracked_files(index: GitIndex, root: str, tracked: List[str]) -> List[str]:
+    """`index.untracked(root)`, listed again only when the index, a directory or an ignore file changed.
+
+    Spawning `git ls-files` is the bulk of listing a large checkout, and
+    repeated listings (a polling watcher) mostly find nothing new.
+    """
+    key = (index.path, root)
+    info_exclude = index.common_dir / "info" / "exclude"
+    with _indexes_lock:
+        cached = _untracked.get(key)
+    # Adding a file to the index takes it off the untracked list
+    stamp = index.stamp()
+    if cached is not None and cached[0] == (stamp, _directory_stamps(root, [*tracked, *cached[1]], info_exclude)):
+        return cached[1]
+    started = time.time_ns()
+    untracked = index.untracked(Path(root))
+    stamps = _directory_stamps(root, [*tracked, *untracked], info_exclude)
+    racy = any(max(mtimes) >= started - _RACY_NS for _name, *mtimes in stamps)
+    with _indexes_lock:
+        if racy:
+            _untracked.pop(key, None)
+        else:
+            _untracked[key] = ((stamp, stamps), untracked)
+    return untracked
+
+
+def git_files(project_root: Path, exclude: Iterable[str] = ()) -> Iterator[SourceFile]:
+    """Files of a project in a git checkout: tracked ones from the index, then untracked, non-ignored ones.
+
+    Blob ids are reported for tracked files whose stat data matches the
+    index, unless checkout converts their contents. Raises ValueError when
+    the project is not in a checkout or its index cannot be read (see
+    `GitIndex`), before anything is yielded.
+    """
+    root = os.path.realpath(project_root)
+    index = GitIndex.find(Path(root))
+    if index is None:
+        raise ValueError("not in a git checkout")
+    prefix = os.path.relpath(root, index.worktree).replace(os.sep, "/")
+    prefix = "" if prefix == "." else prefix
+    try:
+        entries = _index_entries(index, prefix)
+        strip = len(prefix) + 1 if prefix else 0
+        untracked = _untracked_files(index, root, [entry.path[strip:] for entry in entries])
+        converts = index.converts(
+            prefix, [entry.path for entry in entries] + [f"{prefix}/{rel}" if prefix else rel for rel in untracked]
+        )
+    except (OSError, struct.error, subprocess.SubprocessError) as exc:
+        raise ValueError(str(exc)) from exc
+    excluded = [os.path.relpath(os.path.realpath(p), root).replace(os.sep, "/") + "/" for p in exclude]
+    excluded = [p for p in excluded if not p.startswith("../")]
+    # Tracked paths arrive sorted, so most share the previous file's directory
+    directories: Dict[str, bool] = {}
+
+    def wanted(rel: str) -> bool:
+        directory, _, name = rel.rpartition("/")
+        if is_ignored_file(name):
+            return False
+        skip = directories.get(directory)
+        if skip is None:
+            prefixed = directory + "/"
+            skip = directories[directory] = bool(directory) and (
+                is_ignored_path(prefixed) or any(prefixed.startswith(p) for p in excluded)
+            )
+        return not skip
+
+    for entry in entries:
+        rel = entry.path[strip:]
+        if entry.mode == _GITLINK or not wanted(rel):
+            continue
+        path = f"{root}/{rel}"
+        try:
+            st = os.lstat(path)
+            trusted = entry.trusted and not converts
+            if stat.S_ISLNK(st.st_mode):
+                # Git hashes the link target; the build reads the file it points to
+                st = os.stat(path)
+                trusted = False
+        except OSError:
+            continue  # deleted in the worktree
+        if not stat.S_ISREG(st.st_mode):
+            continue
+        digest = None
+        if trusted and entry.stat == (
+            st.st_ctime_ns // 1_000_000_000 & 0xFFFFFFFF,
+            st.st_ctime_ns % 1_000_000_000,
+            st.st_mtime_ns // 1_000_000_000 & 0xFFFFFFFF,
+            st.st_mtime_ns % 1_000_000_000,
+            st.st_ino & 0xFFFFFFFF,
+            st.st_size & 0xFFFFFFFF,
+        ):
+            digest = entry.sha.hex()
+        yield SourceFile(rel, st.st_size, st.st_mtime_ns, digest, st.st_ino)
+    for rel in untracked:
+        if not wanted(rel):
+            continue
+        try:
+            st = os.stat(f"{root}/{rel}")
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            yield SourceFile(rel, st.st_size, st.st_mtime_ns, inode=st.st_ino)
+
+
+class SourceTree:
+    """The input files of a project, enumerated once and shared by every stage of a build.
+
+    In a git checkout the files are the tracked ones plus untracked files git
+    does not ignore. They are read from the index, whose cached stat data
+    vouches for the blob ids it records, so unchanged files need neither a
+    directory walk nor a read. Elsewhere, when the index cannot be used or
+    with PYPACKAGER_SOURCES=walk, a parallel `os.scandir` walk lists every
+    file. Either way the ignored directories and files (see `is_ignored_dir`)
+    and `exclude` are left out.
+
+    Iterating is lazy and thread-safe: the first consumer drives the
+    enumeration, and others replay what it has produced so far.
+    """
+
+    def __init__(self, project_root: Path, exclude: Iterable[str] = ()) -> None:
+        self.project_root = project_root
+        self.exclude = [os.fspath(p) for p in exclude]
+        self.use_git = os.environ.get("PYPACKAGER_SOURCES") != "walk"
+        self.engine: Optional[str] = None
+        self._files: List[SourceFile] = []
+        self._source: Optional[Iterator[SourceFile]] = None
+        self._done = False
+        self._lock = threading.Lock()
+
+    def _enumerate(self) -> Iterator[SourceFile]:
+        if self.use_git:
+            files = git_files(self.project_root, self.exclude)
+            try:
+                first = next(files, None)
+            except ValueError as exc:
+                logger.debug("Not using the git index for %s: %s", self.project_root, exc)
+            else:
+                self.engine = "git"
+                if first is not None:
+                    yield first
+                    yield from files
+                return
+        self.engine = "walk"
+        yield from walk_files(self.project_root, self.exclude)
+
+    def __iter__(self) -> Iterator[SourceFile]:
+        position = 0
+        while True:
+            with self._lock:
+                if position < len(self._files):
+                    file = self._files[position]
+                elif self._done:
+                    return
+                else:
+                    if self._source is None:
+                        self._source = self._enumerate()
+                    file = next(self._source, None)
+                    if file is None:
+                        self._done = True
+                        return
+                    self._files.append(file)
+            position += 1
+            yield file
+
+    def digest(self, file: SourceFile) -> str:
+        """The file's git blob id, from the index when it vouches for it, else by reading it."""
+        return file.digest or blob_sha(self.project_root / file.path)
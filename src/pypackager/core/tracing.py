@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+# ru_maxrss is in KiB on Linux, bytes on macOS
+_RSS_SCALE = 1 if sys.platform == "darwin" else 1024
+_PROC = Path("/proc")
+
+
+def _children_cpu() -> float:
+    """CPU seconds of all reaped child processes so far."""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _written(pid: str = "self") -> Optional[int]:
+    """Bytes written by a process (`wchar` of /proc/<pid>/io), where available."""
+    try:
+        with open(_PROC / pid / "io", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def process_stats(pid: int) -> Optional[Tuple[float, Optional[int]]]:
+    """CPU seconds and bytes written so far by a running process (Linux only)."""
+    try:
+        with open(_PROC / str(pid) / "stat", encoding="ascii") as fh:
+            fields = fh.read().rpartition(")")[2].split()
+    except (OSError, ValueError):
+        return None
+    # utime and stime are fields 14 and 15 of stat(5); fields[0] is field 3
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return cpu, _written(str(pid))
+
+
+class Span:
+    """One timed region: wall and thread CPU time, child rusage and bytes written.
+
+    Spans nest per thread (through a context variable); the events of finished
+    spans go to the active `Tracer`.
+    """
+
+    __slots__ = (
+        "tracer", "name", "category", "args", "parent", "_token",
+        "_start", "_cpu", "_children", "_written", "child_cpu", "child_rss", "child_written",
+    )
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: Dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.parent: Optional[Span] = None
+        # Explicitly attributed child processes (subprocesses, the backend worker)
+        self.child_cpu = 0.0
+        self.child_rss = 0
+        self.child_written = 0
+
+    def __enter__(self) -> "Span":
+        self.parent = _current.get()
+        self._token = _current.set(self)
+        self._children = _children_cpu()
+        self._written = _written()
+        self._cpu = time.thread_time()
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        end = time.perf_counter_ns()
+        cpu = time.thread_time() - self._cpu
+        children_cpu = _children_cpu()
+        written = _written()
+        _current.reset(self._token)
+        # Reaped children not attributed to a subprocess span (e.g. from the
+        # stdlib's own subprocess calls) are counted through the rusage delta
+        reaped = max(children_cpu - self._children, 0.0)
+        fields: Dict[str, Any] = {
+            "duration_ms": round((end - self._start) / 1e6, 3),
+            "cpu_ms": round(cpu * 1000, 3),
+            "children_cpu_ms": round(max(self.child_cpu, reaped) * 1000, 3),
+        }
+        if self.child_rss:
+            fields["children_max_rss"] = self.child_rss
+        if written is not None and self._written is not None:
+            fields["bytes_written"] = written - self._written + self.child_written
+        elif self.child_written:
+            fields["bytes_written"] = self.child_written
+        if exc_info[0] is not None:
+            fields["error"] = exc_info[0].__name__
+        if self.parent is not None:
+            self.parent.child_cpu += self.child_cpu
+            self.parent.child_rss = max(self.parent.child_rss, self.child_rss)
+            self.parent.child_written += self.child_written
+        self.tracer.finish(self, self._start, end, fields)
+
+    def set(self, **args: Any) -> None:
+        self.args.update(args)
+
+    def add_child(self, cpu: float, max_rss: int = 0, written: Optional[int] = None) -> None:
+        """Attribute a child process's resource use to this span."""
+        self.child_cpu += cpu
+        self.child_rss = max(self.child_rss, max_rss)
+        self.child_written += written or 0
+
+
+class _NullSpan:
+    """Stand-in returned while tracing is off; every operation is a no-op."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info: Any) -> None:
+        return None
+
+
+_NULL_SPAN = _NullSpan()
+_current: ContextVar[Optional[Span]] = ContextVar("pypackager_span", default=None)
+
+
+class Tracer:
+    """Collects finished spans as Chrome trace events and/or logs their timings.
+
+    With `events` the spans are kept for `write()` (the `--profile` file, in
+    the trace-event format read by chrome://tracing and Perfetto); with `log`
+    each finished span is logged to `pypackager.trace` with its measurements
+    as structured fields, which the JSON log formatter emits.
+    """
+
+    def __init__(self, events: bool = True, log: bool = False) -> None:
+        self.keep_events = events
+        self.log = log
+        self.events: List[Dict[str, Any]] = []
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+        self._trace_logger = logging.getLogger("pypackager.trace")
+
+    def finish(self, span: Span, start: int, end: int, fields: Dict[str, Any]) -> None:
+        if self.keep_events:
+            thread = threading.current_thread()
+            event = {
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": (start - self._origin) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": os.getpid(),
+                "tid": thread.ident,
+                "args": {**span.args, **fields},
+            }
+            with self._lock:
+                self.events.append(event)
+                if thread.ident not in self._threads:
+                    self._threads[thread.ident] = thread.name  # type: ignore[index]
+        if self.log:
+            self._trace_logger.info(
+                "%s %s finished in %.1f ms", span.category, span.name, fields["duration_ms"],
+                extra={"trace": {"span": span.name, "category": span.category, **span.args, **fields}},
+            )
+
+    def write(self, path: Path) -> None:
+        with self._lock:
+            metadata = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                for tid, name in sorted(self._threads.items())
+            ]
+            metadata.append({"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": "pypackager"}})
+            document = {"traceEvents": [*metadata, *self.events], "displayTimeUnit": "ms"}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(document), encoding="utf-8")
+        logger.info("Wrote profile (%d span(s)) to %s", len(self.events), path)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def enable(events: bool = True, log: bool = False) -> Tracer:
+    global _tracer
+    _tracer = Tracer(events=events, log=log)
+    return _tracer
+
+
+def disable() -> None:
+    global _tracer
+    _tracer = None
+
+
+def active() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, category: str = "stage", **args: Any) -> Any:
+    """Context manager timing a region; yields the `Span`, or None while tracing is off."""
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return Span(tracer, name, category, args)
+
+
+def wait(proc: "subprocess.Popen[Any]", current: Optional[Span]) -> int:
+    """Wait for `proc`, attributing its rusage and bytes written to `current` when tracing."""
+    if current is None or not hasattr(os, "wait4"):
+        return proc.wait()
+    written = None
+    if hasattr(os, "waitid"):
+        # Let it exit but keep the zombie around to read its I/O counters
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        written = _written(str(proc.pid))
+    _pid, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    current.add_child(usage.ru_utime + usage.ru_stime, usage.ru_maxrss * _RSS_SCALE, written)
+    return proc.returncode
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .sources import SourceTree, is_ignored_dir, is_ignored_file, iter_source_dirs
+
+logger = logging.getLogger(__name__)
+
+# (mtime_ns, size, inode) per relative path
+Snapshot = Dict[str, Tuple[int, int, int]]
+
+
+def take_snapshot(project_root: Path, exclude: Iterable[str] = ()) -> Snapshot:
+    # The inode catches a file atomically replaced by one of the same size and mtime
+    return {file.path: (file.mtime_ns, file.size, file.inode) for file in SourceTree(project_root, exclude)}
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> Set[str]:
+    changed = {rel for rel, stamp in new.items() if old.get(rel) != stamp}
+    changed.update(old.keys() - new.keys())
+    return changed
+
+
+class PollingWatcher:
+    """Detect changes by diffing stat snapshots of the project tree."""
+
+    def __init__(self, project_root: Path, exclude: Iterable[str] = (), interval: float = 0.5) -> None:
+        self.project_root = project_root
+        self.exclude = [os.fspath(p) for p in exclude]
+        self.interval = interval
+        self._snapshot = take_snapshot(project_root, self.exclude)
+
+    def poll(self, timeout: Optional[float]) -> Set[str]:
+        """Return paths changed within `timeout` seconds (block forever on None)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = take_snapshot(self.project_root, self.exclude)
+            changed = diff_snapshots(self._snapshot, current)
+            self._snapshot = current
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            wait = self.interval if deadline is None else min(self.interval, max(0.0, deadline - time.monotonic()))
+            time.sleep(wait)
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """Linux inotify watcher over every non-ignored project directory."""
+
+    _IN_MODIFY = 0x002
+    _IN_ATTRIB = 0x004
+    _IN_CLOSE_WRITE = 0x008
+    _IN_MOVED_FROM = 0x040
+    _IN_MOVED_TO = 0x080
+    _IN_CREATE = 0x100
+    _IN_DELETE = 0x200
+    _IN_DELETE_SELF = 0x400
+    _IN_Q_OVERFLOW = 0x4000
+    _IN_IGNORED = 0x8000
+    _IN_ISDIR = 0x40000000
+    _MASK = (
+        _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+        | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+    )
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, project_root: Path, exclude: Iterable[str] = ()) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self.project_root = project_root
+        self.exclude = {os.path.realpath(p) for p in exclude}
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, str] = {}
+        for directory in iter_source_dirs(project_root, self.exclude):
+            self._add_watch(directory)
+
+    def _add_watch(self, directory: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self._MASK)
+        if wd < 0:
+            logger.debug("Cannot watch %s (errno %d)", directory, ctypes.get_errno())
+            return
+        self._dirs[wd] = directory
+
+    def poll(self, timeout: Optional[float]) -> Set[str]:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed: Set[str] = set()
+        root = str(self.project_root)
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = self._EVENT.unpack_from(data, offset)
+                offset += self._EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0").decode(sys.getfilesystemencoding(), "replace")
+                offset += length
+                if mask & self._IN_Q_OVERFLOW:
+                    # Events were dropped; report the root so everything is reconsidered
+                    changed.add(".")
+                    continue
+                if mask & self._IN_IGNORED:
+                    self._dirs.pop(wd, None)
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, name)
+                if mask & self._IN_ISDIR:
+                    if is_ignored_dir(name, directory == root) or os.path.realpath(path) in self.exclude:
+                        continue
+                    if mask & (self._IN_CREATE | self._IN_MOVED_TO):
+                        for sub in iter_source_dirs(Path(path), self.exclude):
+                            self._add_watch(sub)
+                elif is_ignored_file(name):
+                    continue
+                changed.add(os.path.relpath(path, root).replace(os.sep, "/"))
+        return changed
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_watcher(
+    project_root: Path, exclude: Iterable[str] = (), interval: float = 0.5, polling: bool = False
+):
+    """Return an inotify watcher when available, else a stat-polling watcher."""
+    if not polling:
+        try:
+            watcher = InotifyWatcher(project_root, exclude)
+            logger.debug("Watching %s with inotify", project_root)
+            return watcher
+        except (OSError, AttributeError) as exc:
+            logger.debug("inotify unavailable (%s); falling back to polling", exc)
+    return PollingWatcher(project_root, exclude, interval)
+
+
+def wait_for_changes(watcher, debounce: float) -> Set[str]:
+    """Block until something changes, then collect further events until quiet for `debounce` seconds."""
+    changed = watcher.poll(None)
+    while True:
+        more = watcher.poll(debounce)
+        if not more:
+            return changed
+        changed |= more
+
+
+def watch(
+    rebuild: Callable[[Set[str]], None],
+    project_root: Path,
+    exclude: Iterable[str] = (),
+    interval: float = 0.5,
+    debounce: float = 0.3,
+    polling: bool = False,
+    max_iterations: Optional[int] = None,
+) -> None:
+    """Call `rebuild(changed_paths)` after every debounced burst of changes.
+
+    Each rebuild's latency is logged. Runs until interrupted, or for
+    `max_iterations` rebuilds when given.
+    """
+    watcher = create_watcher(project_root, exclude, interval=interval, polling=polling)
+    iterations = 0
+    try:
+        logger.info("Watching %s for changes (Ctrl+C to stop)", project_root)
+        while max_iterations is None or iterations < max_iterations:
+            changed = wait_for_changes(watcher, debounce)
+            sample: List[str] = sorted(changed)[:5]
+            logger.info(
+                "Detected %d changed path(s): %s%s", len(changed), ", ".join(sample),
+                ", ..." if len(changed) > len(sample) else "",
+            )
+            started = time.perf_counter()
+            try:
+                rebuild(changed)
+            except Exception as exc:  # keep watching after a failed build
+                logger.error("Rebuild failed after %.2fs: %s", time.perf_counter() - started, exc)
+            else:
+                logger.info("Rebuilt in %.2fs", time.perf_counter() - started)
+            iterations += 1
+    finally:
+        watcher.close()
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.tags import Tag
+from packaging.utils import InvalidWheelFilename, canonicalize_name, parse_wheel_filename
+from packaging.version import InvalidVersion, Version
+
+from . import process
+from .cache import user_cache_dir
+from .hashing import file_sha256
+from .locking import FileLock
+
+logger = logging.getLogger(__name__)
+
+
+class WheelhouseMissing(RuntimeError):
+    """Offline mode needs wheels the wheelhouse does not have."""
+
+
+def _interpreter_tag(python: str) -> str:
+    if os.path.realpath(python) == os.path.realpath(sys.executable):
+        return f"{sys.implementation.name}-{sys.version_info[0]}.{sys.version_info[1]}-{sys.platform}"
+    out = subprocess.check_output(  # noqa: S603
+        [python, "-c", "import sys; print(f'{sys.implementation.name}-{sys.version_info[0]}.{sys.version_info[1]}-{sys.platform}')"],
+        text=True,
+    )
+    return out.strip()
+
+
+class Wheelhouse:
+    """Shared, content-addressed store of wheels for offline installs.
+
+    Wheels are stored once by SHA-256 under `blobs/` and exposed by filename in
+    a flat `wheels/` directory that pip consumes via `--no-index --find-links`.
+    `sync()` downloads (or builds from sdists) the wheels for a requirement set
+    and its transitive dependencies; each synced set is remembered so later
+    runs skip the network entirely. With `offline=True` nothing is fetched and
+    missing wheels raise `WheelhouseMissing` instead of hanging on the network.
+    """
+
+    def __init__(self, root: Optional[Path] = None, offline: bool = False) -> None:
+        override = os.environ.get("PYPACKAGER_WHEELHOUSE")
+        self.root = root or (Path(override).expanduser() if override else user_cache_dir() / "wheelhouse")
+        self.offline = offline
+        self.wheels_dir = self.root / "wheels"
+        self._index_path = self.root / "index.json"
+        self._lock_path = self.root / ".lock"
+        # Wheels built locally (workspace projects) by canonical name; never fetched
+        self.local: Dict[str, Path] = {}
+
+    def install_args(self) -> List[str]:
+        """pip arguments restricting installs to the wheelhouse."""
+        return ["--no-index", "--find-links", os.fspath(self.wheels_dir)]
+
+    def _external(self, requirements: Iterable[str]) -> List[str]:
+        """Requirements not satisfied by local wheels, which an index must never replace."""
+        reqs = []
+        for req in {r.strip() for r in requirements if r.strip()}:
+            try:
+                name = canonicalize_name(Requirement(req).name)
+            except InvalidRequirement:
+                name = None
+            if name not in self.local:
+                reqs.append(req)
+        return sorted(reqs)
+
+    def ensure(self, requirements: Iterable[str], python: Optional[str] = None) -> None:
+        """Make wheels for `requirements` available, syncing unless offline."""
+        reqs = self._external(requirements)
+        if not reqs:
+            return
+        if self.offline:
+            missing = self.missing(reqs)
+            if missing:
+                raise WheelhouseMissing(
+                    f"Offline mode: no wheel in {self.wheels_dir} for {', '.join(missing)}; "
+                    "run `pypackager wheelhouse sync` while online"
+                )
+            return
+        self.sync(reqs, python)
+
+    def missing(self, requirements: Iterable[str]) -> List[str]:
+        """Direct requirements with no matching wheel (by name and version specifier)."""
+        available: Dict[str, List[str]] = {}
+        for filename in self._read_index():
+            try:
+                name, version, _build, _tags = parse_wheel_filename(filename)
+            except InvalidWheelFilename:
+                continue
+            available.setdefault(name, []).append(str(version))
+        missing = []
+        for req in requirements:
+            try:
+                parsed = Requirement(req)
+            except InvalidRequirement:
+                missing.append(req)
+                continue
+            if parsed.marker is not None and not parsed.marker.evaluate():
+                continue
+            versions = available.get(canonicalize_name(parsed.name), [])
+            if not any(parsed.specifier.contains(v, prereleases=True) for v in versions):
+                missing.append(req)
+        return missing
+
+    def sync(self, requirements: Iterable[str], python: Optional[str] = None, refresh: bool = False) -> List[Path]:
+        """Fetch wheels for `requirements` and their dependencies into the wheelhouse."""
+        reqs = self._external(requirements)
+        python = python or sys.executable
+        if not reqs:
+            return []
+        marker = self._marker(reqs, python)
+        if self._read_marker(marker) is not None and not refresh and not self.missing(reqs):
+            logger.debug("Wheelhouse already synced for %s", ", ".join(reqs))
+            return []
+        if self.offline:
+            raise WheelhouseMissing("Cannot sync the wheelhouse in offline mode")
+
+        self.wheels_dir.mkdir(parents=True, exist_ok=True)
+        logger.info("Syncing wheelhouse for %d requirement(s)", len(reqs))
+        with tempfile.TemporaryDirectory(prefix="pypackager-wheelhouse-") as tmp:
+            process.run([
+                python, "-m", "pip", "wheel", "--disable-pip-version-check",
+                "--wheel-dir", tmp, "--find-links", self.wheels_dir, *reqs,
+            ])
+            added = [self.add(Path(tmp) / name) for name in sorted(os.listdir(tmp)) if name.endswith(".whl")]
+        # pip wheel saves the whole resolved set; remember it for direct installs (see `resolved`)
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        marker.write_text(
+            json.dumps({"requirements": reqs, "wheels": sorted(w.name for w in added)}, indent=2), encoding="utf-8"
+        )
+        return added
+
+    def download(
+        self, requirements: Iterable[str], python_version: str, platforms: Sequence[str], python: Optional[str] = None
+    ) -> List[Path]:
+        """Fetch binary CPython wheels of exact pins for another platform into the wheelhouse.
+
+        As `pip download --platform`: dependencies are not resolved, so pass
+        the full locked set. Each fetched set is remembered, like `sync`.
+        """
+        reqs = self._external(requirements)
+        python = python or sys.executable
+        if not reqs or self.offline:
+            return []
+        marker = self._marker([*reqs, f"python {python_version}", *(f"platform {p}" for p in platforms)], python)
+        if self._read_marker(marker) is not None:
+            logger.debug("Wheelhouse already has %s wheels for %s", platforms[0], ", ".join(reqs))
+            return []
+        self.wheels_dir.mkdir(parents=True, exist_ok=True)
+        logger.info("Fetching %d wheel(s) for %s into the wheelhouse", len(reqs), platforms[0])
+        with tempfile.TemporaryDirectory(prefix="pypackager-wheelhouse-") as tmp:
+            process.run([
+                python, "-m", "pip", "download", "--disable-pip-version-check", "--no-deps",
+                "--only-binary", ":all:", "--implementation", "cp", "--python-version", python_version,
+                *(arg for platform in platforms for arg in ("--platform", platform)),
+                "--dest", tmp, "--find-links", self.wheels_dir, *reqs,
+            ])
+            added = [self.add(Path(tmp) / name) for name in sorted(os.listdir(tmp)) if name.endswith(".whl")]
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        marker.write_text(json.dumps({"requirements": reqs, "platforms": list(platforms)}, indent=2), encoding="utf-8")
+        return added
+
+    def resolved(self, requirements: Iterable[str], python: Optional[str] = None) -> Optional[List[Path]]:
+        """The wheels a previous `sync` of exactly `requirements` for `python` resolved to.
+
+        None when the set was never synced (or only by an older version) or
+        involves local wheels, which pip must resolve.
+        """
+        reqs = {r.strip() for r in requirements if r.strip()}
+        external = self._external(reqs)
+        if not reqs or len(external) != len(reqs):
+            return None
+        synced = self._read_marker(self._marker(external, python or sys.executable))
+        if not synced or "wheels" not in synced:
+            return None
+        wheels = [self.wheels_dir / name for name in synced["wheels"]]
+        return wheels if all(w.is_file() for w in wheels) else None
+
+    def find(self, pins: Sequence[Tuple[str, str]], tags: Sequence[Tag]) -> Optional[List[Path]]:
+        """The wheel for each exact (name, version) pin best matching `tags` (most preferred first).
+
+        Local wheels (see `local`) serve their projects. None if any pin has
+        no compatible wheel here.
+        """
+        rank = {tag: index for index, tag in enumerate(tags)}
+        best: Dict[Tuple[str, Version], Tuple[int, str]] = {}
+        for filename in self._read_index():
+            try:
+                name, version, _build, wheel_tags = parse_wheel_filename(filename)
+            except InvalidWheelFilename:
+                continue
+            score = min((rank[t] for t in wheel_tags if t in rank), default=None)
+            if score is not None and (score, filename) < best.get((name, version), (len(rank), "")):
+                best[(name, version)] = (score, filename)
+        wheels = []
+        for name, version in pins:
+            name = canonicalize_name(name)
+            if name in self.local:
+                wheels.append(self.local[name])
+                continue
+            try:
+                match = best.get((name, Version(version)))
+            except InvalidVersion:
+                return None
+            if match is None:
+                return None
+            wheels.append(self.wheels_dir / match[1])
+        return wheels
+
+    def _marker(self, requirements: List[str], python: str) -> Path:
+        key = hashlib.sha256(json.dumps([_interpreter_tag(python), requirements]).encode("utf-8")).hexdigest()[:20]
+        return self.root / "synced" / key
+
+    @staticmethod
+    def _read_marker(marker: Path) -> Optional[Dict[str, List[str]]]:
+        """A sync marker's contents; {} for the plain-text markers of older versions."""
+        try:
+            text = marker.read_text(encoding="utf-8")
+        except OSError:
+            return None
+        try:
+            return json.loads(text)
+        except ValueError:
+            return {}
+
+    def add(self, wheel: Path, replace: bool = False) -> Path:
+        """Store a wheel by content hash and expose it by filename.
+
+        A different wheel of the same filename is kept unless `replace` is
+        set, as for locally built wheels that are rebuilt without a version bump.
+        """
+        digest = file_sha256(wheel)
+        blob = self.root / "blobs" / "sha256" / digest[:2] / digest
+        target = self.wheels_dir / wheel.name
+        with FileLock(self._lock_path):
+            index = self._read_index()
+            if index.get(wheel.name) not in (None, digest):
+                if not replace:
+                    logger.warning("Keeping existing %s in wheelhouse (content differs)", wheel.name)
+                    return target
+                target.unlink(missing_ok=True)
+            if not blob.exists():
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                tmp = blob.with_name(f"{digest}.{os.getpid()}.tmp")
+                shutil.copyfile(wheel, tmp)
+                os.replace(tmp, blob)
+            if not target.exists():
+                self.wheels_dir.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(blob, target)
+                except OSError:
+                    shutil.copyfile(blob, target)
+            index[wheel.name] = digest
+            self._write_index(index)
+        return target
+
+    def add_local(self, wheel: Path) -> Path:
+        """Add a locally built wheel, replacing any previous build of the same filename.
+
+        Requirements on its project are then served from this wheel only.
+        """
+        target = self.add(wheel, replace=True)
+        self.local[canonicalize_name(parse_wheel_filename(wheel.name)[0])] = target
+        return target
+
+    def _read_index(self) -> Dict[str, str]:
+        try:
+            return json.loads(self._index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index: Dict[str, str]) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self._index_path.with_name(f"index.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(index, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, self._index_path)
@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+import fnmatch
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import InvalidWheelFilename, canonicalize_name, parse_wheel_filename
+from packaging.version import Version
+
+from ..config import DEFAULT_CONFIG_FILENAMES, load_config
+from .envpool import EnvironmentPool, EnvironmentProvider
+from .hashing import file_sha256
+from .pipeline import Pipeline
+from .project import ProjectInfo
+from .scanner import ProjectScanner
+from .scheduler import (
+    STATUS_FAILED,
+    STATUS_OK,
+    STATUS_SKIPPED,
+    BuildFailed,
+    Scheduler,
+    TargetResult,
+    default_jobs,
+)
+from .sources import is_ignored_dir
+from .wheelhouse import Wheelhouse
+
+logger = logging.getLogger(__name__)
+
+# Threads for walking the tree and parsing pyproject.toml files (I/O bound)
+SCAN_WORKERS = 8
+
+
+@dataclass
+class WorkspaceProject:
+    name: str  # canonical
+    root: Path
+    info: ProjectInfo
+    # Canonical names of workspace projects this one depends on
+    local_dependencies: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ProjectResult:
+    name: str
+    root: Path
+    status: str = STATUS_SKIPPED
+    duration: float = 0.0
+    targets: Dict[str, TargetResult] = field(default_factory=dict)
+    error: Optional[BaseException] = None
+
+
+def find_projects(root: Path, exclude: Iterable[str] = (), workers: int = SCAN_WORKERS) -> List[Path]:
+    """Directories under `root` that contain a pyproject.toml, found by a parallel walk.
+
+    Hidden directories, virtualenvs, the usual caches and each project's
+    build output are skipped, as are directories whose path relative to
+    `root` (or whose name) matches one of the `exclude` globs.
+    """
+    root_str = os.fspath(root)
+    patterns = list(exclude)
+
+    def visit(directory: str) -> Tuple[bool, List[str]]:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return False, []
+        names = {entry.name for entry in entries}
+        if "pyvenv.cfg" in names:
+            return False, []
+        is_project = "pyproject.toml" in names
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_dir(follow_symlinks=False):
+                continue
+            if is_ignored_dir(entry.name, is_project or directory == root_str):
+                continue
+            rel = os.path.relpath(entry.path, root_str).replace(os.sep, "/")
+            if any(fnmatch.fnmatch(rel, p) or fnmatch.fnmatch(entry.name, p) for p in patterns):
+                continue
+            subdirs.append(entry.path)
+        return is_project, subdirs
+
+    found: List[Path] = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pypackager-scan") as pool:
+        level = [root_str]
+        while level:
+            next_level: List[str] = []
+            for directory, (is_project, subdirs) in zip(level, pool.map(visit, level)):
+                if is_project:
+                    found.append(Path(directory))
+                next_level.extend(subdirs)
+            level = next_level
+    return sorted(found)
+
+
+def _scan(project_root: Path, wheelhouse: Optional[Wheelhouse] = None) -> Optional[ProjectInfo]:
+    try:
+        return ProjectScanner(project_root, wheelhouse=wheelhouse).scan()
+    except ValueError as e:
+        # e.g. a pyproject.toml holding only tool configuration
+        logger.info("Skipping %s: %s", project_root, e)
+        return None
+
+
+def _local_dependencies(info: ProjectInfo, projects: Mapping[str, WorkspaceProject]) -> List[str]:
+    local = set()
+    for req in [*info.dependencies, *info.build_requires]:
+        try:
+            parsed = Requirement(req)
+        except InvalidRequirement:
+            continue
+        name = canonicalize_name(parsed.name)
+        dependency = projects.get(name)
+        if dependency is None or name == canonicalize_name(info.name):
+            continue
+        if not parsed.specifier.contains(dependency.info.version, prereleases=True):
+            logger.warning(
+                "%s requires %s but the workspace has %s %s; it is resolved like any other dependency",
+                info.name, req, dependency.info.name, dependency.info.version,
+            )
+            continue
+        local.add(name)
+    return sorted(local)
+
+
+class Workspace:
+    """Build every project under a root directory in one run.
+
+    Projects are discovered by `find_projects` and built in dependency order:
+    when a project depends on another workspace project, the dependency's
+    wheel is built first and added to the shared `Wheelhouse`, from which the
+    consumer resolves and installs it. All projects share one environment
+    provider, and at most `jobs` targets (and lock steps) run at a time across
+    the whole workspace. Projects without a pypackager.toml of their own use
+    the workspace root's.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        exclude: Iterable[str] = (),
+        config_path: Optional[Path] = None,
+        wheelhouse: Optional[Wheelhouse] = None,
+    ) -> None:
+        self.root = root
+        self.exclude = list(exclude)
+        self.config_path = config_path
+        self.wheelhouse = wheelhouse or Wheelhouse()
+        self._projects: Optional[Dict[str, WorkspaceProject]] = None
+
+    def _config_path(self, project_root: Path) -> Optional[Path]:
+        if self.config_path is not None:
+            return self.config_path
+        for directory in (project_root, self.root):
+            for name in DEFAULT_CONFIG_FILENAMES:
+                if (directory / name).is_file():
+                    return directory / name
+        return None
+
+    def discover(self) -> Dict[str, WorkspaceProject]:
+        if self._projects is None:
+            started = time.perf_counter()
+            roots = find_projects(self.root, self.exclude)
+            with ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix="pypackager-scan") as pool:
+                infos = list(pool.map(partial(_scan, wheelhouse=self.wheelhouse), roots))
+            projects: Dict[str, WorkspaceProject] = {}
+            for project_root, info in zip(roots, infos):
+                if info is None:
+                    continue
+                name = canonicalize_name(info.name)
+                if name in projects:
+                    raise ValueError(
+                        f"Project {info.name} is defined twice: in {projects[name].root} and {project_root}"
+                    )
+                projects[name] = WorkspaceProject(name, project_root, info)
+            for project in projects.values():
+                project.local_dependencies = _local_dependencies(project.info, projects)
+            logger.info(
+                "Found %d project(s) under %s in %.2fs", len(projects), self.root, time.perf_counter() - started
+            )
+            self._projects = projects
+        return self._projects
+
+    def build(
+        self,
+        targets: Optional[Iterable[str]] = None,
+        output_dir: Optional[Path] = None,
+        jobs: Optional[int] = None,
+        force: bool = False,
+    ) -> Dict[str, ProjectResult]:
+        """Build every project; `targets` default to each project's configured targets.
+
+        Artifacts go to `<output_dir>/<project>/<target>/`, or each project's
+        own `dist/`. Returns the result of every project, failed and skipped
+        ones included.
+        """
+        projects = self.discover()
+        if not projects:
+            raise ValueError(f"No projects found under {self.root}")
+        jobs = jobs or default_jobs()
+        limiter = threading.BoundedSemaphore(jobs)
+        consumed = {d for p in projects.values() for d in p.local_dependencies}
+        published: Dict[str, List[str]] = {}
+        results = {name: ProjectResult(p.info.name, p.root) for name, p in projects.items()}
+
+        started = time.perf_counter()
+        with EnvironmentProvider(EnvironmentPool(wheelhouse=self.wheelhouse)) as provider:
+            tasks = {
+                name: partial(
+                    self._build_project, project, provider, limiter, list(targets or []),
+                    output_dir, jobs, force, name in consumed, published, results[name],
+                )
+                for name, project in projects.items()
+            }
+            # Projects mostly wait on their targets, which hold the job slots
+            outcome = Scheduler(jobs, label="project").run(
+                tasks, {name: p.local_dependencies for name, p in projects.items()}
+            )
+        for name, result in outcome.items():
+            results[name].status = result.status
+            results[name].error = result.error
+        self._log_summary(results, time.perf_counter() - started)
+        return results
+
+    def _build_project(
+        self,
+        project: WorkspaceProject,
+        provider: EnvironmentProvider,
+        limiter: threading.Semaphore,
+        targets: List[str],
+        output_dir: Optional[Path],
+        jobs: int,
+        force: bool,
+        feeds_consumers: bool,
+        published: Dict[str, List[str]],
+        result: ProjectResult,
+    ) -> None:
+        started = time.perf_counter()
+        config = load_config(project.root, self._config_path(project.root))
+        selected = targets or list(config.targets)
+        if feeds_consumers and "wheel" not in selected:
+            selected.append("wheel")
+        out = output_dir / project.name if output_dir else project.root / "dist"
+        upstream = self._closure(project)
+        pipeline = Pipeline(project.root, config=config, provider=provider, wheelhouse=self.wheelhouse)
+        # Local dependencies resolve to the workspace's versions, never to an index's
+        pipeline.local_pins = {name: self.discover()[name].info.version for name in upstream}
+        # and rebuilding them invalidates this project's targets
+        pipeline.upstream = sorted(d for name in upstream for d in published.get(name, []))
+        try:
+            with limiter:
+                pipeline.scan()
+            result.targets = pipeline.run(selected, out, jobs=jobs, force=force, limiter=limiter)
+        except BuildFailed as exc:
+            result.targets = exc.results
+            raise
+        finally:
+            result.duration = time.perf_counter() - started
+        if feeds_consumers:
+            published[project.name] = self._publish(project, out / "wheel")
+
+    def _closure(self, project: WorkspaceProject) -> List[str]:
+        """Workspace projects `project` depends on, directly or transitively."""
+        projects = self.discover()
+        seen: Set[str] = set()
+        stack = list(project.local_dependencies)
+        while stack:
+            name = stack.pop()
+            if name not in seen:
+                seen.add(name)
+                stack.extend(projects[name].local_dependencies)
+        return sorted(seen)
+
+    def _publish(self, project: WorkspaceProject, wheel_dir: Path) -> List[str]:
+        """Add the project's wheels to the wheelhouse for its consumers; returns their digests."""
+        name, version = project.name, Version(project.info.version)
+        directories = [wheel_dir, *(p for p in wheel_dir.iterdir() if p.is_dir())] if wheel_dir.is_dir() else []
+        digests = []
+        for directory in directories:
+            for wheel in sorted(directory.glob("*.whl")):
+                try:
+                    wheel_name, wheel_version, _build, _tags = parse_wheel_filename(wheel.name)
+                except InvalidWheelFilename:
+                    continue
+                if wheel_name == name and wheel_version == version:
+                    self.wheelhouse.add_local(wheel)
+                    digests.append(file_sha256(wheel))
+        if not digests:
+            raise RuntimeError(f"No wheel of {project.info.name} {version} in {wheel_dir} for its dependents")
+        logger.info("Published %d wheel(s) of %s to the wheelhouse", len(digests), project.info.name)
+        return digests
+
+    @staticmethod
+    def _log_summary(results: Mapping[str, ProjectResult], wall: float) -> None:
+        counts = {s: sum(r.status == s for r in results.values()) for s in (STATUS_OK, STATUS_FAILED, STATUS_SKIPPED)}
+        logger.info(
+            "Workspace summary (wall time %.2fs): %d ok, %d failed, %d skipped",
+            wall, counts[STATUS_OK], counts[STATUS_FAILED], counts[STATUS_SKIPPED],
+        )
+        width = max(len(r.name) for r in results.values())
+        for result in sorted(results.values(), key=lambda r: (-r.duration, r.name)):
+            detail = ", ".join(
+                f"{t.name} {t.duration:.2f}s" + ("" if t.status == STATUS_OK else f" {t.status}")
+                for t in sorted(result.targets.values(), key=lambda t: t.name)
+            )
+            line = f"  {result.name:<{width}}  {result.status:<7} {result.duration:6.2f}s"
+            logger.info("%s%s", line, f"  ({detail})" if detail else "")
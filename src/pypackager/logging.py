@@ -20,6 +20,10 @@ class _JsonFormatter(logging.Formatter):
             "message": record.getMessage(),
             "logger": record.name,
         }
+        # Span timings (see core.tracing) travel as structured fields
+        trace = getattr(record, "trace", None)
+        if trace:
+            payload.update(trace)
         if record.exc_info:
             payload["exc_info"] = self.formatException(record.exc_info)
         return json.dumps(payload, ensure_ascii=False)
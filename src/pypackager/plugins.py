@@ -1,53 +1,182 @@
 from __future__ import annotations
 
+import hashlib
+import importlib
+import json
 import logging
-from typing import Dict, Type
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Type
 
-try:
-    from importlib import metadata as importlib_metadata
-except Exception:  # pragma: no cover
-    import importlib_metadata  # type: ignore
+from .core.cache import user_cache_dir
 
 logger = logging.getLogger(__name__)
 
+GROUP = "pypackager.builders"
+INDEX_VERSION = 1
 
-def discover_builders() -> Dict[str, Type]:
-    """Discover builder classes via entry points group 'pypackager.builders'.
+# Used when no distribution declares builders, i.e. when running from source
+BUILTIN_BUILDERS: Dict[str, str] = {
+    "wheel": "pypackager.builders.wheel:WheelBuilder",
+    "docker": "pypackager.builders.docker:DockerBuilder",
+    "binary": "pypackager.builders.binary:BinaryBuilder",
+    "oci": "pypackager.builders.oci:OciBuilder",
+}
 
-    When running from source (uninstalled), fall back to built-in builders.
-    """
+
+def _mtime(path: str) -> Optional[int]:
     try:
-        eps = importlib_metadata.entry_points()
-        if hasattr(eps, "select"):
-            entries = eps.select(group="pypackager.builders")  # type: ignore[attr-defined]
-        else:  # Python 3.9 fallback shape
-            entries = eps.get("pypackager.builders", [])  # type: ignore[index]
-    except Exception as e:  # pragma: no cover
-        logger.warning("Failed to discover entry points: %s", e)
-        entries = []
-
-    result: Dict[str, Type] = {}
-    for ep in entries:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _path_stamp() -> List[Tuple[str, Optional[int]]]:
+    """The import path with the mtime of each entry; installs and removals change them."""
+    return [(entry, _mtime(entry or ".")) for entry in sys.path]
+
+
+def _dist_name(dirname: str) -> str:
+    stem = dirname.rsplit(".", 1)[0]
+    return stem.split("-", 1)[0].lower().replace("_", "-").replace(".", "-")
+
+
+def _scan(group: str) -> Dict[str, Dict[str, str]]:
+    """Entry points of `group` from every distribution on `sys.path`.
+
+    Mirrors `importlib.metadata`: the first distribution of a given name on
+    the path wins. Each entry records the metadata directory it came from.
+    """
+    import configparser  # only needed when the cached index is stale
+
+    entries: Dict[str, Dict[str, str]] = {}
+    seen = set()
+    for entry in sys.path:
         try:
-            cls = ep.load()
-            result[ep.name] = cls
-        except Exception as e:  # pragma: no cover
-            logger.warning("Failed to load builder '%s': %s", getattr(ep, "name", "?"), e)
+            names = sorted(os.listdir(entry or "."))
+        except OSError:
+            continue
+        for dirname in names:
+            if not dirname.endswith((".dist-info", ".egg-info")):
+                continue
+            dist = _dist_name(dirname)
+            if dist in seen:
+                continue
+            seen.add(dist)
+            directory = os.path.join(entry or ".", dirname)
+            parser = configparser.ConfigParser(delimiters=("=",), interpolation=None)
+            parser.optionxform = str  # type: ignore[assignment,method-assign]
+            try:
+                parser.read(os.path.join(directory, "entry_points.txt"), encoding="utf-8")
+            except (configparser.Error, UnicodeDecodeError) as e:
+                logger.warning("Ignoring unreadable entry points of %s: %s", directory, e)
+                continue
+            if parser.has_section(group):
+                for name, value in parser.items(group):
+                    entries.setdefault(name, {"value": value.strip(), "dist": os.path.abspath(directory)})
+    return entries
+
+
+class BuilderRegistry:
+    """Index of the `pypackager.builders` entry points, cached on disk.
+
+    Enumerating entry points reads the metadata of every installed
+    distribution, so the index is stored in the user cache and reused until
+    an entry of `sys.path` or one of the contributing dist-info directories
+    changes mtime. Builder classes are imported only when `load()`ed.
+    """
 
-    # Fallback: import built-in builders directly when entry points are unavailable
-    if not result:
+    def __init__(self, cache_path: Optional[Path] = None) -> None:
+        key = hashlib.sha256(sys.executable.encode("utf-8")).hexdigest()[:12]
+        self.cache_path = cache_path or user_cache_dir() / "entry-points" / f"{key}.json"
+        self._index: Optional[Dict[str, Dict[str, str]]] = None
+        self._loaded: Dict[str, Type] = {}
+
+    def _read_cache(self, stamp: List[Tuple[str, Optional[int]]]) -> Optional[Dict[str, Dict[str, str]]]:
+        try:
+            data = json.loads(self.cache_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != INDEX_VERSION or [tuple(s) for s in data.get("path", [])] != stamp:
+            return None
+        entries = data.get("entries") or {}
+        dists = data.get("dists") or {}
+        if any(_mtime(dist) != mtime for dist, mtime in dists.items()):
+            return None
+        return entries
+
+    def _write_cache(self, stamp: List[Tuple[str, Optional[int]]], entries: Dict[str, Dict[str, str]]) -> None:
+        dists = {e["dist"]: _mtime(e["dist"]) for e in entries.values()}
+        data = {"version": INDEX_VERSION, "path": stamp, "dists": dists, "entries": entries}
         try:
-            from .builders.wheel import WheelBuilder  # type: ignore
-            from .builders.docker import DockerBuilder  # type: ignore
-            from .builders.binary import BinaryBuilder  # type: ignore
-
-            result = {
-                "wheel": WheelBuilder,
-                "docker": DockerBuilder,
-                "binary": BinaryBuilder,
-            }
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_path.with_name(f".{self.cache_path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(data, sort_keys=True), encoding="utf-8")
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            logger.debug("Could not cache the builder index: %s", e)
+
+    def index(self) -> Dict[str, str]:
+        """Builder name → "module:attr", from the cache when still valid."""
+        if self._index is None:
+            stamp = _path_stamp()
+            entries = self._read_cache(stamp)
+            if entries is None:
+                entries = _scan(GROUP)
+                self._write_cache(stamp, entries)
+                logger.debug("Indexed %d builder entry point(s)", len(entries))
+            self._index = entries
+        if not self._index:
             logger.debug("Using built-in builders fallback discovery")
-        except Exception as e:  # pragma: no cover
-            logger.warning("Fallback builder import failed: %s", e)
+            return dict(BUILTIN_BUILDERS)
+        return {name: entry["value"] for name, entry in self._index.items()}
+
+    def names(self) -> List[str]:
+        return list(self.index())
+
+    def load(self, name: str) -> Type:
+        """Import the builder class registered as `name`."""
+        if name not in self._loaded:
+            try:
+                value = self.index()[name]
+            except KeyError:
+                raise ValueError(f"Unknown builder {name!r}") from None
+            module_name, _, attr = value.partition(":")
+            obj = importlib.import_module(module_name.strip())
+            for part in filter(None, attr.split("[", 1)[0].strip().split(".")):
+                obj = getattr(obj, part)
+            self._loaded[name] = obj  # type: ignore[assignment]
+        return self._loaded[name]
+
+    def load_many(self, names: Iterable[str]) -> Dict[str, Type]:
+        """Load the named builders, skipping (with a warning) those that fail to import."""
+        result: Dict[str, Type] = {}
+        for name in names:
+            try:
+                result[name] = self.load(name)
+            except Exception as e:
+                logger.warning("Failed to load builder '%s': %s", name, e)
+        return result
 
-    return result
+
+_registry: Optional[BuilderRegistry] = None
+
+
+def get_registry() -> BuilderRegistry:
+    global _registry
+    if _registry is None:
+        _registry = BuilderRegistry()
+    return _registry
+
+
+def discover_builders(names: Optional[Iterable[str]] = None) -> Dict[str, Type]:
+    """Builder classes by name: all registered builders, or only `names` among them.
+
+    Discovery uses the `pypackager.builders` entry points (see
+    `BuilderRegistry`); when running from source, the built-in builders.
+    """
+    registry = get_registry()
+    available = registry.names()
+    selected = available if names is None else [n for n in available if n in set(names)]
+    return registry.load_many(selected)
@@ -0,0 +1,9 @@
+from __future__ import annotations
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cache(tmp_path_factory, monkeypatch):
+    """Keep the user cache (artifact store, unpacked wheels) out of the real one."""
+    monkeypatch.setenv("PYPACKAGER_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional
+
+from pypackager.core.builder import Builder
+from pypackager.core.incremental import BuildCache
+from pypackager.core.pipeline import _empty_dir
+from pypackager.core.project import ProjectInfo
+from pypackager.core.sources import SourceTree
+
+
+class _Builder(Builder):
+    name = "dummy"
+    version = "1"
+
+    def configure(self, project_info: ProjectInfo) -> None:
+        pass
+
+    def build(self, output_directory: Path, env=None) -> None:
+        output_directory.mkdir(parents=True, exist_ok=True)
+        (output_directory / "out.txt").write_text("built", encoding="utf-8")
+
+
+def _project(root: Path) -> ProjectInfo:
+    return ProjectInfo(name="demo", version="1.0", root=root, python_requires=None, dependencies=[])
+
+
+def _fingerprint(cache: BuildCache, root: Path, builder: Optional[Builder] = None) -> str:
+    builder = builder or _Builder()
+    digest = cache.source_digest(SourceTree(root))
+    return cache.fingerprint(builder, _project(root), None, digest)
+
+
+def _record(cache: BuildCache, root: Path, artifact_dir: Path) -> str:
+    fingerprint = _fingerprint(cache, root)
+    _Builder().build(artifact_dir)
+    cache.record("dummy", fingerprint, artifact_dir)
+    return fingerprint
+
+
+def _tree(tmp_path: Path) -> Path:
+    root = tmp_path / "project"
+    (root / "demo").mkdir(parents=True)
+    (root / "demo" / "__init__.py").write_text("VALUE = 1\n", encoding="utf-8")
+    (root / "pyproject.toml").write_text("[project]\nname = 'demo'\n", encoding="utf-8")
+    return root
+
+
+def test_unchanged_inputs_are_up_to_date(tmp_path):
+    root, out = _tree(tmp_path), tmp_path / "dist"
+    fingerprint = _record(BuildCache(out), root, out / "dummy")
+
+    cache = BuildCache(out)
+    assert _fingerprint(cache, root) == fingerprint
+    assert cache.lookup("dummy", fingerprint, out / "dummy")
+
+
+def test_source_change_is_stale(tmp_path):
+    root, out = _tree(tmp_path), tmp_path / "dist"
+    fingerprint = _record(BuildCache(out), root, out / "dummy")
+
+    (root / "demo" / "__init__.py").write_text("VALUE = 2\n", encoding="utf-8")
+    cache = BuildCache(out)
+    changed = _fingerprint(cache, root)
+    assert changed != fingerprint
+    assert not cache.lookup("dummy", changed, out / "dummy")
+
+
+def test_builder_version_change_is_stale(tmp_path):
+    root, out = _tree(tmp_path), tmp_path / "dist"
+    fingerprint = _record(BuildCache(out), root, out / "dummy")
+
+    bumped = _Builder()
+    bumped.version = "2"
+    assert _fingerprint(BuildCache(out), root, bumped) != fingerprint
+
+
+def test_modified_artifact_is_restored_from_the_store(tmp_path):
+    root, out = _tree(tmp_path), tmp_path / "dist"
+    fingerprint = _record(BuildCache(out), root, out / "dummy")
+
+    (out / "dummy" / "out.txt").write_text("tampered", encoding="utf-8")
+    assert BuildCache(out).lookup("dummy", fingerprint, out / "dummy")
+    assert (out / "dummy" / "out.txt").read_text(encoding="utf-8") == "built"
+
+
+def test_missing_artifact_not_in_the_store_is_stale(tmp_path):
+    root, out = _tree(tmp_path), tmp_path / "dist"
+    cache = BuildCache(out)
+    fingerprint = _record(cache, root, out / "dummy")
+
+    (out / "dummy" / "out.txt").unlink()
+    cache.store.path_for(cache._manifest["targets"]["dummy"]["artifacts"]["out.txt"]["sha256"]).unlink()
+    assert not BuildCache(out).lookup("dummy", fingerprint, out / "dummy")
+
+
+def test_empty_dir_clears_stale_artifacts(tmp_path):
+    artifact_dir = tmp_path / "dummy"
+    (artifact_dir / "sub").mkdir(parents=True)
+    (artifact_dir / "old.whl").write_bytes(b"stale")
+    (artifact_dir / "sub" / "nested").write_bytes(b"stale")
+
+    _empty_dir(artifact_dir)
+    assert artifact_dir.is_dir()
+    assert list(artifact_dir.iterdir()) == []
+    _empty_dir(tmp_path / "new")
+    assert (tmp_path / "new").is_dir()
+
+
+def test_restoring_leaves_the_shared_entry_alone(tmp_path):
+    root, out = _tree(tmp_path), tmp_path / "dist"
+    fingerprint = _record(BuildCache(out), root, out / "dummy")
+
+    cache = BuildCache(out)
+    entry = cache._manifest["targets"]["dummy"]
+    before = {rel: dict(record) for rel, record in entry["artifacts"].items()}
+    (out / "dummy" / "out.txt").write_text("tampered", encoding="utf-8")
+    assert cache.lookup("dummy", fingerprint, out / "dummy")
+
+    assert entry["artifacts"] == before
+    restored = cache._manifest["targets"]["dummy"]["artifacts"]["out.txt"]
+    assert restored["mtime_ns"] == (out / "dummy" / "out.txt").stat().st_mtime_ns
+    assert BuildCache(out)._manifest["targets"]["dummy"]["artifacts"]["out.txt"] == restored
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from pypackager.core.metadata import MetadataCache, _from_metadata
+
+KEY = "k" * 64
+FIELDS = {"version": "1.2.3"}
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    (root / "demo").mkdir(parents=True)
+    (root / "setup.py").write_text("from setuptools import setup\nsetup()\n", encoding="utf-8")
+    (root / "demo" / "__init__.py").write_text("__version__ = '1.2.3'\n", encoding="utf-8")
+    return root
+
+
+def _stored(project: Path, tmp_path: Path) -> MetadataCache:
+    cache = MetadataCache(tmp_path / "cache")
+    inputs = {"files": ["setup.py", "demo/__init__.py"], "dirs": [".", "demo"], "spawned": False}
+    cache.store(project, KEY, FIELDS, inputs)
+    return cache
+
+
+def _later(path: Path) -> None:
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 5_000_000_000))
+
+
+def test_unchanged_inputs_hit(project, tmp_path):
+    cache = _stored(project, tmp_path)
+    assert cache.lookup(project, KEY) == FIELDS
+    # and from disk, in a fresh process
+    assert MetadataCache(tmp_path / "cache").lookup(project, KEY) == FIELDS
+    assert cache.lookup(project, "other" * 8) is None
+
+
+def test_changed_file_misses(project, tmp_path):
+    cache = _stored(project, tmp_path)
+    (project / "demo" / "__init__.py").write_text("__version__ = '2.0'\n", encoding="utf-8")
+    assert cache.lookup(project, KEY) is None
+
+
+def test_deleted_file_misses(project, tmp_path):
+    cache = _stored(project, tmp_path)
+    (project / "setup.py").unlink()
+    assert cache.lookup(project, KEY) is None
+
+
+def test_changed_listing_misses(project, tmp_path):
+    cache = _stored(project, tmp_path)
+    (project / "demo" / "extra.py").write_text("", encoding="utf-8")
+    _later(project / "demo")
+    assert cache.lookup(project, KEY) is None
+
+
+def test_ignored_entries_do_not_change_the_listing(project, tmp_path):
+    cache = _stored(project, tmp_path)
+    (project / "build").mkdir()
+    (project / "demo" / "__pycache__").mkdir()
+    _later(project)
+    _later(project / "demo")
+    assert cache.lookup(project, KEY) == FIELDS
+
+
+def test_touched_file_hits_and_refreshes_its_stamp(project, tmp_path):
+    cache = _stored(project, tmp_path)
+    _later(project / "setup.py")
+    assert cache.lookup(project, KEY) == FIELDS
+
+    [entry_path] = (tmp_path / "cache").glob("*.json")
+    entry = json.loads(entry_path.read_text(encoding="utf-8"))
+    stamps = {rel: mtime for rel, mtime, _size, _digest in entry["files"]}
+    assert stamps["setup.py"] == (project / "setup.py").stat().st_mtime_ns
+    assert MetadataCache(tmp_path / "cache").lookup(project, KEY) == FIELDS
+
+
+def test_metadata_fields_leave_out_extras():
+    text = (
+        "Metadata-Version: 2.1\nName: demo\nVersion: 1.2.3\nRequires-Python: >=3.9\n"
+        "Requires-Dist: requests>=2\n"
+        'Requires-Dist: tomli; python_version < "3.11"\n'
+        'Requires-Dist: pytest; extra == "test"\n'
+        "Requires-Dist: rich; python_version >= '3.9' and extra=='cli'\n"
+        "Provides-Extra: test\n\n"
+    )
+    assert _from_metadata(text, ["version", "dependencies", "requires-python"]) == {
+        "version": "1.2.3",
+        "dependencies": ["requests>=2", 'tomli; python_version < "3.11"'],
+        "requires-python": ">=3.9",
+    }
+    assert _from_metadata(text, ["version"]) == {"version": "1.2.3"}
+
+
+def test_refreshing_stamps_leaves_the_shared_entry_alone(project, tmp_path):
+    cache = _stored(project, tmp_path)
+    shared = cache._entries[project]
+    before = json.dumps(shared, sort_keys=True)
+    _later(project / "setup.py")
+    assert cache.lookup(project, KEY) == FIELDS
+    assert json.dumps(shared, sort_keys=True) == before
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from pypackager.core.archive import Compression
+from pypackager.core.oci import (
+    MEDIA_CONFIG, MEDIA_INDEX, MEDIA_MANIFEST, REF_NAME, BlobStore, Image, load_image, write_layer, write_layout,
+)
+
+PLATFORM = ("linux", "amd64")
+
+
+def _tree(root: Path, mtime: int) -> Path:
+    rng = random.Random(0)
+    files = {
+        "usr/local/lib/python3.12/site-packages/demo/__init__.py": b"VALUE = 1\n" * 50_000,
+        "usr/local/lib/python3.12/site-packages/demo/data.bin": bytes(rng.getrandbits(8) for _ in range(300_000)),
+        "usr/local/bin/demo": b"#!/usr/local/bin/python\n",
+    }
+    for rel, data in files.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    (root / "usr/local/bin/demo").chmod(0o775)
+    (root / "usr/local/bin/python").symlink_to("python3.12")
+    for path in [*root.rglob("*"), root]:
+        os.utime(path, (mtime, mtime), follow_symlinks=False)
+    return root
+
+
+def _sha256(data: bytes) -> str:
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def test_layers_are_reproducible(tmp_path):
+    # The same tree, written at different times and compressed with different thread counts
+    layers = []
+    for i, (mtime, threads) in enumerate([(1_600_000_000, 1), (1_700_000_000, 4)]):
+        store = BlobStore(tmp_path / f"layout{i}" / "blobs")
+        layers.append(write_layer(_tree(tmp_path / f"tree{i}", mtime), store, compression=Compression(threads=threads)))
+        # Nothing but digests in blobs/, and no staging file left next to it
+        assert [p.name for p in (tmp_path / f"layout{i}").iterdir()] == ["blobs"]
+    assert layers[0] == layers[1]
+
+
+def test_layer_digests_and_entries(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    layer = write_layer(_tree(tmp_path / "tree", 1_700_000_000), store, mtime=42)
+    blob = store.path(layer.descriptor.digest).read_bytes()
+    assert (layer.descriptor.digest, layer.descriptor.size) == (_sha256(blob), len(blob))
+    assert layer.diff_id == _sha256(gzip.decompress(blob))
+
+    with tarfile.open(fileobj=io.BytesIO(blob), mode="r:gz") as tar:
+        members = {m.name: m for m in tar.getmembers()}
+    assert list(members) == sorted(members)
+    assert {(m.mtime, m.uid, m.gid, m.uname, m.gname) for m in members.values()} == {(42, 0, 0, "", "")}
+    assert members["usr/local/bin/demo"].mode == 0o755
+    assert members["usr/local/lib/python3.12/site-packages/demo/__init__.py"].mode == 0o644
+    assert members["usr/local/bin/python"].linkname == "python3.12"
+
+
+def _layout(tmp_path: Path) -> Path:
+    directory = tmp_path / "layout"
+    store = BlobStore(directory / "blobs")
+    layer = write_layer(_tree(tmp_path / "tree", 0), store)
+    config = {
+        "architecture": "amd64", "os": "linux", "config": {"Cmd": ["python", "-m", "demo"]},
+        "rootfs": {"type": "layers", "diff_ids": [layer.diff_id]},
+    }
+    write_layout(directory, store, Image(config=config, layers=[layer]), "demo:1.0")
+    return directory
+
+
+def test_layout_index_manifest_and_config(tmp_path):
+    directory = _layout(tmp_path)
+    store = BlobStore(directory / "blobs")
+    assert json.loads((directory / "oci-layout").read_text()) == {"imageLayoutVersion": "1.0.0"}
+    index = json.loads((directory / "index.json").read_text())
+    assert (index["schemaVersion"], index["mediaType"]) == (2, MEDIA_INDEX)
+    [entry] = index["manifests"]
+    assert entry["annotations"] == {REF_NAME: "demo:1.0"}
+
+    data = store.path(entry["digest"]).read_bytes()
+    assert (entry["digest"], entry["size"]) == (_sha256(data), len(data))
+    manifest = store.read_json(entry["digest"])
+    assert (entry["mediaType"], manifest["mediaType"], manifest["config"]["mediaType"]) == (
+        MEDIA_MANIFEST, MEDIA_MANIFEST, MEDIA_CONFIG,
+    )
+    for descriptor in [manifest["config"], *manifest["layers"]]:
+        data = store.path(descriptor["digest"]).read_bytes()
+        assert (descriptor["digest"], descriptor["size"]) == (_sha256(data), len(data))
+    config = store.read_json(manifest["config"]["digest"])
+    assert config["rootfs"]["diff_ids"] == [
+        _sha256(gzip.decompress(store.path(d["digest"]).read_bytes())) for d in manifest["layers"]
+    ]
+
+
+def test_layout_loads_back_as_a_base_image(tmp_path):
+    directory = _layout(tmp_path)
+    image = load_image(directory, BlobStore(tmp_path / "cache"), PLATFORM)
+    assert image.config["config"]["Cmd"] == ["python", "-m", "demo"]
+    assert [layer.diff_id for layer in image.layers] == image.config["rootfs"]["diff_ids"]
+
+
+def _tarball(directory: Path, archive: Path, corrupt: bool = False) -> None:
+    with tarfile.open(archive, "w") as tar:
+        for path in sorted(directory.rglob("*")):
+            if not path.is_file():
+                continue
+            data = path.read_bytes()
+            if corrupt and path.parent.name == "sha256" and data.startswith(b"\x1f\x8b"):
+                data = data[:-1] + bytes([data[-1] ^ 1])
+            info = tarfile.TarInfo("./" + path.relative_to(directory).as_posix())
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def test_tarball_import(tmp_path):
+    archive = tmp_path / "base.tar"
+    _tarball(_layout(tmp_path), archive)
+    image = load_image(archive, BlobStore(tmp_path / "cache"), PLATFORM)
+    assert len(image.layers) == 1
+
+
+def test_tarball_blob_not_matching_its_digest_is_rejected(tmp_path):
+    archive = tmp_path / "base.tar"
+    _tarball(_layout(tmp_path), archive, corrupt=True)
+    store = BlobStore(tmp_path / "cache" / "blobs")
+    with pytest.raises(RuntimeError, match="does not match its digest"):
+        load_image(archive, store, PLATFORM)
+    assert not any(p.is_file() and p.name.endswith(".partial") for p in (tmp_path / "cache").iterdir())
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+from pypackager.core.cache_server import CacheServer
+from pypackager.core.hashing import file_sha256
+from pypackager.core.remote_cache import (
+    CacheUnavailable, FileSystemBackend, HttpBackend, RemoteCache, blob_key, entry_key,
+)
+
+FINGERPRINT = "f" * 64
+
+
+def _artifacts(artifact_dir: Path) -> Dict[str, Dict]:
+    (artifact_dir / "sub").mkdir(parents=True)
+    (artifact_dir / "demo-1.0-py3-none-any.whl").write_bytes(b"wheel bytes")
+    (artifact_dir / "sub" / "demo.pyz").write_bytes(b"#!/usr/bin/env python3\n")
+    (artifact_dir / "sub" / "demo.pyz").chmod(0o755)
+    return {
+        path.relative_to(artifact_dir).as_posix(): {"sha256": file_sha256(path), "size": path.stat().st_size}
+        for path in artifact_dir.rglob("*") if path.is_file()
+    }
+
+
+def _round_trip(cache: RemoteCache, tmp_path: Path) -> Path:
+    built = tmp_path / "built" / "binary"
+    cache.upload("binary", FINGERPRINT, built, _artifacts(built))
+    cache.flush()
+    restored = tmp_path / "restored" / "binary"
+    restored.parent.mkdir()
+    assert cache.fetch("binary", FINGERPRINT, restored)
+    return restored
+
+
+def _assert_same(restored: Path, built: Path) -> None:
+    assert sorted(p.relative_to(restored) for p in restored.rglob("*")) == sorted(
+        p.relative_to(built) for p in built.rglob("*")
+    )
+    assert (restored / "demo-1.0-py3-none-any.whl").read_bytes() == b"wheel bytes"
+    assert (restored / "sub" / "demo.pyz").stat().st_mode & 0o111
+
+
+def test_filesystem_round_trip(tmp_path):
+    cache = RemoteCache(FileSystemBackend(tmp_path / "shared"))
+    restored = _round_trip(cache, tmp_path)
+    _assert_same(restored, tmp_path / "built" / "binary")
+    assert not cache.fetch("binary", "0" * 64, tmp_path / "restored" / "other")
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_http_round_trip(tmp_path):
+    server = CacheServer(tmp_path / "served", port=0, token="secret")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        restored = _round_trip(RemoteCache(HttpBackend(server.url, token="secret")), tmp_path)
+        _assert_same(restored, tmp_path / "built" / "binary")
+        assert (tmp_path / "served" / entry_key(FINGERPRINT)).is_file()
+        with pytest.raises(CacheUnavailable):
+            HttpBackend(server.url, token="wrong").exists(entry_key(FINGERPRINT))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_corrupt_blob_is_a_miss_and_repaired_by_the_next_upload(tmp_path):
+    shared = tmp_path / "shared"
+    cache = RemoteCache(FileSystemBackend(shared))
+    built = tmp_path / "built" / "binary"
+    artifacts = _artifacts(built)
+    cache.upload("binary", FINGERPRINT, built, artifacts)
+    cache.flush()
+    blob = shared / blob_key(artifacts["demo-1.0-py3-none-any.whl"]["sha256"])
+    blob.write_bytes(b"corrupted")
+
+    previous = tmp_path / "restored" / "binary"
+    previous.mkdir(parents=True)
+    (previous / "keep").write_bytes(b"")
+    assert not cache.fetch("binary", FINGERPRINT, previous)
+    assert (previous / "keep").exists()
+    cache.upload("binary", FINGERPRINT, built, artifacts)
+    cache.flush()
+    assert blob.read_bytes() == b"wheel bytes"
+    assert cache.fetch("binary", FINGERPRINT, previous)
+
+
+def test_unreachable_cache_is_disabled_without_failing(tmp_path):
+    cache = RemoteCache(HttpBackend("http://127.0.0.1:9", timeout=1.0))
+    artifact_dir = tmp_path / "binary"
+    assert not cache.fetch("binary", FINGERPRINT, artifact_dir)
+    assert cache.stats.errors == 1
+    cache.upload("binary", FINGERPRINT, artifact_dir, {"x": {"sha256": "0" * 64, "size": 0}})
+    cache.flush()
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import base64
+import csv
+import gzip
+import hashlib
+import io
+import random
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import List, Tuple
+
+import pytest
+
+from pypackager.core.archive import BLOCK_SIZE, Compression
+from pypackager.core.reproducible import normalize_sdist, normalize_wheel, recompress_sdist, recompress_wheel
+
+EPOCH = 1_600_000_000
+
+
+def _payload(seed: int) -> bytes:
+    # Compressible, and spanning several parallel blocks
+    rng = random.Random(seed)
+    words = [bytes(rng.choices(b"abcdefgh", k=8)) for _ in range(64)]
+    return b" ".join(rng.choice(words) for _ in range(BLOCK_SIZE // 3))
+
+
+def _members() -> List[Tuple[str, bytes]]:
+    return [
+        ("demo/__init__.py", b"VALUE = 1\n"),
+        ("demo/data.txt", _payload(1)),
+        ("demo/core.py", b"def main():\n    return 0\n"),
+        ("demo-1.0.dist-info/METADATA", b"Metadata-Version: 2.1\nName: demo\nVersion: 1.0\n"),
+        ("demo-1.0.dist-info/WHEEL", b"Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: py3-none-any\n"),
+        ("demo-1.0.dist-info/RECORD", b""),
+    ]
+
+
+def _write_wheel(path: Path, order: List[int], date_time: Tuple[int, ...]) -> None:
+    members = _members()
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for index in order:
+            name, data = members[index]
+            info = zipfile.ZipInfo(name, date_time)
+            info.external_attr = 0o664 << 16
+            zf.writestr(info, data)
+
+
+def _write_sdist(path: Path, order: List[int], mtime: int) -> None:
+    with tarfile.open(path, "w:gz") as tar:
+        for index in order:
+            name, data = _members()[index]
+            info = tarfile.TarInfo(f"demo-1.0/{name}")
+            info.size, info.mtime, info.uid, info.uname, info.mode = len(data), mtime, 1000, "dev", 0o664
+            tar.addfile(info, io.BytesIO(data))
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_wheels_normalize_byte_identical(tmp_path, threads):
+    first, second = tmp_path / "a" / "demo-1.0-py3-none-any.whl", tmp_path / "b" / "demo-1.0-py3-none-any.whl"
+    first.parent.mkdir()
+    second.parent.mkdir()
+    _write_wheel(first, [0, 1, 2, 3, 4, 5], (2024, 5, 1, 12, 0, 0))
+    _write_wheel(second, [5, 2, 4, 1, 0, 3], (2023, 1, 2, 3, 4, 6))
+
+    normalize_wheel(first, EPOCH, Compression(threads=1))
+    normalize_wheel(second, EPOCH, Compression(threads=threads))
+    assert first.read_bytes() == second.read_bytes()
+    assert not normalize_wheel(first, EPOCH)
+
+
+def test_normalized_wheel_record_matches_contents(tmp_path):
+    wheel = tmp_path / "demo-1.0-py3-none-any.whl"
+    _write_wheel(wheel, [5, 4, 3, 2, 1, 0], (2024, 5, 1, 12, 0, 0))
+    normalize_wheel(wheel, EPOCH, Compression(threads=4))
+
+    with zipfile.ZipFile(wheel) as zf:
+        assert zf.testzip() is None
+        names = zf.namelist()
+        assert names[-1] == "demo-1.0.dist-info/RECORD"
+        rows = list(csv.reader(io.StringIO(zf.read(names[-1]).decode("utf-8"))))
+        for name, digest, size in rows[:-1]:
+            data = zf.read(name)
+            expected = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=").decode("ascii")
+            assert (digest, int(size)) == (f"sha256={expected}", len(data))
+        assert {row[0] for row in rows} == set(names)
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_sdists_normalize_byte_identical(tmp_path, threads):
+    first, second = tmp_path / "a" / "demo-1.0.tar.gz", tmp_path / "b" / "demo-1.0.tar.gz"
+    first.parent.mkdir()
+    second.parent.mkdir()
+    _write_sdist(first, [0, 1, 2, 3, 4], EPOCH + 100)
+    _write_sdist(second, [4, 2, 0, 3, 1], EPOCH + 5000)
+
+    normalize_sdist(first, EPOCH, Compression(threads=1))
+    normalize_sdist(second, EPOCH, Compression(threads=threads))
+    assert first.read_bytes() == second.read_bytes()
+    with tarfile.open(first) as tar:
+        members = tar.getmembers()
+    assert [m.name for m in members] == sorted(m.name for m in members)
+    assert {(m.mtime, m.uid, m.uname, m.mode) for m in members} == {(EPOCH, 0, "", 0o644)}
+
+
+def test_recompression_is_independent_of_threads(tmp_path):
+    stored = tmp_path / "stored.whl"
+    with zipfile.ZipFile(stored, "w", zipfile.ZIP_STORED) as zf:
+        for name, data in _members():
+            zf.writestr(zipfile.ZipInfo(name, (2024, 5, 1, 12, 0, 0)), data)
+    outputs = []
+    for threads in (1, 4):
+        wheel = tmp_path / f"{threads}.whl"
+        wheel.write_bytes(stored.read_bytes())
+        recompress_wheel(wheel, Compression(threads=threads))
+        outputs.append(wheel.read_bytes())
+        with zipfile.ZipFile(wheel) as zf:
+            assert {name: zf.read(name) for name in zf.namelist()} == dict(_members())
+    assert outputs[0] == outputs[1]
+
+
+def test_sdist_recompression_keeps_the_tar_stream(tmp_path):
+    sdist = tmp_path / "demo-1.0.tar.gz"
+    _write_sdist(sdist, [0, 1, 2, 3, 4], EPOCH)
+    tar_stream = gzip.decompress(sdist.read_bytes())
+    outputs = []
+    for threads in (1, 4):
+        recompress_sdist(sdist, Compression(threads=threads))
+        outputs.append(sdist.read_bytes())
+        assert gzip.decompress(outputs[-1]) == tar_stream
+    assert outputs[0] == outputs[1]
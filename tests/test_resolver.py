@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from pypackager.core.resolver import DependencyResolver
+
+
+def _item(name: str, version: str, requires: List[str] = ()) -> Dict:
+    return {
+        "metadata": {"name": name, "version": version, "requires_dist": list(requires)},
+        "download_info": {"archive_info": {"hashes": {"sha256": f"{name}{version}".encode().hex()}}},
+    }
+
+
+REPORT = {
+    "install": [
+        _item("Requests", "2.31.0", ["idna<4,>=2.5", "urllib3<3,>=1.21.1", "PySocks!=1.5.7; extra == 'socks'"]),
+        _item("idna", "3.6"),
+        _item("urllib3", "2.1.0", ["brotli>=1.0.9; extra == 'brotli'"]),
+    ],
+}
+
+
+@pytest.fixture
+def reports(monkeypatch):
+    """Answer every resolution with `REPORT` (in a different order each time); record the calls."""
+    calls: List[List[str]] = []
+
+    def pip_report(self, interpreter, requirements, constraints):
+        calls.append(list(requirements))
+        items = REPORT["install"]
+        shift = len(calls) % len(items)
+        return {"install": items[shift:] + items[:shift]}
+
+    monkeypatch.setattr(DependencyResolver, "_pip_report", pip_report)
+    return calls
+
+
+def _lock(root: Path, cache: Path, deps: List[str] = ("requests>=2",)) -> bytes:
+    root.mkdir(parents=True, exist_ok=True)
+    resolver = DependencyResolver(root, cache_dir=cache)
+    return resolver.write_lockfile("demo", "1.0", list(deps), ">=3.9").read_bytes()
+
+
+def test_lockfile_is_byte_stable(tmp_path, reports):
+    first = _lock(tmp_path / "a", tmp_path / "cache-a")
+    second = _lock(tmp_path / "b", tmp_path / "cache-b")
+    assert len(reports) == 2
+    assert first == second
+    text = first.decode("utf-8")
+    assert text.index('name = "idna"') < text.index('name = "requests"') < text.index('name = "urllib3"')
+    # Requirements for extras nobody asked for stay out of the graph
+    assert 'requires = ["idna", "urllib3"]' in text
+    assert "pysocks" not in text.lower()
+
+
+def test_unchanged_inputs_skip_resolution(tmp_path, reports):
+    root, cache = tmp_path / "project", tmp_path / "cache"
+    lock = _lock(root, cache)
+    assert _lock(root, cache) == lock
+    assert len(reports) == 1
+
+    # Without the lockfile, the cached resolution for the same inputs is reused
+    (root / "pypackager.lock").unlink()
+    assert _lock(root, cache) == lock
+    assert len(reports) == 1
+
+
+def test_changed_inputs_resolve_again(tmp_path, reports):
+    root, cache = tmp_path / "project", tmp_path / "cache"
+    _lock(root, cache)
+    _lock(root, cache, ["requests>=2", "idna"])
+    assert reports[-1] == ["idna"]
+    assert DependencyResolver(root, cache_dir=cache).pinned_requirements() == [
+        "idna==3.6", "requests==2.31.0", "urllib3==2.1.0",
+    ]
+
+
+def test_each_environment_is_resolved_by_its_own_interpreter(tmp_path, monkeypatch):
+    from packaging.markers import default_environment
+
+    host = dict(default_environment())
+    other = {**host, "python_version": "2.7"}
+    probed = {"/opt/alias/python": host, "/opt/old/python": other}
+    monkeypatch.setattr(DependencyResolver, "_probe_environment", staticmethod(probed.__getitem__))
+    used: List[str] = []
+
+    def pip_report(self, interpreter, requirements, constraints):
+        used.append(interpreter)
+        return REPORT
+
+    monkeypatch.setattr(DependencyResolver, "_pip_report", pip_report)
+    # The second interpreter shares the first one's environment
+    resolver = DependencyResolver(
+        tmp_path, interpreters=[sys.executable, "/opt/alias/python", "/opt/old/python"], cache_dir=tmp_path / "cache"
+    )
+    resolver.write_lockfile("demo", "1.0", ["requests>=2"], None)
+    assert used == [sys.executable, "/opt/old/python"]
+    assert len(resolver.environments()) == 2
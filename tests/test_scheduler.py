@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, List
+
+import pytest
+
+from pypackager.core.process import current_target
+from pypackager.core.scheduler import STATUS_FAILED, STATUS_OK, STATUS_SKIPPED, Scheduler
+
+request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="")
+
+
+class _Recorder:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.events: List[str] = []
+        self.running = 0
+        self.peak = 0
+
+    def task(self, name: str, seconds: float = 0.01, fail: bool = False) -> Callable[[], None]:
+        def run() -> None:
+            with self.lock:
+                self.events.append(f"start {name}")
+                self.running += 1
+                self.peak = max(self.peak, self.running)
+            time.sleep(seconds)
+            with self.lock:
+                self.running -= 1
+                self.events.append(f"end {name}")
+            if fail:
+                raise RuntimeError(f"{name} broke")
+
+        return run
+
+
+def test_dependencies_finish_before_dependents_start():
+    rec = _Recorder()
+    deps = {"docker": ["wheel"], "oci": ["wheel"], "binary": ["wheel", "docker"]}
+    tasks = {name: rec.task(name) for name in ["wheel", "docker", "oci", "binary"]}
+    results = Scheduler(jobs=4).run(tasks, deps)
+
+    assert {r.status for r in results.values()} == {STATUS_OK}
+    for name, needed in deps.items():
+        for dep in needed:
+            assert rec.events.index(f"end {dep}") < rec.events.index(f"start {name}")
+
+
+def test_failure_skips_only_dependents():
+    rec = _Recorder()
+    tasks = {
+        "wheel": rec.task("wheel", fail=True),
+        "docker": rec.task("docker"),
+        "binary": rec.task("binary"),
+        "sdist": rec.task("sdist"),
+    }
+    results = Scheduler(jobs=2).run(tasks, {"docker": ["wheel"], "binary": ["docker"]})
+
+    assert results["wheel"].status == STATUS_FAILED
+    assert str(results["wheel"].error) == "wheel broke"
+    assert (results["docker"].status, results["binary"].status) == (STATUS_SKIPPED, STATUS_SKIPPED)
+    assert results["sdist"].status == STATUS_OK
+    assert "start docker" not in rec.events and "start binary" not in rec.events
+
+
+def test_jobs_bound_concurrency():
+    rec = _Recorder()
+    tasks = {f"t{i}": rec.task(f"t{i}", seconds=0.05) for i in range(6)}
+    Scheduler(jobs=2).run(tasks, {})
+    assert rec.peak == 2
+
+
+def test_shared_limiter_bounds_schedulers_together():
+    rec = _Recorder()
+    limiter = threading.Semaphore(2)
+    threads = [
+        threading.Thread(
+            target=Scheduler(jobs=3, limiter=limiter).run,
+            args=({f"{s}{i}": rec.task(f"{s}{i}", seconds=0.05) for i in range(3)}, {}),
+        )
+        for s in "ab"
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert rec.peak <= 2
+
+
+def test_tasks_run_in_the_callers_context():
+    seen: Dict[str, tuple] = {}
+
+    def task(name: str) -> Callable[[], None]:
+        def run() -> None:
+            seen[name] = (request_id.get(), current_target.get())
+            request_id.set("changed by task")
+
+        return run
+
+    token = request_id.set("build-42")
+    try:
+        Scheduler(jobs=2).run({"wheel": task("wheel"), "docker": task("docker")}, {"docker": ["wheel"]})
+        assert request_id.get() == "build-42"
+    finally:
+        request_id.reset(token)
+    assert seen == {"wheel": ("build-42", "wheel"), "docker": ("build-42", "docker")}
+
+
+def test_cycles_are_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        Scheduler(jobs=1).run({"a": lambda: None, "b": lambda: None}, {"a": ["b"], "b": ["a"]})
+    with pytest.raises(ValueError):
+        Scheduler(jobs=-1)
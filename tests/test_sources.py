@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from pypackager.core.sources import SourceTree, blob_sha, git_files, walk_files
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+
+
+def _git(root: Path, *args: str) -> None:
+    subprocess.run(  # noqa: S603
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],  # noqa: S607
+        cwd=root, check=True, capture_output=True,
+    )
+
+
+def _write(root: Path, rel: str, text: str) -> None:
+    path = root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+@pytest.fixture
+def checkout(tmp_path):
+    root = tmp_path / "repo"
+    for i in range(30):
+        _write(root, f"demo/pkg{i % 3}/mod{i}.py", f"VALUE = {i}\n")
+    _write(root, "pyproject.toml", "[project]\nname = 'demo'\n")
+    _write(root, ".gitignore", "data/\n")
+    _git(root, "init", "-q")
+    _git(root, "add", "-A")
+    _git(root, "commit", "-q", "-m", "initial")
+    # Untracked, ignored by git, modified, deleted, and skipped by pypackager itself
+    _write(root, "demo/new.py", "NEW = 1\n")
+    _write(root, "data/blob.bin", "ignored")
+    _write(root, "demo/pkg0/mod0.py", "VALUE = 'changed'\n")
+    (root / "demo/pkg1/mod1.py").unlink()
+    _write(root, "demo/__pycache__/mod.cpython-311.pyc", "")
+    return root
+
+
+def _listing(files):
+    return {f.path: (f.size, f.mtime_ns) for f in files}
+
+
+def test_git_index_lists_what_a_walk_does_minus_ignored(checkout):
+    from_git = _listing(git_files(checkout))
+    from_walk = _listing(walk_files(checkout))
+
+    assert "demo/new.py" in from_git and "demo/pkg0/mod0.py" in from_git
+    assert "demo/pkg1/mod1.py" not in from_git
+    assert not any(path.startswith(("data/", ".git/")) or "__pycache__" in path for path in from_git)
+    assert from_git == {path: meta for path, meta in from_walk.items() if not path.startswith("data/")}
+
+
+def test_git_digests_match_file_contents(checkout):
+    digests = {f.path: f.digest for f in git_files(checkout)}
+    assert digests["demo/new.py"] is None
+    assert any(digest is not None for digest in digests.values())
+    for path, digest in digests.items():
+        if digest is not None:
+            assert digest == blob_sha(checkout / path)
+
+
+def test_untracked_listing_follows_git_add(checkout):
+    assert "demo/later.py" not in _listing(git_files(checkout))
+    _write(checkout, "demo/later.py", "")
+    assert "demo/later.py" in _listing(git_files(checkout))
+    _git(checkout, "add", "demo/later.py")
+    paths = [f.path for f in git_files(checkout)]
+    assert paths.count("demo/later.py") == 1
+
+
+def test_source_tree_falls_back_to_a_walk(checkout, monkeypatch):
+    tree = SourceTree(checkout)
+    assert _listing(tree) == _listing(git_files(checkout))
+    assert tree.engine == "git"
+
+    monkeypatch.setenv("PYPACKAGER_SOURCES", "walk")
+    forced = SourceTree(checkout)
+    assert _listing(forced) == _listing(walk_files(checkout))
+    assert forced.engine == "walk"
+
+    monkeypatch.delenv("PYPACKAGER_SOURCES")
+    shutil.rmtree(checkout / ".git")
+    outside = SourceTree(checkout)
+    assert _listing(outside) == _listing(walk_files(checkout))
+    assert outside.engine == "walk"
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import base64
+import csv
+import hashlib
+import os
+import zipfile
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+from pypackager.core import _wheel_installer as installer
+
+
+def _hash(data: bytes) -> str:
+    return "sha256=" + base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=").decode("ascii")
+
+
+def _wheel(directory: Path, name: str, version: str, files: Dict[str, bytes]) -> Path:
+    dist_info = f"{name}-{version}.dist-info"
+    files = {
+        **files,
+        f"{dist_info}/METADATA": f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n".encode(),
+        f"{dist_info}/WHEEL": b"Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+        f"{dist_info}/entry_points.txt": f"[console_scripts]\n{name}-cli = {name}.cli:main\n".encode(),
+    }
+    record = "".join(f"{path},{_hash(data)},{len(data)}\n" for path, data in files.items())
+    path = directory / f"{name}-{version}-py3-none-any.whl"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for member, data in files.items():
+            zf.writestr(member, data)
+        zf.writestr(f"{dist_info}/RECORD", record + f"{dist_info}/RECORD,,\n")
+    return path
+
+
+def _record(target: Path, dist_info: str) -> Dict[str, list]:
+    with open(target / dist_info / "RECORD", newline="", encoding="utf-8") as fh:
+        return {row[0]: row[1:] for row in csv.reader(fh)}
+
+
+@pytest.fixture
+def wheel(tmp_path):
+    (tmp_path / "wheels").mkdir()
+    return _wheel(tmp_path / "wheels", "demo", "1.0", {
+        "demo/__init__.py": b"VALUE = 1\n",
+        "demo/cli.py": b"def main():\n    return 0\n",
+    })
+
+
+def test_record_lists_every_installed_file(tmp_path, wheel):
+    target = tmp_path / "target"
+    stats = installer.install([str(wheel)], installer.scheme(target=str(target)), cache=str(tmp_path / "cache"), compile=True)
+
+    assert stats["wheels"] == 1 and stats["compiled"] == 2
+    record = _record(target, "demo-1.0.dist-info")
+    installed = {
+        path.relative_to(target).as_posix() for path in target.rglob("*") if path.is_file()
+    }
+    assert set(record) == installed
+    assert "bin/demo-cli" in record and "demo-1.0.dist-info/INSTALLER" in record
+    for rel, (digest, size) in record.items():
+        if rel.endswith("/RECORD"):
+            assert (digest, size) == ("", "")
+            continue
+        data = (target / rel).read_bytes()
+        assert (digest, int(size)) == (_hash(data), len(data))
+    assert os.access(target / "bin" / "demo-cli", os.X_OK)
+
+
+def test_installs_hardlink_the_unpacked_cache(tmp_path, wheel):
+    cache = tmp_path / "cache"
+    first, second = tmp_path / "first", tmp_path / "second"
+    stats = installer.install([str(wheel)], installer.scheme(target=str(first)), cache=str(cache))
+    installer.install([str(wheel)], installer.scheme(target=str(second)), cache=str(cache))
+
+    assert stats["linked"] == 5 and stats["copied"] == 0
+    module = first / "demo" / "__init__.py"
+    assert module.stat().st_nlink == 3
+    assert module.stat().st_ino == (second / "demo" / "__init__.py").stat().st_ino
+    # Launchers are generated, with this interpreter's shebang
+    assert (first / "bin" / "demo-cli").stat().st_nlink == 1
+
+
+def test_reinstall_removes_files_of_the_previous_version(tmp_path, wheel):
+    target = tmp_path / "target"
+    paths = installer.scheme(target=str(target))
+    installer.install([str(wheel)], paths)
+    newer = _wheel(tmp_path / "wheels", "demo", "2.0", {"demo/__init__.py": b"VALUE = 2\n"})
+    installer.install([str(newer)], paths)
+
+    assert not (target / "demo" / "cli.py").exists()
+    assert not (target / "demo-1.0.dist-info").exists()
+    assert (target / "demo" / "__init__.py").read_bytes() == b"VALUE = 2\n"
+
+
+def test_conflicting_wheels_are_left_to_pip(tmp_path, wheel):
+    other = _wheel(tmp_path / "wheels", "other", "1.0", {"demo/__init__.py": b"VALUE = 3\n"})
+    target = tmp_path / "target"
+    with pytest.raises(installer.Unsupported):
+        installer.install([str(wheel), str(other)], installer.scheme(target=str(target)))
+    assert not target.exists()